@@ -0,0 +1,12 @@
+"""
+全流程合成数据基准测试
+synthetic.py      : 生成条纹光多光源图像、COCO GT、YOLO 预测、VLM 回复等全套合成数据 (规模可配置)
+run_benchmarks.py : 对融合、裁剪、拼图、Message 构建、回复解析、指标计算、伪标签生成逐阶段计时，输出 JSON 报告
+mock_openai_server.py : 本地 OpenAI 兼容 Chat Completions 服务 (延迟分布、限流、错误注入、流式返回)
+load_test_call_api.py : 基于 mock 服务驱动 pe/call_api.py，输出并发-吞吐/延迟曲线，并校验续跑、重试、流式行为
+bench_response_parser.py : 统一回复解析库与原 parse_vlm_prediction / check_ai_response 的逐条对比与吞吐测试
+只依赖 NumPy / OpenCV，CPU、无网络环境即可运行；缺少可选依赖 (ensemble_boxes、ultralytics 等) 的阶段会标记为 skipped。
+"""
+from .synthetic import SCALE_PRESETS, generate_synthetic_dataset
+
+__all__ = ['SCALE_PRESETS', 'generate_synthetic_dataset']
@@ -0,0 +1,331 @@
+"""
+VLM 回复解析基准测试：统一解析库 (utils/vlm_response_parser.py) vs 原来各模块里的实现
+    label    : 只取类别。原 parse_vlm_prediction (去代码块 + json.loads + 正则兜底) vs 直接定位 defect 键
+               (另外固定加入 EDGE_CASES：嵌套对象、重复键、键名大小写等快速路径必须退回原逻辑的情况)
+    strict   : 完整校验。原 check_ai_response (split_api_reponse_stu.py 版本) vs parse_response(mode='strict')
+    teacher  : split_api_reponse_tea.py 版本 (defect 由 GT 标签覆盖)，每 7 条去掉一次 meta_info / label，
+               核对合格、retry (含 fail_reason)、异常丢弃三种去向与清洗后的回复文本
+    lenient  : parse_response(mode='lenient') 的耗时与救回条数 (没有原实现可比，只作参考)
+    bulk     : 大 JSONL 批量取类别。原做法逐行 json.loads 整条记录再解析 pred，
+               新做法 parse_jsonl (原始行直接取 pred，跳过 pred_token_probs 的反序列化) 单进程 / 多进程
+每一项都会逐条核对新旧结果是否一致，不一致的条数和前几个样例写进报告。
+回复文本复用 synthetic.py 的生成规则 (代码块、前后废话、截断、ERROR、缺字段、非法 JSON 按比例混合)。
+"""
+import argparse
+import json
+import os
+import re
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+from defect_vlm.benchmarks.synthetic import DEFECT_CLASSES, _teacher_response_text, _vlm_pred_text
+from defect_vlm.pe.split_api_reponse_tea import check_ai_response as check_teacher_response
+from defect_vlm.utils.vlm_response_parser import (DEFECT_LABELS, RESPONSE_KEYS, parse_jsonl, parse_response,
+                                                  parse_vlm_prediction)
+
+MAX_EXAMPLES = 3
+
+# 快速路径容易出错的边界情况，每次都加入 label 测试逐条核对
+EDGE_CASES = [
+    '{"a":{"defect":"run"},"defect":"bulge"}',          # 嵌套对象中也有 defect，原实现取顶层
+    '{"defect":"run","defect":"bulge"}',                 # 重复键，json.loads 取最后一个
+    '{"Defect":"scratch"}',                              # 合法 JSON 但键名大小写不同 -> background
+    '{"DEFECT": "Crater", broken',                       # 非法 JSON，正则兜底大小写不敏感
+    '{"step1": "ok"}',                                   # 合法 JSON 没有 defect
+    '{"defect": ""}',                                    # 空值
+    '{"defect": "run\\u0020x"}',                       # 转义
+    '{"defect": null}',                                  # 非字符串值
+    '[{"defect": "run"}]',                               # 顶层不是对象
+    '```json\n{"defect": "Bulge"}\n```',
+    '{"step1": "a } b", "defect": "inclusion"}',
+    '',
+]
+
+
+# ================= 原实现 (基线，仅供对比) =================
+
+def _legacy_parse_vlm_prediction(pred_text):
+    try:
+        clean_text = pred_text.replace("```json", "").replace("```", "").strip()
+        data = json.loads(clean_text)
+        return data.get("defect", "background").lower()
+    except Exception:
+        match = re.search(r'"defect"\s*:\s*"([^"]+)"', pred_text, re.IGNORECASE)
+        if match:
+            return match.group(1).lower()
+        return "background"
+
+
+def _legacy_check_response(ai_response_str):
+    """原 split_api_reponse_stu.check_ai_response 的判定逻辑，返回 (ok, fail_reason)"""
+    if ai_response_str.startswith("ERROR"):
+        return False, f"API调用阶段报错: {ai_response_str}"
+    start_idx = ai_response_str.find('{')
+    end_idx = ai_response_str.rfind('}')
+    if start_idx != -1 and end_idx != -1 and start_idx <= end_idx:
+        ai_response_str = ai_response_str[start_idx:end_idx + 1]
+    else:
+        return False, "模型回复中未找到有效的JSON大括号结构"
+    try:
+        ai_response = json.loads(ai_response_str, strict=False)
+    except json.JSONDecodeError:
+        return False, "JSON解析失败，非标准JSON格式"
+    ai_response_keys = set(ai_response.keys())
+    if ai_response_keys != set(RESPONSE_KEYS):
+        return False, f"模型的回复缺少必须字段, 当前为 {ai_response_keys}"
+    ai_response_defect = ai_response.get('defect', '').lower()
+    if ai_response_defect not in DEFECT_LABELS:
+        return False, f"模型回复的缺陷类型不符合要求, 当前为 {ai_response_defect}"
+    return True, None
+
+
+def _legacy_check_teacher(item):
+    """原 split_api_reponse_tea.check_ai_response：JSON 解析成功后才读取 meta_info.label"""
+    ai_response_str = item['conversation'][1]['value']
+    if ai_response_str.startswith("ERROR"):
+        if 'meta_info' not in item: item['meta_info'] = {}
+        item['meta_info']['fail_reason'] = f"API调用阶段报错: {ai_response_str}"
+        return False
+    start_idx = ai_response_str.find('{')
+    end_idx = ai_response_str.rfind('}')
+    if start_idx != -1 and end_idx != -1 and start_idx <= end_idx:
+        ai_response_str = ai_response_str[start_idx:end_idx + 1]
+    else:
+        if 'meta_info' not in item: item['meta_info'] = {}
+        item['meta_info']['fail_reason'] = "模型回复中未找到有效的JSON大括号结构"
+        return False
+    try:
+        ai_response = json.loads(ai_response_str, strict=False)
+        ai_response['defect'] = item['meta_info']['label']
+        item['conversation'][1]['value'] = json.dumps(ai_response, ensure_ascii=False, indent=4)
+    except json.JSONDecodeError:
+        if 'meta_info' not in item: item['meta_info'] = {}
+        item['meta_info']['fail_reason'] = "JSON解析失败，非标准JSON格式"
+        return False
+    ai_response_keys = set(ai_response.keys())
+    if ai_response_keys != set(RESPONSE_KEYS):
+        if 'meta_info' not in item: item['meta_info'] = {}
+        item['meta_info']['fail_reason'] = f"模型的回复缺少必须字段, 当前为 {ai_response_keys}"
+        return False
+    return True
+
+
+# ================= 数据 =================
+
+def build_responses(num, seed=0):
+    """VLM pred 与教师回复各占一半"""
+    rng = np.random.default_rng(seed)
+    labels = list(DEFECT_CLASSES) + ["background"]
+    defects = rng.integers(len(labels), size=num)
+    texts = []
+    for i in range(num):
+        defect = labels[defects[i]]
+        texts.append(_vlm_pred_text(rng, defect) if i % 2 == 0 else _teacher_response_text(rng, defect))
+    return texts + EDGE_CASES
+
+
+def write_vlm_jsonl(path, num, seed=0):
+    """与 batch_infer_preds_probs.py 输出结构一致的记录 (messages + pred + 最后 20 个 token 的概率流)"""
+    rng = np.random.default_rng(seed)
+    labels = list(DEFECT_CLASSES) + ["background"]
+    prompt = "<image>\n<image>\nThe first image is the global view, the second is the local view. " * 4
+    with open(path, 'w', encoding='utf-8') as f:
+        for i in range(num):
+            defect = labels[int(rng.integers(len(labels)))]
+            probs = [{"token": f"tok{k}", "logprob": -0.01 * k, "probability": round(float(np.exp(-0.01 * k)), 6),
+                      "top_candidates": [{"token": f"c{j}", "probability": 0.1} for j in range(3)]}
+                     for k in range(20)]
+            item = {
+                "id": f"sp012_gt_pred_{i}",
+                "images": [f"11_composite_yolo_preds/images/val/global_{i}.png",
+                           f"11_composite_yolo_preds/images/val/local_{i}.png"],
+                "messages": [{"role": "system", "content": "You are a defect inspector."},
+                             {"role": "user", "content": prompt}],
+                "pred": _vlm_pred_text(rng, defect),
+                "pred_token_probs": probs,
+                "meta_info": {"bbox": [10, 20, 30, 40], "prior_label": defect, "confidence": 0.5,
+                              "model_source": "WBF", "origin_id": i},
+            }
+            f.write(json.dumps(item, ensure_ascii=False) + '\n')
+
+
+# ================= 计时 =================
+
+def _best_of(fn, repeat):
+    best, out = None, None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        out = fn()
+        dt = time.perf_counter() - t0
+        best = dt if best is None else min(best, dt)
+    return best, out
+
+
+def _compare(name, n, legacy_s, new_s, mismatches, examples):
+    return {"name": name, "items": n, "legacy_s": round(legacy_s, 4), "new_s": round(new_s, 4),
+            "speedup": round(legacy_s / new_s, 2) if new_s else None,
+            "mismatches": mismatches, "examples": examples[:MAX_EXAMPLES]}
+
+
+def bench_label(texts, repeat):
+    legacy_s, legacy = _best_of(lambda: [_legacy_parse_vlm_prediction(t) for t in texts], repeat)
+    new_s, new = _best_of(lambda: [parse_vlm_prediction(t) for t in texts], repeat)
+    diff = [{"text": texts[i][:120], "legacy": a, "new": b} for i, (a, b) in enumerate(zip(legacy, new)) if a != b]
+    return _compare("label", len(texts), legacy_s, new_s, len(diff), diff)
+
+
+def bench_strict(texts, repeat):
+    legacy_s, legacy = _best_of(lambda: [_legacy_check_response(t) for t in texts], repeat)
+
+    def run_new():
+        out = []
+        for t in texts:
+            r = parse_response(t, mode='strict', labels=DEFECT_LABELS)
+            out.append((r.ok, r.fail_reason))
+        return out
+
+    new_s, new = _best_of(run_new, repeat)
+    diff = [{"text": texts[i][:120], "legacy": a, "new": b} for i, (a, b) in enumerate(zip(legacy, new)) if a != b]
+    return _compare("strict", len(texts), legacy_s, new_s, len(diff), diff)
+
+
+def build_teacher_items(texts):
+    """教师回复记录 (split_api_reponse_tea.py 的输入格式)，每 7 条去掉 label、每 11 条去掉整个 meta_info"""
+    items = []
+    for i, t in enumerate(texts):
+        item = {"id": i, "conversation": [{"from": "human", "value": "q"}, {"from": "gpt", "value": t}],
+                "meta_info": {"label": DEFECT_CLASSES[i % len(DEFECT_CLASSES)]}}
+        if i % 7 == 0:
+            del item["meta_info"]["label"]
+        if i % 11 == 0:
+            del item["meta_info"]
+        items.append(item)
+    return items
+
+
+def _split_outcomes(check_fn, items):
+    """按原脚本的外层 try/except 记录每条的去向: (good / bad / dropped, 处理后的记录)"""
+    out = []
+    for item in items:
+        item = json.loads(json.dumps(item))
+        try:
+            out.append(("good" if check_fn(item) else "bad", item))
+        except Exception:
+            out.append(("dropped", None))
+    return out
+
+
+def bench_teacher(texts, repeat):
+    items = build_teacher_items(texts)
+    legacy_s, legacy = _best_of(lambda: _split_outcomes(_legacy_check_teacher, items), repeat)
+    new_s, new = _best_of(lambda: _split_outcomes(check_teacher_response, items), repeat)
+    diff = [{"text": texts[i][:120], "legacy": a[0], "new": b[0]} for i, (a, b) in enumerate(zip(legacy, new)) if a != b]
+    row = _compare("teacher", len(items), legacy_s, new_s, len(diff), diff)
+    row["outcomes"] = {k: sum(o[0] == k for o in new) for k in ("good", "bad", "dropped")}
+    return row
+
+
+def bench_lenient(texts, repeat):
+    def run_new():
+        return [parse_response(t, mode='lenient', labels=DEFECT_LABELS) for t in texts]
+
+    new_s, results = _best_of(run_new, repeat)
+    strict_ok = sum(_legacy_check_response(t)[0] for t in texts)
+    lenient_ok = sum(r.ok for r in results)
+    return {"name": "lenient", "items": len(texts), "new_s": round(new_s, 4),
+            "strict_ok": strict_ok, "lenient_ok": lenient_ok,
+            "recovered": sum(r.ok and r.recovered for r in results)}
+
+
+def bench_bulk(jsonl_path, workers_list, repeat):
+    def run_legacy():
+        out = []
+        with open(jsonl_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                if not line.strip(): continue
+                out.append(_legacy_parse_vlm_prediction(json.loads(line).get("pred", "")))
+        return out
+
+    legacy_s, legacy = _best_of(run_legacy, repeat)
+    rows = []
+    for w in workers_list:
+        new_s, new = _best_of(lambda: parse_jsonl(jsonl_path, field='pred', mode='label', num_workers=w), repeat)
+        diff = [{"line": i, "legacy": a, "new": b} for i, (a, b) in enumerate(zip(legacy, new)) if a != b]
+        if len(new) != len(legacy):
+            diff.insert(0, {"line": -1, "legacy": len(legacy), "new": len(new)})
+        row = _compare(f"bulk[workers={w}]", len(legacy), legacy_s, new_s, len(diff), diff)
+        row["workers"] = w
+        rows.append(row)
+    return rows
+
+
+# ================= 报告 =================
+
+def print_report(report):
+    print("\n" + "=" * 50)
+    print("🧾 VLM 回复解析基准报告")
+    print("=" * 50)
+    print(f"   [配置] 回复条数: {report['num_responses']}, JSONL 记录数: {report['num_records']}, "
+          f"重复: {report['repeat']} 次取最快, CPU: {report['cpu_count']}")
+    for row in report["results"]:
+        print("-" * 50)
+        if row["name"] == "lenient":
+            print(f"🩹 lenient : {row['new_s']:.3f}s ({row['items'] / max(row['new_s'], 1e-9):,.0f} 条/s)")
+            print(f"   strict 合格 {row['strict_ok']} 条 -> lenient 合格 {row['lenient_ok']} 条 "
+                  f"(单遍扫描救回 {row['recovered']} 条)")
+            continue
+        rate_old = row['items'] / max(row['legacy_s'], 1e-9)
+        rate_new = row['items'] / max(row['new_s'], 1e-9)
+        print(f"⚡ {row['name']:<18}: 原实现 {row['legacy_s']:.3f}s ({rate_old:,.0f} 条/s) -> "
+              f"新实现 {row['new_s']:.3f}s ({rate_new:,.0f} 条/s), 加速 {row['speedup']}x")
+        if "outcomes" in row:
+            print(f"   去向: {row['outcomes']}")
+        if row["mismatches"]:
+            print(f"   ⚠️ 结果不一致: {row['mismatches']} 条，例如:")
+            for ex in row["examples"]:
+                print(f"      {ex}")
+        else:
+            print("   ✅ 逐条结果与原实现一致")
+    print("=" * 50)
+
+
+def main(num_responses, num_records, workers_list, repeat=3, report_path=None, work_dir=None):
+    print(f"🧪 正在生成 {num_responses} 条回复文本...")
+    texts = build_responses(num_responses)
+    results = [bench_label(texts, repeat), bench_strict(texts, repeat), bench_teacher(texts, repeat),
+               bench_lenient(texts, repeat)]
+    del texts
+
+    with tempfile.TemporaryDirectory(dir=work_dir) as tmp:
+        jsonl_path = Path(tmp) / "vlm_response.jsonl"
+        print(f"🧪 正在生成 {num_records} 条 VLM 推理记录: {jsonl_path}")
+        write_vlm_jsonl(jsonl_path, num_records)
+        size_mb = os.path.getsize(jsonl_path) / 1024 / 1024
+        results.extend(bench_bulk(str(jsonl_path), workers_list, repeat))
+
+    report = {"num_responses": num_responses, "num_records": num_records, "jsonl_mb": round(size_mb, 1),
+              "repeat": repeat, "cpu_count": os.cpu_count(), "results": results}
+    print_report(report)
+    if report_path:
+        Path(report_path).parent.mkdir(parents=True, exist_ok=True)
+        with open(report_path, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        print(f"✅ 报告已保存至: {report_path}")
+    return report
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="VLM 回复解析基准测试")
+    parser.add_argument("--num_responses", type=int, default=1_000_000, help="label / strict / lenient 的回复条数")
+    parser.add_argument("--num_records", type=int, default=1_000_000, help="bulk 测试的 JSONL 记录数 (约 2KB/条)")
+    parser.add_argument("--workers", type=str, default=f"1,{os.cpu_count() or 1}", help="parse_jsonl 的进程数列表")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--report", type=str, default=None, help="JSON 报告输出路径")
+    parser.add_argument("--work_dir", type=str, default=None, help="临时 JSONL 的存放目录 (默认系统临时目录)")
+    args = parser.parse_args()
+
+    workers = sorted({int(w) for w in args.workers.split(',') if w.strip()})
+    main(args.num_responses, args.num_records, workers, args.repeat, args.report, args.work_dir)
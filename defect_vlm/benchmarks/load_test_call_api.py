@@ -0,0 +1,347 @@
+"""
+call_api.py 压测与行为校验 (基于本地 mock 服务，不花钱)
+1. 压测：在合成图像上构造教师请求 jsonl，按不同并发数依次驱动 pe/call_api.py 的 process_batch_task
+   (真实的 base64 编码、AsyncOpenAI 客户端、断点续跑、逐条追加写入都参与计时)，
+   输出 并发数 -> 吞吐 / 服务端延迟分位数 / 每个任务的实际请求次数 (SDK 自动重试) / 失败条数 的曲线；
+2. 行为校验 (--scenarios)：
+    resume    : 已有部分结果时只请求剩余任务，最终每个 id 恰好一条
+    retry     : 注入 429 / 503 / 断连，SDK 自动重试后仍失败的任务写成 ERROR，不丢任务
+    error_path: 空 choices / 空 content 按 call_api 的约定写成对应的 ERROR 文本，且不会重试
+    streaming : stream=True 拼接后的内容与非流式一致，include_usage 时最后一块带 usage
+    early_stop: JSON 之后带多余文字时，measure 统计多余 token，on 在结论完成后断开流且回复恰好止于右大括号
+mock 服务的参数与 mock_openai_server.py 命令行一致。需要安装 openai。
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import tempfile
+import time
+from pathlib import Path
+
+from defect_vlm.benchmarks.synthetic import generate_synthetic_dataset
+from defect_vlm.benchmarks.mock_openai_server import MockChatServer, add_mock_server_args, server_kwargs_from_args
+
+PROMPT_TXT = Path(__file__).resolve().parents[1] / "pe" / "prompt_text_tea.txt"
+DEFAULT_CONCURRENCY = [1, 2, 4, 8, 16, 32, 64]
+
+
+# ================= 数据准备 =================
+def prepare_images(work_dir, num_images=8, seed=0):
+    """生成合成条纹图，返回可用于请求的图片路径列表"""
+    ctx = generate_synthetic_dataset(Path(work_dir) / "synthetic", num_images=num_images, seed=seed)
+    return sorted(str(p) for p in Path(ctx['paths']['rgb_root']).rglob("*.png"))
+
+
+def build_request_jsonl(path, image_paths, num_requests, prefix="load"):
+    """构造与 build_api_request_teacher.py 输出一致的请求 (两张图 + 教师 prompt)"""
+    prompt = PROMPT_TXT.read_text(encoding='utf-8').replace('{prior_label}', 'scratch').replace('{label}', 'scratch')
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        for i in range(num_requests):
+            item = {
+                "id": f"{prefix}_{i:06d}",
+                "image": [image_paths[(2 * i) % len(image_paths)], image_paths[(2 * i + 1) % len(image_paths)]],
+                "conversation": [{"from": "human", "value": prompt}, {"from": "gpt", "value": ""}],
+            }
+            f.write(json.dumps(item, ensure_ascii=False) + '\n')
+    return path
+
+
+# ================= 驱动 call_api =================
+def run_call_api(input_file, output_file, base_url, concurrency, quiet=True, early_stop='off'):
+    """调用真实的 process_batch_task，返回墙钟耗时 (秒)"""
+    from defect_vlm.pe.call_api import process_batch_task
+
+    args = argparse.Namespace(provider='mock', model='mock-model', input_file=str(input_file),
+                              output_file=str(output_file), concurrency=concurrency,
+                              base_url=base_url, api_key='EMPTY', early_stop=early_stop)
+    start = time.perf_counter()
+    with contextlib.ExitStack() as stack:
+        if quiet:
+            sink = io.StringIO()
+            stack.enter_context(contextlib.redirect_stdout(sink))
+            stack.enter_context(contextlib.redirect_stderr(sink))
+        asyncio.run(process_batch_task(args))
+    return time.perf_counter() - start
+
+
+def summarize_output(output_file):
+    """统计输出文件：总行数、唯一 id 数、各类 ERROR"""
+    rows, ids, errors = 0, set(), {}
+    if Path(output_file).exists():
+        with open(output_file, 'r', encoding='utf-8') as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                item = json.loads(line)
+                rows += 1
+                ids.add(item['id'])
+                value = item['conversation'][1]['value']
+                if not value.startswith('ERROR'):
+                    continue
+                if value.startswith('ERROR: APIError'):
+                    kind = 'APIError'           # 具体报错信息各不相同，按大类统计
+                elif value.startswith('ERROR: Exception'):
+                    kind = 'Exception'
+                else:
+                    kind = value
+                errors[kind] = errors.get(kind, 0) + 1
+    return {"rows": rows, "unique_ids": len(ids), "errors": errors, "num_errors": sum(errors.values())}
+
+
+# ================= 压测 =================
+def load_test(server, input_file, work_dir, concurrency_list, num_requests, early_stop='off'):
+    results = []
+    for c in concurrency_list:
+        output_file = Path(work_dir) / f"load_c{c}.jsonl"
+        output_file.unlink(missing_ok=True)
+        server.reset_stats()
+        wall = run_call_api(input_file, output_file, server.base_url, c, early_stop=early_stop)
+        out = summarize_output(output_file)
+        stats = server.stats()
+        service = stats['service_ms']
+        ok_rows = out['rows'] - out['num_errors']
+        ideal = c / (service['mean'] / 1000) if service['mean'] else None
+        results.append({
+            "concurrency": c,
+            "wall_s": round(wall, 3),
+            "throughput_rps": round(ok_rows / wall, 3) if wall > 0 else None,
+            "ideal_rps": round(ideal, 3) if ideal else None,
+            "service_ms": service,
+            "attempts_per_task": round(stats['requests'] / max(num_requests, 1), 3),
+            "max_in_flight": stats['max_in_flight'],
+            "outcomes": stats['outcomes'],
+            "rows": out['rows'],
+            "errors": out['errors'],
+        })
+        r = results[-1]
+        print(f"   c={c:<4} 吞吐 {r['throughput_rps']:>8.2f} req/s  p50 {service['p50']} ms  p90 {service['p90']} ms  "
+              f"请求/任务 {r['attempts_per_task']:.2f}  ERROR {out['num_errors']}")
+    return results
+
+
+def print_load_report(results, server_kwargs):
+    print("\n" + "=" * 50)
+    print("📈 call_api 并发压测报告")
+    print("=" * 50)
+    print(f"   [mock] 延迟: {server_kwargs['latency']} {server_kwargs['latency_ms']}ms, "
+          f"rpm: {server_kwargs['rpm']}, 并发上限: {server_kwargs['max_concurrency']}, 错误注入: {server_kwargs['error_rates']}")
+    print(f"{'并发':>6}{'吞吐(req/s)':>14}{'理想值':>10}{'效率':>8}{'P50(ms)':>10}{'P90(ms)':>10}{'P99(ms)':>10}{'请求/任务':>10}{'ERROR':>8}")
+    print("-" * 50)
+    best = max(results, key=lambda r: r['throughput_rps'] or 0)
+    for r in results:
+        eff = f"{r['throughput_rps'] / r['ideal_rps'] * 100:.0f}%" if r['ideal_rps'] else "-"
+        s = r['service_ms']
+        mark = " ⭐" if r is best else ""
+        print(f"{r['concurrency']:>6}{r['throughput_rps']:>14.2f}{r['ideal_rps'] or 0:>10.2f}{eff:>8}"
+              f"{s['p50'] or 0:>10.1f}{s['p90'] or 0:>10.1f}{s['p99'] or 0:>10.1f}"
+              f"{r['attempts_per_task']:>10.2f}{sum(r['errors'].values()):>8}{mark}")
+    print("=" * 50)
+    print(f"⭐ 吞吐最高的并发数: {best['concurrency']} ({best['throughput_rps']:.2f} req/s)")
+
+
+def plot_load_curve(results, plot_path):
+    try:
+        import matplotlib
+        matplotlib.use('Agg')
+        import matplotlib.pyplot as plt
+    except ImportError:
+        print("⚠️ 未安装 matplotlib，跳过绘图")
+        return
+    cs = [r['concurrency'] for r in results]
+    fig, ax1 = plt.subplots(figsize=(7, 4))
+    ax1.plot(cs, [r['throughput_rps'] for r in results], 'o-', label='throughput')
+    ax1.plot(cs, [r['ideal_rps'] for r in results], '--', color='gray', label='ideal (c / mean latency)')
+    ax1.set_xscale('log', base=2)
+    ax1.set_xlabel('concurrency')
+    ax1.set_ylabel('req/s')
+    ax2 = ax1.twinx()
+    ax2.plot(cs, [r['service_ms']['p90'] for r in results], 's-', color='tab:red', label='p90 latency')
+    ax2.set_ylabel('p90 latency (ms)')
+    lines = ax1.get_legend_handles_labels()
+    lines2 = ax2.get_legend_handles_labels()
+    ax1.legend(lines[0] + lines2[0], lines[1] + lines2[1], loc='upper left')
+    fig.tight_layout()
+    Path(plot_path).parent.mkdir(parents=True, exist_ok=True)
+    fig.savefig(plot_path, dpi=150)
+    plt.close(fig)
+    print(f"🖼️ 曲线已保存至: {plot_path}")
+
+
+# ================= 行为校验 =================
+def scenario_resume(work_dir, images):
+    n, done = 40, 15
+    input_file = build_request_jsonl(Path(work_dir) / "resume_in.jsonl", images, n, prefix="resume")
+    output_file = Path(work_dir) / "resume_out.jsonl"
+    output_file.unlink(missing_ok=True)
+    with MockChatServer(latency='fixed', latency_ms=10) as server:
+        run_call_api(input_file, output_file, server.base_url, 8)
+        lines = output_file.read_text(encoding='utf-8').splitlines(keepends=True)
+        output_file.write_text("".join(lines[:done]), encoding='utf-8')    # 模拟中途被打断
+        server.reset_stats()
+        run_call_api(input_file, output_file, server.base_url, 8)
+        requests = server.stats()['requests']
+    out = summarize_output(output_file)
+    ok = requests == n - done and out['rows'] == n and out['unique_ids'] == n
+    return ok, f"续跑请求 {requests} 次 (期望 {n - done})，最终 {out['rows']} 行 / {out['unique_ids']} 个 id"
+
+
+def scenario_retry(work_dir, images):
+    n = 60
+    rates = {'http_503': 0.25, 'http_429': 0.1, 'timeout': 0.05}
+    input_file = build_request_jsonl(Path(work_dir) / "retry_in.jsonl", images, n, prefix="retry")
+    output_file = Path(work_dir) / "retry_out.jsonl"
+    output_file.unlink(missing_ok=True)
+    with MockChatServer(latency='fixed', latency_ms=10, error_rates=rates, hang_s=0.2, seed=1) as server:
+        run_call_api(input_file, output_file, server.base_url, 8)
+        stats = server.stats()
+    out = summarize_output(output_file)
+    only_api_errors = set(out['errors']) <= {'APIError'}
+    ok = out['unique_ids'] == n and stats['requests'] > n and only_api_errors
+    return ok, (f"{n} 个任务共请求 {stats['requests']} 次，重试后仍失败 {out['num_errors']} 条 "
+                f"(期望约 {n * sum(rates.values()) ** 3:.1f})，错误类型 {out['errors']}")
+
+
+def scenario_error_path(work_dir, images):
+    n = 40
+    input_file = build_request_jsonl(Path(work_dir) / "errpath_in.jsonl", images, n, prefix="errpath")
+    output_file = Path(work_dir) / "errpath_out.jsonl"
+    output_file.unlink(missing_ok=True)
+    with MockChatServer(latency='fixed', latency_ms=5, error_rates={'empty_choices': 0.2, 'empty_content': 0.2},
+                        seed=2) as server:
+        run_call_api(input_file, output_file, server.base_url, 8)
+        stats = server.stats()
+    out = summarize_output(output_file)
+    expected = {'ERROR: Empty choices list': stats['outcomes'].get('injected_empty_choices', 0),
+                'ERROR: Empty message content': stats['outcomes'].get('injected_empty_content', 0)}
+    ok = stats['requests'] == n and out['unique_ids'] == n and \
+        all(out['errors'].get(k, 0) == v for k, v in expected.items())
+    return ok, f"请求 {stats['requests']} 次 (不重试)，ERROR 分布 {out['errors']}，服务端注入 {expected}"
+
+
+def scenario_streaming(work_dir, images):
+    from openai import AsyncOpenAI
+
+    text = "Stream me back: {\"defect\": \"scratch\"}"
+
+    async def run(base_url):
+        client = AsyncOpenAI(api_key='EMPTY', base_url=base_url)
+        messages = [{"role": "user", "content": [{"type": "text", "text": text}]}]
+        resp = await client.chat.completions.create(model='mock-model', messages=messages)
+        stream = await client.chat.completions.create(model='mock-model', messages=messages, stream=True,
+                                                      stream_options={"include_usage": True})
+        pieces, usage = [], None
+        async for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                pieces.append(chunk.choices[0].delta.content)
+            if chunk.usage is not None:
+                usage = chunk.usage
+        await client.close()
+        return resp.choices[0].message.content, "".join(pieces), usage
+
+    with MockChatServer(response_mode='echo', latency='fixed', latency_ms=5, tokens_per_s=2000) as server:
+        plain, streamed, usage = asyncio.run(run(server.base_url))
+    ok = plain == text and streamed == text and usage is not None
+    return ok, f"非流式与流式内容一致: {plain == streamed == text}，usage: {usage.completion_tokens if usage else None}"
+
+
+def scenario_early_stop(work_dir, images):
+    from defect_vlm.utils.json_early_stop import find_verdict_end
+
+    n = 24
+    input_file = build_request_jsonl(Path(work_dir) / "early_in.jsonl", images, n, prefix="early")
+    runs = {}
+    with MockChatServer(latency='fixed', latency_ms=5, tokens_per_s=2000, ramble_chars=800) as server:
+        for mode in ('measure', 'on'):
+            output_file = Path(work_dir) / f"early_{mode}.jsonl"
+            output_file.unlink(missing_ok=True)
+            server.reset_stats()
+            wall = run_call_api(input_file, output_file, server.base_url, 8, early_stop=mode)
+            items = [json.loads(line) for line in output_file.read_text(encoding='utf-8').splitlines()]
+            runs[mode] = {"wall": wall, "items": items, "outcomes": server.stats()['outcomes']}
+    measured = runs['measure']['items']
+    stopped = runs['on']['items']
+    tail = sum(it['early_stop']['tail_tokens'] for it in measured)
+    gen_measure = sum(it['early_stop']['generated_tokens'] for it in measured)
+    gen_on = sum(it['early_stop']['generated_tokens'] for it in stopped)
+    verdict_ok = all(find_verdict_end(it['conversation'][1]['value']) == len(it['conversation'][1]['value'])
+                     for it in stopped)
+    ok = len(stopped) == n and tail > 0 and all(it['early_stop']['stopped'] for it in stopped) and verdict_ok
+    return ok, (f"measure: 结论后多余 {tail / n:.1f} token/条 (共生成 {gen_measure})；"
+                f"on: 提前停止 {sum(it['early_stop']['stopped'] for it in stopped)}/{n} 条，共生成 {gen_on}，"
+                f"耗时 {runs['measure']['wall']:.2f}s -> {runs['on']['wall']:.2f}s，服务端 {runs['on']['outcomes']}")
+
+
+SCENARIOS = {
+    'resume': scenario_resume,
+    'retry': scenario_retry,
+    'error_path': scenario_error_path,
+    'streaming': scenario_streaming,
+    'early_stop': scenario_early_stop,
+}
+
+
+def run_scenarios(work_dir, images, names=None):
+    print("\n" + "=" * 50)
+    print("🧪 call_api 行为校验 (mock 服务)")
+    print("=" * 50)
+    passed = {}
+    for name in names or SCENARIOS:
+        start = time.perf_counter()
+        try:
+            ok, detail = SCENARIOS[name](work_dir, images)
+        except Exception as e:
+            ok, detail = False, f"异常: {e!r}"
+        passed[name] = ok
+        print(f"{'✅' if ok else '❌'} [{name}] {detail} ({time.perf_counter() - start:.1f}s)")
+    print("=" * 50)
+    print(f"通过 {sum(passed.values())} / {len(passed)}")
+    return passed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="call_api.py 并发压测 / 行为校验 (本地 mock 服务)")
+    parser.add_argument('--concurrency', type=int, nargs='*', default=DEFAULT_CONCURRENCY, help='依次测试的并发数')
+    parser.add_argument('--num_requests', type=int, default=256, help='每个并发档位的请求数')
+    parser.add_argument('--num_images', type=int, default=8, help='合成图像数量 (请求中循环使用)')
+    parser.add_argument('--work_dir', type=str, default=None, help='临时文件目录，默认使用系统临时目录')
+    parser.add_argument('--report', type=str, default=None, help='压测结果 JSON 输出路径')
+    parser.add_argument('--plot', type=str, default=None, help='吞吐 / 延迟曲线图输出路径')
+    parser.add_argument('--scenarios', nargs='*', default=None, help=f'只做行为校验，可选 {list(SCENARIOS)}，不写则全部')
+    parser.add_argument('--early_stop', type=str, default='off', help='压测时 call_api 的 --early_stop 模式')
+    add_mock_server_args(parser)
+    parser.set_defaults(latency_ms=200.0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        work_dir = Path(args.work_dir or tmp)
+        work_dir.mkdir(parents=True, exist_ok=True)
+        with contextlib.redirect_stdout(io.StringIO()):
+            images = prepare_images(work_dir, args.num_images)
+
+        if args.scenarios is not None:
+            passed = run_scenarios(work_dir, images, args.scenarios or None)
+            raise SystemExit(0 if all(passed.values()) else 1)
+
+        server_kwargs = server_kwargs_from_args(args)
+        input_file = build_request_jsonl(work_dir / "load_in.jsonl", images, args.num_requests)
+        print(f"🚀 压测 call_api.process_batch_task: {args.num_requests} 个请求 x {len(args.concurrency)} 个并发档位")
+        with MockChatServer(**server_kwargs) as server:
+            results = load_test(server, input_file, work_dir, args.concurrency, args.num_requests, args.early_stop)
+        print_load_report(results, server_kwargs)
+
+        if args.report:
+            Path(args.report).parent.mkdir(parents=True, exist_ok=True)
+            with open(args.report, 'w', encoding='utf-8') as f:
+                json.dump({"mock": {k: v for k, v in server_kwargs.items() if k != 'canned'},
+                           "num_requests": args.num_requests, "results": results}, f, ensure_ascii=False, indent=2)
+            print(f"📄 压测结果已保存至: {args.report}")
+        if args.plot:
+            plot_load_curve(results, args.plot)
+
+
+if __name__ == "__main__":
+    main()
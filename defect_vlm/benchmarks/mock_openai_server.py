@@ -0,0 +1,526 @@
+"""
+本地 OpenAI 兼容的 Chat Completions 模拟服务
+调 call_api.py 的并发、重试、断点续跑都要真的花钱请求厂商 API，这里用标准库起一个本地替身：
+    POST /v1/chat/completions : 支持普通返回和 stream=True 的 SSE 流式返回 (含 stream_options.include_usage)
+    GET  /v1/models           : 模型列表
+    GET  /stats               : 请求计数、各类结果、最大并发、服务耗时分位数
+    POST /stats/reset         : 清空统计
+可配置项：
+    延迟分布   : fixed / uniform / lognormal / exp (首 token 延迟)，tokens_per_s 控制生成速度
+    限流       : rpm (滑动 60s 窗口)、max_concurrency (同时处理的请求上限)，超出返回 429 + retry-after-ms
+    错误注入   : http_500 / http_503 / http_429 / timeout (挂起后断开连接) / empty_choices / empty_content / truncated
+    回复内容   : echo (回显用户文本) / canned (轮流返回给定回复，可直接用历史 API 结果 jsonl) / teacher (格式合格的教师回复)
+                 ramble_chars 在 teacher 回复的 JSON 之后追加多余文字，模拟模型“说完还不停”
+只依赖标准库，可在测试或压测脚本中用 with MockChatServer(...) as server 启动在后台线程，也可命令行独立运行。
+"""
+import argparse
+import json
+import math
+import random
+import threading
+import time
+import uuid
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from defect_vlm.benchmarks.synthetic import DEFECT_CLASSES
+
+LATENCY_DISTS = ('fixed', 'uniform', 'lognormal', 'exp')
+ERROR_KINDS = ('http_500', 'http_503', 'http_429', 'timeout', 'empty_choices', 'empty_content', 'truncated')
+RESPONSE_MODES = ('echo', 'canned', 'teacher')
+IMAGE_TOKENS = 256          # 估算 usage 时每张图按固定 token 数计
+CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(text):
+    return max(1, math.ceil(len(text) / CHARS_PER_TOKEN)) if text else 0
+
+
+def split_stream_pieces(text):
+    """按 CHARS_PER_TOKEN 切成流式返回的小段，模拟逐 token 输出"""
+    return [text[i:i + CHARS_PER_TOKEN] for i in range(0, len(text), CHARS_PER_TOKEN)]
+
+
+RAMBLE_TEXT = ("Note: the conclusion above is based on the stripe deformation and brightness pattern. "
+               "Other interpretations are possible if the lighting differs. ")
+
+
+def ramble(n_chars):
+    """模拟模型在 JSON 之后的多余输出"""
+    if n_chars <= 0:
+        return ""
+    text = RAMBLE_TEXT * (n_chars // len(RAMBLE_TEXT) + 1)
+    return "\n\n" + text[:n_chars]
+
+
+def teacher_answer(rng):
+    """
+    合格的教师回复 (与 prompt_text_tea.txt 要求的输出格式一致)
+    不复用 synthetic._teacher_response_text：那里故意混入了 ERROR / 非法 JSON，
+    这里的失败只由错误注入控制，压测统计的 ERROR 才不会混入内容层面的“假错误”
+    """
+    defect = rng.choice(DEFECT_CLASSES)
+    body = {"step1": "the stripe is bent inside the bbox", "step2": "local brightness change in the global view",
+            "step3": f"the reflection pattern is consistent with {defect}", "defect": defect}
+    return "Here is my answer:\n" + json.dumps(body, ensure_ascii=False, indent=2)
+
+
+def load_canned_responses(path):
+    """
+    读取 canned 回复：每行一个 JSON，优先取 conversation[1].value (call_api 的输出格式)，
+    其次取 content / pred 字段，纯字符串行直接使用
+    """
+    responses = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            if isinstance(item, str):
+                responses.append(item)
+            elif 'conversation' in item:
+                responses.append(item['conversation'][1]['value'])
+            else:
+                responses.append(item.get('content') or item.get('pred') or "")
+    return responses
+
+
+def _error_body(message, err_type, code):
+    return {"error": {"message": message, "type": err_type, "param": None, "code": code}}
+
+
+class _MockState:
+    """服务端共享状态：配置、随机数、限流窗口与统计 (所有读写都在 lock 内)"""
+
+    def __init__(self, response_mode, canned, latency, latency_ms, latency_sigma, tokens_per_s,
+                 rpm, max_concurrency, error_rates, hang_s, seed, ramble_chars=0):
+        if response_mode not in RESPONSE_MODES:
+            raise ValueError(f"不支持的回复模式: {response_mode}，可选 {RESPONSE_MODES}")
+        if latency not in LATENCY_DISTS:
+            raise ValueError(f"不支持的延迟分布: {latency}，可选 {LATENCY_DISTS}")
+        if response_mode == 'canned' and not canned:
+            raise ValueError("canned 模式需要提供回复列表")
+        error_rates = dict(error_rates or {})
+        unknown = set(error_rates) - set(ERROR_KINDS)
+        if unknown:
+            raise ValueError(f"未知的错误类型: {sorted(unknown)}，可选 {ERROR_KINDS}")
+        if sum(error_rates.values()) > 1:
+            raise ValueError("错误注入概率之和不能超过 1")
+
+        self.response_mode = response_mode
+        self.canned = list(canned or [])
+        self.latency = latency
+        self.latency_ms = latency_ms
+        self.latency_sigma = latency_sigma
+        self.tokens_per_s = tokens_per_s
+        self.rpm = rpm
+        self.max_concurrency = max_concurrency
+        self.error_rates = error_rates
+        self.hang_s = hang_s
+        self.ramble_chars = ramble_chars
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self._canned_idx = 0
+        self._window = deque()
+        self.in_flight = 0          # 不随 reset_stats 清零，避免重置时仍在处理的请求把计数减成负数
+        self.reset_stats()
+
+    def reset_stats(self):
+        with self.lock:
+            self.requests = 0
+            self.outcomes = {}
+            self.max_in_flight = self.in_flight
+            self.service_s = []
+            self.prompt_tokens = 0
+            self.completion_tokens = 0
+            self.first_ts = None
+            self.last_ts = None
+
+    def _record(self, outcome):
+        self.outcomes[outcome] = self.outcomes.get(outcome, 0) + 1
+
+    def admit(self):
+        """
+        请求到达时调用：先做限流检查，通过后抽取注入的错误类型
+        :return: (outcome, error_kind)；outcome 不为 None 时直接以 429 拒绝
+        """
+        now = time.monotonic()
+        with self.lock:
+            self.requests += 1
+            self.first_ts = self.first_ts or now
+            self.last_ts = now
+            if self.max_concurrency and self.in_flight >= self.max_concurrency:
+                self._record('rejected_concurrency')
+                return 'rejected_concurrency', None
+            if self.rpm:
+                while self._window and now - self._window[0] >= 60.0:
+                    self._window.popleft()
+                if len(self._window) >= self.rpm:
+                    self._record('rejected_rpm')
+                    return 'rejected_rpm', None
+                self._window.append(now)
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+
+            r, acc = self.rng.random(), 0.0
+            for kind, p in self.error_rates.items():
+                acc += p
+                if r < acc:
+                    return None, kind
+            return None, None
+
+    def release(self, outcome, service_s=None, prompt_tokens=0, completion_tokens=0):
+        with self.lock:
+            self.in_flight -= 1
+            self._record(outcome)
+            self.last_ts = time.monotonic()
+            if service_s is not None:
+                self.service_s.append(service_s)
+            self.prompt_tokens += prompt_tokens
+            self.completion_tokens += completion_tokens
+
+    def sample_ttft(self):
+        """首 token 延迟 (秒)，latency_ms 在 lognormal 下为中位数，在 exp 下为均值"""
+        with self.lock:
+            if self.latency == 'fixed':
+                ms = self.latency_ms
+            elif self.latency == 'uniform':
+                ms = self.rng.uniform(self.latency_ms * (1 - self.latency_sigma), self.latency_ms * (1 + self.latency_sigma))
+            elif self.latency == 'lognormal':
+                ms = self.latency_ms * math.exp(self.rng.gauss(0.0, self.latency_sigma))
+            else:
+                ms = self.rng.expovariate(1.0 / self.latency_ms) if self.latency_ms > 0 else 0.0
+        return max(ms, 0.0) / 1000.0
+
+    def token_delay(self):
+        return 1.0 / self.tokens_per_s if self.tokens_per_s else 0.0
+
+    def make_content(self, messages):
+        if self.response_mode == 'echo':
+            return _last_user_text(messages)
+        with self.lock:
+            if self.response_mode == 'canned':
+                content = self.canned[self._canned_idx % len(self.canned)]
+                self._canned_idx += 1
+                return content
+            return teacher_answer(self.rng) + ramble(self.ramble_chars)
+
+    def snapshot(self):
+        with self.lock:
+            s = sorted(self.service_s)
+            span_s = (self.last_ts - self.first_ts) if self.first_ts else 0.0
+
+            def q(p):
+                return round(s[min(len(s) - 1, int(p * len(s)))] * 1000, 2) if s else None
+
+            return {
+                "requests": self.requests,
+                "outcomes": dict(self.outcomes),
+                "in_flight": self.in_flight,
+                "max_in_flight": self.max_in_flight,
+                "service_ms": {"count": len(s), "mean": round(sum(s) / len(s) * 1000, 2) if s else None,
+                               "p50": q(0.5), "p90": q(0.9), "p99": q(0.99)},
+                "prompt_tokens": self.prompt_tokens,
+                "completion_tokens": self.completion_tokens,
+                "active_span_s": round(span_s, 3),
+            }
+
+
+def _message_parts(messages):
+    """拆出所有文本和图片数量 (content 可以是字符串，也可以是 OpenAI 多模态的 list 格式)"""
+    texts, images = [], 0
+    for msg in messages:
+        content = msg.get('content')
+        if isinstance(content, str):
+            texts.append(content)
+        elif isinstance(content, list):
+            for part in content:
+                if part.get('type') == 'text':
+                    texts.append(part.get('text', ''))
+                elif part.get('type') == 'image_url':
+                    images += 1
+    return texts, images
+
+
+def _last_user_text(messages):
+    for msg in reversed(messages):
+        if msg.get('role') == 'user':
+            texts, _ = _message_parts([msg])
+            return "".join(texts)
+    return ""
+
+
+class _MockHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'       # keep-alive，与真实服务一样复用连接
+
+    def log_message(self, format, *args):
+        pass    # 压测时每个请求打印一行会拖慢服务
+
+    # ---------- 基础响应 ----------
+    def _send_json(self, status, body, headers=None):
+        data = json.dumps(body, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_chunk(self, data):
+        self.wfile.write(f"{len(data):X}\r\n".encode('ascii') + data + b"\r\n")
+        self.wfile.flush()
+
+    def _read_body(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    # ---------- 路由 ----------
+    def do_GET(self):
+        state = self.server.state
+        if self.path.rstrip('/').endswith('/models'):
+            self._send_json(200, {"object": "list", "data": [
+                {"id": "mock-model", "object": "model", "created": 0, "owned_by": "mock"}]})
+        elif self.path.rstrip('/') == '/stats':
+            self._send_json(200, state.snapshot())
+        elif self.path.rstrip('/') == '/health':
+            self._send_json(200, {"status": "ok"})
+        else:
+            self._send_json(404, _error_body(f"未知路径: {self.path}", "invalid_request_error", "not_found"))
+
+    def do_POST(self):
+        state = self.server.state
+        if self.path.rstrip('/') == '/stats/reset':
+            self._read_body()
+            state.reset_stats()
+            self._send_json(200, {"status": "reset"})
+            return
+        if not self.path.rstrip('/').endswith('/chat/completions'):
+            self._read_body()
+            self._send_json(404, _error_body(f"未知路径: {self.path}", "invalid_request_error", "not_found"))
+            return
+        try:
+            body = self._read_body()
+        except json.JSONDecodeError as e:
+            self._send_json(400, _error_body(f"请求体不是合法 JSON: {e}", "invalid_request_error", "bad_json"))
+            return
+        self._chat_completions(state, body)
+
+    # ---------- Chat Completions ----------
+    def _chat_completions(self, state, body):
+        start = time.perf_counter()
+        rejected, kind = state.admit()
+        if rejected:
+            msg = "Rate limit reached (rpm)" if rejected == 'rejected_rpm' else "Too many concurrent requests"
+            self._send_json(429, _error_body(msg, "rate_limit_error", "rate_limit_exceeded"),
+                            headers={'retry-after-ms': '50'})
+            return
+
+        outcome = 'server_exception'     # 正常返回前被异常打断时记为此类
+        try:
+            if kind in ('http_429', 'http_503'):
+                status = 429 if kind == 'http_429' else 503
+                self._send_json(status, _error_body(f"injected {kind}", "server_error", kind),
+                                headers={'retry-after-ms': '50'})
+                outcome = f'injected_{kind}'
+                return
+            if kind == 'timeout':
+                time.sleep(state.hang_s)
+                self.close_connection = True    # 挂起后直接断开，不返回任何响应
+                outcome = 'injected_timeout'
+                return
+
+            messages = body.get('messages') or []
+            texts, images = _message_parts(messages)
+            prompt_tokens = sum(estimate_tokens(t) for t in texts) + images * IMAGE_TOKENS
+            content = state.make_content(messages)
+            finish_reason = 'stop'
+            if kind == 'truncated':
+                content, finish_reason = content[: len(content) // 2], 'length'
+            elif kind == 'empty_content':
+                content = ""
+            completion_tokens = estimate_tokens(content)
+
+            time.sleep(state.sample_ttft())
+            if kind == 'http_500':
+                self._send_json(500, _error_body("injected http_500", "server_error", "http_500"))
+                outcome = 'injected_http_500'
+                return
+
+            model = body.get('model', 'mock-model')
+            usage = {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                     "total_tokens": prompt_tokens + completion_tokens}
+            if body.get('stream'):
+                include_usage = bool((body.get('stream_options') or {}).get('include_usage'))
+                self._stream(state, model, content, finish_reason, usage if include_usage else None,
+                             empty_choices=(kind == 'empty_choices'))
+            else:
+                time.sleep(state.token_delay() * completion_tokens)
+                choices = [] if kind == 'empty_choices' else [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": content},
+                    "finish_reason": finish_reason,
+                    "logprobs": None,
+                }]
+                self._send_json(200, {
+                    "id": f"chatcmpl-{uuid.uuid4().hex[:24]}", "object": "chat.completion",
+                    "created": int(time.time()), "model": model, "choices": choices, "usage": usage,
+                })
+            outcome = f'injected_{kind}' if kind else 'ok'
+            state.release(outcome, time.perf_counter() - start, prompt_tokens, completion_tokens)
+            outcome = None
+        except (BrokenPipeError, ConnectionResetError):
+            outcome = 'client_disconnected'
+        finally:
+            if outcome is not None:
+                state.release(outcome)
+
+    def _stream(self, state, model, content, finish_reason, usage, empty_choices=False):
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+
+        chunk_id = f"chatcmpl-{uuid.uuid4().hex[:24]}"
+        created = int(time.time())
+
+        def event(delta, finish=None, usage_obj=None, choices=True):
+            payload = {"id": chunk_id, "object": "chat.completion.chunk", "created": created, "model": model,
+                       "choices": [{"index": 0, "delta": delta, "finish_reason": finish, "logprobs": None}] if choices else []}
+            if usage_obj is not None:
+                payload["usage"] = usage_obj
+            self._send_chunk(f"data: {json.dumps(payload, ensure_ascii=False)}\n\n".encode('utf-8'))
+
+        if not empty_choices:
+            event({"role": "assistant", "content": ""})
+            delay = state.token_delay()
+            for piece in split_stream_pieces(content):
+                if delay:
+                    time.sleep(delay)
+                event({"content": piece})
+            event({}, finish=finish_reason)
+        if usage is not None:
+            event(None, usage_obj=usage, choices=False)
+        self._send_chunk(b"data: [DONE]\n\n")
+        self._send_chunk(b"")       # chunked 编码的结束块
+
+
+class _MockHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+    request_queue_size = 1024       # 高并发压测时避免 listen 队列溢出
+
+
+class MockChatServer:
+    """
+    用法：
+        with MockChatServer(latency_ms=500, rpm=600, error_rates={'http_503': 0.05}) as server:
+            client = AsyncOpenAI(api_key="EMPTY", base_url=server.base_url)
+            ...
+            print(server.stats())
+    """
+
+    def __init__(self, host='127.0.0.1', port=0, response_mode='teacher', canned=None,
+                 latency='lognormal', latency_ms=800.0, latency_sigma=0.5, tokens_per_s=None,
+                 rpm=None, max_concurrency=None, error_rates=None, hang_s=5.0, seed=0, ramble_chars=0):
+        self.state = _MockState(response_mode, canned, latency, latency_ms, latency_sigma, tokens_per_s,
+                                rpm, max_concurrency, error_rates, hang_s, seed, ramble_chars)
+        self.httpd = _MockHTTPServer((host, port), _MockHandler)
+        self.httpd.state = self.state
+        self.host, self.port = self.httpd.server_address[:2]
+        self._thread = None
+
+    @property
+    def base_url(self):
+        return f"http://{self.host}:{self.port}/v1"
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name="mock-openai", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def stats(self):
+        return self.state.snapshot()
+
+    def reset_stats(self):
+        self.state.reset_stats()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def parse_error_rates(items):
+    """['http_503=0.05', 'timeout=0.01'] -> {'http_503': 0.05, 'timeout': 0.01}"""
+    rates = {}
+    for item in items or []:
+        kind, _, p = item.partition('=')
+        rates[kind] = float(p)
+    return rates
+
+
+def add_mock_server_args(parser):
+    """mock 服务的命令行参数，命令行启动和压测脚本共用"""
+    parser.add_argument('--response_mode', choices=RESPONSE_MODES, default='teacher', help='回复内容')
+    parser.add_argument('--canned', type=str, default=None, help='canned 模式的回复 jsonl (可直接使用 call_api 的输出文件)')
+    parser.add_argument('--latency', choices=LATENCY_DISTS, default='lognormal', help='首 token 延迟分布')
+    parser.add_argument('--latency_ms', type=float, default=800.0, help='延迟中位数 (lognormal) / 均值 (exp) / 固定值')
+    parser.add_argument('--latency_sigma', type=float, default=0.5, help='lognormal 的 sigma，uniform 的相对半宽')
+    parser.add_argument('--tokens_per_s', type=float, default=None, help='生成速度，不设置时回复瞬间返回')
+    parser.add_argument('--rpm', type=int, default=None, help='每分钟请求上限')
+    parser.add_argument('--max_concurrency', type=int, default=None, help='服务端同时处理的请求上限')
+    parser.add_argument('--error', nargs='*', default=[], help=f'错误注入，例如 http_503=0.05 timeout=0.01，可选 {ERROR_KINDS}')
+    parser.add_argument('--hang_s', type=float, default=5.0, help='timeout 错误挂起的秒数')
+    parser.add_argument('--ramble_chars', type=int, default=0, help='teacher 模式下 JSON 之后追加的多余文字长度')
+    parser.add_argument('--seed', type=int, default=0)
+    return parser
+
+
+def server_kwargs_from_args(args):
+    return {
+        'response_mode': args.response_mode,
+        'canned': load_canned_responses(args.canned) if args.canned else None,
+        'latency': args.latency, 'latency_ms': args.latency_ms, 'latency_sigma': args.latency_sigma,
+        'tokens_per_s': args.tokens_per_s, 'rpm': args.rpm, 'max_concurrency': args.max_concurrency,
+        'error_rates': parse_error_rates(args.error), 'hang_s': args.hang_s, 'seed': args.seed,
+        'ramble_chars': args.ramble_chars,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本地 OpenAI 兼容 Chat Completions 模拟服务")
+    parser.add_argument('--host', type=str, default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8008)
+    add_mock_server_args(parser)
+    args = parser.parse_args()
+
+    server = MockChatServer(host=args.host, port=args.port, **server_kwargs_from_args(args))
+    print("=" * 50)
+    print(f"🧪 Mock OpenAI 服务已启动: {server.base_url}")
+    print(f"   回复模式: {args.response_mode}, 延迟: {args.latency} {args.latency_ms}ms, rpm: {args.rpm}, "
+          f"并发上限: {args.max_concurrency}")
+    if args.error:
+        print(f"   错误注入: {parse_error_rates(args.error)}")
+    print(f"   call_api.py 使用: --base_url {server.base_url} --api_key EMPTY")
+    print("=" * 50)
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        print("\n🛑 已停止")
+        print(json.dumps(server.stats(), ensure_ascii=False, indent=2))
+    finally:
+        server.httpd.server_close()
+
+
+if __name__ == "__main__":
+    main()
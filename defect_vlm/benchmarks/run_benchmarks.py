@@ -0,0 +1,345 @@
+"""
+逐阶段基准测试
+在合成数据上依次计时流水线的各个阶段 (直接调用仓库里的真实函数，而不是复刻一份)：
+    fusion_nwd        : NWD 共识融合 (utils/nwd_fusion.py)
+    fusion_scale_aware: 尺度感知 WBF + Soft-NMS 融合 (cascade/decision_fusion.py，需要 ensemble_boxes)
+    crop              : 按预测框裁剪四光源局部图 (cascade/crop_yolo_preds_bbox.py)
+    composite         : 2x2 拼图 (cascade/composite_images_from_yolo_preds.py)
+    build_message     : 构建 swift 推理 Message (cascade/build_vlm_message.py)
+    parse_vlm         : 解析 VLM pred 文本 (utils/vlm_response_parser.py 的 parse_vlm_prediction)
+    parse_api_teacher : 教师 API 回复合规校验 (pe/split_api_reponse_tea.py 的 check_ai_response)
+    extract_vlm       : VLM 结果字段提取 (flywheel/extract_vlm_data.py)
+    metric_pr_curve   : 全局 P-R 曲线构建 (cascade/pr_curve_engine.py)
+    metric_cascade    : 实验一/二/三单遍联合分析 (cascade/exp_cascade_onepass.py)
+    metric_ultralytics: mAP / 混淆矩阵 (cascade/compute_fusion_metric.py，需要 ultralytics)
+    pseudo_label      : 双阈值伪标签精炼 (flywheel/refine_pseudo_labels.py)
+
+每个阶段重复若干次取中位数，被测函数的打印输出会被屏蔽。缺少可选依赖的阶段记为 skipped，不影响其它阶段。
+报告为 JSON (环境信息 + 每个阶段的耗时、吞吐)；指定 --baseline 时与历史报告对比，超出容差的阶段标记为回归。
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+from defect_vlm.benchmarks.synthetic import SCALE_PRESETS, generate_synthetic_dataset
+
+REPORT_VERSION = 1
+PROMPT_JSON = Path(__file__).resolve().parents[1] / "pe" / "prompts.json"
+
+FUSION_CONFIG = {
+    'IMG_W': 300.0, 'IMG_H': 300.0, 'SIGMA_SOFT': 0.05, 'SKIP_BOX_THR': 0.15, 'AREA_TH': 0.0004,
+    'IOU_THR_WBF': 0.45, 'IOU_THR_SOFT': 0.45,
+    'SMALL_FUSION': 'WBF', 'NWD_THR': 0.8, 'NWD_C': 50.0, 'NWD_ASSIGN': 'greedy',
+}
+
+
+def _load_json(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def _count_lines(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return sum(1 for line in f if line.strip())
+
+
+# ================= 各阶段 =================
+# 每个阶段函数签名为 fn(ctx, work_dir) -> 处理的条目数，ctx 为 generate_synthetic_dataset 的返回值
+
+def stage_fusion_nwd(ctx, work_dir):
+    from defect_vlm.utils.nwd_fusion import nwd_consensus_fusion
+    preds_a = _load_json(ctx['paths']['preds_col3'])
+    preds_b = _load_json(ctx['paths']['preds_row3'])
+    n = 0
+    for name in set(preds_a) | set(preds_b):
+        a, b = preds_a.get(name, []), preds_b.get(name, [])
+        nwd_consensus_fusion(a, b, nwd_thr=FUSION_CONFIG['NWD_THR'], C=FUSION_CONFIG['NWD_C'])
+        n += len(a) + len(b)
+    return n
+
+
+def stage_fusion_scale_aware(ctx, work_dir):
+    from defect_vlm.cascade.decision_fusion import process_scale_aware_fusion
+    process_scale_aware_fusion(ctx['paths']['preds_col3'], ctx['paths']['preds_row3'],
+                               str(work_dir / "decision_fusion.json"), dict(FUSION_CONFIG))
+    return ctx['counts']['preds_col3'] + ctx['counts']['preds_row3']
+
+
+def stage_crop(ctx, work_dir):
+    from defect_vlm.cascade.crop_yolo_preds_bbox import main as crop_main
+    out_json = work_dir / "crop.json"
+    crop_main(ctx['paths']['fusion_json'], ctx['paths']['rgb_root'], work_dir / "crops", out_json, ctx['paths']['data_root'])
+    return len(_load_json(out_json))
+
+
+def stage_composite(ctx, work_dir):
+    from defect_vlm.cascade.composite_images_from_yolo_preds import process_composite_inference
+    # 拼图的输入是裁剪阶段的输出，这里先在计时外准备好 (见 run_stage 的 setup)
+    out_json = work_dir / "composite.json"
+    process_composite_inference(str(work_dir / "crop.json"), str(ctx['paths']['data_root']),
+                                str(work_dir / "composite_images"), str(out_json))
+    return len(_load_json(out_json))
+
+
+def setup_composite(ctx, work_dir):
+    stage_crop(ctx, work_dir)
+
+
+def stage_build_message(ctx, work_dir):
+    from defect_vlm.cascade.build_vlm_message import main as build_main
+    out_jsonl = work_dir / "message.jsonl"
+    build_main(Path(ctx['paths']['data_root']), Path(ctx['paths']['composite_json']), out_jsonl, PROMPT_JSON, 3)
+    return _count_lines(out_jsonl)
+
+
+def stage_parse_vlm(ctx, work_dir):
+    from defect_vlm.utils.vlm_response_parser import parse_vlm_prediction
+    n = 0
+    with open(ctx['paths']['vlm_jsonl'], 'r', encoding='utf-8') as f:
+        for line in f:
+            if not line.strip(): continue
+            parse_vlm_prediction(json.loads(line).get("pred", ""))
+            n += 1
+    return n
+
+
+def stage_parse_api_teacher(ctx, work_dir):
+    from defect_vlm.pe.split_api_reponse_tea import check_ai_response
+    # check_ai_response 会原地修改 item，这里每次都从原始行重新解析
+    n = 0
+    with open(ctx['paths']['api_tea_jsonl'], 'r', encoding='utf-8') as f:
+        for line in f:
+            if not line.strip(): continue
+            check_ai_response(json.loads(line))
+            n += 1
+    return n
+
+
+def stage_extract_vlm(ctx, work_dir):
+    from defect_vlm.flywheel.extract_vlm_data import extract_vlm_core_data
+    extract_vlm_core_data(ctx['paths']['vlm_jsonl'], work_dir / "extracted")
+    return ctx['counts']['proposals']
+
+
+def stage_metric_pr_curve(ctx, work_dir):
+    from defect_vlm.cascade.pr_curve_engine import build_or_load_curve
+    cache_path = work_dir / "pr_curve.npz"
+    if cache_path.exists():
+        cache_path.unlink()
+    build_or_load_curve(ctx['paths']['preds_col3'], ctx['paths']['gt_json'], cache_path)
+    return ctx['counts']['preds_col3']
+
+
+def stage_metric_cascade(ctx, work_dir):
+    from defect_vlm.cascade.exp_cascade_onepass import main as onepass_main
+    onepass_main(ctx['paths']['gt_json'], ctx['paths']['composite_json'], ctx['paths']['vlm_jsonl'],
+                 work_dir / "exp_onepass", cascade_thresholds=[0.1, 0.2, 0.3])
+    return ctx['counts']['proposals']
+
+
+def stage_metric_ultralytics(ctx, work_dir):
+    from defect_vlm.cascade.compute_fusion_metric import evaluate_fusion_results
+    evaluate_fusion_results(ctx['paths']['preds_col3'], ctx['paths']['gt_json'], str(work_dir / "fusion_metric"))
+    return ctx['counts']['preds_col3']
+
+
+def stage_pseudo_label(ctx, work_dir):
+    from defect_vlm.flywheel.refine_pseudo_labels import generate_refined_pseudo_labels
+    from defect_vlm.benchmarks.synthetic import DEFECT_CLASSES
+    generate_refined_pseudo_labels(
+        input_jsonl=ctx['paths']['vlm_extracted_jsonl'],
+        output_jsonl=work_dir / "pseudo" / "refined.jsonl",
+        th_l=0.1, th_h=0.83, alpha=1.0, eta=0.5,
+        class_weights={c: 1 for c in DEFECT_CLASSES}, class_method='none', class_args='none'
+    )
+    return ctx['counts']['proposals']
+
+
+# (阶段名, 函数, 计时前的准备函数, 是否需要渲染图像)
+STAGES = [
+    ("fusion_nwd", stage_fusion_nwd, None, False),
+    ("fusion_scale_aware", stage_fusion_scale_aware, None, False),
+    ("crop", stage_crop, None, True),
+    ("composite", stage_composite, setup_composite, True),
+    ("build_message", stage_build_message, None, False),
+    ("parse_vlm", stage_parse_vlm, None, False),
+    ("parse_api_teacher", stage_parse_api_teacher, None, False),
+    ("extract_vlm", stage_extract_vlm, None, False),
+    ("metric_pr_curve", stage_metric_pr_curve, None, False),
+    ("metric_cascade", stage_metric_cascade, None, False),
+    ("metric_ultralytics", stage_metric_ultralytics, None, False),
+    ("pseudo_label", stage_pseudo_label, None, False),
+]
+
+
+# ================= 计时 =================
+def run_stage(name, fn, setup, ctx, work_dir, repeat=3, verbose=False):
+    """运行单个阶段 repeat 次，返回该阶段的报告字典"""
+    stage_dir = Path(work_dir) / name
+    stage_dir.mkdir(parents=True, exist_ok=True)
+    sink = io.StringIO()
+    times, items = [], 0
+    try:
+        with contextlib.ExitStack() as stack:
+            if not verbose:
+                stack.enter_context(contextlib.redirect_stdout(sink))
+                stack.enter_context(contextlib.redirect_stderr(sink))
+            if setup is not None:
+                setup(ctx, stage_dir)
+            for _ in range(repeat):
+                start = time.perf_counter()
+                items = fn(ctx, stage_dir)
+                times.append(time.perf_counter() - start)
+    except ImportError as e:
+        return {"status": "skipped", "reason": f"缺少依赖: {e}"}
+    except Exception as e:
+        return {"status": "error", "reason": f"{type(e).__name__}: {e}"}
+
+    median = statistics.median(times)
+    return {
+        "status": "ok",
+        "items": int(items),
+        "repeat": repeat,
+        "median_s": median,
+        "min_s": min(times),
+        "max_s": max(times),
+        "items_per_s": items / median if median > 0 else None,
+    }
+
+
+def collect_environment():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                cwd=Path(__file__).resolve().parent, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "numpy": np.__version__,
+        "git_commit": commit,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+
+
+def compare_with_baseline(report, baseline, tolerance=0.2):
+    """对比两份报告中状态均为 ok 的阶段，中位耗时超过 baseline * (1 + tolerance) 记为回归"""
+    rows = []
+    for name, cur in report["stages"].items():
+        old = baseline.get("stages", {}).get(name)
+        if cur.get("status") != "ok" or not old or old.get("status") != "ok":
+            continue
+        ratio = cur["median_s"] / old["median_s"] if old["median_s"] > 0 else float('inf')
+        rows.append({"stage": name, "baseline_s": old["median_s"], "current_s": cur["median_s"],
+                     "ratio": ratio, "regression": ratio > 1 + tolerance})
+    return rows
+
+
+def print_report(report, comparison=None):
+    print("=" * 78)
+    print(f"⏱️ 基准测试报告 (规模={report['config']['scale']}, 图像={report['dataset']['counts']['images']}, "
+          f"重复={report['config']['repeat']})")
+    print("=" * 78)
+    print(f"{'阶段':<22}{'状态':<9}{'条目':>8}{'中位耗时(s)':>14}{'吞吐(条/s)':>14}")
+    print("-" * 78)
+    for name, s in report["stages"].items():
+        if s["status"] == "ok":
+            ips = f"{s['items_per_s']:.1f}" if s['items_per_s'] else "-"
+            print(f"{name:<22}{'✅ ok':<9}{s['items']:>8}{s['median_s']:>14.4f}{ips:>14}")
+        else:
+            icon = "⏭️ " if s["status"] == "skipped" else "❌ "
+            print(f"{name:<22}{icon + s['status']:<9}  {s['reason'][:60]}")
+    if comparison:
+        print("-" * 78)
+        print("📈 与基线对比:")
+        for row in comparison:
+            flag = "🔴 回归" if row["regression"] else "🟢"
+            print(f"  {row['stage']:<22}{row['baseline_s']:>10.4f}s -> {row['current_s']:>10.4f}s  x{row['ratio']:.2f}  {flag}")
+    print("=" * 78)
+
+
+def run_benchmarks(output_json, scale='small', seed=0, repeat=3, stages=None, work_dir=None,
+                   baseline=None, tolerance=0.2, keep_data=False, verbose=False):
+    """
+    生成合成数据并运行全部 (或指定) 阶段
+    :param stages: 只运行这些阶段，None 表示全部
+    :param work_dir: 合成数据与中间产物目录，默认使用临时目录 (keep_data=False 时结束后删除)
+    :param baseline: 历史报告路径，用于回归对比
+    """
+    selected = [s for s in STAGES if stages is None or s[0] in stages]
+    need_images = any(s[3] for s in selected)
+
+    tmp_root = None
+    if work_dir is None:
+        tmp_root = tempfile.mkdtemp(prefix="defect_vlm_bench_")
+        work_dir = tmp_root
+    work_dir = Path(work_dir)
+    try:
+        ctx = generate_synthetic_dataset(work_dir / "data", seed=seed, write_images=need_images, **SCALE_PRESETS[scale])
+        results = {}
+        for name, fn, setup, _ in selected:
+            print(f"🚀 正在运行阶段: {name}")
+            results[name] = run_stage(name, fn, setup, ctx, work_dir / "runs", repeat=repeat, verbose=verbose)
+
+        report = {
+            "version": REPORT_VERSION,
+            "environment": collect_environment(),
+            "config": {"scale": scale, "seed": seed, "repeat": repeat, **SCALE_PRESETS[scale]},
+            "dataset": {"counts": ctx['counts'], "generate_s": ctx['seconds']},
+            "stages": results,
+        }
+
+        comparison = None
+        if baseline:
+            comparison = compare_with_baseline(report, _load_json(baseline), tolerance)
+            report["comparison"] = {"baseline": str(baseline), "tolerance": tolerance, "rows": comparison}
+
+        output_json = Path(output_json)
+        output_json.parent.mkdir(parents=True, exist_ok=True)
+        with open(output_json, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print_report(report, comparison)
+        print(f"💾 报告已保存至: {output_json}")
+        return report
+    finally:
+        if tmp_root and not keep_data:
+            shutil.rmtree(tmp_root, ignore_errors=True)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="defect-vlm 全流程合成数据基准测试")
+    parser.add_argument("--output", default="bench_report.json", help="JSON 报告输出路径")
+    parser.add_argument("--scale", default="small", choices=list(SCALE_PRESETS.keys()))
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--stages", nargs="*", default=None, help=f"只运行指定阶段，可选: {[s[0] for s in STAGES]}")
+    parser.add_argument("--work_dir", default=None, help="合成数据目录，默认使用临时目录")
+    parser.add_argument("--keep_data", action="store_true", help="保留临时目录中的合成数据")
+    parser.add_argument("--baseline", default=None, help="历史报告路径，用于回归对比")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="允许的耗时增长比例")
+    parser.add_argument("--fail_on_regression", action="store_true", help="存在回归时以非零状态码退出")
+    parser.add_argument("--verbose", action="store_true", help="不屏蔽被测函数的输出")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    report = run_benchmarks(args.output, scale=args.scale, seed=args.seed, repeat=args.repeat, stages=args.stages,
+                            work_dir=args.work_dir, baseline=args.baseline, tolerance=args.tolerance,
+                            keep_data=args.keep_data, verbose=args.verbose)
+    regressions = [r for r in report.get("comparison", {}).get("rows", []) if r["regression"]]
+    if args.fail_on_regression and regressions:
+        sys.exit(1)
@@ -0,0 +1,274 @@
+"""
+合成数据生成器
+在没有 /data/ZS/... 真实数据集的机器上，生成一套结构与真实流水线完全一致的小型数据：
+    1_paint_rgb/images/{16col,16row,32col,32row}/*.png   条纹光伪 RGB 图 (三个相位叠成 BGR 三通道，缺陷处相位畸变)
+    labels/val.json                                       COCO 格式 GT (bbox 为 xywh)
+    9_yolo_preds/{col3,row3}.json                         双流 YOLO 预测 {file_name: [{bbox(xyxy), confidence, class_id, class_name, model_source}]}
+    9_yolo_preds/fusion.json                              融合后的预测 (裁剪阶段的输入)
+    11_composite_yolo_preds/labels/val.json               2x2 拼图元数据 (exp 分析 / Message 构建的输入)
+    13_vlm_response/val.jsonl                             VLM 推理结果 (pred 文本混合了标准 JSON、代码块、前后缀废话和截断)
+    7_vlm_extracted_data/val.jsonl                        提取后的 VLM 结果 (伪标签精炼的输入)
+    5_api_response/teacher.jsonl                          教师模型 API 回复 (含 ERROR、缺字段、非法 JSON 等失败样本)
+所有随机性都由 seed 决定，同一参数生成的数据逐字节一致。
+"""
+import json
+import time
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+DEFECT_CLASSES = ['breakage', 'inclusion', 'scratch', 'crater', 'run', 'bulge']
+LIGHT_SOURCES = ['16col', '16row', '32col', '32row']
+
+# 规模预设：图像数量、每张图的 GT 上限、每个模型每张图的误检数量
+SCALE_PRESETS = {
+    'tiny':   {'num_images': 20,   'max_gt_per_image': 3, 'fp_per_image': 2},
+    'small':  {'num_images': 200,  'max_gt_per_image': 3, 'fp_per_image': 3},
+    'medium': {'num_images': 1000, 'max_gt_per_image': 4, 'fp_per_image': 4},
+    'large':  {'num_images': 5000, 'max_gt_per_image': 4, 'fp_per_image': 4},
+}
+
+
+# ================= 图像 =================
+def render_stripe_image(light, boxes, img_size, rng):
+    """
+    渲染某个光源下的条纹光伪 RGB 图：三个通道分别为相移 0 / 2π/3 / 4π/3 的正弦条纹，
+    缺陷框内叠加一个高斯形的相位畸变和亮度凹陷
+    """
+    period = 16 if light.startswith('16') else 32
+    axis = 'x' if light.endswith('col') else 'y'
+    yy, xx = np.mgrid[0:img_size, 0:img_size].astype(np.float32)
+    coord = xx if axis == 'x' else yy
+
+    phase_bump = np.zeros((img_size, img_size), dtype=np.float32)
+    dip = np.zeros((img_size, img_size), dtype=np.float32)
+    for x, y, w, h in boxes:
+        cx, cy = x + w / 2.0, y + h / 2.0
+        sx, sy = max(w / 2.5, 1.0), max(h / 2.5, 1.0)
+        g = np.exp(-(((xx - cx) / sx) ** 2 + ((yy - cy) / sy) ** 2))
+        phase_bump += g * rng.uniform(1.0, 2.5)
+        dip += g * rng.uniform(20, 60)
+
+    channels = []
+    for k in range(3):
+        phase = 2 * np.pi * coord / period + phase_bump + 2 * np.pi * k / 3
+        img = 128 + 90 * np.cos(phase) - dip + rng.normal(0, 6, (img_size, img_size))
+        channels.append(np.clip(img, 0, 255).astype(np.uint8))
+    return np.stack(channels, axis=2)
+
+
+# ================= 框 =================
+def _random_box(rng, img_size):
+    # 约 1/3 的微小缺陷 (面积小于 6x6，会走融合的小目标分支)
+    if rng.random() < 0.33:
+        w, h = rng.integers(2, 6, 2)
+    else:
+        w, h = rng.integers(6, 60, 2)
+    x = rng.integers(0, img_size - w)
+    y = rng.integers(0, img_size - h)
+    return [float(x), float(y), float(w), float(h)]
+
+
+def _jitter_box(rng, box, img_size, max_shift=3):
+    x, y, w, h = box
+    dx, dy, dw, dh = rng.integers(-max_shift, max_shift + 1, 4)
+    w, h = max(1.0, w + dw), max(1.0, h + dh)
+    x = float(np.clip(x + dx, 0, img_size - w))
+    y = float(np.clip(y + dy, 0, img_size - h))
+    return [x, y, w, h]
+
+
+def _make_pred(box_xywh, conf, cls_id, source):
+    x, y, w, h = box_xywh
+    return {
+        "bbox": [x, y, x + w, y + h],
+        "confidence": round(float(conf), 4),
+        "class_id": int(cls_id),
+        "class_name": DEFECT_CLASSES[cls_id],
+        "model_source": source,
+    }
+
+
+def _simulate_model(rng, gts, img_size, fp_per_image, source, recall=0.85, cls_acc=0.8):
+    """模拟一个 YOLO 分支：大部分 GT 被检出 (带抖动和少量错分)，外加若干低置信度误检"""
+    preds, truths = [], []
+    for box, cls_id in gts:
+        if rng.random() > recall:
+            continue
+        pred_cls = cls_id if rng.random() < cls_acc else int(rng.integers(len(DEFECT_CLASSES)))
+        preds.append(_make_pred(_jitter_box(rng, box, img_size), rng.beta(5, 2), pred_cls, source))
+        truths.append(DEFECT_CLASSES[cls_id])
+    for _ in range(rng.integers(0, fp_per_image + 1)):
+        preds.append(_make_pred(_random_box(rng, img_size), rng.beta(1.5, 6), rng.integers(len(DEFECT_CLASSES)), source))
+        truths.append("background")
+    return preds, truths
+
+
+# ================= 文本回复 =================
+def _vlm_pred_text(rng, defect):
+    """模拟 VLM 的 pred 文本，格式质量参差不齐"""
+    body = json.dumps({"step1": "stripe distortion observed", "step2": "local phase shift",
+                       "step3": f"consistent with {defect}", "defect": defect}, ensure_ascii=False)
+    r = rng.random()
+    if r < 0.70:
+        return body
+    if r < 0.85:
+        return f"```json\n{body}\n```"
+    if r < 0.95:
+        return f"Analysis finished. {body} Hope this helps."
+    return body[: int(len(body) * 0.6)]
+
+
+def _teacher_response_text(rng, defect):
+    """模拟教师模型 API 回复：多数合格，少数为 ERROR / 缺字段 / 无大括号 / 非法 JSON"""
+    full = {"step1": "the stripe is bent", "step2": "bright spot in bbox", "step3": "reasoning", "defect": defect}
+    r = rng.random()
+    if r < 0.75:
+        return "Here is my answer:\n" + json.dumps(full, ensure_ascii=False, indent=2)
+    if r < 0.82:
+        return "ERROR: 429 Too Many Requests"
+    if r < 0.89:
+        partial = {k: v for k, v in full.items() if k != 'step3'}
+        return json.dumps(partial, ensure_ascii=False)
+    if r < 0.95:
+        return "I cannot determine the defect type from these images."
+    return '{"step1": "line\nbreak", "step2": unquoted, "defect": "' + defect + '"}'
+
+
+# ================= 主入口 =================
+def generate_synthetic_dataset(output_dir, num_images=200, img_size=300, max_gt_per_image=3, fp_per_image=3,
+                               seed=0, write_images=True):
+    """
+    生成全套合成数据，返回各文件路径组成的字典
+    :param write_images: False 时跳过 PNG 渲染 (只测纯 JSON 阶段时可以省掉大部分生成时间)
+    """
+    start = time.perf_counter()
+    rng = np.random.default_rng(seed)
+    root = Path(output_dir)
+    paths = {
+        'data_root': root,
+        'rgb_root': root / "1_paint_rgb" / "images",
+        'gt_json': root / "labels" / "val.json",
+        'preds_col3': root / "9_yolo_preds" / "col3.json",
+        'preds_row3': root / "9_yolo_preds" / "row3.json",
+        'fusion_json': root / "9_yolo_preds" / "fusion.json",
+        'composite_json': root / "11_composite_yolo_preds" / "labels" / "val.json",
+        'vlm_jsonl': root / "13_vlm_response" / "val.jsonl",
+        'vlm_extracted_jsonl': root / "7_vlm_extracted_data" / "val.jsonl",
+        'api_tea_jsonl': root / "5_api_response" / "teacher.jsonl",
+    }
+    for key, p in paths.items():
+        if key in ('data_root', 'rgb_root'):
+            p.mkdir(parents=True, exist_ok=True)
+        else:
+            p.parent.mkdir(parents=True, exist_ok=True)
+    for light in LIGHT_SOURCES:
+        (paths['rgb_root'] / light).mkdir(parents=True, exist_ok=True)
+
+    images, annotations = [], []
+    preds_col3, preds_row3, fusion = {}, {}, {}
+    composite, vlm_lines, extracted_lines = [], [], []
+    origin_id = 1000001
+
+    for img_id in range(num_images):
+        file_name = f"syn_{img_id:06d}.png"
+        images.append({"id": img_id, "file_name": file_name, "width": img_size, "height": img_size})
+
+        gts = []
+        for _ in range(rng.integers(0, max_gt_per_image + 1)):
+            box, cls_id = _random_box(rng, img_size), int(rng.integers(len(DEFECT_CLASSES)))
+            gts.append((box, cls_id))
+            annotations.append({"id": len(annotations), "image_id": img_id, "category_id": cls_id,
+                                "bbox": box, "area": box[2] * box[3], "iscrowd": 0})
+
+        if write_images:
+            for light in LIGHT_SOURCES:
+                img = render_stripe_image(light, [b for b, _ in gts], img_size, rng)
+                cv2.imwrite(str(paths['rgb_root'] / light / file_name), img)
+
+        col3, truths = _simulate_model(rng, gts, img_size, fp_per_image, "col3")
+        row3, _ = _simulate_model(rng, gts, img_size, fp_per_image, "row3")
+        preds_col3[file_name] = col3
+        preds_row3[file_name] = row3
+        fusion[file_name] = [dict(p, model_source="WBF") for p in col3]
+
+        # 融合后的每个预测框对应一组 2x2 拼图和一条 VLM 回复
+        for pred, truth in zip(col3, truths):
+            x1, y1, x2, y2 = pred['bbox']
+            bbox = [x1, y1, x2 - x1, y2 - y1]
+            orig_paths = [f"1_paint_rgb/images/{light}/{file_name}" for light in LIGHT_SOURCES]
+            composite.append({
+                "id": origin_id,
+                "composite_global_path": f"11_composite_yolo_preds/images/val/global_{origin_id}.png",
+                "composite_local_path": f"11_composite_yolo_preds/images/val/local_{origin_id}.png",
+                "bbox": bbox,
+                "prior_label": pred['class_name'],
+                "confidence": pred['confidence'],
+                "model_source": "WBF",
+                "light_source_order": LIGHT_SOURCES,
+                "original_image_paths": orig_paths,
+                "original_crop_paths": [p.replace("1_paint_rgb", "10_yolo_preds_bbox") for p in orig_paths],
+            })
+
+            vlm_defect = truth if rng.random() < 0.8 else (
+                "background" if rng.random() < 0.5 else DEFECT_CLASSES[int(rng.integers(len(DEFECT_CLASSES)))])
+            meta = {"bbox": bbox, "prior_label": pred['class_name'], "confidence": pred['confidence'],
+                    "model_source": "WBF", "origin_id": origin_id}
+            images_pair = [composite[-1]["composite_global_path"], composite[-1]["composite_local_path"]]
+            vlm_lines.append({"id": f"sp012_gt_pred_{origin_id}", "images": images_pair,
+                              "pred": _vlm_pred_text(rng, vlm_defect), "meta_info": meta})
+            extracted_lines.append({"id": f"sp012_gt_pred_{origin_id}", "images": images_pair, "bbox": bbox,
+                                    "confidence": pred['confidence'], "model_source": "WBF",
+                                    "prior_label": pred['class_name'], "vlm_pred": vlm_defect})
+            origin_id += 1
+
+    categories = [{"id": i, "name": name} for i, name in enumerate(DEFECT_CLASSES)]
+    with open(paths['gt_json'], 'w', encoding='utf-8') as f:
+        json.dump({"images": images, "annotations": annotations, "categories": categories}, f)
+    for key, data in (('preds_col3', preds_col3), ('preds_row3', preds_row3),
+                      ('fusion_json', fusion), ('composite_json', composite)):
+        with open(paths[key], 'w', encoding='utf-8') as f:
+            json.dump(data, f)
+    for key, lines in (('vlm_jsonl', vlm_lines), ('vlm_extracted_jsonl', extracted_lines)):
+        with open(paths[key], 'w', encoding='utf-8') as f:
+            for item in lines:
+                f.write(json.dumps(item, ensure_ascii=False) + '\n')
+
+    # 教师 API 回复与检测数据无关，按 GT 框数量生成等量样本
+    with open(paths['api_tea_jsonl'], 'w', encoding='utf-8') as f:
+        for i, ann in enumerate(annotations or [{"category_id": 0}]):
+            defect = DEFECT_CLASSES[ann["category_id"]]
+            item = {
+                "id": f"tea_{i:07d}",
+                "conversation": [{"from": "human", "value": "<image>\n<image>\nWhat defect is in the bbox?"},
+                                 {"from": "gpt", "value": _teacher_response_text(rng, defect)}],
+                "meta_info": {"label": defect},
+            }
+            f.write(json.dumps(item, ensure_ascii=False) + '\n')
+
+    counts = {
+        'images': num_images,
+        'gt_boxes': len(annotations),
+        'preds_col3': sum(len(v) for v in preds_col3.values()),
+        'preds_row3': sum(len(v) for v in preds_row3.values()),
+        'proposals': len(composite),
+        'teacher_responses': max(len(annotations), 1),
+    }
+    elapsed = time.perf_counter() - start
+    print("=" * 50)
+    print(f"🧪 合成数据已生成: {root} (seed={seed}, 耗时 {elapsed:.1f}s)")
+    for k, v in counts.items():
+        print(f"  - {k}: {v}")
+    print("=" * 50)
+    return {'paths': {k: str(v) for k, v in paths.items()}, 'counts': counts, 'seconds': elapsed}
+
+
+if __name__ == "__main__":
+    # ================= 配置区 =================
+    OUTPUT_DIR = "/data/ZS/defect-vlm/output/bench_synthetic/small"
+    SCALE = 'small'
+    SEED = 0
+    # ==========================================
+
+    generate_synthetic_dataset(OUTPUT_DIR, seed=SEED, **SCALE_PRESETS[SCALE])
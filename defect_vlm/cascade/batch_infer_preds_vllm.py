@@ -13,7 +13,10 @@ TENSOR_PARALLEL_SIZE = 2                      # 对应你上面配置的 3 张
 # ==================================================
 
 import json
+import time
 from tqdm import tqdm
+from defect_vlm.utils.tracing import span, count, observe
+from defect_vlm.utils.json_early_stop import EarlyStopStats, stop_words_for, finalize_engine_output, resolve_stop_mode
 from typing import List
 
 from swift import InferRequest, RequestConfig
@@ -27,7 +30,7 @@ def get_val(obj, key, default=None):
         return obj.get(key, default)
     return default
 
-def init_engine(model_path: str, adapter_path: str=None):
+def init_engine(model_path: str, adapter_path: str=None, early_stop: str='off'):
     """
     初始化 vLLM 模型引擎和配置参数
     """
@@ -39,7 +42,7 @@ def init_engine(model_path: str, adapter_path: str=None):
     engine = VllmEngine(model_path, max_model_len=8192, enforce_eager=True, tensor_parallel_size=TENSOR_PARALLEL_SIZE)
     
     # 移除了 logprobs 相关配置，保持基本的生成参数
-    request_config = RequestConfig(max_tokens=4096, temperature=0)
+    request_config = RequestConfig(max_tokens=4096, temperature=0, stop=stop_words_for(early_stop))
     
     return engine, request_config
 
@@ -59,15 +62,21 @@ def build_requests(data_chunk: list) -> List[InferRequest]:
 
     return infer_requests
 
-def infer_and_save_chunk(engine: VllmEngine, request_config: RequestConfig, data_chunk: list, output_path: str):
+def infer_and_save_chunk(engine: VllmEngine, request_config: RequestConfig, data_chunk: list, output_path: str,
+                         early_stop_stats: EarlyStopStats=None):
     """
     分块推理并保存（已剥离 logprobs 逻辑）
     """
     # 组装请求
-    infer_requests = build_requests(data_chunk)
+    with span("vlm_infer.build_requests", n=len(data_chunk)):
+        infer_requests = build_requests(data_chunk)
     
     # vLLM 批量推理
-    resp_list = engine.infer(infer_requests, request_config)
+    with span("vlm_infer.engine", n=len(infer_requests)):
+        infer_start = time.perf_counter()
+        resp_list = engine.infer(infer_requests, request_config)
+    observe("vlm_infer.ms_per_item", (time.perf_counter() - infer_start) * 1000 / max(len(infer_requests), 1))
+    count("vlm_infer.items", len(infer_requests))
     
     # 将预测结果塞回 data_chunk
     for i, resp in enumerate(resp_list):
@@ -76,13 +85,18 @@ def infer_and_save_chunk(engine: VllmEngine, request_config: RequestConfig, data
         else:
             data_chunk[i]['pred'] = ""
             print(f"⚠️ 第 {i} 条数据推理返回异常，已置为空字符串。")
+        if early_stop_stats is not None:
+            # JSON 结论完成即停止: on 模式补回被 stop 词截掉的右大括号，measure 模式只统计多余 token
+            completion_tokens = getattr(getattr(resp, 'usage', None), 'completion_tokens', 0)
+            data_chunk[i]['pred'], data_chunk[i]['early_stop'] = finalize_engine_output(
+                data_chunk[i]['pred'], completion_tokens, early_stop_stats)
     
     # 追加写入文件
-    with open(output_path, 'a', encoding='utf-8') as f:
+    with span("vlm_infer.write"), open(output_path, 'a', encoding='utf-8') as f:
         for item in data_chunk:
             f.write(json.dumps(item, ensure_ascii=False) + '\n')
 
-def main(input_path, output_path, model_path, adapter_path=None, chunk_size=32):
+def main(input_path, output_path, model_path, adapter_path=None, chunk_size=32, early_stop='off'):
     """
     主控流：vLLM 的并发能力极强，推荐较大的 chunk_size
     """
@@ -115,17 +129,22 @@ def main(input_path, output_path, model_path, adapter_path=None, chunk_size=32):
         return
         
     # 5. 加载 vLLM 引擎
-    engine, request_config = init_engine(model_path, adapter_path)
+    early_stop = resolve_stop_mode(early_stop, rest_data)     # stop 词只适用于只输出 defect 的提示词
+    engine, request_config = init_engine(model_path, adapter_path, early_stop)
+    early_stop_stats = EarlyStopStats(early_stop) if early_stop != 'off' else None
     
     # 6. 开始分块推理
     for i in tqdm(range(0, rest_items, chunk_size), desc='VLLM Inferencing'):
         try:
             chunk = rest_data[i: i+chunk_size]
-            infer_and_save_chunk(engine, request_config, chunk, output_path)
+            infer_and_save_chunk(engine, request_config, chunk, output_path, early_stop_stats)
         
         except Exception as e:
             print(f"❌ 处理索引 [{i}:{i+chunk_size}] 时发生错误: {e}")
 
+    if early_stop_stats is not None:
+        early_stop_stats.print_report()
+
 if __name__ == "__main__":
     # ==================== 路径配置 ====================
     input_path = '/data/ZS/defect_dataset/12_vlm_message/stripe_phase012/val_0p01_crop0.jsonl'
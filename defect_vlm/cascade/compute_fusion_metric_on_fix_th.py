@@ -21,6 +21,7 @@ if PROJECT_ROOT not in sys.path:
 # =====================================================================
 
 from ultralytics.utils.metrics import ConfusionMatrix, ap_per_class, box_iou
+from defect_vlm.utils.gt_index import load_gt_index
 
 # ================== 字体配置 ==================
 TIMES_FONT_PATH = "/data/ZS/defect-vlm/defect_vlm/paper_plots/fonts/times.ttf"
@@ -39,18 +40,10 @@ def evaluate_fusion_results(pred_json, gt_json, output_dir, target_conf=0.1):
     
     # 1. 解析 Ground Truth
     print(f"📖 正在加载真实标签: {gt_json}")
-    with open(gt_json, 'r', encoding='utf-8') as f:
-        coco_gt = json.load(f)
-        
-    names_dict = {cat['id']: cat['name'] for cat in coco_gt['categories']}
-    imgid2name = {img['id']: img['file_name'] for img in coco_gt['images']}
-    
-    gt_dict = {img['file_name']: [] for img in coco_gt['images']}
-    for ann in coco_gt['annotations']:
-        img_name = imgid2name[ann['image_id']]
-        cat_id = ann['category_id']
-        x, y, w, h = ann['bbox']
-        gt_dict[img_name].append([cat_id, x, y, x + w, y + h])
+    gt_index = load_gt_index(gt_json)
+    names_dict = gt_index.names_dict
+    # 扁平数组 + 偏移表的 GT 索引，已完成 xywh -> xyxy 转换 (带磁盘缓存)
+    gt_dict = gt_index.to_gt_dict()
         
     # 2. 解析 Predictions
     print(f"📖 正在加载预测结果: {pred_json}")
@@ -208,4 +201,11 @@ if __name__ == '__main__':
     TARGET_CONF = 0.15
     OUTPUT_DIR = f"/data/ZS/defect-vlm/output/figures/ch4_cascade_final/ch4_yolo_th{TARGET_CONF}" 
     
-    evaluate_fusion_results(PRED_JSON, GT_JSON, OUTPUT_DIR, target_conf=TARGET_CONF)
\ No newline at end of file
+    evaluate_fusion_results(PRED_JSON, GT_JSON, OUTPUT_DIR, target_conf=TARGET_CONF)
+
+    # 批量模式：同一个进程里用同一份 GT 索引评估多个预测文件 (GT 只加载一次)
+    # PRED_JSONS = {
+    #     "nms_0p01": PRED_JSON,
+    #     "decision_fusion": "/data/ZS/defect_dataset/9_yolo_preds/自己手写的推理脚本/val_0p001/decision_fusion.json",
+    # }
+    # batch_evaluate(evaluate_fusion_results, PRED_JSONS, GT_JSON, f"/data/ZS/defect-vlm/output/figures/ch4_cascade_final/batch_th{TARGET_CONF}", target_conf=TARGET_CONF)
\ No newline at end of file
@@ -16,6 +16,7 @@ if PROJECT_ROOT not in sys.path:
 # =====================================================================
 
 from ultralytics.utils.metrics import box_iou
+from defect_vlm.utils.gt_index import load_gt_index
 
 def calculate_pr_thresholds(pred_json, gt_json, output_dir, target_thresholds, target_recalls, target_precisions):
     output_dir = Path(output_dir)
@@ -23,18 +24,10 @@ def calculate_pr_thresholds(pred_json, gt_json, output_dir, target_thresholds, t
     
     # 1. 解析 Ground Truth
     print(f"📖 正在加载真实标签: {gt_json}")
-    with open(gt_json, 'r', encoding='utf-8') as f:
-        coco_gt = json.load(f)
-        
-    imgid2name = {img['id']: img['file_name'] for img in coco_gt['images']}
-    gt_dict = {img['file_name']: [] for img in coco_gt['images']}
-    total_gts = 0
-    for ann in coco_gt['annotations']:
-        img_name = imgid2name[ann['image_id']]
-        cat_id = ann['category_id']
-        x, y, w, h = ann['bbox']
-        gt_dict[img_name].append([cat_id, x, y, x + w, y + h])
-        total_gts += 1
+    gt_index = load_gt_index(gt_json)
+    # 扁平数组 + 偏移表的 GT 索引，已完成 xywh -> xyxy 转换 (带磁盘缓存)
+    gt_dict = gt_index.to_gt_dict()
+    total_gts = len(gt_index.cls)
         
     # 2. 解析 Predictions
     print(f"📖 正在加载预测结果: {pred_json}")
@@ -4,7 +4,6 @@
 输出：PR 曲线、F1 曲线、混淆矩阵，严格阈值下的全局宏平均 P、R、F1，并同步保存
 """
 import os
-import re
 import sys
 import json
 import torch
@@ -21,20 +20,9 @@ if PROJECT_ROOT not in sys.path:
 # =====================================================================
 
 from ultralytics.utils.metrics import ConfusionMatrix, ap_per_class, box_iou
-
-def parse_vlm_prediction(pred_text):
-    """鲁棒地解析 VLM 输出的 JSON 文本，提取缺陷类别"""
-    try:
-        # 去除可能存在的 markdown 代码块包裹
-        clean_text = pred_text.replace("```json", "").replace("```", "").strip()
-        data = json.loads(clean_text)
-        return data.get("defect", "background").lower()
-    except Exception:
-        # 如果 json 解析失败，使用正则兜底提取
-        match = re.search(r'"defect"\s*:\s*"([^"]+)"', pred_text, re.IGNORECASE)
-        if match:
-            return match.group(1).lower()
-        return "background"
+from defect_vlm.utils.gt_index import load_gt_index
+from defect_vlm.utils.tracing import span, count
+from defect_vlm.utils.vlm_response_parser import parse_vlm_prediction
 
 def evaluate_vlm_results(vlm_jsonl, inter_json, gt_json, output_dir, target_conf=0.2):
     output_dir = Path(output_dir)
@@ -42,19 +30,12 @@ def evaluate_vlm_results(vlm_jsonl, inter_json, gt_json, output_dir, target_conf
     
     # 1. 解析 Ground Truth (COCO 格式)
     print(f"📖 正在加载真实标签: {gt_json}")
-    with open(gt_json, 'r', encoding='utf-8') as f:
-        coco_gt = json.load(f)
-        
-    names_dict = {cat['id']: cat['name'] for cat in coco_gt['categories']}
-    name2id = {cat['name']: cat['id'] for cat in coco_gt['categories']}
-    imgid2name = {img['id']: img['file_name'] for img in coco_gt['images']}
-    
-    gt_dict = {img['file_name']: [] for img in coco_gt['images']}
-    for ann in coco_gt['annotations']:
-        img_name = imgid2name[ann['image_id']]
-        cat_id = ann['category_id']
-        x, y, w, h = ann['bbox']
-        gt_dict[img_name].append([cat_id, x, y, x + w, y + h])
+    with span("metric.load_gt"):
+        gt_index = load_gt_index(gt_json)
+        names_dict = gt_index.names_dict
+        name2id = gt_index.name2id
+        # 扁平数组 + 偏移表的 GT 索引，已完成 xywh -> xyxy 转换 (带磁盘缓存)
+        gt_dict = gt_index.to_gt_dict()
 
     # 2. 加载中间映射文件 (用于 ID 溯源到原图名称)
     print(f"🔗 正在加载 ID 映射文件: {inter_json}")
@@ -68,35 +49,36 @@ def evaluate_vlm_results(vlm_jsonl, inter_json, gt_json, output_dir, target_conf
 
     # 3. 解析 VLM 的预测结果
     print(f"🧠 正在解析 VLM 预测结果: {vlm_jsonl}")
-    pred_dict = {img['file_name']: [] for img in coco_gt['images']}
+    pred_dict = {name: [] for name in gt_index.file_names}
     
-    with open(vlm_jsonl, 'r', encoding='utf-8') as f:
-        for line in f:
-            if not line.strip(): continue
-            item = json.loads(line)
+    with span("metric.load_pred"):
+        with open(vlm_jsonl, 'r', encoding='utf-8') as f:
+            for line in f:
+                if not line.strip(): continue
+                item = json.loads(line)
             
-            origin_id = item["meta_info"]["origin_id"]
-            if origin_id not in id2filename: continue
+                origin_id = item["meta_info"]["origin_id"]
+                if origin_id not in id2filename: continue
             
-            filename = id2filename[origin_id]
-            pred_cls_name = parse_vlm_prediction(item.get("pred", ""))
+                filename = id2filename[origin_id]
+                pred_cls_name = parse_vlm_prediction(item.get("pred", ""))
             
-            # 如果 VLM 认为是背景 (无缺陷)，抛弃该候选框
-            if pred_cls_name == "background" or pred_cls_name not in name2id:
-                continue
+                # 如果 VLM 认为是背景 (无缺陷)，抛弃该候选框
+                if pred_cls_name == "background" or pred_cls_name not in name2id:
+                    continue
                 
-            class_id = name2id[pred_cls_name]
-            # 提取前级置信度
-            prob = item["meta_info"]["confidence"]
+                class_id = name2id[pred_cls_name]
+                # 提取前级置信度
+                prob = item["meta_info"]["confidence"]
             
-            # 注：这里去掉了硬过滤，把完整的概率流送给底层评估器，才能画出完整的 PR 曲线！
+                # 注：这里去掉了硬过滤，把完整的概率流送给底层评估器，才能画出完整的 PR 曲线！
             
-            x, y, w, h = item["meta_info"]["bbox"]
-            pred_dict[filename].append({
-                'bbox': [x, y, x + w, y + h],
-                'confidence': prob,
-                'class_id': class_id
-            })
+                x, y, w, h = item["meta_info"]["bbox"]
+                pred_dict[filename].append({
+                    'bbox': [x, y, x + w, y + h],
+                    'confidence': prob,
+                    'class_id': class_id
+                })
 
     # 4. 准备 Ultralytics 评估矩阵
     iouv = torch.linspace(0.5, 0.95, 10)
@@ -108,49 +90,52 @@ def evaluate_vlm_results(vlm_jsonl, inter_json, gt_json, output_dir, target_conf
     print("⚙️ 正在执行边界框匹配与 IoU 计算...")
     all_images = set(gt_dict.keys()).union(set(pred_dict.keys()))
     
-    for filename in all_images:
-        gts = gt_dict.get(filename, [])
-        preds = pred_dict.get(filename, [])
+    with span("metric.match", images=len(all_images)):
+        for filename in all_images:
+            gts = gt_dict.get(filename, [])
+            preds = pred_dict.get(filename, [])
         
-        labels = torch.tensor(gts, dtype=torch.float32) if len(gts) > 0 else torch.empty(0, 5)
+            labels = torch.tensor(gts, dtype=torch.float32) if len(gts) > 0 else torch.empty(0, 5)
         
-        if len(preds) > 0:
-            detections = torch.tensor(
-                [[p['bbox'][0], p['bbox'][1], p['bbox'][2], p['bbox'][3], p['confidence'], p['class_id']]
-                 for p in preds], dtype=torch.float32
-            )
-            detections = detections[detections[:, 4].argsort(descending=True)]
-        else:
-            detections = torch.empty(0, 6)
-
-        tp = torch.zeros((detections.shape[0], len(iouv)), dtype=torch.bool)
-        if labels.shape[0] > 0 and detections.shape[0] > 0:
-            ious = box_iou(labels[:, 1:], detections[:, :4])
-            correct_class = labels[:, 0:1] == detections[:, 5]
+            if len(preds) > 0:
+                detections = torch.tensor(
+                    [[p['bbox'][0], p['bbox'][1], p['bbox'][2], p['bbox'][3], p['confidence'], p['class_id']]
+                     for p in preds], dtype=torch.float32
+                )
+                detections = detections[detections[:, 4].argsort(descending=True)]
+            else:
+                detections = torch.empty(0, 6)
+
+            tp = torch.zeros((detections.shape[0], len(iouv)), dtype=torch.bool)
+            if labels.shape[0] > 0 and detections.shape[0] > 0:
+                ious = box_iou(labels[:, 1:], detections[:, :4])
+                correct_class = labels[:, 0:1] == detections[:, 5]
             
-            for i, threshold in enumerate(iouv):
-                matches = torch.nonzero((ious >= threshold) & correct_class)
-                if matches.shape[0] > 0:
-                    matches_iou = ious[matches[:, 0], matches[:, 1]]
-                    matches = torch.cat([matches, matches_iou[:, None]], dim=1)
-                    matches = matches[matches[:, 2].argsort(descending=True)]
+                for i, threshold in enumerate(iouv):
+                    matches = torch.nonzero((ious >= threshold) & correct_class)
+                    if matches.shape[0] > 0:
+                        matches_iou = ious[matches[:, 0], matches[:, 1]]
+                        matches = torch.cat([matches, matches_iou[:, None]], dim=1)
+                        matches = matches[matches[:, 2].argsort(descending=True)]
                     
-                    matched_labels, matched_detections = set(), set()
-                    for m in matches:
-                        l_idx, d_idx = int(m[0]), int(m[1])
-                        if l_idx not in matched_labels and d_idx not in matched_detections:
-                            matched_labels.add(l_idx)
-                            matched_detections.add(d_idx)
-                            tp[d_idx, i] = True
+                        matched_labels, matched_detections = set(), set()
+                        for m in matches:
+                            l_idx, d_idx = int(m[0]), int(m[1])
+                            if l_idx not in matched_labels and d_idx not in matched_detections:
+                                matched_labels.add(l_idx)
+                                matched_detections.add(d_idx)
+                                tp[d_idx, i] = True
                             
-        cm.process_batch(detections, labels[:, 1:], labels[:, 0])
+            cm.process_batch(detections, labels[:, 1:], labels[:, 0])
         
-        stats.append((
-            tp,
-            detections[:, 4] if len(detections) > 0 else torch.empty(0),
-            detections[:, 5] if len(detections) > 0 else torch.empty(0),
-            labels[:, 0] if len(labels) > 0 else torch.empty(0)
-        ))
+            stats.append((
+                tp,
+                detections[:, 4] if len(detections) > 0 else torch.empty(0),
+                detections[:, 5] if len(detections) > 0 else torch.empty(0),
+                labels[:, 0] if len(labels) > 0 else torch.empty(0)
+            ))
+
+    count("metric.images", len(all_images))
 
     # 6. 生成最终指标与图表
     print("📊 正在生成 PR 曲线、混淆矩阵及计算 mAP...")
@@ -1,12 +1,16 @@
 """
 将0_defect_dataset_raw/paint_stripe里面的 images 和 label（coco的json格式），
 划分成为第一章多流主干网络需要的输入数据格式（yolo需要的txt格式）
+
+main_manifest: 不再复制 6 份图片，而是生成一份多流索引 (见 utils/multistream_manifest.py)，
+训练/推理可以直接按索引拼接读取；确实需要文件夹布局时再用硬链接/软链接物化。
 """
 import os
 import json
 import shutil
 from pathlib import Path
 from tqdm import tqdm
+from defect_vlm.utils.multistream_manifest import build_manifest_from_coco, save_manifest, materialize_manifest
 
 def main():
     # 1. 定义源路径和目标路径
@@ -89,5 +93,45 @@ def main():
         print(f"⚠️ 注意：过程中有 {missing_images} 次图片未找到，{missing_labels} 次标签未找到。")
         print("这通常是因为原始文件夹中缺失了对应的模态图片或标注。")
 
+def main_manifest(materialize_mode=None, materialize_dir=None):
+    """
+    生成多流索引，并按需物化目录结构
+    :param materialize_mode: 'hardlink' | 'symlink' | 'copy' | None (None 表示只生成索引)
+    :param materialize_dir: 物化的目标目录，必须与 target_root 不同 (row3 是 GT 数据集，被多个脚本作为 GT_DIR，不能改动)
+    """
+    source_root = Path("/data/ZS/defect_dataset/0_defect_dataset_raw/paint_stripe")
+    target_root = Path("/data/ZS/v11_input/datasets/row3")
+    manifest_path = target_root / "manifest.json"
+
+    stream_mapping = {
+        "16row0": "",
+        "16row1": "_1",
+        "16row2": "_2",
+        "32row0": "_3",
+        "32row1": "_4",
+        "32row2": "_5"
+    }
+    split_jsons = {
+        "train": source_root / "labels" / "train.json",
+        "val": source_root / "labels" / "val.json"
+    }
+
+    print("正在构建多流索引...")
+    manifest = build_manifest_from_coco(source_root, stream_mapping, split_jsons)
+    save_manifest(manifest, manifest_path)
+
+    if materialize_mode is not None:
+        if materialize_dir is None or Path(materialize_dir).resolve() == target_root.resolve():
+            raise ValueError("❌ 物化目录不能为空，也不能是 GT 数据集目录本身，请指定单独的 materialize_dir")
+        materialize_manifest(manifest, materialize_dir, mode=materialize_mode)
+
+    print("-" * 50)
+    print("✅ 多流数据集索引构建完成！")
+
 if __name__ == "__main__":
-    main()
+    # 旧流程：复制 6 份图片
+    # main()
+
+    # 新流程：只生成索引；需要文件夹布局时物化到单独目录 (硬链接不占用额外磁盘空间)
+    main_manifest(materialize_mode=None)
+    # main_manifest(materialize_mode='hardlink', materialize_dir="/data/ZS/v11_input/datasets/row3_hardlink")
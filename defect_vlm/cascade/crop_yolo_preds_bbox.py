@@ -9,6 +9,7 @@ import json
 import numpy as np
 from pathlib import Path
 from tqdm import tqdm
+from defect_vlm.utils.tracing import span, count
 
 def get_dynamic_context_ratio(bbox_size: float) -> float:
     """根据bbox的尺寸动态计算context_ratio (保持与训练集完全对齐)"""
@@ -86,9 +87,11 @@ def main(fusion_json_path, rgb_image_root, save_img_dir, out_json_path, data_roo
             
             if not original_img_path.exists():
                 missing_images += 1
+                count("crop.missing_images")
                 continue
                 
-            raw_image = cv2.imread(str(original_img_path))
+            with span("crop.imread"):
+                raw_image = cv2.imread(str(original_img_path))
             if raw_image is None:
                 continue
                 
@@ -101,7 +104,8 @@ def main(fusion_json_path, rgb_image_root, save_img_dir, out_json_path, data_roo
                 model_source = pred['model_source']
                 
                 # 执行裁剪 (必须指定 xyxy 格式)
-                crop = get_region_proposal(raw_image, bbox_xyxy, bbox_format='xyxy')
+                with span("crop.region_proposal"):
+                    crop = get_region_proposal(raw_image, bbox_xyxy, bbox_format='xyxy')
                 
                 if crop is None or crop.size == 0:
                     continue
@@ -110,7 +114,9 @@ def main(fusion_json_path, rgb_image_root, save_img_dir, out_json_path, data_roo
                 save_name = f"{file_stem}_{light}_{prior_label}_{box_idx}.png"
                 save_path = save_img_dir / save_name
                 
-                cv2.imwrite(str(save_path), crop)
+                with span("crop.imwrite"):
+                    cv2.imwrite(str(save_path), crop)
+                count("crop.crops")
                 
                 # ================= 记录元数据 =================
                 # 尝试计算相对路径，如果跨盘符失败则直接保留绝对路径
@@ -135,6 +141,8 @@ def main(fusion_json_path, rgb_image_root, save_img_dir, out_json_path, data_roo
                     "model_source": model_source,
                     "light_source": light
                 }
+                if 'cluster_id' in pred:
+                    metadata["cluster_id"] = pred['cluster_id']   # dedup_proposals 聚类后的代表框
                 metadata_list.append(metadata)
                 global_id += 1
                 
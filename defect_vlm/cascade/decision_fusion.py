@@ -7,6 +7,8 @@ import json
 import os
 import numpy as np
 from ensemble_boxes import weighted_boxes_fusion, soft_nms
+from defect_vlm.utils.nwd_fusion import nwd_consensus_fusion
+from defect_vlm.utils.tracing import span, count
 
 # 类别 ID 到 名称 的映射 (用于融合后还原)
 CLASS_ID_TO_NAME = {
@@ -82,8 +84,9 @@ def filter_empty_predictions(boxes, scores, labels, weights):
 
 def process_scale_aware_fusion(json1_path, json2_path, out_path, config):  
     print("加载预测结果 JSON 文件...")
-    preds_col3 = load_json(json1_path)
-    preds_row3 = load_json(json2_path)
+    with span("fusion.load_json"):
+        preds_col3 = load_json(json1_path)
+        preds_row3 = load_json(json2_path)
     
     img_w = config['IMG_W']
     img_h = config['IMG_H']
@@ -92,6 +95,8 @@ def process_scale_aware_fusion(json1_path, json2_path, out_path, config):
     iou_thr_soft = config['IOU_THR_SOFT']
     sigma_soft = config['SIGMA_SOFT']
     skip_box_thr = config['SKIP_BOX_THR']
+    # 微小缺陷分支的融合策略: 'WBF' (默认) 或 'NWD' (NWD 共识强化融合)
+    small_fusion = config.get('SMALL_FUSION', 'WBF')
 
     all_images = set(preds_col3.keys()).union(set(preds_row3.keys()))
     fused_results = {}
@@ -114,37 +119,53 @@ def process_scale_aware_fusion(json1_path, json2_path, out_path, config):
             
         final_img_preds = []
         
-        # --- 2. 微小缺陷分支：使用 WBF ---
-        b_s, s_s, l_s = format_for_ensemble(small_col3, small_row3, img_w, img_h)
-        # 【修改点】过滤掉没有预测出小缺陷的模型分支
-        vb_s, vs_s, vl_s, vw_s = filter_empty_predictions(b_s, s_s, l_s, [1, 1])
-        
-        if len(vb_s) > 0: # 如果过滤后还有有效的模型分支
-            fused_b, fused_s, fused_l = weighted_boxes_fusion(
-                vb_s, vs_s, vl_s, 
-                weights=vw_s, iou_thr=iou_thr_wbf, skip_box_thr=skip_box_thr
-            )
-            final_img_preds.extend(denormalize_boxes(fused_b, fused_s, fused_l, "WBF", img_w, img_h))
+        # --- 2. 微小缺陷分支 ---
+        with span("fusion.small_branch", strategy=small_fusion):
+            if small_fusion == 'NWD':
+                # 2a. NWD 共识强化融合 (无需归一化，直接算)
+                fused_small = nwd_consensus_fusion(
+                    small_col3, small_row3,
+                    nwd_thr=config['NWD_THR'], C=config['NWD_C'], assign=config.get('NWD_ASSIGN', 'greedy')
+                )
+                # 对单边保留下来的极低置信度噪点做个过滤
+                final_img_preds.extend([p for p in fused_small if p['confidence'] >= skip_box_thr])
+            else:
+                # 2b. WBF
+                b_s, s_s, l_s = format_for_ensemble(small_col3, small_row3, img_w, img_h)
+                # 【修改点】过滤掉没有预测出小缺陷的模型分支
+                vb_s, vs_s, vl_s, vw_s = filter_empty_predictions(b_s, s_s, l_s, [1, 1])
+            
+                if len(vb_s) > 0: # 如果过滤后还有有效的模型分支
+                    fused_b, fused_s, fused_l = weighted_boxes_fusion(
+                        vb_s, vs_s, vl_s, 
+                        weights=vw_s, iou_thr=iou_thr_wbf, skip_box_thr=skip_box_thr
+                    )
+                    final_img_preds.extend(denormalize_boxes(fused_b, fused_s, fused_l, "WBF", img_w, img_h))
 
         # --- 3. 大尺度缺陷分支：使用 Soft-NMS ---
-        b_l, s_l, l_l = format_for_ensemble(large_col3, large_row3, img_w, img_h)
-        # 【修改点】过滤掉没有预测出大缺陷的模型分支
-        vb_l, vs_l, vl_l, vw_l = filter_empty_predictions(b_l, s_l, l_l, [1, 1])
+        with span("fusion.large_branch"):
+            b_l, s_l, l_l = format_for_ensemble(large_col3, large_row3, img_w, img_h)
+            # 【修改点】过滤掉没有预测出大缺陷的模型分支
+            vb_l, vs_l, vl_l, vw_l = filter_empty_predictions(b_l, s_l, l_l, [1, 1])
         
-        if len(vb_l) > 0: # 如果过滤后还有有效的模型分支
-            fused_b, fused_s, fused_l = soft_nms(
-                vb_l, vs_l, vl_l, 
-                weights=vw_l, iou_thr=iou_thr_soft, sigma=sigma_soft, thresh=skip_box_thr
-            )
-            final_img_preds.extend(denormalize_boxes(fused_b, fused_s, fused_l, "SoftNMS", img_w, img_h))
+            if len(vb_l) > 0: # 如果过滤后还有有效的模型分支
+                fused_b, fused_s, fused_l = soft_nms(
+                    vb_l, vs_l, vl_l, 
+                    weights=vw_l, iou_thr=iou_thr_soft, sigma=sigma_soft, thresh=skip_box_thr
+                )
+                final_img_preds.extend(denormalize_boxes(fused_b, fused_s, fused_l, "SoftNMS", img_w, img_h))
             
         # --- 4. 汇总该图像的最终预测 ---
         final_img_preds.sort(key=lambda x: x['confidence'], reverse=True)
         fused_results[img_name] = final_img_preds
+        count("fusion.images")
+        count("fusion.boxes_in", len(img_preds_col3) + len(img_preds_row3))
+        count("fusion.boxes_small", len(small_col3) + len(small_row3))
+        count("fusion.boxes_out", len(final_img_preds))
 
     # 保存最终 JSON
     print(f"融合完成！正在保存至 {out_path} ...")
-    with open(out_path, 'w', encoding='utf-8') as f:
+    with span("fusion.save_json"), open(out_path, 'w', encoding='utf-8') as f:
         json.dump(fused_results, f, indent=2, ensure_ascii=False)
     print("处理完毕！")
 
@@ -159,6 +180,12 @@ if __name__ == "__main__":
         'AREA_TH': 0.0004,          # 尺度感知面积阈值 (th): (6*6像素作为界限)
         'IOU_THR_WBF': 0.45,        # WBF 的聚类 IoU 阈值
         'IOU_THR_SOFT': 0.45,       # Soft-NMS 的重叠阈值
+
+        # --- 微小缺陷分支策略 ---
+        'SMALL_FUSION': 'WBF',      # 'WBF' 或 'NWD' (NWD 共识强化融合)
+        'NWD_THR': 0.8,             # NWD 相似度匹配阈值 (越接近1越严格，通常取 0.8~0.9)
+        'NWD_C': 50.0,              # 常数 C，通常设为数据集微小目标的平均绝对尺寸(像素)
+        'NWD_ASSIGN': 'greedy',     # 'greedy' (与原实现一致) 或 'optimal' (匈牙利最优匹配，需要 scipy)
     }
 
     # 配置你的文件路径
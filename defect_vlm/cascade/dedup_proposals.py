@@ -0,0 +1,78 @@
+"""
+融合之后、抠图之前的类别无关 proposal 去重 (规则见 defect_vlm/utils/proposal_clustering.py)
+同一张图内 IoU (或 NWD) >= thr 的框归为一簇，每簇只保留置信度最高的代表框送入
+crop -> composite -> message -> VLM，VLM 推理完成后由 fan_out_cluster_verdicts.py 把结论回填给簇内所有成员。
+运行时先打印预计节省的 VLM 请求数，再决定是否继续后面的阶段。
+输入：9_yolo_preds (或 flywheel 的 2_yolo_preds) 下的融合结果
+输出：代表框的融合 json (格式不变，额外带 cluster_id / cluster_size) + 簇成员映射 json
+"""
+import json
+from pathlib import Path
+from defect_vlm.utils.proposal_clustering import dedup_fusion_preds
+
+LIGHTS_PER_PROPOSAL = 4     # 每个框要在 4 个光源上抠图
+
+
+def dedup_proposals(fusion_json, rep_json, cluster_json, method='iou', thr=0.7, nwd_c=50.0):
+    print(f"📖 正在加载融合结果: {fusion_json}")
+    with open(fusion_json, 'r', encoding='utf-8') as f:
+        fusion_preds = json.load(f)
+
+    rep_preds, clusters, stats = dedup_fusion_preds(fusion_preds, method, thr, nwd_c)
+
+    rep_json, cluster_json = Path(rep_json), Path(cluster_json)
+    rep_json.parent.mkdir(parents=True, exist_ok=True)
+    cluster_json.parent.mkdir(parents=True, exist_ok=True)
+    with open(rep_json, 'w', encoding='utf-8') as f:
+        json.dump(rep_preds, f, indent=2, ensure_ascii=False)
+
+    total = max(stats["proposals"], 1)
+    saved = stats["proposals"] - stats["clusters"]
+    meta = {
+        "method": method,
+        "thr": thr,
+        "nwd_c": nwd_c,
+        "fusion_json": str(fusion_json),
+        "rep_json": str(rep_json),
+        "statistics": stats,
+        "vlm_requests_saved_ratio": round(saved / total, 4),
+    }
+    with open(cluster_json, 'w', encoding='utf-8') as f:
+        json.dump({"meta": meta, "clusters": clusters}, f, ensure_ascii=False)
+
+    print("\n" + "=" * 50)
+    print("🧩 Proposal 聚类去重报告 (VLM 推理前预估)")
+    print("=" * 50)
+    print(f"   [配置] method: {method}, thr: {thr}" + (f", C: {nwd_c}" if method == 'nwd' else ""))
+    print(f"📥 融合后候选框总数 : {stats['proposals']} (共 {stats['images']} 张图)")
+    print(f"📦 聚类后簇数       : {stats['clusters']} (即实际送入 VLM 的请求数)")
+    print(f"  ├── 🔀 跨类别重复簇 : {stats['cross_class']}")
+    print(f"  └── 🔀 跨流重复簇   : {stats['cross_stream']}")
+    print("-" * 50)
+    print("📊 簇大小分布:")
+    for size in sorted(stats["size_hist"]):
+        n = stats["size_hist"][size]
+        print(f"   size={size:<3}: {n} 簇 ({n / max(stats['clusters'], 1) * 100:.2f}%)")
+    print("-" * 50)
+    print(f"⚡ VLM 请求减少 : {saved} 条 ({saved / total * 100:.2f}%)")
+    print(f"⚡ 免去抠图     : {saved * LIGHTS_PER_PROPOSAL} 张, 免去拼图: {saved} 组")
+    print("=" * 50)
+    print(f"✅ 代表框融合结果已保存至: {rep_json}")
+    print(f"✅ 簇成员映射已保存至   : {cluster_json}")
+    return stats
+
+
+if __name__ == '__main__':
+    # 1. 输入：融合结果
+    FUSION_JSON = "/data/ZS/defect_dataset/9_yolo_preds/pipeline_val/nms_fusion_conf_0p01.json"
+
+    # 2. 输出：代表框交给 crop_yolo_preds_bbox.py，簇映射交给 fan_out_cluster_verdicts.py
+    REP_JSON = "/data/ZS/defect_dataset/9_yolo_preds/pipeline_val/nms_fusion_conf_0p01_dedup.json"
+    CLUSTER_JSON = "/data/ZS/defect_dataset/9_yolo_preds/pipeline_val/nms_fusion_conf_0p01_clusters.json"
+
+    # 3. 聚类方式：'iou' 或 'nwd' (小目标建议 nwd，C 与 decision_fusion 的 NWD_C 一致)
+    METHOD = 'iou'
+    THR = 0.7
+    NWD_C = 50.0
+
+    dedup_proposals(FUSION_JSON, REP_JSON, CLUSTER_JSON, METHOD, THR, NWD_C)
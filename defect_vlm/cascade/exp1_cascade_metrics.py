@@ -5,42 +5,15 @@
 输出：各类别及宏观平均的 P, R, F1 对比表 (同时打印到终端并保存为 txt)
 """
 import os
-import re
 import json
 import numpy as np
 from collections import defaultdict
 from pathlib import Path
+from defect_vlm.utils.box_geometry import box_iou
+from defect_vlm.utils.gt_index import load_gt_index
+from defect_vlm.utils.vlm_response_parser import parse_vlm_prediction
 
 # ================= 工具函数 =================
-def parse_vlm_prediction(pred_text):
-    """鲁棒地解析 VLM 预测的类别"""
-    try:
-        clean_text = pred_text.replace("```json", "").replace("```", "").strip()
-        data = json.loads(clean_text)
-        return data.get("defect", "background").lower()
-    except Exception:
-        match = re.search(r'"defect"\s*:\s*"([^"]+)"', pred_text, re.IGNORECASE)
-        if match:
-            return match.group(1).lower()
-        return "background"
-
-def compute_iou(box1, box2):
-    """计算两个 [x1, y1, x2, y2] 框的 IoU"""
-    x1 = max(box1[0], box2[0])
-    y1 = max(box1[1], box2[1])
-    x2 = min(box1[2], box2[2])
-    y2 = min(box1[3], box2[3])
-    
-    inter_area = max(0, x2 - x1) * max(0, y2 - y1)
-    if inter_area == 0:
-        return 0.0
-        
-    box1_area = (box1[2] - box1[0]) * (box1[3] - box1[1])
-    box2_area = (box2[2] - box2[0]) * (box2[3] - box2[1])
-    
-    return inter_area / float(box1_area + box2_area - inter_area)
-
-# ================= 核心评估引擎 =================
 def evaluate_predictions(preds_dict, gt_dict, num_classes, iou_thresh=0.45):
     """
     计算 TP, FP, FN 并返回 P, R, F1
@@ -71,7 +44,7 @@ def evaluate_predictions(preds_dict, gt_dict, num_classes, iou_thresh=0.45):
                 if g['class_id'] != p_cls:
                     continue
                     
-                iou = compute_iou(p_box, g['bbox'])
+                iou = box_iou(p_box, g['bbox'])
                 if iou > best_iou:
                     best_iou = iou
                     best_gt_idx = idx
@@ -112,20 +85,11 @@ def main(gt_json_path, yolo_json_path, vlm_jsonl_path, output_dir,
         file_handle.write(text + "\n")
 
     # 1. 加载 GT
-    with open(gt_json_path, 'r', encoding='utf-8') as f:
-        coco_gt = json.load(f)
-        
-    names_dict = {cat['id']: cat['name'] for cat in coco_gt['categories']}
-    name2id = {cat['name']: cat['id'] for cat in coco_gt['categories']}
-    imgid2name = {img['id']: img['file_name'] for img in coco_gt['images']}
+    gt_index = load_gt_index(gt_json_path)
+    names_dict = gt_index.names_dict
+    name2id = gt_index.name2id
     num_classes = len(names_dict)
-    
-    gt_dict = defaultdict(list)
-    for ann in coco_gt['annotations']:
-        filename = imgid2name[ann['image_id']]
-        c_id = ann['category_id']
-        x, y, w, h = ann['bbox']
-        gt_dict[filename].append({'class_id': c_id, 'bbox': [x, y, x + w, y + h]})
+    gt_dict = gt_index.to_records('class_id')
         
     # 2. 加载 YOLO 预测并建立 ID 映射
     with open(yolo_json_path, 'r', encoding='utf-8') as f:
@@ -0,0 +1,411 @@
+"""
+实验一 + 实验二 + 实验三 的单遍联合分析 (One-pass Cascade Analysis)
+exp1_cascade_metrics.py / exp2_arbitration_flow.py / exp3_decoupled_analysis.py 各自重新加载 GT、YOLO 拼图预测和 VLM JSONL，
+重新解析 pred 文本并重做 IoU 匹配；换一个级联阈值又要全部重跑一遍。这里改为：
+1. 只加载、解析一次，建立共享的 "匹配表" (每个提议框一行：置信度、先验类别、所属图像、与本图所有 GT 的 IoU 行向量；
+   每条 VLM 记录一行：对应的提议框、VLM 类别、meta_info 中的先验类别)；
+2. 对给定的一组级联阈值，只在匹配表上做掩码筛选和轻量的贪心匹配，分别得到：
+   - 实验一：Base YOLO vs. Cascade 的 P / R / F1；
+   - 实验二：VLM 仲裁流向 (降噪 / 矫正 / 共识)；
+   - 实验三：HQ / LQ 定位-语义解耦统计；
+3. 每个阈值输出一份合并报告，另外输出跨阈值的汇总表 (txt + json)。
+各项统计口径与原三个脚本逐一致 (包括各自的匹配方式、过滤条件和先验类别来源)。
+"""
+import os
+import json
+import numpy as np
+from collections import defaultdict
+from pathlib import Path
+from defect_vlm.utils.box_geometry import pairwise_iou
+from defect_vlm.utils.gt_index import load_gt_index
+from defect_vlm.utils.vlm_response_parser import parse_vlm_prediction
+
+# ================= 共享匹配表 =================
+def build_matched_table(gt_json_path, yolo_json_path, vlm_jsonl_path, min_conf=0.0):
+    """
+    一次性加载 GT / YOLO / VLM 并计算每个提议框与其所在图像全部 GT 的 IoU
+    :param min_conf: 低于该置信度的提议框直接丢弃 (取所有待分析阈值的最小值即可)
+    """
+    gt_index = load_gt_index(gt_json_path)
+    names_dict = gt_index.names_dict
+    name2id = gt_index.name2id
+
+    with open(yolo_json_path, 'r', encoding='utf-8') as f:
+        yolo_data = json.load(f)
+
+    origin_ids, filenames, confs, priors, boxes = [], [], [], [], []
+    for item in yolo_data:
+        if item["confidence"] < min_conf:
+            continue
+        x, y, w, h = item["bbox"]
+        origin_ids.append(item["id"])
+        filenames.append(os.path.basename(item["original_image_paths"][0]))
+        confs.append(item["confidence"])
+        priors.append(item["prior_label"].lower())
+        boxes.append([x, y, x + w, y + h])
+
+    n = len(origin_ids)
+    table = {
+        'names_dict': names_dict,
+        'name2id': name2id,
+        'num_classes': len(names_dict),
+        'origin_id': origin_ids,
+        'filename': filenames,
+        'conf': np.asarray(confs, dtype=np.float64),
+        'prior': priors,
+        # 先验类别不在 GT 类别表中时记为 -1 (实验一会跳过这些框)
+        'prior_cid': np.array([name2id.get(p, -1) for p in priors], dtype=np.int64),
+        'bbox': boxes,
+        'iou_rows': [None] * n,
+    }
+
+    # 按图像分组，一张图只算一次 (N_img, M_img) 的 IoU 矩阵
+    by_img = defaultdict(list)
+    for i, name in enumerate(filenames):
+        by_img[name].append(i)
+    gt_cache = {}
+    for name, idx in by_img.items():
+        gt_cls, gt_boxes = gt_index.get(name)
+        gt_cache[name] = (gt_cls, gt_boxes)
+        iou = pairwise_iou(np.asarray([boxes[i] for i in idx], dtype=np.float64), gt_boxes)
+        for row, i in enumerate(idx):
+            table['iou_rows'][i] = iou[row]
+    table['by_img'] = dict(by_img)
+    table['gt_cache'] = gt_cache
+    table['gt_index'] = gt_index
+
+    # 实验三的 "最佳 GT" 与阈值无关 (不排他)，这里一次算好
+    best_iou = np.zeros(n)
+    best_name = []
+    for i in range(n):
+        row = table['iou_rows'][i]
+        if row.size and row.max() > 0:
+            k = int(np.argmax(row))
+            best_iou[i] = row[k]
+            best_name.append(names_dict[int(gt_cache[filenames[i]][0][k])])
+        else:
+            best_name.append("background")
+    table['best_iou'] = best_iou
+    table['best_gt_name'] = best_name
+
+    # VLM 记录：保持文件中的顺序 (实验一的级联预测顺序依赖于此)，pred 只解析一次
+    oid2row = {oid: i for i, oid in enumerate(origin_ids)}
+    vlm_rows, vlm_cls, vlm_meta_prior = [], [], []
+    num_lines = 0
+    with open(vlm_jsonl_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if not line.strip(): continue
+            item = json.loads(line)
+            num_lines += 1
+            row = oid2row.get(item["meta_info"]["origin_id"])
+            if row is None:
+                continue
+            vlm_rows.append(row)
+            vlm_cls.append(parse_vlm_prediction(item.get("pred", "")))
+            vlm_meta_prior.append(item["meta_info"].get("prior_label", "").lower())
+    table['vlm_row'] = np.asarray(vlm_rows, dtype=np.int64)
+    table['vlm_cls'] = vlm_cls
+    table['vlm_meta_prior'] = vlm_meta_prior
+
+    print(f"📦 匹配表构建完成: {n} 个提议框 (conf >= {min_conf}), {len(by_img)} 张图像, "
+          f"{len(vlm_rows)}/{num_lines} 条 VLM 记录命中")
+    return table
+
+
+# ================= 实验一：P / R / F1 =================
+def _greedy_prf(pred_rows, pred_cids, table, iou_thresh):
+    """
+    与 exp1.evaluate_predictions 一致的贪心匹配 (按预测顺序，同类别、未被占用的 GT 中取 IoU 最大者)
+    :param pred_rows: 每个预测对应的提议框行号 (框来自匹配表，IoU 直接复用)
+    :param pred_cids: 每个预测的类别 id
+    """
+    num_classes = table['num_classes']
+    tp = np.zeros(num_classes)
+    fp = np.zeros(num_classes)
+    fn = np.zeros(num_classes)
+
+    preds_by_img = defaultdict(list)
+    for row, cid in zip(pred_rows, pred_cids):
+        preds_by_img[table['filename'][row]].append((row, cid))
+
+    gt_index = table['gt_index']
+    for name in set(preds_by_img.keys()).union(gt_index.file_names):
+        gt_cls = table['gt_cache'][name][0] if name in table['gt_cache'] else gt_index.get(name)[0]
+        available = np.ones(len(gt_cls), dtype=bool)
+        for row, cid in preds_by_img.get(name, []):
+            cand = np.where(available & (gt_cls == cid), table['iou_rows'][row], 0.0)
+            k = int(np.argmax(cand)) if cand.size else -1
+            if k >= 0 and cand[k] > 0 and cand[k] >= iou_thresh:
+                tp[cid] += 1
+                available[k] = False
+            else:
+                fp[cid] += 1
+        for c in gt_cls[available]:
+            fn[c] += 1
+
+    p = np.divide(tp, tp + fp, out=np.zeros_like(tp), where=(tp + fp) != 0)
+    r = np.divide(tp, tp + fn, out=np.zeros_like(tp), where=(tp + fn) != 0)
+    f1 = np.divide(2 * p * r, p + r, out=np.zeros_like(tp), where=(p + r) != 0)
+    return p, r, f1
+
+
+def eval_base(table, base_yolo_conf_thresh, iou_thresh):
+    mask = (table['conf'] >= base_yolo_conf_thresh) & (table['prior_cid'] >= 0)
+    rows = np.flatnonzero(mask)
+    return _greedy_prf(rows, table['prior_cid'][rows], table, iou_thresh)
+
+
+def eval_cascade(table, cascade_yolo_conf_thresh, iou_thresh):
+    name2id = table['name2id']
+    rows, cids = [], []
+    for row, vlm_cls in zip(table['vlm_row'], table['vlm_cls']):
+        # 与 exp1 一致：级联提议框需满足阈值且先验类别合法；VLM 判为背景或未知类别的框被丢弃
+        if table['conf'][row] < cascade_yolo_conf_thresh or table['prior_cid'][row] < 0:
+            continue
+        if vlm_cls != "background" and vlm_cls in name2id:
+            rows.append(row)
+            cids.append(name2id[vlm_cls])
+    return _greedy_prf(rows, cids, table, iou_thresh)
+
+
+# ================= 实验二：仲裁流向 =================
+def compute_flow_stats(table, cascade_yolo_conf_thresh, iou_thresh):
+    names_dict = table['names_dict']
+    conf = table['conf']
+
+    # 与 exp2 一致：每张图内按置信度降序，取 IoU 最大的 GT (不区分类别)，该 GT 未被占用且达到阈值才算命中
+    true_label = {}
+    for name, idx in table['by_img'].items():
+        idx = [i for i in idx if conf[i] >= cascade_yolo_conf_thresh]
+        idx.sort(key=lambda i: conf[i], reverse=True)
+        gt_cls = table['gt_cache'][name][0]
+        matched = set()
+        for i in idx:
+            row = table['iou_rows'][i]
+            k = int(np.argmax(row)) if row.size and row.max() > 0 else -1
+            best = row[k] if k >= 0 else 0
+            if best >= iou_thresh and k not in matched:
+                true_label[i] = names_dict[int(gt_cls[k])]
+                matched.add(k)
+            else:
+                true_label[i] = "background"
+
+    flow_stats = {
+        'total_analyzed': 0,
+        'yolo_fake_alarms': 0,
+        'agreement': {'total': 0, 'correct': 0, 'wrong': 0},
+        'noise_reduction': {'total': 0, 'true_background_killed': 0, 'real_defect_killed': 0},
+        'rectification': {'total': 0, 'vlm_correct': 0, 'yolo_was_correct': 0, 'both_wrong': 0}
+    }
+    for row, vlm_cls in zip(table['vlm_row'], table['vlm_cls']):
+        if row not in true_label:
+            continue
+        yolo_cls = table['prior'][row]
+        true_cls = true_label[row]
+
+        flow_stats['total_analyzed'] += 1
+        if true_cls == "background":
+            flow_stats['yolo_fake_alarms'] += 1
+
+        if vlm_cls == "background":
+            flow_stats['noise_reduction']['total'] += 1
+            if true_cls == "background":
+                flow_stats['noise_reduction']['true_background_killed'] += 1
+            else:
+                flow_stats['noise_reduction']['real_defect_killed'] += 1
+        elif vlm_cls == yolo_cls:
+            flow_stats['agreement']['total'] += 1
+            if vlm_cls == true_cls:
+                flow_stats['agreement']['correct'] += 1
+            else:
+                flow_stats['agreement']['wrong'] += 1
+        else:
+            flow_stats['rectification']['total'] += 1
+            if vlm_cls == true_cls:
+                flow_stats['rectification']['vlm_correct'] += 1
+            elif yolo_cls == true_cls:
+                flow_stats['rectification']['yolo_was_correct'] += 1
+            else:
+                flow_stats['rectification']['both_wrong'] += 1
+    return flow_stats
+
+
+# ================= 实验三：定位-语义解耦 =================
+def compute_decoupled_stats(table, cascade_yolo_conf_thresh, iou_thresh):
+    stats = {
+        'hq': {'total': 0, 'vlm_correct': 0, 'yolo_correct': 0},
+        'lq': {'total': 0, 'vlm_correct': 0}
+    }
+    for row, vlm_cls, yolo_prior in zip(table['vlm_row'], table['vlm_cls'], table['vlm_meta_prior']):
+        if table['conf'][row] < cascade_yolo_conf_thresh:
+            continue
+        # 与 exp3 一致：最佳 IoU 达到阈值为优质框 (HQ)，否则真实标签视为 background
+        is_hq = table['best_iou'][row] >= iou_thresh
+        true_cls = table['best_gt_name'][row] if is_hq else "background"
+
+        group = 'hq' if is_hq else 'lq'
+        stats[group]['total'] += 1
+        if vlm_cls == true_cls:
+            stats[group]['vlm_correct'] += 1
+        # exp3 的 YOLO 先验取自 VLM 记录的 meta_info
+        if is_hq and yolo_prior == true_cls:
+            stats['hq']['yolo_correct'] += 1
+    return stats
+
+
+# ================= 报告 =================
+def _pct(a, b):
+    return a / b * 100 if b > 0 else 0.0
+
+
+def write_threshold_report(out_file, names_dict, base_prf, casc_prf, flow_stats, stats,
+                           base_yolo_conf_thresh, cascade_yolo_conf_thresh, iou_thresh):
+    lines = []
+    log = lines.append
+    p_base, r_base, f1_base = base_prf
+    p_casc, r_casc, f1_casc = casc_prf
+
+    log("=" * 90)
+    log(f"📊 实验一：基线 YOLO (Conf>{base_yolo_conf_thresh}) vs. 级联 VLM (YOLO Conf>{cascade_yolo_conf_thresh} + VLM)")
+    log("=" * 90)
+    header = f"{'Category':<12} | {'Base Precision':<15} {'Base Recall':<15} {'Base F1':<10} | {'VLM Precision':<15} {'VLM Recall':<15} {'VLM F1':<10}"
+    log(header)
+    log("-" * len(header))
+    for c_id in range(len(names_dict)):
+        log(f"{names_dict[c_id]:<12} | {p_base[c_id]:<15.4f} {r_base[c_id]:<15.4f} {f1_base[c_id]:<10.4f} | "
+            f"{p_casc[c_id]:<15.4f} {r_casc[c_id]:<15.4f} {f1_casc[c_id]:<10.4f}")
+    log("-" * len(header))
+    log(f"{'Macro-Avg':<12} | {np.mean(p_base):<15.4f} {np.mean(r_base):<15.4f} {np.mean(f1_base):<10.4f} | "
+        f"{np.mean(p_casc):<15.4f} {np.mean(r_casc):<15.4f} {np.mean(f1_casc):<10.4f}")
+
+    nr, rect, agree = flow_stats['noise_reduction'], flow_stats['rectification'], flow_stats['agreement']
+    log("\n" + "=" * 90)
+    log(f"🌊 实验二：VLM 仲裁流向与降噪漏斗分析 (YOLO Conf > {cascade_yolo_conf_thresh})")
+    log("=" * 90)
+    log(f"📦 初始提议池: {flow_stats['total_analyzed']} 个框, 其中背景假阳性 {flow_stats['yolo_fake_alarms']} 个")
+    log(f"🛡️ 噪点过滤: {nr['total']} 次 | ✅ 拦截假阳性 {nr['true_background_killed']} "
+        f"({_pct(nr['true_background_killed'], nr['total']):.1f}%) | ❌ 误杀真实缺陷 {nr['real_defect_killed']}")
+    log(f"🔧 类别矫正: {rect['total']} 次 | ✅ 成功纠错 {rect['vlm_correct']} ({_pct(rect['vlm_correct'], rect['total']):.1f}%) "
+        f"| ❌ 帮倒忙 {rect['yolo_was_correct']} | ⚠️ 双方都错 {rect['both_wrong']}")
+    log(f"🤝 共识确认: {agree['total']} 次 | ✅ 确认正确 {agree['correct']} ({_pct(agree['correct'], agree['total']):.1f}%) "
+        f"| ❌ 共同踩坑 {agree['wrong']}")
+    if flow_stats['yolo_fake_alarms'] > 0:
+        log(f"💡 误报消除率 (FPRR): {_pct(nr['true_background_killed'], flow_stats['yolo_fake_alarms']):.1f}%")
+
+    hq, lq = stats['hq'], stats['lq']
+    log("\n" + "=" * 90)
+    log(f"🎯 实验三：定位-语义解耦分析 (YOLO 提议阈值={cascade_yolo_conf_thresh}, 优质框 IoU阈值={iou_thresh})")
+    log("=" * 90)
+    log(f"✅ 优质提议框 (IoU >= {iou_thresh}): {hq['total']} 个 | 🧠 VLM 准确率 {_pct(hq['vlm_correct'], hq['total']):.2f}% "
+        f"(猜对 {hq['vlm_correct']} 个) | 🤖 YOLO 先验准确率 {_pct(hq['yolo_correct'], hq['total']):.2f}%")
+    log(f"❌ 劣质提议框 (IoU < {iou_thresh}): {lq['total']} 个 | 🧠 VLM 排伪/纠偏准确率 {_pct(lq['vlm_correct'], lq['total']):.2f}% "
+        f"(成功过滤/判断 {lq['vlm_correct']} 个)")
+    log("=" * 90)
+
+    text = "\n".join(lines)
+    print(text)
+    with open(out_file, 'w', encoding='utf-8') as f:
+        f.write(text + "\n")
+    print(f"💾 合并报告已保存至: {out_file}")
+
+
+# ================= 主控流 =================
+def main(gt_json_path, yolo_json_path, vlm_jsonl_path, output_dir,
+         cascade_thresholds=(0.1,),
+         base_yolo_conf_thresh=0.25,
+         iou_thresh=0.45):
+    """
+    单遍联合分析：匹配表只建一次，依次对每个级联阈值计算实验一/二/三
+    :param cascade_thresholds: 待分析的级联 YOLO 置信度阈值列表
+    """
+    out_path = Path(output_dir)
+    out_path.mkdir(parents=True, exist_ok=True)
+    cascade_thresholds = sorted(set(cascade_thresholds))
+
+    # 基线阈值也可能低于级联阈值，匹配表需要覆盖两者
+    table = build_matched_table(gt_json_path, yolo_json_path, vlm_jsonl_path,
+                                min_conf=min(cascade_thresholds + [base_yolo_conf_thresh]))
+    names_dict = table['names_dict']
+
+    # 基线与级联阈值无关，只算一次
+    base_prf = eval_base(table, base_yolo_conf_thresh, iou_thresh)
+
+    summary = []
+    for th in cascade_thresholds:
+        print("\n" + "#" * 90)
+        print(f"🚀 级联阈值: {th}")
+        casc_prf = eval_cascade(table, th, iou_thresh)
+        flow_stats = compute_flow_stats(table, th, iou_thresh)
+        stats = compute_decoupled_stats(table, th, iou_thresh)
+
+        out_file = out_path / f"experiment123_onepass_base{base_yolo_conf_thresh}_casc{th}.txt"
+        write_threshold_report(out_file, names_dict, base_prf, casc_prf, flow_stats, stats,
+                               base_yolo_conf_thresh, th, iou_thresh)
+
+        nr = flow_stats['noise_reduction']
+        summary.append({
+            'cascade_thresh': th,
+            'macro_p': float(np.mean(casc_prf[0])),
+            'macro_r': float(np.mean(casc_prf[1])),
+            'macro_f1': float(np.mean(casc_prf[2])),
+            'proposals': flow_stats['total_analyzed'],
+            'fake_alarms': flow_stats['yolo_fake_alarms'],
+            'fprr': _pct(nr['true_background_killed'], flow_stats['yolo_fake_alarms']),
+            'hq_total': stats['hq']['total'],
+            'hq_vlm_acc': _pct(stats['hq']['vlm_correct'], stats['hq']['total']),
+            'lq_total': stats['lq']['total'],
+            'lq_vlm_acc': _pct(stats['lq']['vlm_correct'], stats['lq']['total']),
+            'flow_stats': flow_stats,
+            'decoupled_stats': stats,
+        })
+
+    # 跨阈值汇总
+    lines = [
+        "=" * 100,
+        f"📈 级联阈值扫描汇总 (Base YOLO Conf>{base_yolo_conf_thresh}: "
+        f"P={np.mean(base_prf[0]):.4f} R={np.mean(base_prf[1]):.4f} F1={np.mean(base_prf[2]):.4f})",
+        "=" * 100,
+        f"{'Casc Th':<8} | {'Macro P':<8} {'Macro R':<8} {'Macro F1':<9} | {'Props':<7} {'FakeAl':<7} {'FPRR%':<7} | "
+        f"{'HQ':<6} {'HQ Acc%':<8} {'LQ':<6} {'LQ Acc%':<8}",
+        "-" * 100,
+    ]
+    for s in summary:
+        lines.append(f"{s['cascade_thresh']:<8} | {s['macro_p']:<8.4f} {s['macro_r']:<8.4f} {s['macro_f1']:<9.4f} | "
+                     f"{s['proposals']:<7} {s['fake_alarms']:<7} {s['fprr']:<7.1f} | "
+                     f"{s['hq_total']:<6} {s['hq_vlm_acc']:<8.2f} {s['lq_total']:<6} {s['lq_vlm_acc']:<8.2f}")
+    lines.append("=" * 100)
+    text = "\n".join(lines)
+    print("\n" + text)
+
+    summary_txt = out_path / f"experiment123_onepass_sweep_base{base_yolo_conf_thresh}.txt"
+    with open(summary_txt, 'w', encoding='utf-8') as f:
+        f.write(text + "\n")
+    with open(summary_txt.with_suffix('.json'), 'w', encoding='utf-8') as f:
+        json.dump({'base_yolo_conf_thresh': base_yolo_conf_thresh, 'iou_thresh': iou_thresh,
+                   'base_macro': [float(np.mean(m)) for m in base_prf], 'sweep': summary},
+                  f, ensure_ascii=False, indent=2)
+    print(f"💾 扫描汇总已保存至: {summary_txt} (及同名 .json)")
+    return summary
+
+
+if __name__ == "__main__":
+    # ================= 配置区 =================
+    GT_JSON_PATH = "/data/ZS/defect_dataset/0_defect_dataset_raw/paint_stripe/labels/val.json"
+    YOLO_JSON_PATH = "/data/ZS/defect_dataset/11_composite_yolo_preds/stripe_phase012/labels/val_0p1.json"
+    VLM_JSONL_PATH = "/data/ZS/defect_dataset/13_vlm_response/stripe_phase012/v2_qwen3_4b_LM.jsonl"
+    OUTPUT_DIRECTORY = "/data/ZS/defect-vlm/output/figures/"
+
+    CASCADE_THRESHOLDS = [0.1, 0.15, 0.2, 0.25]   # 级联系统底层阈值 (不能低于生成 YOLO_JSON 时的阈值)
+    BASE_YOLO_CONF_THRESH = 0.25                  # 基线 YOLO 部署阈值
+    IOU_THRESH = 0.45                             # 与验证指标保持一致
+    # ==========================================
+
+    main(
+        gt_json_path=GT_JSON_PATH,
+        yolo_json_path=YOLO_JSON_PATH,
+        vlm_jsonl_path=VLM_JSONL_PATH,
+        output_dir=OUTPUT_DIRECTORY,
+        cascade_thresholds=CASCADE_THRESHOLDS,
+        base_yolo_conf_thresh=BASE_YOLO_CONF_THRESH,
+        iou_thresh=IOU_THRESH
+    )
@@ -0,0 +1,88 @@
+"""
+把代表框的 VLM 结论回填给簇内所有成员 (dedup_proposals.py 的后半步)
+VLM 只对每簇的代表框做了推理，这里按 meta_info.cluster_id 找到簇成员，为每个成员复制一份 VLM 响应：
+    - pred / pred_token_probs / images / origin_id 沿用代表框的 (同一区域、同一张原图)
+    - bbox (COCO xywh) / confidence / prior_label / model_source 换成成员自己的
+    - meta_info 额外记录 cluster_id、cluster_member (0 为代表框) 和 original_image
+输出格式与 VLM 推理结果完全一致，可以直接交给 compute_vlm_metric.py / extract_vlm_data.py。
+没有 cluster_id 的记录 (未经聚类) 原样写出。
+"""
+import copy
+import json
+from pathlib import Path
+
+
+def fan_out_verdicts(vlm_jsonl, cluster_json, output_jsonl):
+    print(f"🔗 正在加载簇成员映射: {cluster_json}")
+    with open(cluster_json, 'r', encoding='utf-8') as f:
+        clusters = json.load(f)["clusters"]
+
+    output_jsonl = Path(output_jsonl)
+    output_jsonl.parent.mkdir(parents=True, exist_ok=True)
+
+    stats = {"vlm_records": 0, "passthrough": 0, "unknown_cluster": 0, "written": 0}
+    seen = set()
+    print(f"🧠 正在回填 VLM 结论: {vlm_jsonl}")
+    with open(vlm_jsonl, 'r', encoding='utf-8') as fin, \
+         open(output_jsonl, 'w', encoding='utf-8') as fout:
+        for line in fin:
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            stats["vlm_records"] += 1
+            cluster_id = item.get("meta_info", {}).get("cluster_id")
+            if cluster_id is None:
+                fout.write(json.dumps(item, ensure_ascii=False) + '\n')
+                stats["passthrough"] += 1
+                stats["written"] += 1
+                continue
+            cluster = clusters.get(cluster_id)
+            if cluster is None:
+                stats["unknown_cluster"] += 1
+                if stats["unknown_cluster"] <= 5:
+                    print(f"⚠️ 映射中找不到簇 {cluster_id}，跳过。")
+                continue
+            seen.add(cluster_id)
+
+            for k, member in enumerate(cluster["members"]):
+                x1, y1, x2, y2 = member['bbox']
+                out = copy.deepcopy(item) if k else item
+                meta = out["meta_info"]
+                meta.update({
+                    "bbox": [x1, y1, x2 - x1, y2 - y1],     # 与拼图元数据一致，使用 COCO xywh
+                    "prior_label": member['class_name'],
+                    "confidence": member['confidence'],
+                    "model_source": member['model_source'],
+                    "cluster_member": k,
+                    "original_image": cluster["image"],
+                })
+                if k:
+                    out["id"] = f"{item['id']}_m{k}"
+                fout.write(json.dumps(out, ensure_ascii=False) + '\n')
+                stats["written"] += 1
+
+    missing = len(clusters) - len(seen)
+    print("\n" + "=" * 50)
+    print("🧩 簇结论回填报告")
+    print("=" * 50)
+    print(f"📥 VLM 响应条数     : {stats['vlm_records']} (未聚类直接透传 {stats['passthrough']} 条)")
+    print(f"📦 已回填簇数       : {len(seen)} / {len(clusters)}")
+    if missing:
+        print(f"⚠️ 没有 VLM 响应的簇 : {missing} (抠图失败或推理中断)")
+    if stats["unknown_cluster"]:
+        print(f"⚠️ 映射中不存在的簇 : {stats['unknown_cluster']}")
+    print(f"📤 回填后输出条数   : {stats['written']}")
+    print("=" * 50)
+    print(f"✅ 回填结果已保存至: {output_jsonl}")
+    return stats
+
+
+if __name__ == '__main__':
+    # 1. 输入：代表框的 VLM 推理结果 + dedup_proposals.py 生成的簇映射
+    VLM_JSONL = "/data/ZS/defect_dataset/13_vlm_response/stripe_phase012/v2_qwen3_4b_LM_val_0p01_dedup.jsonl"
+    CLUSTER_JSON = "/data/ZS/defect_dataset/9_yolo_preds/pipeline_val/nms_fusion_conf_0p01_clusters.json"
+
+    # 2. 输出：与 VLM 推理结果格式一致，交给 compute_vlm_metric.py
+    OUTPUT_JSONL = "/data/ZS/defect_dataset/13_vlm_response/stripe_phase012/v2_qwen3_4b_LM_val_0p01_fanout.jsonl"
+
+    fan_out_verdicts(VLM_JSONL, CLUSTER_JSON, OUTPUT_JSONL)
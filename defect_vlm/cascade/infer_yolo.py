@@ -24,6 +24,7 @@ import torch
 import numpy as np
 from ultralytics import YOLO
 from tqdm import tqdm
+from defect_vlm.utils.tracing import span, count, observe, add_trace_args, setup_tracing
 
 def run_multistream_inference(model_path, input_dir, output_json, conf_thres=0.1):
     """
@@ -42,7 +43,8 @@ def run_multistream_inference(model_path, input_dir, output_json, conf_thres=0.1
     print(f"📦 加载权重: {model_path}")
     
     # 1. 加载模型
-    model = YOLO(model_path)
+    with span("infer_yolo.load_model", model=str(model_path)):
+        model = YOLO(model_path)
     
     # 获取类别映射字典 (例如 {0: 'breakage', 1: 'inclusion', ...})
     names_dict = model.names 
@@ -63,18 +65,21 @@ def run_multistream_inference(model_path, input_dir, output_json, conf_thres=0.1
     # 4. 遍历所有图片进行推理
     for filename in tqdm(image_filenames, desc="推理进度"):
         ims_list = []
+        count("infer_yolo.images")
         
         # 依次读取各个视角的光照图像
-        for val_dir in val_dirs:
-            img_path = input_dir / val_dir / "images" / filename
-            if not img_path.exists():
-                print(f"\n⚠️ 警告: 缺失图像分支 {img_path}")
-                continue
-                
-            # 读取灰度图 (保持与你之前 base.py 中 load_image 的逻辑一致)
-            img = cv2.imread(str(img_path), cv2.IMREAD_GRAYSCALE)
-            if img is not None:
-                ims_list.append(img)
+        with span("infer_yolo.read_streams"):
+            for val_dir in val_dirs:
+                img_path = input_dir / val_dir / "images" / filename
+                if not img_path.exists():
+                    print(f"\n⚠️ 警告: 缺失图像分支 {img_path}")
+                    count("infer_yolo.missing_streams")
+                    continue
+                    
+                # 读取灰度图 (保持与你之前 base.py 中 load_image 的逻辑一致)
+                img = cv2.imread(str(img_path), cv2.IMREAD_GRAYSCALE)
+                if img is not None:
+                    ims_list.append(img)
         
         if not ims_list:
             results_dict[filename] = []
@@ -87,37 +92,41 @@ def run_multistream_inference(model_path, input_dir, output_json, conf_thres=0.1
         # 5. 执行推理
         # 直接传入 Numpy 数组，YOLO 内部会调用我们之前修复好的 LetterBox 补边，再转 Tensor
         # 这里关闭 verbose 防止进度条被刷屏，设置 imgsz=300 保持与训练一致
-        preds = model.predict(source=stacked_img, imgsz=300, conf=conf_thres, verbose=False)
+        with span("infer_yolo.predict"):
+            preds = model.predict(source=stacked_img, imgsz=300, conf=conf_thres, verbose=False)
         
         # 6. 解析结果
         img_results = []
-        for r in preds:
-            boxes = r.boxes
-            if boxes is None or len(boxes) == 0:
-                continue
+        with span("infer_yolo.postprocess"):
+            for r in preds:
+                boxes = r.boxes
+                if boxes is None or len(boxes) == 0:
+                    continue
                 
-            # 获取坐标、置信度、类别
-            xyxys = boxes.xyxy.cpu().numpy()  # [N, 4] -> [x_min, y_min, x_max, y_max]
-            confs = boxes.conf.cpu().numpy()  # [N]
-            clss = boxes.cls.cpu().numpy()    # [N]
+                # 获取坐标、置信度、类别
+                xyxys = boxes.xyxy.cpu().numpy()  # [N, 4] -> [x_min, y_min, x_max, y_max]
+                confs = boxes.conf.cpu().numpy()  # [N]
+                clss = boxes.cls.cpu().numpy()    # [N]
             
-            for box, conf, cls_id in zip(xyxys, confs, clss):
-                img_results.append({
-                    "class_id": int(cls_id),
-                    "class_name": names_dict[int(cls_id)],
-                    "bbox": [float(val) for val in box],  # 转换为普通 float 以便 json 序列化
-                    "confidence": float(conf),
-                    "model_source": model_source
-                })
+                for box, conf, cls_id in zip(xyxys, confs, clss):
+                    img_results.append({
+                        "class_id": int(cls_id),
+                        "class_name": names_dict[int(cls_id)],
+                        "bbox": [float(val) for val in box],  # 转换为普通 float 以便 json 序列化
+                        "confidence": float(conf),
+                        "model_source": model_source
+                    })
                 
         # 存入结果字典，即使为空也要保存一个 []
         results_dict[filename] = img_results
+        count("infer_yolo.boxes", len(img_results))
+        observe("infer_yolo.boxes_per_image", len(img_results))
         
     # 7. 导出为 JSON 文件
     output_path = Path(output_json)
     output_path.parent.mkdir(parents=True, exist_ok=True)
     
-    with open(output_path, 'w', encoding='utf-8') as f:
+    with span("infer_yolo.save_json"), open(output_path, 'w', encoding='utf-8') as f:
         json.dump(results_dict, f, indent=2, ensure_ascii=False)
         
     print(f"✅ 推理完成！结果已成功保存至: {output_path}")
@@ -129,7 +138,9 @@ def main():
     parser.add_argument('--input_dir', type=str, required=True, help='待推理数据集所在文件夹')
     parser.add_argument('--output_json', type=str, required=True, help='输出json路径')
     parser.add_argument('--conf_thres', type=float, required=True, help='置信度阈值')
+    add_trace_args(parser)
     args = parser.parse_args()
+    setup_tracing(args.trace, args.trace_chrome)
 
     run_multistream_inference(
         model_path = args.model_path,       
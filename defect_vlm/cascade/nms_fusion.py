@@ -10,6 +10,7 @@ import json
 import torch
 import torchvision
 from pathlib import Path
+from defect_vlm.utils.tracing import span, count
 
 def fusion_nms(json_col3, json_row3, output_json, iou_thres=0.45, conf_thres=0.0):
     """
@@ -22,10 +23,11 @@ def fusion_nms(json_col3, json_row3, output_json, iou_thres=0.45, conf_thres=0.0
     """
     # 1. 加载两个 JSON 文件
     print(f"📂 正在加载预测结果...\n -> {json_col3}\n -> {json_row3}")
-    with open(json_col3, 'r', encoding='utf-8') as f:
-        col3_data = json.load(f)
-    with open(json_row3, 'r', encoding='utf-8') as f:
-        row3_data = json.load(f)
+    with span("nms_fusion.load_json"):
+        with open(json_col3, 'r', encoding='utf-8') as f:
+            col3_data = json.load(f)
+        with open(json_row3, 'r', encoding='utf-8') as f:
+            row3_data = json.load(f)
         
     # 获取所有的图片名（取并集，防止某个模型漏掉某些图片）
     all_images = set(col3_data.keys()).union(set(row3_data.keys()))
@@ -71,11 +73,12 @@ def fusion_nms(json_col3, json_row3, output_json, iou_thres=0.45, conf_thres=0.0
                 continue
                 
             # 提取坐标和置信度，转换为 PyTorch Tensor (借助 torchvision 的高性能 nms 算子)
-            boxes = torch.tensor([p['bbox'] for p in preds], dtype=torch.float32)
-            scores = torch.tensor([p['confidence'] for p in preds], dtype=torch.float32)
+            with span("nms_fusion.nms", n=len(preds)):
+                boxes = torch.tensor([p['bbox'] for p in preds], dtype=torch.float32)
+                scores = torch.tensor([p['confidence'] for p in preds], dtype=torch.float32)
             
-            # 调用 NMS: 返回需要保留的框的索引
-            keep_indices = torchvision.ops.nms(boxes, scores, iou_thres)
+                # 调用 NMS: 返回需要保留的框的索引
+                keep_indices = torchvision.ops.nms(boxes, scores, iou_thres)
             
             # 把保留下来的框存入结果
             for idx in keep_indices.tolist():
@@ -83,13 +86,16 @@ def fusion_nms(json_col3, json_row3, output_json, iou_thres=0.45, conf_thres=0.0
                 
         fusion_data[img_name] = fused_img_preds
         total_fused_boxes += len(fused_img_preds)
+        count("nms_fusion.images")
 
     # 5. 保存融合结果
     output_path = Path(output_json)
     output_path.parent.mkdir(parents=True, exist_ok=True)
     
-    with open(output_path, 'w', encoding='utf-8') as f:
+    with span("nms_fusion.save_json"), open(output_path, 'w', encoding='utf-8') as f:
         json.dump(fusion_data, f, indent=2, ensure_ascii=False)
+    count("nms_fusion.boxes_in", total_original_boxes)
+    count("nms_fusion.boxes_out", total_fused_boxes)
         
     print("-" * 50)
     print("✅ 过滤与 NMS 融合完成！")
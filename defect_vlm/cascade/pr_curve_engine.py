@@ -0,0 +1,366 @@
+"""
+多阈值 P-R 查询引擎 (单次排序，任意查询)
+`compute_th_PR.py`、`compute_fusion_metric_on_fix_th.py`、`compute_vlm_metric_wo_probs_on_fix_th.py`
+每换一个阈值 / 一个文件就要重新做一遍匹配和指标计算。这里把匹配 (IoU >= 0.5，类别一致，贪心一对一)
+和全局排序、累加 TP/FP 只做一次，存成曲线数组 (.npz)，之后的查询全部用 searchsorted 完成：
+- conf      -> (P, R, F1, 留存框数)
+- recall    -> 所需 conf 阈值 (首次达到该召回率的点，用于确定 th_l)
+- precision -> 所需 conf 阈值 (能维持该精度的最低置信度，用于确定 th_h)
+全类别 (overall) 和单类别都支持。曲线文件带有源文件签名，输入没变时直接从磁盘加载。
+
+输入：COCO 格式 GT + 融合后的 YOLO 预测 json (或 VLM JSONL + 中间映射 json)
+输出：曲线缓存 (.npz) + 阈值分析报告 (txt)
+"""
+import os
+import json
+import numpy as np
+from pathlib import Path
+from defect_vlm.utils.gt_index import load_gt_index
+from defect_vlm.utils.tracing import span, count
+from defect_vlm.utils.vlm_response_parser import parse_vlm_prediction
+
+CURVE_VERSION = 1
+
+
+# ================= 数据加载 =================
+def load_gt_dict(gt_json):
+    """解析 COCO GT (走 GT 索引缓存)，返回 ({file_name: [[cat_id, x1, y1, x2, y2], ...]}, {cat_id: name})"""
+    gt_index = load_gt_index(gt_json)
+    return gt_index.to_gt_dict(), gt_index.names_dict
+
+
+def load_fusion_preds(pred_json):
+    """加载融合后的预测结果 {file_name: [{'bbox': xyxy, 'confidence', 'class_id'}, ...]}"""
+    with open(pred_json, 'r', encoding='utf-8') as f:
+        pred_dict = json.load(f)
+    pred_dict.pop('config', None)
+    return pred_dict
+
+
+def load_vlm_preds(vlm_jsonl, inter_json, names_dict):
+    """
+    加载 VLM 级联结果，VLM 判为背景的候选框被抛弃，其余框使用 VLM 的类别和前级 YOLO 的置信度
+    返回格式与 load_fusion_preds 一致
+    """
+    name2id = {name: cat_id for cat_id, name in names_dict.items()}
+    with open(inter_json, 'r', encoding='utf-8') as f:
+        id2filename = {item["id"]: Path(item["original_image_paths"][0]).name for item in json.load(f)}
+
+    pred_dict = {}
+    with open(vlm_jsonl, 'r', encoding='utf-8') as f:
+        for line in f:
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            meta = item["meta_info"]
+            filename = id2filename.get(meta["origin_id"])
+            if filename is None:
+                continue
+            pred_cls_name = parse_vlm_prediction(item.get("pred", ""))
+            if pred_cls_name not in name2id:
+                continue
+            x, y, w, h = meta["bbox"]
+            pred_dict.setdefault(filename, []).append({
+                'bbox': [x, y, x + w, y + h],
+                'confidence': meta["confidence"],
+                'class_id': name2id[pred_cls_name]
+            })
+    return pred_dict
+
+
+# ================= 匹配 =================
+def box_iou_np(boxes1, boxes2):
+    """(N, 4) x (M, 4) 的 xyxy IoU 矩阵"""
+    lt = np.maximum(boxes1[:, None, :2], boxes2[None, :, :2])
+    rb = np.minimum(boxes1[:, None, 2:], boxes2[None, :, 2:])
+    inter = np.clip(rb - lt, 0, None).prod(axis=2)
+    area1 = (boxes1[:, 2] - boxes1[:, 0]) * (boxes1[:, 3] - boxes1[:, 1])
+    area2 = (boxes2[:, 2] - boxes2[:, 0]) * (boxes2[:, 3] - boxes2[:, 1])
+    return inter / (area1[:, None] + area2[None, :] - inter + 1e-7)
+
+
+def match_image(gts, preds, iou_thres=0.5, max_det=300):
+    """
+    与 compute_th_PR.py 完全一致的单图匹配：按置信度降序保留前 max_det 个框，
+    类别一致且 IoU >= iou_thres 的候选按 IoU 降序贪心一对一匹配。
+    返回 (conf, cls, tp)
+    """
+    if len(preds) == 0:
+        return np.empty(0), np.empty(0, dtype=np.int64), np.empty(0, dtype=bool)
+
+    dets = np.array([[*p['bbox'], p['confidence'], p['class_id']] for p in preds], dtype=np.float64)
+    dets = dets[np.argsort(-dets[:, 4], kind='stable')][:max_det]
+    tp = np.zeros(len(dets), dtype=bool)
+
+    if len(gts) > 0:
+        labels = np.asarray(gts, dtype=np.float64)
+        ious = box_iou_np(labels[:, 1:], dets[:, :4])
+        correct_class = labels[:, 0:1] == dets[None, :, 5]
+        li, di = np.nonzero((ious >= iou_thres) & correct_class)
+        if len(li) > 0:
+            order = np.argsort(-ious[li, di], kind='stable')
+            matched_labels, matched_dets = set(), set()
+            for k in order:
+                l_idx, d_idx = int(li[k]), int(di[k])
+                if l_idx not in matched_labels and d_idx not in matched_dets:
+                    matched_labels.add(l_idx)
+                    matched_dets.add(d_idx)
+                    tp[d_idx] = True
+
+    return dets[:, 4], dets[:, 5].astype(np.int64), tp
+
+
+# ================= 曲线 =================
+class _Curve:
+    """单条 (某一类别或全类别) 按置信度降序的累计曲线"""
+    def __init__(self, conf, tp, n_gt):
+        self.conf = conf
+        self.n_gt = int(n_gt)
+        self.tpc = np.cumsum(tp)
+        n = np.arange(1, len(conf) + 1)
+        self.recall = self.tpc / (self.n_gt + 1e-16)
+        self.precision = self.tpc / n
+        # 后缀最大精度，单调不增，用于 precision -> conf 的二分查询
+        self.prec_suffix_max = np.maximum.accumulate(self.precision[::-1])[::-1] if len(conf) else self.precision
+        self._neg_conf = -conf
+
+    def at_conf(self, th):
+        n = int(np.searchsorted(self._neg_conf, -th, side='right'))
+        if n == 0:
+            return 1.0, 0.0, 0.0, 0
+        p, r = float(self.precision[n - 1]), float(self.recall[n - 1])
+        return p, r, 2 * p * r / (p + r + 1e-16), n
+
+    def at_recall(self, target):
+        idx = int(np.searchsorted(self.recall, target, side='left'))
+        if idx >= len(self.recall):
+            # 达不到该召回率，取最低阈值
+            if len(self.recall) == 0:
+                return 0.0, 0.0
+            return 0.0, float(self.precision[-1])
+        return float(self.conf[idx]), float(self.precision[idx])
+
+    def at_precision(self, target):
+        count = int(np.searchsorted(-self.prec_suffix_max, -target, side='right'))
+        if count == 0:
+            return 1.0, 0.0
+        idx = count - 1
+        return float(self.conf[idx]), float(self.recall[idx])
+
+
+class PRCurveEngine:
+    """
+    保存全局排序后的 (conf, cls, tp) 和每个类别的 GT 数量，
+    overall 以及每个类别的曲线在加载时由一次排序得到。
+    """
+    def __init__(self, conf, cls, tp, gt_counts, names_dict, sources=None):
+        order = np.argsort(-conf, kind='stable')
+        self.conf = np.asarray(conf, dtype=np.float64)[order]
+        self.cls = np.asarray(cls, dtype=np.int64)[order]
+        self.tp = np.asarray(tp, dtype=bool)[order]
+        self.gt_counts = {int(k): int(v) for k, v in gt_counts.items()}
+        self.names_dict = {int(k): v for k, v in names_dict.items()}
+        self.sources = sources or {}
+
+        self.overall = _Curve(self.conf, self.tp, sum(self.gt_counts.values()))
+        self.per_class = {}
+        for c in sorted(self.names_dict):
+            mask = self.cls == c
+            self.per_class[c] = _Curve(self.conf[mask], self.tp[mask], self.gt_counts.get(c, 0))
+
+    # ---------- 构建 ----------
+    @classmethod
+    def from_dicts(cls, pred_dict, gt_dict, names_dict, iou_thres=0.5, max_det=300, sources=None):
+        confs, clss, tps = [], [], []
+        gt_counts = {c: 0 for c in names_dict}
+        for gts in gt_dict.values():
+            for g in gts:
+                gt_counts[g[0]] = gt_counts.get(g[0], 0) + 1
+
+        for filename in set(gt_dict.keys()).union(pred_dict.keys()):
+            conf, c, tp = match_image(gt_dict.get(filename, []), pred_dict.get(filename, []), iou_thres, max_det)
+            if len(conf):
+                confs.append(conf)
+                clss.append(c)
+                tps.append(tp)
+
+        if confs:
+            conf, c, tp = np.concatenate(confs), np.concatenate(clss), np.concatenate(tps)
+        else:
+            conf, c, tp = np.empty(0), np.empty(0, dtype=np.int64), np.empty(0, dtype=bool)
+        return cls(conf, c, tp, gt_counts, names_dict, sources)
+
+    # ---------- 持久化 ----------
+    def save(self, path):
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        meta = {
+            "version": CURVE_VERSION,
+            "gt_counts": self.gt_counts,
+            "names_dict": self.names_dict,
+            "sources": self.sources
+        }
+        with open(path, 'wb') as f:
+            np.savez(f, conf=self.conf, cls=self.cls, tp=self.tp, meta=np.array(json.dumps(meta, ensure_ascii=False)))
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            meta = json.loads(str(data["meta"]))
+            if meta.get("version") != CURVE_VERSION:
+                raise ValueError(f"曲线文件 {path} 版本不一致: {meta.get('version')} != {CURVE_VERSION}")
+            return cls(data["conf"], data["cls"], data["tp"], meta["gt_counts"], meta["names_dict"], meta["sources"])
+
+    # ---------- 查询 ----------
+    def _curve(self, class_id=None):
+        return self.overall if class_id is None else self.per_class[class_id]
+
+    def at_conf(self, th, class_id=None):
+        """conf -> (P, R, F1, 留存框数)"""
+        return self._curve(class_id).at_conf(th)
+
+    def at_recall(self, target, class_id=None):
+        """recall -> (conf, P)"""
+        return self._curve(class_id).at_recall(target)
+
+    def at_precision(self, target, class_id=None):
+        """precision -> (conf, R)"""
+        return self._curve(class_id).at_precision(target)
+
+    def macro_at_conf(self, th):
+        """对 GT 中出现过的类别做宏平均，返回 (P, R, F1)"""
+        rows = [self.at_conf(th, c) for c in self.per_class if self.gt_counts.get(c, 0) > 0]
+        if not rows:
+            return 0.0, 0.0, 0.0
+        arr = np.array([r[:3] for r in rows])
+        return tuple(float(v) for v in arr.mean(axis=0))
+
+
+# ================= 缓存 =================
+def file_signature(path):
+    st = os.stat(path)
+    return [str(Path(path).resolve()), st.st_size, st.st_mtime_ns]
+
+
+def build_or_load_curve(pred_json, gt_json, cache_path, inter_json=None, iou_thres=0.5, max_det=300):
+    """
+    输入文件签名与缓存一致时直接加载曲线，否则重新匹配并覆盖缓存。
+    提供 inter_json 时 pred_json 被视为 VLM 的 JSONL 结果。
+    """
+    cache_path = Path(cache_path)
+    sources = {
+        "pred": file_signature(pred_json),
+        "gt": file_signature(gt_json),
+        "inter": file_signature(inter_json) if inter_json else None,
+        "iou_thres": iou_thres,
+        "max_det": max_det
+    }
+    if cache_path.exists():
+        try:
+            engine = PRCurveEngine.load(cache_path)
+            if engine.sources == sources:
+                print(f"⚡ 命中曲线缓存: {cache_path}")
+                count("pr_curve.cache_hit")
+                return engine
+        except (ValueError, KeyError, OSError) as e:
+            print(f"⚠️ 曲线缓存无法使用，将重新计算: {e}")
+
+    print(f"📖 正在加载真实标签: {gt_json}")
+    with span("metric.load_gt"):
+        gt_dict, names_dict = load_gt_dict(gt_json)
+    print(f"📖 正在加载预测结果: {pred_json}")
+    with span("metric.load_pred"):
+        if inter_json:
+            pred_dict = load_vlm_preds(pred_json, inter_json, names_dict)
+        else:
+            pred_dict = load_fusion_preds(pred_json)
+
+    print("⚙️ 正在计算全局 P-R 曲线...")
+    with span("metric.match", images=len(gt_dict)):
+        engine = PRCurveEngine.from_dicts(pred_dict, gt_dict, names_dict, iou_thres, max_det, sources)
+    with span("pr_curve.save"):
+        engine.save(cache_path)
+    print(f"💾 曲线已缓存至: {cache_path}")
+    return engine
+
+
+# ================= 报告 =================
+def format_report(engine, target_thresholds, target_recalls, target_precisions, per_class=True):
+    """与 compute_th_PR.py 相同的三类查询，额外给出 F1 和逐类别结果"""
+    scopes = [(None, "all")]
+    if per_class:
+        scopes += [(c, name) for c, name in engine.names_dict.items()]
+    total_preds = len(engine.conf)
+
+    lines = []
+    lines.append("=" * 75)
+    lines.append("📊 多阈值 P-R 查询报告")
+    lines.append("=" * 75)
+    lines.append(f"数据集总真实框 (GT) 数量: {engine.overall.n_gt}")
+    lines.append(f"模型总预测框 (Pred) 数量: {total_preds}")
+    lines.append("-" * 75)
+
+    lines.append("【任务 1: 给定 Conf 阈值 -> 查询 Precision, Recall, F1 & 留存框数量】")
+    lines.append(f"{'Class':>12} | {'Target Conf':>12} | {'Precision':>10} | {'Recall':>10} | {'F1':>10} | {'留存框':>8} | {'过滤框':>8}")
+    for c, name in scopes:
+        n_all = total_preds if c is None else len(engine.per_class[c].conf)
+        for th in target_thresholds:
+            p, r, f1, kept = engine.at_conf(th, c)
+            lines.append(f"{name:>12} | {th:>12.4f} | {p:>10.4f} | {r:>10.4f} | {f1:>10.4f} | {kept:>8} | {n_all - kept:>8}")
+    lines.append("-" * 75)
+
+    lines.append("【任务 2: 给定目标 Recall -> 查询 阈值 & Precision】")
+    lines.append(f"{'Class':>12} | {'Target Recall':>13} | {'Req. Conf(th_l)':>15} | {'Precision':>10}")
+    for c, name in scopes:
+        for tr in target_recalls:
+            th, p = engine.at_recall(tr, c)
+            lines.append(f"{name:>12} | {tr:>13.4f} | {th:>15.4f} | {p:>10.4f}")
+    lines.append("-" * 75)
+
+    lines.append("【任务 3: 给定目标 Precision -> 查询 阈值 & Recall】")
+    lines.append(f"{'Class':>12} | {'Target Prec.':>13} | {'Req. Conf(th_h)':>15} | {'Recall':>10}")
+    for c, name in scopes:
+        for tp_val in target_precisions:
+            th, r = engine.at_precision(tp_val, c)
+            lines.append(f"{name:>12} | {tp_val:>13.4f} | {th:>15.4f} | {r:>10.4f}")
+    lines.append("=" * 75)
+    return "\n".join(lines)
+
+
+def run_pr_queries(pred_json, gt_json, output_dir, target_thresholds, target_recalls, target_precisions,
+                   inter_json=None, per_class=True):
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    cache_path = output_dir / f"{Path(pred_json).stem}_pr_curve.npz"
+
+    engine = build_or_load_curve(pred_json, gt_json, cache_path, inter_json=inter_json)
+    if len(engine.conf) == 0:
+        print("❌ 警告：未检测到任何预测框！")
+        return engine
+
+    report_str = format_report(engine, target_thresholds, target_recalls, target_precisions, per_class)
+    print(report_str)
+
+    txt_save_path = output_dir / "threshold_query_report.txt"
+    with open(txt_save_path, 'w', encoding='utf-8') as f:
+        f.write(report_str)
+    print(f"\n📄 阈值查询报告已成功导出至: {txt_save_path}")
+    return engine
+
+
+if __name__ == '__main__':
+    # 文件路径
+    GT_JSON = "/data/ZS/defect_dataset/0_defect_dataset_raw/paint_stripe/labels/val.json"
+    PRED_JSON = "/data/ZS/defect_dataset/9_yolo_preds/自己手写的推理脚本/val_0p001/nms_fusion_th0.json"
+    INTER_JSON = None   # 评估 VLM 级联结果时填写中间映射 json，同时 PRED_JSON 改为 VLM 的 JSONL
+    OUTPUT_DIR = "/data/ZS/defect-vlm/output/pr_query"
+
+    # ============ 配置你需要查询的目标值 ============
+    TEST_THRESHOLDS = [0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.15, 0.2, 0.25]
+    TARGET_RECALLS = [0.65, 0.70, 0.75, 0.80]
+    TARGET_PRECISIONS = [0.85, 0.90, 0.95, 0.98]
+    # ===============================================
+
+    run_pr_queries(PRED_JSON, GT_JSON, OUTPUT_DIR,
+                   TEST_THRESHOLDS, TARGET_RECALLS, TARGET_PRECISIONS,
+                   inter_json=INTER_JSON, per_class=True)
@@ -0,0 +1,222 @@
+"""
+级联流水线一键执行 (带缓存的 DAG)
+原来的流程需要依次修改并运行各脚本 __main__ 中的路径：
+    infer_yolo (col3 / row3) -> nms_fusion (或 decision_fusion) -> [dedup_proposals] -> crop_yolo_preds_bbox
+    -> composite_images_from_yolo_preds -> build_vlm_message -> batch_infer_preds_probs
+    -> [fan_out_cluster_verdicts] -> compute_vlm_metric
+这里把它们声明为 DAG (见 defect_vlm/utils/pipeline_dag.py)：
+    - 每个阶段的输入内容、参数、脚本源码都没变时直接跳过；只改一个参数时只重算依赖它的阶段
+    - col3 / row3 推理、多个融合置信度阈值的分支并发执行；VLM 推理共用一个 GPU 资源，按顺序执行
+    - 已有 YOLO 预测结果时把 model_path 设为 None，对应 json 直接作为流水线的源数据
+输出路径沿用各脚本原来的目录约定：9_yolo_preds / 10_yolo_preds_bbox / 11_composite_yolo_preds / 12_vlm_message / 13_vlm_response
+"""
+import argparse
+from pathlib import Path
+from defect_vlm.utils.pipeline_dag import Artifact, Stage, Pipeline, jsonl_coverage_check
+from defect_vlm.utils.tracing import add_trace_args, setup_tracing
+
+
+def th_tag(th):
+    """0.01 -> '0p01'，与各脚本输出文件的命名习惯一致"""
+    return f"{th:g}".replace('.', 'p')
+
+
+def build_cascade_stages(cfg):
+    """
+    根据配置生成级联流水线的全部阶段
+    :param cfg: 见 __main__ 中的 CONFIG
+    :return: Stage 列表
+    """
+    data_root = Path(cfg['data_root'])
+    run_name = cfg['run_name']
+    light = cfg.get('light_dir', 'stripe_phase012')
+    pred_dir = data_root / '9_yolo_preds' / run_name
+    stages = []
+
+    # 1. 多流 YOLO 推理 (每个模型一个分支)
+    stream_preds = {}
+    for stream, yolo_cfg in cfg['yolo'].items():
+        out = Artifact(yolo_cfg.get('output_json') or pred_dir / f"{stream}.json", 'json')
+        stream_preds[stream] = out
+        if yolo_cfg.get('model_path') is None:
+            continue  # 直接使用已有预测结果
+        stages.append(Stage(
+            f"infer_{stream}", "defect_vlm.cascade.infer_yolo:run_multistream_inference",
+            inputs={'model_path': Artifact(yolo_cfg['model_path']), 'input_dir': Artifact(yolo_cfg['input_dir'], 'dir')},
+            outputs={'output_json': out},
+            params={'conf_thres': yolo_cfg.get('conf_thres', 0.001)},
+            resource='yolo_gpu'
+        ))
+    json_a, json_b = (stream_preds[s] for s in cfg['fusion_streams'])
+
+    # 2. 每个置信度阈值一个分支: 融合 -> 抠图 -> 拼图 -> Message -> VLM -> 指标
+    for th in cfg['conf_thresholds']:
+        tag = f"{cfg.get('branch_prefix', 'val')}_{th_tag(th)}"
+        fusion_out = Artifact(pred_dir / f"{cfg['fusion']}_fusion_conf_{th_tag(th)}.json", 'json')
+        if cfg['fusion'] == 'nms':
+            stages.append(Stage(
+                f"fusion_{tag}", "defect_vlm.cascade.nms_fusion:fusion_nms",
+                inputs={'json_col3': json_a, 'json_row3': json_b},
+                outputs={'output_json': fusion_out},
+                params={'iou_thres': cfg['nms_iou'], 'conf_thres': th}
+            ))
+        else:
+            # 尺度感知决策融合：阈值作用于 SKIP_BOX_THR
+            stages.append(Stage(
+                f"fusion_{tag}", "defect_vlm.cascade.decision_fusion:process_scale_aware_fusion",
+                inputs={'json1_path': json_a, 'json2_path': json_b},
+                outputs={'out_path': fusion_out},
+                params={'config': dict(cfg['decision_fusion'], SKIP_BOX_THR=th)}
+            ))
+
+        # 可选：类别无关聚类去重，只把每簇的代表框送入后续阶段
+        dedup_cfg = cfg.get('dedup')
+        cluster_json = None
+        if dedup_cfg:
+            rep_json = Artifact(pred_dir / f"{cfg['fusion']}_fusion_conf_{th_tag(th)}_dedup.json", 'json')
+            cluster_json = Artifact(pred_dir / f"{cfg['fusion']}_fusion_conf_{th_tag(th)}_clusters.json", 'json')
+            stages.append(Stage(
+                f"dedup_{tag}", "defect_vlm.cascade.dedup_proposals:dedup_proposals",
+                inputs={'fusion_json': fusion_out},
+                outputs={'rep_json': rep_json, 'cluster_json': cluster_json},
+                params={'method': dedup_cfg.get('method', 'iou'), 'thr': dedup_cfg.get('thr', 0.7),
+                        'nwd_c': dedup_cfg.get('nwd_c', 50.0)}
+            ))
+            fusion_out = rep_json
+
+        crop_json = Artifact(data_root / '10_yolo_preds_bbox' / light / 'labels' / f"{tag}.json", 'json')
+        stages.append(Stage(
+            f"crop_{tag}", "defect_vlm.cascade.crop_yolo_preds_bbox:main",
+            inputs={'fusion_json_path': fusion_out, 'rgb_image_root': Artifact(cfg['rgb_image_root'], 'dir')},
+            outputs={'save_img_dir': Artifact(data_root / '10_yolo_preds_bbox' / light / 'images' / tag, 'dir'),
+                     'out_json_path': crop_json},
+            params={'data_root': str(data_root)}
+        ))
+
+        composite_json = Artifact(data_root / '11_composite_yolo_preds' / light / 'labels' / f"{tag}.json", 'json')
+        stages.append(Stage(
+            f"composite_{tag}", "defect_vlm.cascade.composite_images_from_yolo_preds:process_composite_inference",
+            inputs={'input_json': crop_json},
+            outputs={'output_img_dir': Artifact(data_root / '11_composite_yolo_preds' / light / 'images' / tag, 'dir'),
+                     'output_json_path': composite_json},
+            params={'data_root': str(data_root), 'start_id': cfg.get('start_id', 1000001)}
+        ))
+
+        message_jsonl = Artifact(data_root / '12_vlm_message' / light / f"{tag}.jsonl", 'jsonl')
+        stages.append(Stage(
+            f"message_{tag}", "defect_vlm.cascade.build_vlm_message:main",
+            inputs={'input_json': composite_json, 'prompt_json': Artifact(cfg['prompt_json'], 'json')},
+            outputs={'output_jsonl': message_jsonl},
+            params={'data_root': data_root, 'prompt_idx': cfg['prompt_idx']},
+            path_type=Path
+        ))
+
+        vlm_cfg = cfg.get('vlm')
+        if not vlm_cfg:
+            continue
+        vlm_inputs = {'input_path': message_jsonl}
+        vlm_params = {'model_path': vlm_cfg['model_path'], 'chunk_size': vlm_cfg.get('chunk_size', 16),
+                      'max_batch_size': vlm_cfg.get('max_batch_size', 16)}
+        if vlm_cfg.get('early_stop', 'off') != 'off':
+            vlm_params['early_stop'] = vlm_cfg['early_stop']     # 只在开启时加入参数，默认配置的缓存指纹保持不变
+        if vlm_cfg.get('adapter_path'):
+            vlm_inputs['adapter_path'] = Artifact(vlm_cfg['adapter_path'], 'dir')
+        else:
+            vlm_params['adapter_path'] = None
+        vlm_jsonl = Artifact(data_root / '13_vlm_response' / light / f"{vlm_cfg['name']}_{tag}.jsonl", 'jsonl')
+        # batch_infer_preds_probs 按 id 断点续跑：同一指纹中断后重跑会接着写，指纹变化时先清空旧结果
+        stages.append(Stage(
+            f"vlm_{tag}", "defect_vlm.cascade.batch_infer_preds_probs:main",
+            inputs=vlm_inputs,
+            outputs={'output_path': vlm_jsonl},
+            params=vlm_params,
+            resource='vlm_gpu',
+            checks=[jsonl_coverage_check('input_path', 'output_path')]     # 部分 chunk 失败时不缓存，下次补跑缺失的 id
+        ))
+
+        if cluster_json is not None:
+            fanout_jsonl = Artifact(data_root / '13_vlm_response' / light / f"{vlm_cfg['name']}_{tag}_fanout.jsonl", 'jsonl')
+            stages.append(Stage(
+                f"fanout_{tag}", "defect_vlm.cascade.fan_out_cluster_verdicts:fan_out_verdicts",
+                inputs={'vlm_jsonl': vlm_jsonl, 'cluster_json': cluster_json},
+                outputs={'output_jsonl': fanout_jsonl}
+            ))
+            vlm_jsonl = fanout_jsonl
+
+        if cfg.get('gt_json'):
+            stages.append(Stage(
+                f"metric_{tag}", "defect_vlm.cascade.compute_vlm_metric:evaluate_vlm_results",
+                inputs={'vlm_jsonl': vlm_jsonl, 'inter_json': composite_json, 'gt_json': Artifact(cfg['gt_json'], 'json')},
+                outputs={'output_dir': Artifact(Path(cfg['metric_root']) / f"{vlm_cfg['name']}_{tag}", 'dir')}
+            ))
+    return stages
+
+
+def main(cfg, state_path, targets=None, force=(), dry_run=False, max_workers=2):
+    stages = build_cascade_stages(cfg)
+    pipeline = Pipeline(stages, state_path, max_workers=max_workers,
+                        resources={'yolo_gpu': cfg.get('yolo_concurrency', 2), 'vlm_gpu': 1})
+    return pipeline.run(targets=targets, force=force, dry_run=dry_run)
+
+
+if __name__ == "__main__":
+    # ================= 配置区 =================
+    CONFIG = {
+        'data_root': "/data/ZS/defect_dataset",
+        'run_name': "pipeline_val",                             # 9_yolo_preds 下的子目录
+        'light_dir': "stripe_phase012",
+        'rgb_image_root': "/data/ZS/defect_dataset/1_paint_rgb/stripe_phase012/images",
+
+        # 多流 YOLO：model_path 为 None 时直接使用 output_json 中已有的预测结果
+        'yolo': {
+            'col3': {
+                'model_path': "/data/ZS/defect-vlm/output/yolo_weights/gt_col3_part_cbam_max.pt",
+                'input_dir': "/data/ZS/v11_input/datasets/col3",
+                'conf_thres': 0.001,
+            },
+            'row3': {
+                'model_path': "/data/ZS/defect-vlm/output/yolo_weights/gt_row3_part_cbam_max.pt",
+                'input_dir': "/data/ZS/v11_input/datasets/row3",
+                'conf_thres': 0.001,
+            },
+        },
+        'fusion_streams': ['col3', 'row3'],
+        'fusion': 'nms',                                        # 'nms' 或 'decision'
+        'nms_iou': 0.45,
+        'decision_fusion': {
+            'IMG_W': 300.0, 'IMG_H': 300.0, 'SIGMA_SOFT': 0.05, 'AREA_TH': 0.0004,
+            'IOU_THR_WBF': 0.45, 'IOU_THR_SOFT': 0.45, 'SMALL_FUSION': 'WBF',
+            'NWD_THR': 0.8, 'NWD_C': 50.0, 'NWD_ASSIGN': 'greedy',
+        },
+        'dedup': None,                                          # 例如 {'method': 'iou', 'thr': 0.7}，None 表示不做聚类去重
+        'conf_thresholds': [0.01, 0.1],                         # 每个阈值一个并发分支
+        'branch_prefix': "val",
+
+        'prompt_json': "/data/ZS/defect-vlm/defect_vlm/pe/prompts.json",
+        'prompt_idx': 3,
+
+        'vlm': {
+            'name': "v2_qwen3_4b_LM",
+            'model_path': "Qwen/Qwen3-VL-4B-Instruct",
+            'adapter_path': "/data/ZS/defect-vlm/output/weights/v1-20260308-204436_qwen3_4b_LM/checkpoint-4800_best",
+            'chunk_size': 16,
+            'max_batch_size': 16,
+            'early_stop': 'off',                                # off / measure / on，见 utils/json_early_stop.py
+        },
+        'gt_json': "/data/ZS/defect_dataset/0_defect_dataset_raw/paint_stripe/labels/val.json",
+        'metric_root': "/data/ZS/defect-vlm/output/figures/ch4_cascade/pipeline",
+    }
+    STATE_PATH = "/data/ZS/defect_dataset/9_yolo_preds/pipeline_val/.pipeline_state.json"
+    # ==========================================
+
+    parser = argparse.ArgumentParser(description="级联流水线 (带缓存的 DAG)")
+    parser.add_argument('--targets', nargs='*', default=None, help='只运行这些阶段及其上游，例如 message_val_0p01')
+    parser.add_argument('--force', nargs='*', default=(), help='强制重跑的阶段')
+    parser.add_argument('--dry_run', action='store_true', help='只打印执行计划')
+    parser.add_argument('--workers', type=int, default=2, help='同时运行的阶段数')
+    parser.add_argument('--state', type=str, default=STATE_PATH, help='流水线状态文件')
+    add_trace_args(parser)
+    args = parser.parse_args()
+    setup_tracing(args.trace, args.trace_chrome)
+
+    main(CONFIG, args.state, targets=args.targets, force=args.force, dry_run=args.dry_run, max_workers=args.workers)
@@ -0,0 +1,610 @@
+"""
+在线流式级联 (逐件出结果，内部微批推理)
+离线级联是 "一批文件 -> 落盘 -> 下一个脚本" 的流程，产线上需要的是单个工件的端到端时延。
+这里把同样的处理链放进内存，用有界队列串成四个阶段：
+    1. detect   : 多流 YOLO (col3 / row3 ...) 微批推理
+    2. prepare  : 逐类 NMS 融合 (与 nms_fusion.py 一致) + 内存中抠图 / 2x2 拼图 (与 crop / composite 脚本一致)
+    3. vlm      : 跨工件攒批的 VLM 校验 (每个 proposal 一条请求，Prompt 与 build_vlm_message.py 一致)
+    4. 汇总     : 一个工件的所有 proposal 都有结论后，返回融合后的判定结果
+submit() 返回 Future，队列满时阻塞 (反压)；metrics() 给出各阶段的时延分位数和批大小。
+给定 route_thresholds=(th_l, th_h) 时，融合后先按置信度分流 (见 utils/proposal_routing.py)：
+低于 th_l 丢弃、不低于 th_h 直接信任 YOLO，只有中间区间才抠图拼图并送入 VLM。
+
+检测端支持 YoloDetector (魔改 ultralytics) 和 ReplayDetector (回放已有预测 json)；
+VLM 端支持 SwiftVLMBackend (ms-swift) 和 StandInVLMBackend (无 GPU 的本地替身，按 "固定开销 + 每条耗时" 模拟批推理)。
+"""
+import hashlib
+import json
+import os
+import queue
+import threading
+import time
+from collections import defaultdict, deque
+from concurrent.futures import Future
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+from defect_vlm.cascade.crop_yolo_preds_bbox import get_region_proposal
+from defect_vlm.cascade.composite_images_from_yolo_preds import (
+    LIGHT_ORDER, draw_bbox_on_image, letter_resize_bbox, composite_2x2_images
+)
+from defect_vlm.cascade.build_vlm_message import load_prompt_text
+from defect_vlm.utils.vlm_response_parser import parse_vlm_prediction
+from defect_vlm.utils.box_geometry import nms
+from defect_vlm.utils.proposal_routing import route_band, BAND_DROP, BAND_TRUST
+from defect_vlm.utils.tracing import span, count, observe
+
+DEFECT_CLASSES = ['breakage', 'inclusion', 'scratch', 'crater', 'run', 'bulge']
+_STOP = object()
+
+
+# ================= 检测后端 =================
+class YoloDetector:
+    """
+    多流 YOLO 检测器 (需要 /data/ZS/v11_input 下魔改的 ultralytics，与 infer_yolo.py 相同)
+    输入为 (H, W, N) 的多流灰度堆叠图，输出格式与 infer_yolo.py 写入 json 的每张图结果一致
+    """
+
+    def __init__(self, model_path, source_name, conf_thres=0.001, imgsz=300):
+        from ultralytics import YOLO
+        self.model = YOLO(model_path)
+        self.names = self.model.names
+        self.source_name = source_name
+        self.conf_thres = conf_thres
+        self.imgsz = imgsz
+
+    def predict_batch(self, frames):
+        arrays = [f['streams'][self.source_name] for f in frames]
+        results = self.model.predict(source=arrays, imgsz=self.imgsz, conf=self.conf_thres, verbose=False)
+        out = []
+        for r in results:
+            preds = []
+            if r.boxes is not None and len(r.boxes) > 0:
+                for box, conf, cls_id in zip(r.boxes.xyxy.cpu().numpy(), r.boxes.conf.cpu().numpy(), r.boxes.cls.cpu().numpy()):
+                    preds.append({"class_id": int(cls_id), "class_name": self.names[int(cls_id)],
+                                  "bbox": [float(v) for v in box], "confidence": float(conf),
+                                  "model_source": self.source_name})
+            out.append(preds)
+        return out
+
+
+class ReplayDetector:
+    """回放 infer_yolo.py 产出的预测 json (按 image_id 查表)，用于联调和压测"""
+
+    def __init__(self, preds_json, source_name, latency_ms=0.0):
+        with open(preds_json, 'r', encoding='utf-8') as f:
+            self.preds = json.load(f)
+        self.source_name = source_name
+        self.latency_ms = latency_ms
+
+    def predict_batch(self, frames):
+        if self.latency_ms:
+            time.sleep(self.latency_ms / 1000)
+        return [[dict(p) for p in self.preds.get(f['image_id'], [])] for f in frames]
+
+
+# ================= VLM 后端 =================
+class StandInVLMBackend:
+    """
+    本地替身 VLM：不加载模型，sleep(base + per_item * n) 模拟一次批推理，
+    回复为与真实模型相同格式的 JSON 文本。判定由 (seed, request_id) 哈希决定，结果可复现。
+    """
+
+    def __init__(self, base_latency_ms=80.0, per_item_ms=15.0, background_rate=0.3, flip_rate=0.1,
+                 class_names=DEFECT_CLASSES, seed=0):
+        self.base_latency_ms = base_latency_ms
+        self.per_item_ms = per_item_ms
+        self.background_rate = background_rate
+        self.flip_rate = flip_rate
+        self.class_names = list(class_names)
+        self.seed = seed
+
+    def _verdict(self, request):
+        digest = hashlib.sha256(f"{self.seed}:{request['request_id']}".encode('utf-8')).digest()
+        u = int.from_bytes(digest[:8], 'little') / 2 ** 64
+        prior = request['prior_label']
+        if u < self.background_rate:
+            return "background"
+        if u < self.background_rate + self.flip_rate:
+            others = [c for c in self.class_names if c != prior] or self.class_names
+            return others[digest[8] % len(others)]
+        return prior
+
+    def infer(self, requests):
+        time.sleep((self.base_latency_ms + self.per_item_ms * len(requests)) / 1000)
+        return [json.dumps({"step1": "stand-in", "step2": "stand-in", "step3": "stand-in",
+                            "defect": self._verdict(r)}, ensure_ascii=False) for r in requests]
+
+
+class SwiftVLMBackend:
+    """ms-swift 推理引擎 (与 batch_infer_preds_probs.py 相同的加载方式)，图像直接以内存中的 PIL 图传入"""
+
+    def __init__(self, model_path, adapter_path=None, max_batch_size=16):
+        from PIL import Image
+        from swift.infer_engine import InferRequest
+        from defect_vlm.cascade.batch_infer_preds_probs import init_engine
+        self._image_cls = Image
+        self._request_cls = InferRequest
+        self.engine, self.request_config = init_engine(model_path, adapter_path, max_batch_size)
+
+    def infer(self, requests):
+        infer_requests = [self._request_cls(
+            messages=[{"role": "user", "content": r['prompt']}],
+            images=[self._image_cls.fromarray(cv2.cvtColor(img, cv2.COLOR_BGR2RGB)) for img in r['images']]
+        ) for r in requests]
+        resp_list = self.engine.infer(infer_requests, self.request_config)
+        return [resp.choices[0].message.content if resp is not None else "" for resp in resp_list]
+
+
+# ================= 单图处理 (与离线脚本保持一致) =================
+def fuse_image_nms(stream_preds, iou_thres=0.45, conf_thres=0.0):
+    """单张图的多流预测融合：置信度过滤 + 逐类 NMS，结果与 nms_fusion.fusion_nms 对该图的输出一致"""
+    combined = [p for preds in stream_preds for p in preds if p['confidence'] >= conf_thres]
+    class_to_preds = {}
+    for p in combined:
+        class_to_preds.setdefault(p['class_id'], []).append(p)
+
+    fused = []
+    for preds in class_to_preds.values():
+        if len(preds) == 1:
+            fused.extend(preds)
+            continue
+        keep = nms([p['bbox'] for p in preds], [p['confidence'] for p in preds], iou_thres)
+        fused.extend(preds[i] for i in keep)
+    return fused
+
+
+def build_proposal_images(rgb, bbox_xyxy):
+    """
+    内存中完成抠图 + 2x2 拼图，返回 (global_img, local_img)；任一光源缺失或裁剪为空时返回 None
+    (离线流程中这样的组在 composite 阶段会因为不足 4 张而被丢弃)
+    """
+    x1, y1, x2, y2 = bbox_xyxy
+    bbox_coco = [x1, y1, x2 - x1, y2 - y1]
+    originals, crops = [], []
+    for light in LIGHT_ORDER:
+        image = rgb.get(light)
+        if image is None:
+            return None
+        crop = get_region_proposal(image, bbox_xyxy, bbox_format='xyxy')
+        if crop is None or crop.size == 0:
+            return None
+        originals.append(draw_bbox_on_image(image, bbox_coco))
+        crops.append(letter_resize_bbox(crop, target_size=300))
+    return composite_2x2_images(originals, target_size=600), composite_2x2_images(crops, target_size=600)
+
+
+def load_frame_from_disk(filename, stream_dirs, rgb_root):
+    """
+    从离线数据目录组装一个工件 (用于联调 / 压测)
+    :param stream_dirs: {'col3': '/data/ZS/v11_input/datasets/col3', ...}，读取方式与 infer_yolo.py 一致
+    :param rgb_root: 伪 RGB 根目录，下面是 16col / 16row / 32col / 32row
+    """
+    streams = {}
+    for name, input_dir in (stream_dirs or {}).items():
+        input_dir = Path(input_dir)
+        val_dirs = sorted(d for d in os.listdir(input_dir) if d.startswith('val') and (input_dir / d).is_dir())
+        ims = [cv2.imread(str(input_dir / d / "images" / filename), cv2.IMREAD_GRAYSCALE) for d in val_dirs]
+        ims = [im for im in ims if im is not None]
+        if ims:
+            streams[name] = np.dstack(ims)
+    rgb = {light: cv2.imread(str(Path(rgb_root) / light / filename)) for light in LIGHT_ORDER}
+    return {"image_id": filename, "streams": streams, "rgb": {k: v for k, v in rgb.items() if v is not None}}
+
+
+# ================= 指标 =================
+class LatencyStats:
+    """各阶段时延 (ms) 的滑动窗口统计，线程安全"""
+
+    def __init__(self, window=10000):
+        self._data = defaultdict(lambda: deque(maxlen=window))
+        self._totals = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def record(self, name, value):
+        with self._lock:
+            self._data[name].append(value)
+            self._totals[name] += 1
+        observe(f"streaming.{name}", value)
+
+    def summary(self):
+        with self._lock:
+            snapshot = {k: np.asarray(v, dtype=np.float64) for k, v in self._data.items()}
+            totals = dict(self._totals)
+        out = {}
+        for name, arr in sorted(snapshot.items()):
+            if len(arr) == 0:
+                continue
+            p50, p90, p99 = np.percentile(arr, [50, 90, 99])
+            out[name] = {"count": totals[name], "mean": float(arr.mean()), "p50": float(p50),
+                         "p90": float(p90), "p99": float(p99), "max": float(arr.max())}
+        return out
+
+
+class _Job:
+    """一个工件在流水线中的状态"""
+    __slots__ = ("frame", "future", "t_submit", "marks", "fused", "trusted", "dropped", "proposals", "pending", "done", "lock")
+
+    def __init__(self, frame):
+        self.frame = frame
+        self.future = Future()
+        self.t_submit = time.perf_counter()
+        self.marks = {}
+        self.fused = []
+        self.trusted = []
+        self.dropped = 0
+        self.proposals = []
+        self.pending = 0
+        self.done = False
+        self.lock = threading.Lock()
+
+
+def _take_batch(q, max_batch, max_wait_s):
+    """阻塞取第一条，之后在 max_wait_s 内尽量凑满 max_batch；遇到 _STOP 时把它放在批末尾返回"""
+    first = q.get()
+    batch = [first]
+    if first is _STOP:
+        return batch
+    deadline = time.perf_counter() + max_wait_s
+    while len(batch) < max_batch:
+        remaining = deadline - time.perf_counter()
+        try:
+            item = q.get(timeout=remaining) if remaining > 0 else q.get_nowait()
+        except queue.Empty:
+            break
+        batch.append(item)
+        if item is _STOP:
+            break
+    return batch
+
+
+# ================= 服务 =================
+class StreamingCascade:
+    """
+    流式级联服务
+    :param detectors: {流名称: 检测器}，检测器需实现 predict_batch(frames) -> 每帧的预测列表
+    :param vlm_backend: 需实现 infer(requests) -> 回复文本列表；为 None 时只做检测 + 融合
+    :param prompt_text: Prompt 模板 ('{}' 处填先验类别)，见 pe/prompts.json
+    :param det_batch / det_wait_ms: 检测微批的最大条数和最长等待
+    :param vlm_batch / vlm_wait_ms: VLM 微批的最大条数和最长等待 (跨工件攒批)
+    :param queue_size: 每个有界队列的容量，队列满时 submit() 阻塞
+    :param prepare_workers: 融合 + 抠图拼图的线程数 (OpenCV 运算会释放 GIL)
+    :param route_thresholds: (th_l, th_h)，为 None 时所有融合框都送入 VLM
+    """
+
+    def __init__(self, detectors, vlm_backend, prompt_text, iou_thres=0.45, conf_thres=0.0,
+                 det_batch=8, det_wait_ms=5.0, vlm_batch=16, vlm_wait_ms=20.0, queue_size=64, prepare_workers=2,
+                 route_thresholds=None):
+        self.detectors = dict(detectors)
+        self.vlm_backend = vlm_backend
+        self.prompt_text = prompt_text
+        self.iou_thres = iou_thres
+        self.conf_thres = conf_thres
+        self.det_batch = det_batch
+        self.det_wait_s = det_wait_ms / 1000
+        self.vlm_batch = vlm_batch
+        self.vlm_wait_s = vlm_wait_ms / 1000
+        self.prepare_workers = max(1, prepare_workers)
+        self.route_thresholds = route_thresholds
+
+        self.q_detect = queue.Queue(maxsize=queue_size)
+        self.q_prepare = queue.Queue(maxsize=queue_size)
+        self.q_vlm = queue.Queue(maxsize=queue_size * 4)
+        self.stats = LatencyStats()
+        self._closed = False
+
+        self._threads = [threading.Thread(target=self._detect_loop, name="cascade-detect", daemon=True)]
+        self._threads += [threading.Thread(target=self._prepare_loop, name=f"cascade-prepare-{i}", daemon=True)
+                          for i in range(self.prepare_workers)]
+        self._threads.append(threading.Thread(target=self._vlm_loop, name="cascade-vlm", daemon=True))
+        for t in self._threads:
+            t.start()
+
+    # ---------- 对外接口 ----------
+    def submit(self, frame, timeout=None):
+        """
+        提交一个工件: {'image_id': str, 'streams': {流名称: (H, W, N) 灰度堆叠}, 'rgb': {光源: BGR 图}}
+        :return: Future，结果见 _finish
+        """
+        if self._closed:
+            raise RuntimeError("StreamingCascade 已关闭")
+        job = _Job(frame)
+        self.q_detect.put(job, timeout=timeout)
+        return job.future
+
+    def process(self, frame, timeout=None):
+        """同步处理单个工件"""
+        return self.submit(frame).result(timeout=timeout)
+
+    def process_many(self, frames):
+        """按提交顺序逐个返回结果，提交与处理重叠进行"""
+        pending = deque()
+        for frame in frames:
+            pending.append(self.submit(frame))
+            while pending and pending[0].done():
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+    def metrics(self):
+        return self.stats.summary()
+
+    def close(self):
+        """处理完已提交的工件后停止所有线程"""
+        if self._closed:
+            return
+        self._closed = True
+        self.q_detect.put(_STOP)
+        for t in self._threads:
+            t.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # ---------- 阶段 1: 检测 ----------
+    def _detect_loop(self):
+        while True:
+            batch = _take_batch(self.q_detect, self.det_batch, self.det_wait_s)
+            stop = batch[-1] is _STOP
+            jobs = [j for j in batch if j is not _STOP]
+            if jobs:
+                self._run_detect(jobs)
+            if stop:
+                for _ in range(self.prepare_workers):
+                    self.q_prepare.put(_STOP)
+                return
+
+    def _run_detect(self, jobs):
+        t0 = time.perf_counter()
+        for job in jobs:
+            job.marks["detect_start"] = t0
+        self.stats.record("batch_size.detect", len(jobs))
+        frames = [job.frame for job in jobs]
+        try:
+            with span("streaming.detect", n=len(jobs)):
+                per_stream = [det.predict_batch(frames) for det in self.detectors.values()]
+        except Exception as e:
+            for job in jobs:
+                self._fail(job, e)
+            return
+        t1 = time.perf_counter()
+        self.stats.record("detect", (t1 - t0) * 1000)
+        for i, job in enumerate(jobs):
+            job.fused = [preds[i] for preds in per_stream]  # 暂存各流原始结果，融合在 prepare 阶段完成
+            job.marks["detect_end"] = t1
+            self.stats.record("queue_wait.detect", (t0 - job.t_submit) * 1000)
+            self.q_prepare.put(job)
+
+    # ---------- 阶段 2: 融合 + 抠图拼图 ----------
+    def _prepare_loop(self):
+        while True:
+            job = self.q_prepare.get()
+            if job is _STOP:
+                self.q_vlm.put(_STOP)
+                return
+            try:
+                self._run_prepare(job)
+            except Exception as e:
+                self._fail(job, e)
+
+    def _run_prepare(self, job):
+        t0 = time.perf_counter()
+        with span("streaming.fuse"):
+            job.fused = fuse_image_nms(job.fused, self.iou_thres, self.conf_thres)
+        t1 = time.perf_counter()
+        self.stats.record("fuse", (t1 - t0) * 1000)
+
+        image_id = job.frame['image_id']
+        proposals = []
+        if self.vlm_backend is not None:
+            to_verify = list(enumerate(job.fused))
+            if self.route_thresholds is not None:
+                th_l, th_h = self.route_thresholds
+                to_verify = []
+                for idx, pred in enumerate(job.fused):
+                    band = route_band(pred['confidence'], th_l, th_h)
+                    if band == BAND_DROP:
+                        job.dropped += 1
+                    elif band == BAND_TRUST:
+                        job.trusted.append(pred)
+                    else:
+                        to_verify.append((idx, pred))
+                count("streaming.route_dropped", job.dropped)
+                count("streaming.route_trusted", len(job.trusted))
+            with span("streaming.composite", n=len(to_verify)):
+                for idx, pred in to_verify:
+                    images = build_proposal_images(job.frame.get('rgb', {}), pred['bbox'])
+                    if images is None:
+                        count("streaming.invalid_proposals")
+                        continue
+                    proposals.append({"request_id": f"{image_id}#{idx}", "pred": pred, "job": job,
+                                      "images": list(images), "prior_label": pred['class_name'],
+                                      "prompt": self.prompt_text.replace('{}', pred['class_name'])})
+            self.stats.record("composite", (time.perf_counter() - t1) * 1000)
+        job.marks["prepare_end"] = time.perf_counter()
+        job.proposals = proposals
+        job.pending = len(proposals)
+        count("streaming.proposals", len(proposals))
+        if not proposals:
+            self._finish(job)
+            return
+        for p in proposals:
+            self.q_vlm.put(p)
+
+    # ---------- 阶段 3: VLM 校验 ----------
+    def _vlm_loop(self):
+        stops = 0
+        while True:
+            batch = _take_batch(self.q_vlm, self.vlm_batch, self.vlm_wait_s)
+            items = [p for p in batch if p is not _STOP]
+            if items:
+                self._run_vlm(items)
+            stops += len(batch) - len(items)
+            if stops >= self.prepare_workers:
+                return
+
+    def _run_vlm(self, items):
+        t0 = time.perf_counter()
+        self.stats.record("batch_size.vlm", len(items))
+        for p in items:
+            self.stats.record("queue_wait.vlm", (t0 - p['job'].marks["prepare_end"]) * 1000)
+        try:
+            with span("streaming.vlm", n=len(items)):
+                texts = self.vlm_backend.infer(items)
+        except Exception as e:
+            for p in items:
+                self._fail(p['job'], e)
+            return
+        self.stats.record("vlm", (time.perf_counter() - t0) * 1000)
+        count("streaming.vlm_requests", len(items))
+
+        texts = list(texts or [])
+        if len(texts) != len(items):
+            # 后端少返回了结果：按顺序对齐已有的部分，其余 proposal 所属的工件显式失败，不能让调用方一直等待
+            err = RuntimeError(f"VLM 后端返回 {len(texts)} 条结果，请求为 {len(items)} 条")
+            count("streaming.vlm_missing", max(len(items) - len(texts), 0))
+            for p in items[len(texts):]:
+                self._fail(p['job'], err)
+            items = items[:len(texts)]
+
+        finished = []
+        for p, text in zip(items, texts):
+            p['vlm_text'] = text
+            p['images'] = None  # 释放拼图内存
+            job = p['job']
+            with job.lock:
+                job.pending -= 1
+                if job.pending == 0:
+                    finished.append(job)
+        t1 = time.perf_counter()
+        for job in finished:
+            job.marks["vlm_end"] = t1
+            self._finish(job)
+
+    # ---------- 汇总 ----------
+    def _fail(self, job, exc):
+        with job.lock:
+            if job.done:
+                return
+            job.done = True
+        count("streaming.failed")
+        job.future.set_exception(exc)
+
+    def _finish(self, job):
+        """
+        组装单个工件的结果：
+        detections 为最终保留的缺陷 (高置信度直通、VLM 认可或纠正)，rejected 为被 VLM 判为背景的 proposal；
+        未配置 VLM 时 detections 即融合结果。
+        """
+        with job.lock:
+            if job.done:
+                return
+            job.done = True
+        # 单个工件组装出错只让该工件失败，不能杀死调用它的 VLM / 预处理线程
+        try:
+            result = self._assemble_result(job)
+        except Exception as e:
+            count("streaming.failed")
+            job.future.set_exception(e)
+            return
+        job.future.set_result(result)
+        job.frame = None  # 释放原图内存
+
+    def _assemble_result(self, job):
+        detections, rejected = [], []
+        if self.vlm_backend is None:
+            for pred in job.fused:
+                detections.append(dict(pred, final_label=pred['class_name'], decision_source="YOLO_Fused"))
+        else:
+            for pred in job.trusted:
+                detections.append(dict(pred, final_label=pred['class_name'], decision_source="YOLO_Trusted"))
+            for p in job.proposals:
+                pred = p['pred']
+                vlm_label = parse_vlm_prediction(p.get('vlm_text', ""))
+                item = dict(pred, vlm_label=vlm_label, proposal_id=p['request_id'])
+                if vlm_label == "background":
+                    rejected.append(dict(item, decision_source="VLM_Background"))
+                elif vlm_label == pred['class_name']:
+                    detections.append(dict(item, final_label=vlm_label, decision_source="VLM_Agreed"))
+                else:
+                    detections.append(dict(item, final_label=vlm_label, decision_source="VLM_Corrected"))
+
+        t_end = time.perf_counter()
+        marks = job.marks
+        latency = {"total": (t_end - job.t_submit) * 1000}
+        if "detect_start" in marks:
+            latency["queue_wait"] = (marks["detect_start"] - job.t_submit) * 1000
+            latency["detect"] = (marks["detect_end"] - marks["detect_start"]) * 1000
+        if "prepare_end" in marks:
+            latency["prepare"] = (marks["prepare_end"] - marks["detect_end"]) * 1000
+        if "vlm_end" in marks:
+            latency["vlm"] = (marks["vlm_end"] - marks["prepare_end"]) * 1000
+        self.stats.record("end_to_end", latency["total"])
+        count("streaming.images")
+
+        return {
+            "image_id": job.frame['image_id'],
+            "detections": detections,
+            "rejected": rejected,
+            "num_fused": len(job.fused),
+            "num_dropped": job.dropped,
+            "num_trusted": len(job.trusted),
+            "num_vlm_requests": len(job.proposals),
+            "latency_ms": {k: round(v, 3) for k, v in latency.items()},
+        }
+
+
+def print_metrics(metrics):
+    print("=" * 50)
+    print("⏱️ 流式级联各阶段时延 (ms)")
+    print(f"{'stage':<20} {'count':>7} {'mean':>9} {'p50':>9} {'p90':>9} {'p99':>9} {'max':>9}")
+    for name, s in metrics.items():
+        print(f"{name:<20} {s['count']:>7} {s['mean']:>9.2f} {s['p50']:>9.2f} {s['p90']:>9.2f} {s['p99']:>9.2f} {s['max']:>9.2f}")
+    print("=" * 50)
+
+
+if __name__ == "__main__":
+    # ================= 配置区 =================
+    RGB_ROOT = "/data/ZS/defect_dataset/1_paint_rgb/stripe_phase012/images"
+    STREAM_DIRS = {'col3': "/data/ZS/v11_input/datasets/col3", 'row3': "/data/ZS/v11_input/datasets/row3"}
+    PROMPT_JSON = Path("/data/ZS/defect-vlm/defect_vlm/pe/prompts.json")
+    PROMPT_IDX = 3
+    NUM_IMAGES = 200
+
+    # 检测端：有 GPU 时用 YoloDetector，否则回放已有预测
+    USE_YOLO = False
+    YOLO_WEIGHTS = {'col3': "/data/ZS/defect-vlm/output/yolo_weights/gt_col3_part_cbam_max.pt",
+                    'row3': "/data/ZS/defect-vlm/output/yolo_weights/gt_row3_part_cbam_max.pt"}
+    REPLAY_PREDS = {'col3': "/data/ZS/defect_dataset/9_yolo_preds/自己手写的推理脚本/val_0p001/col3.json",
+                    'row3': "/data/ZS/defect_dataset/9_yolo_preds/自己手写的推理脚本/val_0p001/row3.json"}
+    CONF_THRES = 0.1
+    ROUTE_THRESHOLDS = (0.1, 0.83)      # (th_l, th_h)，与伪标签精炼一致；None 表示全部送入 VLM
+
+    # VLM 端：None 表示使用本地替身
+    VLM_MODEL = None        # 'Qwen/Qwen3-VL-4B-Instruct'
+    VLM_ADAPTER = None
+    # ==========================================
+
+    if USE_YOLO:
+        detectors = {name: YoloDetector(path, name) for name, path in YOLO_WEIGHTS.items()}
+    else:
+        detectors = {name: ReplayDetector(path, name) for name, path in REPLAY_PREDS.items()}
+    backend = SwiftVLMBackend(VLM_MODEL, VLM_ADAPTER) if VLM_MODEL else StandInVLMBackend()
+    prompt_text = load_prompt_text(PROMPT_JSON, PROMPT_IDX)
+
+    filenames = sorted(os.listdir(Path(RGB_ROOT) / LIGHT_ORDER[0]))[:NUM_IMAGES]
+    frames = (load_frame_from_disk(name, STREAM_DIRS if USE_YOLO else None, RGB_ROOT) for name in filenames)
+
+    n_det = n_rej = 0
+    with StreamingCascade(detectors, backend, prompt_text, conf_thres=CONF_THRES,
+                          route_thresholds=ROUTE_THRESHOLDS) as service:
+        for res in service.process_many(frames):
+            n_det += len(res['detections'])
+            n_rej += len(res['rejected'])
+        print(f"✅ 共处理 {len(filenames)} 个工件，保留缺陷 {n_det} 个，VLM 判为背景 {n_rej} 个")
+        print_metrics(service.metrics())
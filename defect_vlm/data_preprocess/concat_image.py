@@ -1,7 +1,13 @@
 """
 将paint_stripe中的灰度图像图像沿通道方向进行拼接，得到伪BGR图像
+- concat_image: 原始的串行实现；
+- concat_image_parallel: 线程池实现 (cv2 的读写会释放 GIL，线程即可并行)；
+- iter_stacked_images: 不落盘，按文件名惰性地产出拼接后的数组，供下游裁剪脚本直接消费相位图。
 """
 import os
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from tqdm import tqdm
 import cv2
@@ -34,6 +40,94 @@ def concat_image(image_dir: str, phase_names: list[str], save_dir: str) -> None:
             print(f"处理 {ch0_path.name} 时报错： {e}")
             continue
 
+def stack_phase_image(image_dir: Path, phase_names: list[str], file_name: str) -> np.ndarray:
+    """读取同名的三张相位灰度图并沿通道拼接，任意一张缺失时返回 None"""
+    channels = []
+    for name in phase_names[:3]:
+        ch = cv2.imread(str(Path(image_dir) / name / file_name), cv2.IMREAD_GRAYSCALE)
+        if ch is None:
+            return None
+        channels.append(ch)
+    return np.stack(channels, axis=2)
+
+def list_phase_files(image_dir: str, phase_names: list[str]) -> list[str]:
+    """以第一个相位目录为准，列出所有待拼接的文件名 (排序后保证顺序稳定)"""
+    return sorted(p.name for p in (Path(image_dir) / phase_names[0]).glob('*.png'))
+
+def iter_stacked_images(image_dir: str, phase_names: list[str], file_names: list[str] = None, num_workers: int = 8, prefetch: int = 32):
+    """
+    惰性地产出 (file_name, 伪BGR数组)，不写磁盘
+    线程池预读最多 prefetch 张图，按 file_names 的顺序依次产出，内存占用与数据集大小无关
+    :param file_names: 需要的文件名列表，默认取第一个相位目录下的全部 png
+    """
+    if file_names is None:
+        file_names = list_phase_files(image_dir, phase_names)
+
+    with ThreadPoolExecutor(max_workers=num_workers) as pool:
+        pending = deque()
+        names = iter(file_names)
+        for name in names:
+            pending.append((name, pool.submit(stack_phase_image, image_dir, phase_names, name)))
+            if len(pending) >= prefetch:
+                break
+        while pending:
+            name, future = pending.popleft()
+            next_name = next(names, None)
+            if next_name is not None:
+                pending.append((next_name, pool.submit(stack_phase_image, image_dir, phase_names, next_name)))
+            image = future.result()
+            if image is None:
+                print(f"处理 {name} 时报错： 相位图缺失或无法读取")
+                continue
+            yield name, image
+
+def _concat_one(image_dir: Path, phase_names: list[str], save_dir: Path, file_name: str) -> bool:
+    try:
+        rgb_image = stack_phase_image(image_dir, phase_names, file_name)
+        if rgb_image is None:
+            print(f"处理 {file_name} 时报错： 相位图缺失或无法读取")
+            return False
+        return cv2.imwrite(str(save_dir / file_name), rgb_image)     # 注意这里保存的顺序是BGR
+    except Exception as e:
+        print(f"处理 {file_name} 时报错： {e}")
+        return False
+
+def concat_image_parallel(image_dir: str, phase_names: list[str], save_dir: str, num_workers: int = 8) -> dict:
+    """线程池版本的 concat_image，返回吞吐统计"""
+    image_dir = Path(image_dir)
+    save_dir = Path(save_dir)
+    save_dir.mkdir(parents=True, exist_ok=True)
+    file_names = list_phase_files(image_dir, phase_names)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=num_workers) as pool:
+        results = list(tqdm(
+            pool.map(lambda n: _concat_one(image_dir, phase_names, save_dir, n), file_names),
+            total=len(file_names), desc='Processing: '
+        ))
+    elapsed = time.perf_counter() - start
+    return {'mode': 'disk', 'total': len(file_names), 'ok': sum(results), 'seconds': elapsed}
+
+def bench_in_memory(image_dir: str, phase_names: list[str], num_workers: int = 8) -> dict:
+    """只通过 iter_stacked_images 消费一遍全部图像 (不写盘)，返回吞吐统计"""
+    file_names = list_phase_files(image_dir, phase_names)
+    start = time.perf_counter()
+    ok = 0
+    for _, _ in tqdm(iter_stacked_images(image_dir, phase_names, file_names, num_workers), total=len(file_names), desc='In-memory: '):
+        ok += 1
+    elapsed = time.perf_counter() - start
+    return {'mode': 'memory', 'total': len(file_names), 'ok': ok, 'seconds': elapsed}
+
+def print_throughput_report(stats_list: list[dict], num_workers: int) -> None:
+    print("\n" + "=" * 50)
+    print(f"📊 伪BGR拼接吞吐报告 (workers={num_workers})")
+    print("=" * 50)
+    for stats in stats_list:
+        ips = stats['ok'] / stats['seconds'] if stats['seconds'] > 0 else 0.0
+        label = '落盘模式' if stats['mode'] == 'disk' else '内存模式'
+        print(f"  {label:<6}: {stats['ok']}/{stats['total']} 张, 耗时 {stats['seconds']:.2f}s, 吞吐 {ips:.1f} images/sec")
+    print("=" * 50)
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument(
@@ -49,8 +143,22 @@ if __name__ == "__main__":
         type=str, help='拼接后的图像所在的文件夹'
     )
                      
+    parser.add_argument('--num_workers', default=8, type=int,
+        help='线程数，设为 0 则使用原来的串行实现'
+    )
+
+    parser.add_argument('--bench_memory', action='store_true',
+        help='额外以不落盘的内存模式跑一遍，用于对比吞吐'
+    )
+
     args = parser.parse_args()
-    
-    concat_image(args.image_dir, args.phase_names, args.save_dir)
+
+    if args.num_workers <= 0:
+        concat_image(args.image_dir, args.phase_names, args.save_dir)
+    else:
+        stats_list = [concat_image_parallel(args.image_dir, args.phase_names, args.save_dir, args.num_workers)]
+        if args.bench_memory:
+            stats_list.append(bench_in_memory(args.image_dir, args.phase_names, args.num_workers))
+        print_throughput_report(stats_list, args.num_workers)
         
         
\ No newline at end of file
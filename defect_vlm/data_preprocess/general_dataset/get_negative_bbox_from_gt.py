@@ -14,6 +14,8 @@ from pathlib import Path
 from collections import defaultdict
 from tqdm import tqdm
 import gc
+from defect_vlm.utils.bbox_sampler import sample_background_bboxes
+from defect_vlm.utils.box_geometry import box_iou
 
 random.seed(42)
 np.random.seed(42)
@@ -21,41 +23,11 @@ np.random.seed(42)
 # 缺陷类别映射 (模拟 YOLO 乱猜的 Prior Label)
 DEFECT_MAP = ('breakage', 'inclusion', 'crater', 'bulge', 'run', 'scratch')
 
-def compute_iou(box1, box2):
-    """计算IoU: box=[x, y, w, h]"""
-    x1, y1, w1, h1 = box1
-    x2, y2, w2, h2 = box2
-
-    inter_x1 = max(x1, x2)
-    inter_y1 = max(y1, y2)
-    inter_x2 = min(x1 + w1, x2 + w2)
-    inter_y2 = min(y1 + h1, y2 + h2)
-
-    if inter_x2 < inter_x1 or inter_y2 < inter_y1:
-        return 0.0
-
-    inter_area = (inter_x2 - inter_x1) * (inter_y2 - inter_y1)
-    union_area = w1 * h1 + w2 * h2 - inter_area
-    return 0.0 if union_area <= 0 else inter_area / union_area
-
-def generate_pure_bg_bbox(image_w, image_h, gt_bboxes, ref_sizes, max_trials=50):
-    """生成纯背景框 (与任何 GT 的 IoU = 0)"""
-    for _ in range(max_trials):
-        base_w, base_h = random.choice(ref_sizes) if ref_sizes else (100, 100)
-        scale = random.uniform(0.8, 1.2)
-        w = max(10, min(int(base_w * scale), image_w - 1))
-        h = max(10, min(int(base_h * scale), image_h - 1))
-
-        if image_w - w <= 0 or image_h - h <= 0: continue
-            
-        x = random.randint(0, image_w - w)
-        y = random.randint(0, image_h - h)
-        candidate_box = [x, y, w, h]
-
-        has_overlap = any(compute_iou(candidate_box, gt) > 0.0 for gt in gt_bboxes)
-        if not has_overlap:
-            return candidate_box, 0.0
-    return None, 0.0
+def generate_pure_bg_bbox(bg_pool):
+    """从预先批量采样好的纯背景框池中取一个 (与任何 GT 的 IoU = 0)"""
+    if not bg_pool:
+        return None, 0.0
+    return bg_pool.pop(0), 0.0
 
 def generate_hard_negative_bbox(target_gt, all_gts, image_w, image_h, target_iou_min, target_iou_max, max_attempts=150):
     """通过大尺度抖动 GT，生成指定 IoU 范围的负样本框"""
@@ -81,12 +53,12 @@ def generate_hard_negative_bbox(target_gt, all_gts, image_w, image_h, target_iou
         new_h = max(1, min(new_h, image_h - new_y))
         
         candidate_box = [new_x, new_y, new_w, new_h]
-        iou_with_target = compute_iou(target_gt, candidate_box)
+        iou_with_target = box_iou(target_gt, candidate_box, fmt='xywh')
         
         # 1. 必须落在我们期望的负样本 IoU 区间内
         if target_iou_min <= iou_with_target <= target_iou_max:
             # 2. 安全防碰撞校验：保证这个框不仅对 target_gt 是负样本，对图上**其他所有缺陷**也必须是负样本 (<0.5)
-            max_iou_all = max([compute_iou(candidate_box, gt) for gt in all_gts])
+            max_iou_all = max([box_iou(candidate_box, gt, fmt='xywh') for gt in all_gts])
             if max_iou_all < 0.5:
                 return candidate_box, iou_with_target
                 
@@ -170,6 +142,14 @@ def process_negative_dataset(
         if not load_success: continue
 
         # --- 2. 生成 N 组负样本 ---
+        # 纯背景框一次性批量采样 (最坏情况下 N 组全部需要纯背景，包括难例降级的情况)
+        bg_pool = sample_background_bboxes(
+            image_shape=(image_h, image_w),
+            gt_bboxes=current_gt_bboxes,
+            num_samples=samples_per_image,
+            ref_sizes=ref_size_pool
+        )
+
         for _ in range(samples_per_image):
             # 决定当前生成的负样本类别
             rand_val = random.random()
@@ -188,7 +168,7 @@ def process_negative_dataset(
 
             # 核心策略：依据 target_type 去生成对应的框
             if target_type == "pure_bg":
-                rand_bbox, actual_iou = generate_pure_bg_bbox(image_w, image_h, current_gt_bboxes, ref_size_pool)
+                rand_bbox, actual_iou = generate_pure_bg_bbox(bg_pool)
             else:
                 target_gt = random.choice(current_gt_bboxes)
                 if target_type == "hard_0.1_0.3":
@@ -199,7 +179,7 @@ def process_negative_dataset(
                 # 如果受限于空间位置死活摇不出 hard negative，降级为纯背景
                 if rand_bbox is None:
                     target_type = "pure_bg_fallback"
-                    rand_bbox, actual_iou = generate_pure_bg_bbox(image_w, image_h, current_gt_bboxes, ref_size_pool)
+                    rand_bbox, actual_iou = generate_pure_bg_bbox(bg_pool)
 
             if rand_bbox is None: continue 
 
@@ -11,36 +11,12 @@ from pathlib import Path
 from collections import defaultdict
 from tqdm import tqdm
 import gc
+from defect_vlm.utils.box_geometry import box_iou
 
 # 设置随机种子，保证实验可复现
 random.seed(42)
 np.random.seed(42)
 
-def compute_iou(box1, box2):
-    """计算两个 [x, y, w, h] 格式 bounding box 的 IoU"""
-    x1_min, y1_min = box1[0], box1[1]
-    x1_max, y1_max = box1[0] + box1[2], box1[1] + box1[3]
-    
-    x2_min, y2_min = box2[0], box2[1]
-    x2_max, y2_max = box2[0] + box2[2], box2[1] + box2[3]
-    
-    inter_x_min = max(x1_min, x2_min)
-    inter_y_min = max(y1_min, y2_min)
-    inter_x_max = min(x1_max, x2_max)
-    inter_y_max = min(y1_max, y2_max)
-    
-    inter_w = max(0, inter_x_max - inter_x_min)
-    inter_h = max(0, inter_y_max - inter_y_min)
-    inter_area = inter_w * inter_h
-    
-    box1_area = box1[2] * box1[3]
-    box2_area = box2[2] * box2[3]
-    union_area = box1_area + box2_area - inter_area
-    
-    if union_area == 0:
-        return 0.0
-    return inter_area / union_area
-
 def generate_jittered_bbox(gt_bbox, image_w, image_h, target_iou_min, target_iou_max, max_attempts=100):
     """通过随机平移和缩放生成模拟 YOLO 的抖动框"""
     x, y, w, h = gt_bbox
@@ -65,7 +41,7 @@ def generate_jittered_bbox(gt_bbox, image_w, image_h, target_iou_min, target_iou
         new_h = max(1, min(new_h, image_h - new_y))
         
         jittered_box = [new_x, new_y, new_w, new_h]
-        iou = compute_iou(gt_bbox, jittered_box)
+        iou = box_iou(gt_bbox, jittered_box, fmt='xywh')
         
         if target_iou_min <= iou <= target_iou_max:
             return jittered_box, iou
@@ -11,6 +11,8 @@ from pathlib import Path
 from collections import defaultdict
 from tqdm import tqdm
 import gc
+from defect_vlm.utils.bbox_sampler import sample_background_bboxes
+from defect_vlm.utils.parallel_runner import make_image_rngs, run_image_tasks, merge_sample_groups, RENAME_KEY
 
 # 设置随机种子
 random.seed(42)
@@ -23,70 +25,6 @@ DEFECT_MAP = ('breakage', 'inclusion', 'crater', 'bulge', 'run', 'scratch')
 # 必须存在的4个光源，顺序不敏感，但必须齐备
 REQUIRED_LIGHTS = ['16col', '16row', '32col', '32row']
 
-def compute_iou(box1, box2):
-    """计算IoU: box=[x, y, w, h]"""
-    x1, y1, w1, h1 = box1
-    x2, y2, w2, h2 = box2
-
-    b1_x1, b1_y1, b1_x2, b1_y2 = x1, y1, x1 + w1, y1 + h1
-    b2_x1, b2_y1, b2_x2, b2_y2 = x2, y2, x2 + w2, y2 + h2
-
-    inter_x1 = max(b1_x1, b2_x1)
-    inter_y1 = max(b1_y1, b2_y1)
-    inter_x2 = min(b1_x2, b2_x2)
-    inter_y2 = min(b1_y2, b2_y2)
-
-    if inter_x2 < inter_x1 or inter_y2 < inter_y1:
-        return 0.0
-
-    inter_area = (inter_x2 - inter_x1) * (inter_y2 - inter_y1)
-    b1_area = w1 * h1
-    b2_area = w2 * h2
-
-    union_area = b1_area + b2_area - inter_area
-    if union_area <= 0: return 0.0
-        
-    return inter_area / union_area
-
-def generate_random_bbox(image_shape, gt_bboxes, ref_sizes, max_trials=50):
-    """生成一个不与任何GT重叠的随机BBox"""
-    h_img, w_img = image_shape
-    
-    for _ in range(max_trials):
-        # 1. 随机尺寸
-        if not ref_sizes:
-            base_w, base_h = 100, 100
-        else:
-            base_w, base_h = random.choice(ref_sizes)
-            
-        scale = random.uniform(0.8, 1.2)
-        w = int(base_w * scale)
-        h = int(base_h * scale)
-        
-        w = max(10, min(w, w_img - 1))
-        h = max(10, min(h, h_img - 1))
-
-        # 2. 随机位置
-        if w_img - w <= 0 or h_img - h <= 0:
-            continue
-            
-        x = random.randint(0, w_img - w)
-        y = random.randint(0, h_img - h)
-        
-        candidate_box = [x, y, w, h]
-
-        # 3. IoU 检查 (必须是纯背景)
-        has_overlap = False
-        for gt_box in gt_bboxes:
-            if compute_iou(candidate_box, gt_box) > 0.0:
-                has_overlap = True
-                break
-        
-        if not has_overlap:
-            return candidate_box
-
-    return None
-
 def get_dynamic_context_ratio(bbox_size: float) -> float:
     """根据尺寸动态计算扩充比例"""
     sizes = [20, 100]
@@ -216,18 +154,15 @@ def main(
         img_h, img_w = first_img_shape
 
         # 2. 生成 N 组负样本
-        for _ in range(samples_per_image):
-            # A. 随机生成 1 个位置 (BBox)
-            rand_bbox = generate_random_bbox(
-                image_shape=(img_h, img_w),
-                gt_bboxes=current_gt_bboxes,
-                ref_sizes=ref_size_pool,
-                max_trials=50
-            )
-
-            if rand_bbox is None:
-                continue # 找不到合适的位置，跳过这次尝试
-
+        # A. 一次性批量采样 N 个不与 GT 重叠的位置 (BBox)，找不到足够位置时返回的数量会少于 N
+        rand_bboxes = sample_background_bboxes(
+            image_shape=(img_h, img_w),
+            gt_bboxes=current_gt_bboxes,
+            num_samples=samples_per_image,
+            ref_sizes=ref_size_pool
+        )
+
+        for rand_bbox in rand_bboxes:
             # B. 随机分配一个“假”标签 (Prior Label)
             # 模拟：检出器错误地认为这里是 scratch，但实际上是 background
             prior_label = random.choice(DEFECT_MAP)
@@ -291,13 +226,148 @@ def main(
     with open(out_json_path, 'w', encoding='utf-8') as f:
         json.dump(metadata_list, f, indent=2)
 
+def _process_negative_image(task: dict) -> list:
+    """
+    单张图像的负样本生成 (供进程池调用)
+    随机数由 (seed, image_id) 派生，文件先以临时名保存，全局 id 和最终文件名在合并阶段确定
+    """
+    file_name = task['file_name']
+    file_stem = Path(file_name).stem
+    image_root_dir, save_img_dir, data_root = task['image_root_dir'], task['save_img_dir'], task['data_root']
+    py_rng, np_rng = make_image_rngs(task['seed'], task['image_id'])
+
+    light_images = {}
+    for light in REQUIRED_LIGHTS:
+        img_path = image_root_dir / light / file_name
+        if not img_path.exists():
+            return []
+        img = cv2.imread(str(img_path))
+        if img is None:
+            return []
+        light_images[light] = img
+
+    rand_bboxes = sample_background_bboxes(
+        image_shape=light_images[REQUIRED_LIGHTS[0]].shape[:2],
+        gt_bboxes=task['gt_bboxes'],
+        num_samples=task['samples_per_image'],
+        ref_sizes=task['ref_size_pool'],
+        rng=np_rng
+    )
+
+    groups = []
+    for k, rand_bbox in enumerate(rand_bboxes):
+        prior_label = py_rng.choice(DEFECT_MAP)
+
+        temp_crops = {}
+        for light in REQUIRED_LIGHTS:
+            crop = get_region_proposal(light_images[light], rand_bbox, fixed_context_ratio=0.4)
+            if crop is None or crop.size == 0:
+                break
+            temp_crops[light] = crop
+        if len(temp_crops) != len(REQUIRED_LIGHTS):
+            continue
+
+        group = []
+        for light in REQUIRED_LIGHTS:
+            save_path = save_img_dir / f"{file_stem}_{light}_neg_tmp{k}.png"
+            cv2.imwrite(str(save_path), temp_crops[light])
+            try:
+                rel_original_path = (image_root_dir / light / file_name).relative_to(data_root)
+                rel_crop_path = save_path.relative_to(data_root)
+            except ValueError:
+                continue
+
+            group.append({
+                "original_image_path": str(rel_original_path),
+                "crop_image_path": str(rel_crop_path),
+                "bbox": rand_bbox,
+                "label": "background",
+                "prior_label": prior_label,
+                "light_source": light,
+                "sample_type": "negative",
+                RENAME_KEY: f"{file_stem}_{light}_neg_{{id}}.png"
+            })
+        groups.append(group)
+
+    return groups
+
+def main_parallel(
+    data_root: Path,
+    dataset_name: str,
+    split: str,
+    samples_per_image: int = 2,
+    num_workers: int = 8,
+    seed: int = 42
+):
+    """
+    main 的进程池版本
+    每张图的随机数由 (seed, image_id) 派生，结果按 image_id 升序合并，
+    因此不论 num_workers 取多少，生成的文件名和 JSON 完全一致
+    """
+    raw_dir = data_root / '1_paint_rgb' / dataset_name
+    json_path = raw_dir / 'labels' / f'{split}.json'
+    image_root_dir = raw_dir / 'images'
+
+    output_base_dir = data_root / '2_paint_bbox' / f'{dataset_name}_gt_negative'
+    save_img_dir = output_base_dir / 'images' / split
+    save_label_dir = output_base_dir / 'labels'
+    save_img_dir.mkdir(parents=True, exist_ok=True)
+    save_label_dir.mkdir(parents=True, exist_ok=True)
+
+    print(f"正在加载标签文件: {json_path} ...")
+    with open(json_path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+
+    img_id_to_info = {img['id']: img for img in data['images']}
+    img_id_to_anns = defaultdict(list)
+    all_defect_sizes = []
+    for ann in data['annotations']:
+        img_id_to_anns[ann['image_id']].append(ann)
+        all_defect_sizes.append((ann['bbox'][2], ann['bbox'][3]))
+
+    # 尺寸参考池 (在主进程中用固定种子抽取，所有 worker 共享)
+    if len(all_defect_sizes) > 2000:
+        ref_size_pool = random.Random(seed).sample(all_defect_sizes, 2000)
+    else:
+        ref_size_pool = all_defect_sizes
+
+    tasks = [
+        {
+            'image_id': image_id,
+            'file_name': img_id_to_info[image_id]['file_name'],
+            'gt_bboxes': [ann['bbox'] for ann in img_id_to_anns[image_id]],
+            'samples_per_image': samples_per_image,
+            'ref_size_pool': ref_size_pool,
+            'seed': seed,
+            'image_root_dir': image_root_dir,
+            'save_img_dir': save_img_dir,
+            'data_root': data_root,
+        }
+        for image_id in sorted(img_id_to_info)
+    ]
+    print(f"开始并行处理 {len(tasks)} 张图像，目标生成负样本 (workers={num_workers})...")
+
+    results = run_image_tasks(_process_negative_image, tasks, num_workers, desc=f"Generating Neg {split}")
+    metadata_list = merge_sample_groups(results, data_root)
+
+    out_json_path = save_label_dir / f'{split}.json'
+    print(f"正在保存负样本元数据到: {out_json_path}")
+    with open(out_json_path, 'w', encoding='utf-8') as f:
+        json.dump(metadata_list, f, indent=2)
+
 if __name__ == "__main__":
     DATA_ROOT = Path('/data/ZS/defect_dataset')
     
     # 你的项目名称
     PROJECT_NAME = 'stripe_phase012' # 注意修改这里
     
+    # 并行进程数，设为 0 则使用原来的串行流程
+    NUM_WORKERS = 16
+
     # 分别处理 train 和 val
     # samples_per_image=2 表示每张大图生成 2 组 (2x4=8张) 负样本
-    main(DATA_ROOT, PROJECT_NAME, 'train', samples_per_image=2)
-    main(DATA_ROOT, PROJECT_NAME, 'val', samples_per_image=2)
\ No newline at end of file
+    for split in ['train', 'val']:
+        if NUM_WORKERS > 0:
+            main_parallel(DATA_ROOT, PROJECT_NAME, split, samples_per_image=2, num_workers=NUM_WORKERS, seed=42)
+        else:
+            main(DATA_ROOT, PROJECT_NAME, split, samples_per_image=2)
\ No newline at end of file
@@ -14,6 +14,7 @@ from pathlib import Path
 from collections import defaultdict
 from tqdm import tqdm
 import gc
+from defect_vlm.utils.bbox_sampler import sample_background_bboxes
 
 # 设置随机种子
 random.seed(42)
@@ -25,61 +26,8 @@ HARD_DEFECT_MAP = ('breakage', 'inclusion', 'scratch')
 # 必须存在的4个光源，顺序不敏感，但必须齐备
 REQUIRED_LIGHTS = ['16col', '16row', '32col', '32row']
 
-def compute_iou(box1, box2):
-    """计算IoU: box=[x, y, w, h]"""
-    x1, y1, w1, h1 = box1
-    x2, y2, w2, h2 = box2
-
-    b1_x1, b1_y1, b1_x2, b1_y2 = x1, y1, x1 + w1, y1 + h1
-    b2_x1, b2_y1, b2_x2, b2_y2 = x2, y2, x2 + w2, y2 + h2
-
-    inter_x1 = max(b1_x1, b2_x1)
-    inter_y1 = max(b1_y1, b2_y1)
-    inter_x2 = min(b1_x2, b2_x2)
-    inter_y2 = min(b1_y2, b2_y2)
-
-    if inter_x2 < inter_x1 or inter_y2 < inter_y1:
-        return 0.0
-
-    inter_area = (inter_x2 - inter_x1) * (inter_y2 - inter_y1)
-    b1_area = w1 * h1
-    b2_area = w2 * h2
-
-    union_area = b1_area + b2_area - inter_area
-    if union_area <= 0: return 0.0
-        
-    return inter_area / union_area
-
-# === 核心修改 2：强制生成极小的 BBox ===
-def generate_micro_random_bbox(image_shape, gt_bboxes, max_trials=50):
-    """生成一个极小的、且不与任何GT重叠的随机BBox"""
-    h_img, w_img = image_shape
-    
-    for _ in range(max_trials):
-        # 尺寸严格限制在 15 到 35 像素之间 (微小目标)
-        w = random.randint(8, 20)
-        h = random.randint(8, 20)
-        
-        # 2. 随机位置
-        if w_img - w <= 0 or h_img - h <= 0:
-            continue
-            
-        x = random.randint(0, w_img - w)
-        y = random.randint(0, h_img - h)
-        
-        candidate_box = [x, y, w, h]
-
-        # 3. IoU 检查 (必须是纯背景)
-        has_overlap = False
-        for gt_box in gt_bboxes:
-            if compute_iou(candidate_box, gt_box) > 0.0:
-                has_overlap = True
-                break
-        
-        if not has_overlap:
-            return candidate_box
-
-    return None
+# === 核心修改 2：强制生成极小的 BBox (尺寸在 8~20 像素之间，由 sample_background_bboxes 的 size_range 控制) ===
+MICRO_SIZE_RANGE = (8, 20)
 
 def get_region_proposal(image: np.ndarray, bbox: list, fixed_context_ratio: float = None) -> np.ndarray:
     """裁剪图像"""
@@ -188,17 +136,15 @@ def main(
         img_h, img_w = first_img_shape
 
         # 2. 生成 N 组负样本
-        for _ in range(samples_per_image):
-            # A. 随机生成 1 个【微小】位置
-            rand_bbox = generate_micro_random_bbox(
-                image_shape=(img_h, img_w),
-                gt_bboxes=current_gt_bboxes,
-                max_trials=50
-            )
-
-            if rand_bbox is None:
-                continue 
-
+        # A. 一次性批量采样 N 个【微小】且不与 GT 重叠的位置
+        rand_bboxes = sample_background_bboxes(
+            image_shape=(img_h, img_w),
+            gt_bboxes=current_gt_bboxes,
+            num_samples=samples_per_image,
+            size_range=MICRO_SIZE_RANGE
+        )
+
+        for rand_bbox in rand_bboxes:
             # B. 限定在最易混淆的 3 种缺陷中分配假先验
             prior_label = random.choice(HARD_DEFECT_MAP)
 
@@ -10,6 +10,7 @@ from pathlib import Path
 from collections import defaultdict
 from tqdm import tqdm
 import gc
+from defect_vlm.utils.parallel_runner import run_image_tasks, merge_sample_groups
 
 # 设置随机种子
 random.seed(42)
@@ -190,6 +191,95 @@ def main(data_root: Path, dataset_name: str, split: str, light_sources: list):
     with open(out_json_path, 'w', encoding='utf-8') as f:
         json.dump(metadata_list, f, indent=2)
 
+def _process_positive_image(task: dict) -> list:
+    """单张图像的正样本裁剪 (供进程池调用)，返回样本组列表，全局 id 在合并阶段分配"""
+    file_name = task['file_name']
+    file_stem = Path(file_name).stem
+    image_root_dir, save_img_dir, data_root = task['image_root_dir'], task['save_img_dir'], task['data_root']
+    groups = []
+
+    for light in task['light_sources']:
+        original_img_path = image_root_dir / light / file_name
+        if not original_img_path.exists():
+            continue
+        raw_image = cv2.imread(str(original_img_path))
+        if raw_image is None:
+            continue
+
+        for i, ann in enumerate(task['anns']):
+            bbox = ann['bbox']
+            cat_name = task['cat_id_to_name'].get(ann['category_id'], 'unknown')
+
+            crop = get_region_proposal(raw_image, bbox)
+            if crop is None or crop.size == 0:
+                continue
+
+            save_path = save_img_dir / f"{file_stem}_{light}_{cat_name}_{i}.png"
+            cv2.imwrite(str(save_path), crop)
+
+            try:
+                rel_original_path = original_img_path.relative_to(data_root)
+                rel_crop_path = save_path.relative_to(data_root)
+            except ValueError as e:
+                print(f"路径错误: {e}")
+                continue
+
+            groups.append([{
+                "original_image_path": str(rel_original_path),
+                "crop_image_path": str(rel_crop_path),
+                "bbox": bbox,
+                "label": cat_name,
+                "light_source": light
+            }])
+    return groups
+
+def main_parallel(data_root: Path, dataset_name: str, split: str, light_sources: list, num_workers: int = 8):
+    """
+    main 的进程池版本：按 image_id 升序合并结果，输出与 worker 数量无关
+    (正样本裁剪本身不涉及随机数，因此不需要派生种子)
+    """
+    raw_dir = data_root / '1_paint_rgb' / dataset_name
+    json_path = raw_dir / 'labels' / f'{split}.json'
+    image_root_dir = raw_dir / 'images'
+
+    output_base_dir = data_root / '2_paint_bbox' / f'{dataset_name}_gt_positive'
+    save_img_dir = output_base_dir / 'images' / split
+    save_label_dir = output_base_dir / 'labels'
+    save_img_dir.mkdir(parents=True, exist_ok=True)
+    save_label_dir.mkdir(parents=True, exist_ok=True)
+
+    print(f"正在加载标签文件: {json_path} ...")
+    with open(json_path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+
+    img_id_to_info = {img['id']: img for img in data['images']}
+    cat_id_to_name = {cat['id']: cat['name'] for cat in data['categories']}
+    img_id_to_anns = defaultdict(list)
+    for ann in data['annotations']:
+        img_id_to_anns[ann['image_id']].append(ann)
+
+    tasks = [
+        {
+            'file_name': img_id_to_info[image_id]['file_name'],
+            'anns': img_id_to_anns[image_id],
+            'light_sources': light_sources,
+            'cat_id_to_name': cat_id_to_name,
+            'image_root_dir': image_root_dir,
+            'save_img_dir': save_img_dir,
+            'data_root': data_root,
+        }
+        for image_id in sorted(img_id_to_anns) if image_id in img_id_to_info
+    ]
+    print(f"开始并行处理 {len(tasks)} 张含有标注的图像 (workers={num_workers})...")
+
+    results = run_image_tasks(_process_positive_image, tasks, num_workers, desc=f"Processing {split}")
+    metadata_list = merge_sample_groups(results, data_root)
+
+    out_json_path = save_label_dir / f'{split}.json'
+    print(f"正在保存元数据到: {out_json_path}")
+    with open(out_json_path, 'w', encoding='utf-8') as f:
+        json.dump(metadata_list, f, indent=2)
+
 if __name__ == "__main__":
     # 配置锚点路径
     DATA_ROOT = Path('/data/ZS/defect_dataset')
@@ -200,6 +290,12 @@ if __name__ == "__main__":
     #                  '32col0', '32col1', '32col2', '32row0', '32row1', '32row2']
     light_sources = ['16col','16row', '32col', '32row'] 
 
+    # 并行进程数，设为 0 则使用原来的串行流程
+    NUM_WORKERS = 16
+
     # 分别处理 train 和 val
-    main(DATA_ROOT, dataset_name, 'train', light_sources)
-    main(DATA_ROOT, dataset_name, 'val', light_sources)
+    for split in ['train', 'val']:
+        if NUM_WORKERS > 0:
+            main_parallel(DATA_ROOT, dataset_name, split, light_sources, num_workers=NUM_WORKERS)
+        else:
+            main(DATA_ROOT, dataset_name, split, light_sources)
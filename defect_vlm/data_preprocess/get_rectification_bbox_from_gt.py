@@ -14,6 +14,7 @@ from pathlib import Path
 from collections import defaultdict
 from tqdm import tqdm
 import gc
+from defect_vlm.utils.parallel_runner import make_image_rngs, run_image_tasks, merge_sample_groups, RENAME_KEY
 
 # 设置随机种子
 random.seed(42)
@@ -188,9 +189,137 @@ def main(
     with open(out_json_path, 'w', encoding='utf-8') as f:
         json.dump(metadata_list, f, indent=2)
 
+def _process_rectification_image(task: dict) -> list:
+    """
+    单张图像的纠错样本生成 (供进程池调用)
+    假标签由 (seed, image_id) 派生的随机数决定，文件先以临时名保存，合并阶段再确定全局 id
+    """
+    file_name = task['file_name']
+    file_stem = Path(file_name).stem
+    image_root_dir, save_img_dir, data_root = task['image_root_dir'], task['save_img_dir'], task['data_root']
+    categories, all_defect_names = task['categories'], task['all_defect_names']
+    py_rng, _ = make_image_rngs(task['seed'], task['image_id'])
+
+    light_images = {}
+    for light in REQUIRED_LIGHTS:
+        path = image_root_dir / light / file_name
+        if not path.exists():
+            return []
+        img = cv2.imread(str(path))
+        if img is None:
+            return []
+        light_images[light] = img
+
+    groups = []
+    for idx, ann in enumerate(task['anns']):
+        gt_bbox = ann['bbox']
+        true_label = categories.get(ann['category_id'], 'unknown')
+
+        possible_fakes = [c for c in all_defect_names if c != true_label]
+        if not possible_fakes: continue
+        fake_label = py_rng.choice(possible_fakes)
+
+        temp_crops = {}
+        for light in REQUIRED_LIGHTS:
+            crop = get_region_proposal(light_images[light], gt_bbox)
+            if crop is None or crop.size == 0:
+                break
+            temp_crops[light] = crop
+        if len(temp_crops) != len(REQUIRED_LIGHTS): continue
+
+        group = []
+        for light in REQUIRED_LIGHTS:
+            save_path = save_img_dir / f"{file_stem}_{light}_rect_tmp{idx}.png"
+            cv2.imwrite(str(save_path), temp_crops[light])
+            try:
+                rel_original_path = (image_root_dir / light / file_name).relative_to(data_root)
+                rel_crop_path = save_path.relative_to(data_root)
+            except ValueError:
+                continue
+
+            group.append({
+                "original_image_path": str(rel_original_path),
+                "crop_image_path": str(rel_crop_path),
+                "bbox": gt_bbox,
+                "label": true_label,
+                "prior_label": fake_label,
+                "light_source": light,
+                "sample_type": "rectification",
+                RENAME_KEY: f"{file_stem}_{light}_rect_{true_label}_as_{fake_label}_{{id}}.png"
+            })
+        groups.append(group)
+
+    return groups
+
+def main_parallel(
+    data_root: Path,
+    dataset_name: str,
+    split: str,
+    num_workers: int = 8,
+    seed: int = 42
+    ):
+    """
+    main 的进程池版本：每张图的随机数由 (seed, image_id) 派生，结果按 image_id 升序合并，
+    不论 num_workers 取多少，输出完全一致
+    """
+    raw_dir = data_root / '1_paint_rgb' / dataset_name
+    json_path = raw_dir / 'labels' / f'{split}.json'
+    image_root_dir = raw_dir / 'images'
+
+    output_base_dir = data_root / '2_paint_bbox' / f'{dataset_name}_gt_rectification'
+    save_img_dir = output_base_dir / 'images' / split
+    save_label_dir = output_base_dir / 'labels'
+    save_img_dir.mkdir(parents=True, exist_ok=True)
+    save_label_dir.mkdir(parents=True, exist_ok=True)
+
+    print(f"正在加载标签文件: {json_path} ...")
+    with open(json_path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+
+    categories = {cat['id']: cat['name'] for cat in data['categories']}
+    all_defect_names = [name for name in categories.values() if name.lower() != 'background']
+    if len(all_defect_names) < 2:
+        print("警告: 缺陷类别不足 2 个，无法构造类别混淆样本！")
+        return
+
+    img_id_to_info = {img['id']: img for img in data['images']}
+    img_id_to_anns = defaultdict(list)
+    for ann in data['annotations']:
+        img_id_to_anns[ann['image_id']].append(ann)
+
+    tasks = [
+        {
+            'image_id': image_id,
+            'file_name': img_id_to_info[image_id]['file_name'],
+            'anns': img_id_to_anns[image_id],
+            'categories': categories,
+            'all_defect_names': all_defect_names,
+            'seed': seed,
+            'image_root_dir': image_root_dir,
+            'save_img_dir': save_img_dir,
+            'data_root': data_root,
+        }
+        for image_id in sorted(img_id_to_anns) if image_id in img_id_to_info
+    ]
+    print(f"开始并行生成纠错样本 (Rectification, workers={num_workers})...")
+
+    results = run_image_tasks(_process_rectification_image, tasks, num_workers, desc=f"Processing {split}")
+    metadata_list = merge_sample_groups(results, data_root)
+
+    out_json_path = save_label_dir / f'{split}.json'
+    print(f"纠错样本元数据已保存至: {out_json_path}")
+    with open(out_json_path, 'w', encoding='utf-8') as f:
+        json.dump(metadata_list, f, indent=2)
+
 if __name__ == "__main__":
     DATA_ROOT = Path('/data/ZS/defect_dataset')
     PROJECT_NAME = 'stripe_phase123' 
 
-    main(DATA_ROOT, PROJECT_NAME, 'train')
-    main(DATA_ROOT, PROJECT_NAME, 'val')
+    # 并行进程数，设为 0 则使用原来的串行流程
+    NUM_WORKERS = 16
+
+    for split in ['train', 'val']:
+        if NUM_WORKERS > 0:
+            main_parallel(DATA_ROOT, PROJECT_NAME, split, num_workers=NUM_WORKERS, seed=42)
+        else:
+            main(DATA_ROOT, PROJECT_NAME, split)
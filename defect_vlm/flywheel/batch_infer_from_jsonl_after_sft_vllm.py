@@ -6,7 +6,10 @@
 """
 import os
 import json
+import time
 from tqdm import tqdm
+from defect_vlm.utils.tracing import span, count, observe
+from defect_vlm.utils.json_early_stop import EarlyStopStats, stop_words_for, finalize_engine_output, resolve_stop_mode
 from typing import List
 os.environ['MAX_PIXELS'] = '1003520'
 
@@ -20,7 +23,7 @@ from swift import InferRequest, RequestConfig
 from swift.infer_engine import VllmEngine
 
 
-def init_engine(model_path: str):
+def init_engine(model_path: str, early_stop: str='off'):
     """
     初始化 vLLM 模型引擎和配置参数
     """
@@ -36,7 +39,7 @@ def init_engine(model_path: str):
     )
     
     # max_tokens 设为你需要生成的最大长度，temperature=0 保证输出稳定性，不需要 logprobs
-    request_config = RequestConfig(max_tokens=4096, temperature=0)
+    request_config = RequestConfig(max_tokens=4096, temperature=0, stop=stop_words_for(early_stop))
     
     return engine, request_config
 
@@ -58,7 +61,8 @@ def build_requests(data_chunk: list) -> List[InferRequest]:
     return infer_requests
 
 
-def infer_and_save_chunk(engine: VllmEngine, request_config: RequestConfig, data_chunk: list, output_path: str):
+def infer_and_save_chunk(engine: VllmEngine, request_config: RequestConfig, data_chunk: list, output_path: str,
+                         early_stop_stats: EarlyStopStats=None):
     """
     1. 调用 build_requests 组装请求
     2. engine.infer() 批量推理
@@ -66,10 +70,15 @@ def infer_and_save_chunk(engine: VllmEngine, request_config: RequestConfig, data
     4. 写入文件
     """
     # 组装请求
-    infer_requests = build_requests(data_chunk)
+    with span("vlm_infer.build_requests", n=len(data_chunk)):
+        infer_requests = build_requests(data_chunk)
     
     # vLLM 推理 (内部自动处理并发和 PagedAttention)
-    resp_list = engine.infer(infer_requests, request_config)
+    with span("vlm_infer.engine", n=len(infer_requests)):
+        infer_start = time.perf_counter()
+        resp_list = engine.infer(infer_requests, request_config)
+    observe("vlm_infer.ms_per_item", (time.perf_counter() - infer_start) * 1000 / max(len(infer_requests), 1))
+    count("vlm_infer.items", len(infer_requests))
     
     # 将处理结果追加到原始数据中
     for i, resp in enumerate(resp_list):
@@ -79,14 +88,19 @@ def infer_and_save_chunk(engine: VllmEngine, request_config: RequestConfig, data
         else:
             data_chunk[i]['pred'] = ""
             print(f"⚠️ 警告: 第 {i} 条数据推理返回异常，已置为空字符串。")
+        if early_stop_stats is not None:
+            # JSON 结论完成即停止: on 模式补回被 stop 词截掉的右大括号，measure 模式只统计多余 token
+            completion_tokens = getattr(getattr(resp, 'usage', None), 'completion_tokens', 0)
+            data_chunk[i]['pred'], data_chunk[i]['early_stop'] = finalize_engine_output(
+                data_chunk[i]['pred'], completion_tokens, early_stop_stats)
     
     # 保存处理结果
-    with open(output_path, 'a', encoding='utf-8') as f:
+    with span("vlm_infer.write"), open(output_path, 'a', encoding='utf-8') as f:
         for item in data_chunk:
             f.write(json.dumps(item, ensure_ascii=False) + '\n')
 
 
-def main(input_path, output_path, model_path, chunk_size=64):
+def main(input_path, output_path, model_path, chunk_size=64, early_stop='off'):
     """
     主控流：
     vLLM 的吞吐量极大，可以将 chunk_size 设置得大一点（比如 64~128），
@@ -125,17 +139,22 @@ def main(input_path, output_path, model_path, chunk_size=64):
         return
         
     # 5. 加载引擎
-    engine, request_config = init_engine(model_path)
+    early_stop = resolve_stop_mode(early_stop, rest_data)     # stop 词只适用于只输出 defect 的提示词
+    engine, request_config = init_engine(model_path, early_stop)
+    early_stop_stats = EarlyStopStats(early_stop) if early_stop != 'off' else None
     
     # 6. 开始分块推理
     for i in tqdm(range(0, rest_items, chunk_size), desc='VLLM Inferencing'):
         try:
             chunk = rest_data[i: i+chunk_size]
-            infer_and_save_chunk(engine, request_config, chunk, output_path)
+            infer_and_save_chunk(engine, request_config, chunk, output_path, early_stop_stats)
         
         except Exception as e:
             print(f"❌ 处理索引 [{i}:{i+chunk_size}] 时发生错误: {e}")
 
+    if early_stop_stats is not None:
+        early_stop_stats.print_report()
+
 
 if __name__ == "__main__":
     # 1. 输入数据路径
@@ -7,11 +7,17 @@
 
 输出：
 能够直接被 `/data/ZS/v11_input/inference.py` 调用的格式
+
+build_chunks_from_manifest: chunk 选择改为对多流索引的过滤，输出一份子索引，
+inference.py 可以直接按子索引推理；需要目录结构时再增量物化 (只改动差异文件，不再整体删除重建)。
 """
 import os
 import json
 import shutil
 from pathlib import Path
+from defect_vlm.utils.multistream_manifest import (
+    build_manifest_from_layout, load_manifest, save_manifest, select_chunks, materialize_manifest
+)
 
 def build_symlinks_for_chunks(chunk_json, source_dir, target_dir, target_chunks=["chunk1"]):
     source_dir = Path(source_dir)
@@ -65,6 +71,26 @@ def build_symlinks_for_chunks(chunk_json, source_dir, target_dir, target_chunks=
     print(f"📁 目标路径: {target_dir}")
     print("="*50)
 
+def build_chunks_from_manifest(chunk_json, source_dir, target_manifest, target_chunks=["chunk1"], materialize_dir=None, mode='symlink'):
+    """
+    :param source_dir: 全量多流数据 (目录布局)，或者已经生成好的全量索引文件 (.json/.parquet)
+    :param target_manifest: 输出的子索引路径
+    :param materialize_dir: 不为 None 时，把子索引物化为 val/val_1.../images 目录
+                            (该目录专供本轮迭代使用，不在子索引中的旧链接会被清理，与 build_symlinks_for_chunks 重建目录等价)
+    """
+    source_dir = Path(source_dir)
+    if source_dir.is_file():
+        manifest = load_manifest(source_dir)
+    else:
+        manifest = build_manifest_from_layout(source_dir, splits=("val",))
+
+    sub_manifest = select_chunks(manifest, chunk_json, target_chunks)
+    save_manifest(sub_manifest, target_manifest)
+
+    if materialize_dir is not None:
+        materialize_manifest(sub_manifest, materialize_dir, mode=mode, with_labels=False, prune=True)
+    return sub_manifest
+
 if __name__ == '__main__':
     # ================= 配置区 =================
     CHUNK_JSON_PATH = "/data/ZS/flywheel_dataset/chunks/chunk_splits.json"              # 不用动
@@ -77,11 +103,23 @@ if __name__ == '__main__':
     # Iter 2: ["chunk1", "chunk2"]
     # Iter 3: ["chunk1", "chunk2", "chunk3"]
     TARGET_CHUNKS = ["chunk1", "chunk2", "chunk3"]
+
+    USE_MANIFEST = True                 # True: 只生成子索引 (推理时传 manifest_path={TARGET_BASE_DIR}/manifest.json)；False: 旧的软链接目录
+    MATERIALIZE = False                 # 使用索引时，是否仍然增量物化出软链接目录
     # ==========================================
 
-    build_symlinks_for_chunks(
-        chunk_json=CHUNK_JSON_PATH,
-        source_dir=SOURCE_BASE_DIR,
-        target_dir=TARGET_BASE_DIR,
-        target_chunks=TARGET_CHUNKS
-    )
+    if USE_MANIFEST:
+        build_chunks_from_manifest(
+            chunk_json=CHUNK_JSON_PATH,
+            source_dir=SOURCE_BASE_DIR,
+            target_manifest=f"{TARGET_BASE_DIR}/manifest.json",
+            target_chunks=TARGET_CHUNKS,
+            materialize_dir=TARGET_BASE_DIR if MATERIALIZE else None
+        )
+    else:
+        build_symlinks_for_chunks(
+            chunk_json=CHUNK_JSON_PATH,
+            source_dir=SOURCE_BASE_DIR,
+            target_dir=TARGET_BASE_DIR,
+            target_chunks=TARGET_CHUNKS
+        )
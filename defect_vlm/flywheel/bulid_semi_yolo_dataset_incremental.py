@@ -0,0 +1,454 @@
+"""
+增量式构建用于 YOLO 多流半监督训练的数据集 (GT + Pseudo Labels)。
+与 `bulid_semi_yolo_dataset.py` 产出的目录结构完全一致，区别在于：
+1. 在输出目录下维护一个清单文件 (semi_manifest.json)，记录每个软链接和标签文件的来源/内容摘要，
+   重建时只对比清单的差异，只增删改发生变化的图像和标签；
+2. 伪标签图像的宽高从缓存的 PNG 文件头索引中读取，不再逐张用 PIL 打开；
+3. 伪标签通过 VLM 样本的 origin_id 与拼图映射文件关联，不再依赖四舍五入后的浮点 bbox 作为键
+   (只有 id 解析失败时才回退到 bbox 键)；
+4. 软链接的创建/删除和标签文件的写入交给线程池并行执行。
+
+什么都没变的重建只需要扫描一遍目录和清单，几秒内完成。
+迭代之间复用同一个 OUTPUT_DIR 即可实现增量更新；如果需要保留旧迭代的快照，请先备份该目录。
+
+输入：
+原始纯粹的GT的数据集目录
+无标注的数据集图像目录
+组合不同光源的结果json文件
+对VLM处理结果过滤后的jsonl文件
+
+输出：
+最终的输出文件夹 + semi_manifest.json
+"""
+
+import os
+import json
+import struct
+import hashlib
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+from PIL import Image
+from tqdm import tqdm
+
+MANIFEST_NAME = "semi_manifest.json"
+MANIFEST_VERSION = 1
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+
+def get_bbox_key(bbox, decimals=4):
+    """
+    将 bbox 转化为保留固定小数位数的元组，仅在无法通过 id 关联时作为兜底的匹配键。
+    """
+    return tuple(round(float(x), decimals) for x in bbox)
+
+
+def convert_to_yolo_format(bbox, img_w, img_h):
+    """
+    将绝对坐标 [x_min, y_min, w, h] 转换为 YOLO 归一化中心点坐标 [x_center, y_center, w_norm, h_norm]
+    """
+    x_min, y_min, w, h = bbox
+    x_center = x_min + w / 2.0
+    y_center = y_min + h / 2.0
+
+    # 归一化并限制在 0-1 之间，防止越界报错
+    x_center = max(0.0, min(1.0, x_center / img_w))
+    y_center = max(0.0, min(1.0, y_center / img_h))
+    w_norm = max(0.0, min(1.0, w / img_w))
+    h_norm = max(0.0, min(1.0, h / img_h))
+
+    return [x_center, y_center, w_norm, h_norm]
+
+
+def parse_origin_id(vlm_id):
+    """
+    从 VLM 样本 id (例如 sp012_gt_pred_1000123) 中解析出拼图阶段的 origin_id。
+    解析失败返回 None。
+    """
+    tail = str(vlm_id).rsplit("_", 1)[-1]
+    return int(tail) if tail.isdigit() else None
+
+
+# ================= 图像尺寸索引 =================
+def read_png_size(img_path):
+    """
+    直接读取 PNG 文件头中的 IHDR 块获取 (宽, 高)，只读 24 个字节。
+    非 PNG 文件回退到 PIL (PIL 也是惰性读取文件头)。
+    """
+    with open(img_path, "rb") as f:
+        head = f.read(24)
+    if len(head) == 24 and head[:8] == PNG_SIGNATURE and head[12:16] == b"IHDR":
+        w, h = struct.unpack(">II", head[16:24])
+        return int(w), int(h)
+    with Image.open(img_path) as img:
+        return img.size
+
+
+class ImageSizeIndex:
+    """
+    图像尺寸缓存索引: {绝对路径: [mtime_ns, 文件大小, 宽, 高]}
+    文件的 mtime 或大小变化时自动失效并重新读取文件头。
+    """
+    def __init__(self, index_path):
+        self.index_path = Path(index_path)
+        self.entries = {}
+        self.dirty = False
+        if self.index_path.exists():
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                self.entries = json.load(f)
+
+    def get_size(self, img_path):
+        key = str(img_path)
+        st = os.stat(img_path)
+        cached = self.entries.get(key)
+        if cached is not None and cached[0] == st.st_mtime_ns and cached[1] == st.st_size:
+            return cached[2], cached[3]
+
+        w, h = read_png_size(img_path)
+        self.entries[key] = [st.st_mtime_ns, st.st_size, w, h]
+        self.dirty = True
+        return w, h
+
+    def save(self):
+        if not self.dirty:
+            return
+        self.index_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.index_path.with_suffix(".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.entries, f)
+        os.replace(tmp_path, self.index_path)
+        self.dirty = False
+
+
+# ================= 清单 =================
+def load_manifest(manifest_path):
+    """读取上一次构建的清单，不存在或版本不一致时返回空清单"""
+    empty = {"version": MANIFEST_VERSION, "links": {}, "labels": {}}
+    if not manifest_path.exists():
+        return empty
+    with open(manifest_path, "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+    if manifest.get("version") != MANIFEST_VERSION:
+        print(f"⚠️ 清单版本不一致 ({manifest.get('version')} != {MANIFEST_VERSION})，将按全量重建处理。")
+        return empty
+    return manifest
+
+
+def save_manifest(manifest_path, manifest):
+    tmp_path = manifest_path.with_suffix(".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False)
+    os.replace(tmp_path, manifest_path)
+
+
+def text_digest(text):
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+# ================= 期望状态 =================
+def build_pseudo_dict(mapping_json, refined_jsonl, class_name2id):
+    """
+    解析映射文件和精炼伪标签，按图片重组数据。
+    返回: {filename: [{"bbox", "cls_id", "weight"}, ...]}
+    """
+    id2filename = {}
+    bbox2filename = {}
+    with open(mapping_json, "r", encoding="utf-8") as f:
+        for item in json.load(f):
+            filename = Path(item["original_image_paths"][0]).name
+            id2filename[item["id"]] = filename
+            bbox2filename[get_bbox_key(item["bbox"])] = filename
+
+    print(f"   [状态] 成功建立 {len(id2filename)} 个 id 映射关系。")
+
+    pseudo_dict = {}
+    miss_count = 0
+    fallback_count = 0
+    with open(refined_jsonl, "r", encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            data = json.loads(line)
+
+            # route_proposals 直通的框没有拼图 (id 为 trusted_x)，精炼结果中直接带有原图文件名
+            filename = data.get("original_image")
+            if filename is None:
+                filename = id2filename.get(parse_origin_id(data["id"]))
+            if filename is None:
+                filename = bbox2filename.get(get_bbox_key(data["bbox"]))
+                if filename is not None:
+                    fallback_count += 1
+
+            if filename is None:
+                miss_count += 1
+                if miss_count <= 5:
+                    print(f"⚠️ 映射表中找不到样本 {data['id']}，跳过该伪标签。")
+                continue
+
+            final_label = data["final_label"]
+            if final_label not in class_name2id:
+                continue
+
+            pseudo_dict.setdefault(filename, []).append({
+                "bbox": data["bbox"],
+                "cls_id": class_name2id[final_label],
+                "weight": data["final_weight"]
+            })
+
+    if fallback_count > 0:
+        print(f"⚠️ 有 {fallback_count} 个伪标签无法通过 id 关联，已回退到 bbox 键匹配。")
+    if miss_count > 0:
+        print(f"⚠️ 总共有 {miss_count} 个伪标签无法在映射表中找到对应文件。")
+    return pseudo_dict
+
+
+def plan_gt(gt_dir):
+    """
+    扫描 GT 目录，生成期望的软链接和标签。
+    标签只记录源文件的 (mtime_ns, size) 签名，内容在真正需要写入时才读取。
+    """
+    links = {}
+    labels = {}
+    gt_train_count = 0
+    gt_val_count = 0
+
+    for split in ["train", "val"]:
+        for i in range(6):
+            folder = f"{split}_{i}" if i > 0 else split
+            src_img_dir = gt_dir / folder / "images"
+            if not src_img_dir.exists():
+                continue
+
+            with os.scandir(src_img_dir) as it:
+                names = sorted(e.name for e in it if e.name.endswith(".png"))
+
+            for name in names:
+                links[f"{folder}/images/{name}"] = str(src_img_dir / name)
+
+                # 【核心】：仅在主分支生成 labels
+                if i == 0:
+                    stem = Path(name).stem
+                    src_lbl_path = gt_dir / split / "labels" / f"{stem}.txt"
+                    if src_lbl_path.exists():
+                        st = os.stat(src_lbl_path)
+                        labels[f"{split}/labels/{stem}.txt"] = {
+                            "src": str(src_lbl_path),
+                            "sig": [st.st_mtime_ns, st.st_size]
+                        }
+                    if split == "train":
+                        gt_train_count += 1
+                    else:
+                        gt_val_count += 1
+
+    return links, labels, gt_train_count, gt_val_count
+
+
+def plan_pseudo(pseudo_dict, unlabeled_dir, size_index):
+    """生成伪标签图像的期望软链接和标签内容 (标签内容用 sha1 摘要表示)"""
+    links = {}
+    labels = {}
+    contents = {}
+    pseudo_img_count = 0
+
+    for filename in sorted(pseudo_dict):
+        anns = pseudo_dict[filename]
+        src_main_img = unlabeled_dir / "val" / "images" / filename
+        if not src_main_img.exists():
+            print(f"⚠️ 找不到无标签原图: {src_main_img}，跳过该图。")
+            continue
+
+        img_w, img_h = size_index.get_size(src_main_img)
+
+        for i in range(6):
+            src_folder = f"val_{i}" if i > 0 else "val"
+            dst_folder = f"train_{i}" if i > 0 else "train"
+            src_img = unlabeled_dir / src_folder / "images" / filename
+            if src_img.exists():
+                links[f"{dst_folder}/images/{filename}"] = str(src_img)
+
+        lines = []
+        for ann in anns:
+            norm_bbox = convert_to_yolo_format(ann["bbox"], img_w, img_h)
+            lines.append(f"{ann['cls_id']} {norm_bbox[0]:.6f} {norm_bbox[1]:.6f} {norm_bbox[2]:.6f} {norm_bbox[3]:.6f} {ann['weight']:.4f}\n")
+        text = "".join(lines)
+
+        rel_lbl = f"train/labels/{Path(filename).stem}.txt"
+        labels[rel_lbl] = {"digest": text_digest(text)}
+        contents[rel_lbl] = text
+        pseudo_img_count += 1
+
+    return links, labels, contents, pseudo_img_count
+
+
+# ================= 落盘操作 =================
+def render_gt_label(src_lbl_path):
+    """GT 数据末尾追加权重 1.0"""
+    lines = []
+    with open(src_lbl_path, "r") as fin:
+        for line in fin:
+            parts = line.strip().split()
+            if len(parts) >= 5:
+                lines.append(f"{parts[0]} {parts[1]} {parts[2]} {parts[3]} {parts[4]} 1.0\n")
+    return "".join(lines)
+
+
+def _remove(path):
+    if os.path.lexists(path):
+        os.remove(path)
+
+
+def _relink(src, dst):
+    if os.path.lexists(dst):
+        os.remove(dst)
+    os.symlink(src, dst)
+
+
+def _write_text(path, text):
+    with open(path, "w") as f:
+        f.write(text)
+
+
+def run_parallel(fn, args_list, num_workers, desc):
+    if not args_list:
+        return
+    with ThreadPoolExecutor(max_workers=num_workers) as pool:
+        futures = [pool.submit(fn, *args) for args in args_list]
+        for fut in tqdm(futures, desc=desc, leave=False):
+            fut.result()
+
+
+def build_semi_dataset_incremental(
+    gt_dir,
+    unlabeled_dir,
+    mapping_json,
+    refined_jsonl,
+    output_dir,
+    class_name2id,
+    size_index_path=None,
+    num_workers=16
+):
+    gt_dir = Path(gt_dir)
+    unlabeled_dir = Path(unlabeled_dir)
+    output_dir = Path(output_dir)
+    manifest_path = output_dir / MANIFEST_NAME
+    # 尺寸索引默认放在输出目录的上一级，供同一迭代的 row3/col3 等视角共享
+    size_index_path = Path(size_index_path) if size_index_path else output_dir.parent / ".image_size_index.json"
+
+    print(f"🚀 开始增量构建半监督快照数据集: {output_dir}")
+
+    # ================= 1. 解析伪标签 =================
+    print("📖 正在解析映射文件与精炼伪标签...")
+    pseudo_dict = build_pseudo_dict(mapping_json, refined_jsonl, class_name2id)
+
+    # ================= 2. 生成期望状态 =================
+    print("🧮 正在扫描 GT 与无标签图像，生成期望状态...")
+    size_index = ImageSizeIndex(size_index_path)
+    gt_links, gt_labels, gt_train_count, gt_val_count = plan_gt(gt_dir)
+    ps_links, ps_labels, ps_contents, pseudo_img_count = plan_pseudo(pseudo_dict, unlabeled_dir, size_index)
+    size_index.save()
+
+    # 与全量脚本的行为保持一致：同名时图像软链接保留 GT (全量脚本只在目标不存在时才链接伪标签图像)，
+    # 标签文件则被伪标签覆盖 (全量脚本后写伪标签 TXT)
+    new_links = dict(ps_links)
+    new_links.update(gt_links)
+    new_labels = dict(gt_labels)
+    new_labels.update(ps_labels)
+
+    # ================= 3. 与旧清单做差分 =================
+    old_manifest = load_manifest(manifest_path)
+    old_links = old_manifest["links"]
+    old_labels = old_manifest["labels"]
+
+    stale_links = [rel for rel in old_links if rel not in new_links]
+    stale_labels = [rel for rel in old_labels if rel not in new_labels]
+
+    link_jobs = []
+    for rel, src in new_links.items():
+        dst = output_dir / rel
+        if old_links.get(rel) != src or not os.path.lexists(dst):
+            link_jobs.append((src, dst))
+
+    label_jobs = []
+    for rel, entry in new_labels.items():
+        dst = output_dir / rel
+        if old_labels.get(rel) == entry and dst.exists():
+            continue
+        text = ps_contents[rel] if rel in ps_contents else render_gt_label(entry["src"])
+        label_jobs.append((dst, text))
+
+    print(f"   [差分] 软链接: 新增/更新 {len(link_jobs)}，删除 {len(stale_links)}")
+    print(f"   [差分] 标签  : 新增/更新 {len(label_jobs)}，删除 {len(stale_labels)}")
+
+    # ================= 4. 落盘 =================
+    sub_dirs = [f"train_{i}" if i > 0 else "train" for i in range(6)] + \
+               [f"val_{i}" if i > 0 else "val" for i in range(6)]
+    for sub in sub_dirs:
+        (output_dir / sub / "images").mkdir(parents=True, exist_ok=True)
+        (output_dir / sub / "labels").mkdir(parents=True, exist_ok=True)
+
+    run_parallel(_remove, [(output_dir / rel,) for rel in stale_links + stale_labels], num_workers, "清理过期文件")
+    run_parallel(_relink, link_jobs, num_workers, "创建软链接")
+    run_parallel(_write_text, label_jobs, num_workers, "写入标签")
+
+    save_manifest(manifest_path, {
+        "version": MANIFEST_VERSION,
+        "sources": {
+            "gt_dir": str(gt_dir),
+            "unlabeled_dir": str(unlabeled_dir),
+            "mapping_json": str(mapping_json),
+            "refined_jsonl": str(refined_jsonl),
+        },
+        "links": new_links,
+        "labels": new_labels
+    })
+
+    print("\n" + "=" * 50)
+    print("✅ 半监督超级数据集增量构建完成！")
+    print("=" * 50)
+    print(f"📁 存放路径: {output_dir}")
+    print(f"📄 清单文件: {manifest_path}")
+    print("📊 数据规模统计:")
+    print(f"  ├── 真实标注 (GT) Train 图像数 : {gt_train_count} 张")
+    print(f"  ├── 真实标注 (GT) Val 图像数   : {gt_val_count} 张")
+    print(f"  ├── 注入伪标签 (Pseudo) 图像数 : {pseudo_img_count} 张 (全量注入 Train)")
+    print("  │")
+    print(f"  ├── 🎯 融合后 Train 集实际规模 : {gt_train_count + pseudo_img_count} 张")
+    print(f"  └── 🌐 最终全量数据集总规模    : {gt_train_count + gt_val_count + pseudo_img_count} 张")
+    print(f"🔁 本次实际改动: 软链接 {len(link_jobs) + len(stale_links)} 个, 标签 {len(label_jobs) + len(stale_labels)} 个")
+    print("=" * 50)
+
+
+if __name__ == '__main__':
+    # 类别映射字典
+    CLASS_NAME2ID = {
+        "breakage": 0,
+        "inclusion": 1,
+        "scratch": 2,
+        "crater": 3,
+        "run": 4,
+        "bulge": 5
+    }
+
+    # 复制的图像
+    GT_DIR = "/data/ZS/v11_input/datasets/row3"                                         # 这里用的是创建软链接的方式，这个文件夹里面的内容一定不能动！
+    UNLABELED_DIR = "/data/ZS/flywheel_dataset/0_multi_input/sp012/row3"                # 这里用的是创建软链接的方式，这个文件夹里面的内容一定不能动！
+
+    # 路径配置1，不用sp123(因为baseline是在sp012训练的)
+    MAPPING_JSON = "/data/ZS/flywheel_dataset/4_composite_yolo_preds/iter3/labels/0p1_chunk123.json"
+    REFINED_JSONL = "/data/ZS/flywheel_dataset/8_pseudo_labels/iter3/0p1_chunk123_v1_LM_12.json"
+
+    # 路径配置2，修改横向还是纵向条纹 (迭代之间复用同一个目录即可增量更新)
+    OUTPUT_DIR = "/data/ZS/flywheel_dataset/9_semi_yolo_dataset/latest/row3"
+
+    # 图像尺寸缓存，放在不会被清理的公共位置，跨迭代复用
+    SIZE_INDEX_PATH = "/data/ZS/flywheel_dataset/9_semi_yolo_dataset/.image_size_index.json"
+
+    build_semi_dataset_incremental(
+        gt_dir=GT_DIR,
+        unlabeled_dir=UNLABELED_DIR,
+        mapping_json=MAPPING_JSON,
+        refined_jsonl=REFINED_JSONL,
+        output_dir=OUTPUT_DIR,
+        class_name2id=CLASS_NAME2ID,
+        size_index_path=SIZE_INDEX_PATH,
+        num_workers=16
+    )
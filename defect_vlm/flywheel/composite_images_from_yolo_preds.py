@@ -10,6 +10,7 @@ import numpy as np
 from pathlib import Path
 from collections import defaultdict
 from tqdm import tqdm
+from defect_vlm.utils.tracing import span, count
 
 # === 全局配置 ===
 LIGHT_ORDER = ["16col", "16row", "32col", "32row"]
@@ -121,15 +122,17 @@ def process_composite_inference(input_json: str, data_root: str, output_img_dir:
             orig_abs_path = os.path.join(data_root, it['original_image_path'])
             crop_abs_path = os.path.join(data_root, it['crop_image_path'])
             
-            orig_img = cv2.imread(orig_abs_path)
-            crop_img = cv2.imread(crop_abs_path)
+            with span("composite.imread"):
+                orig_img = cv2.imread(orig_abs_path)
+                crop_img = cv2.imread(crop_abs_path)
             
             if orig_img is None or crop_img is None:
                 valid_group = False
                 break
                 
-            orig_with_box = draw_bbox_on_image(orig_img, bbox)
-            crop_resized = letter_resize_bbox(crop_img, target_size=300) 
+            with span("composite.draw_resize"):
+                orig_with_box = draw_bbox_on_image(orig_img, bbox)
+                crop_resized = letter_resize_bbox(crop_img, target_size=300) 
             
             original_imgs_draw.append(orig_with_box)
             crop_imgs_resize.append(crop_resized)
@@ -138,10 +141,12 @@ def process_composite_inference(input_json: str, data_root: str, output_img_dir:
             crop_paths_record.append(it['crop_image_path'])
             
         if not valid_group:
+            count("composite.invalid_groups")
             continue
             
-        final_global_img = composite_2x2_images(original_imgs_draw, target_size=600)
-        final_local_img = composite_2x2_images(crop_imgs_resize, target_size=600)
+        with span("composite.compose"):
+            final_global_img = composite_2x2_images(original_imgs_draw, target_size=600)
+            final_local_img = composite_2x2_images(crop_imgs_resize, target_size=600)
         
         global_filename = f"global_{current_id}.png"
         local_filename = f"local_{current_id}.png"
@@ -149,8 +154,10 @@ def process_composite_inference(input_json: str, data_root: str, output_img_dir:
         global_save_path = os.path.join(output_img_dir, global_filename)
         local_save_path = os.path.join(output_img_dir, local_filename)
         
-        cv2.imwrite(global_save_path, final_global_img)
-        cv2.imwrite(local_save_path, final_local_img)
+        with span("composite.imwrite"):
+            cv2.imwrite(global_save_path, final_global_img)
+            cv2.imwrite(local_save_path, final_local_img)
+        count("composite.groups")
         
         # 自动计算相对路径 (基于 DATA_ROOT)，再也不需要手工拼接 split 或 project 字符串
         try:
@@ -173,6 +180,8 @@ def process_composite_inference(input_json: str, data_root: str, output_img_dir:
             "original_crop_paths": [p.replace("\\", "/") for p in crop_paths_record]
         }
         
+        if 'cluster_id' in base_item:
+            out_item["cluster_id"] = base_item['cluster_id']
         processed_data_list.append(out_item)
         current_id += 1
 
@@ -18,6 +18,8 @@ if PROJECT_ROOT not in sys.path:
 
 # 导入 Ultralytics 的核心评估和绘图工具
 from ultralytics.utils.metrics import ConfusionMatrix, ap_per_class, box_iou
+from defect_vlm.utils.gt_index import load_gt_index
+from defect_vlm.utils.tracing import span, count
 
 def evaluate_fusion_results(pred_json, gt_json, output_dir):
     """
@@ -28,28 +30,20 @@ def evaluate_fusion_results(pred_json, gt_json, output_dir):
     
     # 1. 解析 Ground Truth (COCO 格式)
     print(f"📖 正在加载真实标签: {gt_json}")
-    with open(gt_json, 'r', encoding='utf-8') as f:
-        coco_gt = json.load(f)
-        
-    # 建立映射字典
-    names_dict = {cat['id']: cat['name'] for cat in coco_gt['categories']}
-    imgid2name = {img['id']: img['file_name'] for img in coco_gt['images']}
-    
-    # 将 COCO 的 [x,y,w,h] 转换为 YOLO 的 [x1,y1,x2,y2]
-    gt_dict = {img['file_name']: [] for img in coco_gt['images']}
-    for ann in coco_gt['annotations']:
-        img_name = imgid2name[ann['image_id']]
-        cat_id = ann['category_id']
-        x, y, w, h = ann['bbox']
-        gt_dict[img_name].append([cat_id, x, y, x + w, y + h])
+    with span("metric.load_gt"):
+        gt_index = load_gt_index(gt_json)
+        names_dict = gt_index.names_dict
+        # 扁平数组 + 偏移表的 GT 索引，已完成 xywh -> xyxy 转换 (带磁盘缓存)
+        gt_dict = gt_index.to_gt_dict()
         
     # 2. 解析 Predictions (你的 fusion.json)
     print(f"📖 正在加载预测结果: {pred_json}")
-    with open(pred_json, 'r', encoding='utf-8') as f:
-        pred_dict = json.load(f)
+    with span("metric.load_pred"):
+        with open(pred_json, 'r', encoding='utf-8') as f:
+            pred_dict = json.load(f)
 
-    if 'config' in pred_dict:
-        del pred_dict['config']         # 删除之前保存的决策融合的配置项
+        if 'config' in pred_dict:
+            del pred_dict['config']         # 删除之前保存的决策融合的配置项
 
     # 3. 准备 Ultralytics 的评估工具
     # 设置 10 个 IoU 阈值，从 0.5 到 0.95 (用于计算 mAP@50-95)
@@ -64,62 +58,65 @@ def evaluate_fusion_results(pred_json, gt_json, output_dir):
     print("⚙️ 正在对比每一张图像的预测框与真实框...")
     all_images = set(gt_dict.keys()).union(set(pred_dict.keys()))
     
-    for filename in all_images:
-        gts = gt_dict.get(filename, [])
-        preds = pred_dict.get(filename, [])
+    with span("metric.match", images=len(all_images)):
+        for filename in all_images:
+            gts = gt_dict.get(filename, [])
+            preds = pred_dict.get(filename, [])
         
-        # 转换为 Tensor 格式
-        # labels: [M, 5] (class_id, x1, y1, x2, y2)
-        labels = torch.tensor(gts, dtype=torch.float32) if len(gts) > 0 else torch.empty(0, 5)
+            # 转换为 Tensor 格式
+            # labels: [M, 5] (class_id, x1, y1, x2, y2)
+            labels = torch.tensor(gts, dtype=torch.float32) if len(gts) > 0 else torch.empty(0, 5)
         
-        # detections: [N, 6] (x1, y1, x2, y2, conf, class_id)
-        if len(preds) > 0:
-            detections = torch.tensor(
-                [[p['bbox'][0], p['bbox'][1], p['bbox'][2], p['bbox'][3], p['confidence'], p['class_id']]
-                 for p in preds], dtype=torch.float32
-            )
-            # 必须按照置信度降序排列
-            detections = detections[detections[:, 4].argsort(descending=True)]
+            # detections: [N, 6] (x1, y1, x2, y2, conf, class_id)
+            if len(preds) > 0:
+                detections = torch.tensor(
+                    [[p['bbox'][0], p['bbox'][1], p['bbox'][2], p['bbox'][3], p['confidence'], p['class_id']]
+                     for p in preds], dtype=torch.float32
+                )
+                # 必须按照置信度降序排列
+                detections = detections[detections[:, 4].argsort(descending=True)]
             
-            # <--- ✨ 新增：极其关键的 Top-K 截断机制，完美对齐官方评测 --->
-            max_det = 300  # YOLO 官方验证默认保留前 300 个高分框
-            if detections.shape[0] > max_det:
-                detections = detections[:max_det]
+                # <--- ✨ 新增：极其关键的 Top-K 截断机制，完美对齐官方评测 --->
+                max_det = 300  # YOLO 官方验证默认保留前 300 个高分框
+                if detections.shape[0] > max_det:
+                    detections = detections[:max_det]
 
-        else:
-            detections = torch.empty(0, 6)
+            else:
+                detections = torch.empty(0, 6)
 
-        # 核心逻辑：匹配 TP (True Positives)
-        tp = torch.zeros((detections.shape[0], len(iouv)), dtype=torch.bool)
-        if labels.shape[0] > 0 and detections.shape[0] > 0:
-            ious = box_iou(labels[:, 1:], detections[:, :4])
-            correct_class = labels[:, 0:1] == detections[:, 5]
+            # 核心逻辑：匹配 TP (True Positives)
+            tp = torch.zeros((detections.shape[0], len(iouv)), dtype=torch.bool)
+            if labels.shape[0] > 0 and detections.shape[0] > 0:
+                ious = box_iou(labels[:, 1:], detections[:, :4])
+                correct_class = labels[:, 0:1] == detections[:, 5]
             
-            for i, threshold in enumerate(iouv):
-                matches = torch.nonzero((ious >= threshold) & correct_class)
-                if matches.shape[0] > 0:
-                    matches_iou = ious[matches[:, 0], matches[:, 1]]
-                    matches = torch.cat([matches, matches_iou[:, None]], dim=1)
-                    matches = matches[matches[:, 2].argsort(descending=True)]
+                for i, threshold in enumerate(iouv):
+                    matches = torch.nonzero((ious >= threshold) & correct_class)
+                    if matches.shape[0] > 0:
+                        matches_iou = ious[matches[:, 0], matches[:, 1]]
+                        matches = torch.cat([matches, matches_iou[:, None]], dim=1)
+                        matches = matches[matches[:, 2].argsort(descending=True)]
                     
-                    matched_labels, matched_detections = set(), set()
-                    for m in matches:
-                        l_idx, d_idx = int(m[0]), int(m[1])
-                        if l_idx not in matched_labels and d_idx not in matched_detections:
-                            matched_labels.add(l_idx)
-                            matched_detections.add(d_idx)
-                            tp[d_idx, i] = True
+                        matched_labels, matched_detections = set(), set()
+                        for m in matches:
+                            l_idx, d_idx = int(m[0]), int(m[1])
+                            if l_idx not in matched_labels and d_idx not in matched_detections:
+                                matched_labels.add(l_idx)
+                                matched_detections.add(d_idx)
+                                tp[d_idx, i] = True
                             
-        # 更新混淆矩阵 (拆分传入坐标和类别)
-        cm.process_batch(detections, labels[:, 1:], labels[:, 0])
+            # 更新混淆矩阵 (拆分传入坐标和类别)
+            cm.process_batch(detections, labels[:, 1:], labels[:, 0])
         
-        # 记录给 mAP 计算器的数据
-        stats.append((
-            tp,
-            detections[:, 4] if len(detections) > 0 else torch.empty(0),
-            detections[:, 5] if len(detections) > 0 else torch.empty(0),
-            labels[:, 0] if len(labels) > 0 else torch.empty(0)
-        ))
+            # 记录给 mAP 计算器的数据
+            stats.append((
+                tp,
+                detections[:, 4] if len(detections) > 0 else torch.empty(0),
+                detections[:, 5] if len(detections) > 0 else torch.empty(0),
+                labels[:, 0] if len(labels) > 0 else torch.empty(0)
+            ))
+
+    count("metric.images", len(all_images))
 
     # 5. 拼合所有统计数据
     print("📊 正在计算 mAP 并绘制曲线...")
@@ -128,13 +125,14 @@ def evaluate_fusion_results(pred_json, gt_json, output_dir):
 
     # 6. 生成所有指标并绘图
     # 新版 YOLO 的 ap_per_class 返回 12 个变量
-    tp_arr, fp_arr, p, r, f1, all_ap, ap_class, p_curve, r_curve, f1_curve, x, prec_values = ap_per_class(
-        tp, conf, pred_cls, target_cls, 
-        plot=True, 
-        save_dir=output_dir, 
-        names=names_dict,
-        prefix="Fusion_"  # 给图表加上前缀，防止和普通评估混淆
-    )
+    with span("metric.ap_per_class"):
+        tp_arr, fp_arr, p, r, f1, all_ap, ap_class, p_curve, r_curve, f1_curve, x, prec_values = ap_per_class(
+            tp, conf, pred_cls, target_cls, 
+            plot=True, 
+            save_dir=output_dir, 
+            names=names_dict,
+            prefix="Fusion_"  # 给图表加上前缀，防止和普通评估混淆
+        )
     
     # <--- 核心修改点：提取 mAP@0.5, mAP@0.75, mAP@[0.5:0.95] --->
     # all_ap 矩阵的形状为 [nc, 10]，代表每个类别在 10 个 IoU 阈值下的 AP
@@ -143,8 +141,9 @@ def evaluate_fusion_results(pred_json, gt_json, output_dir):
     ap_mean = all_ap.mean(1)  # 对 10 个阈值求平均，即 mAP@[0.5:0.95]
 
     # 绘制并保存混淆矩阵
-    cm.plot(save_dir=output_dir, names=tuple(names_dict.values()), normalize=True)
-    cm.plot(save_dir=output_dir, names=tuple(names_dict.values()), normalize=False)
+    with span("metric.plot_cm"):
+        cm.plot(save_dir=output_dir, names=tuple(names_dict.values()), normalize=True)
+        cm.plot(save_dir=output_dir, names=tuple(names_dict.values()), normalize=False)
     
     # 保存所有的指标并打印
     report_str = "=" * 70 + "\n"
@@ -0,0 +1,156 @@
+"""
+流式多模型权重融合脚本 (Memory-mapped, N-way EMA Fusion)
+`ema_fusion.py` 会把 Teacher 和 Student 两个 checkpoint (连同 optimizer 状态) 完整读入内存再逐层融合。
+这里改为：
+1. 用 torch.load(mmap=True) 以内存映射方式打开所有 checkpoint，张量只有在被访问时才按页读入；
+2. 逐个张量进行 FP32 累加融合，峰值内存约为 "输出模型 + 单个张量的临时缓冲"，与参与融合的模型数量无关；
+3. 支持 N 个 checkpoint 任意权重的加权平均，或者跨多轮迭代的 EMA 链 (一次调用完成)；
+4. 融合结果直接写回第一个 checkpoint 的映射张量 (写时复制)，不额外构造第二份完整副本，
+   其余 checkpoint 中的 optimizer / 训练状态永远不会被读入内存。
+
+EMA 链: T_0 = C_0, T_k = alpha_k * T_{k-1} + (1 - alpha_k) * C_k
+可以展开为对 C_0..C_n 的一次加权平均，因此和 N 路加权融合共用同一个流式内核。
+
+注意：只对浮点张量做融合，整型 buffer (如 BN 的 num_batches_tracked) 直接沿用第一个 checkpoint 的值。
+"""
+import sys
+import torch
+from pathlib import Path
+PROJECT_ROOT = '/data/ZS/v11_input'
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+
+def ema_chain_weights(alphas):
+    """
+    将 EMA 链的动量参数展开为每个 checkpoint 的线性权重
+    :param alphas: [alpha_1, ..., alpha_n]，对应 C_1..C_n 加入时 Teacher 的保留比例
+    :return: [w_0, w_1, ..., w_n]，和为 1
+    """
+    weights = [1.0]
+    for alpha in alphas:
+        weights = [w * alpha for w in weights]
+        weights.append(1.0 - alpha)
+    return weights
+
+
+def load_ckpt_mmap(ckpt_path):
+    """以内存映射方式加载 checkpoint (需要 torch >= 2.1 且为新版 zip 格式)"""
+    return torch.load(ckpt_path, map_location='cpu', mmap=True, weights_only=False)
+
+
+def get_state_dict(ckpt):
+    """提取真正的模型对象 (YOLO 官方通常把最优权重放在 'ema' 或 'model' 键值下)"""
+    model = ckpt.get('ema') or ckpt['model']
+    return model, model.state_dict()
+
+
+def fuse_checkpoints_streaming(ckpt_paths, weights, output_ckpt_path):
+    """
+    N 路流式加权融合
+    :param ckpt_paths: checkpoint 路径列表，第一个作为结构与元信息的基底
+    :param weights: 与 ckpt_paths 等长的权重列表，和不为 1 时会自动归一化
+    :param output_ckpt_path: 融合后的输出路径
+    """
+    if len(ckpt_paths) != len(weights):
+        raise ValueError(f"checkpoint 数量 ({len(ckpt_paths)}) 与权重数量 ({len(weights)}) 不一致")
+    if len(ckpt_paths) < 2:
+        raise ValueError("至少需要两个 checkpoint 才能融合")
+
+    total = float(sum(weights))
+    if total <= 0:
+        raise ValueError(f"权重之和必须为正数: {weights}")
+    if abs(total - 1.0) > 1e-6:
+        print(f"⚠️ 权重之和为 {total:.6f}，已自动归一化。")
+        weights = [w / total for w in weights]
+
+    print("=" * 60)
+    print("🔄 开始执行流式多模型权重融合...")
+    for path, w in zip(ckpt_paths, weights):
+        print(f"   📦 {w:.6f} x {path}")
+
+    # 1. 内存映射加载，此时几乎不占用物理内存
+    ckpts = [load_ckpt_mmap(p) for p in ckpt_paths]
+    base_ckpt = ckpts[0]
+    base_model, base_sd = get_state_dict(base_ckpt)
+    other_sds = [get_state_dict(c)[1] for c in ckpts[1:]]
+
+    # 2. 逐个张量融合
+    print("⚙️  正在逐张量进行参数空间融合...")
+    fused_layers = 0
+    skipped = []
+
+    with torch.no_grad():
+        for k, v_base in base_sd.items():
+            if not torch.is_floating_point(v_base):
+                continue
+
+            vs = [sd.get(k) for sd in other_sds]
+            if any(v is None or v.shape != v_base.shape for v in vs):
+                skipped.append(k)
+                continue
+
+            # 统一转为 FP32 进行高精度累加，防止 FP16 溢出
+            acc = v_base.float() * weights[0]
+            for w, v in zip(weights[1:], vs):
+                acc.add_(v.float(), alpha=w)
+
+            # 写回基底张量并恢复原有数据类型 (mmap 为写时复制，不会修改磁盘上的源文件)
+            v_base.copy_(acc.to(v_base.dtype))
+            fused_layers += 1
+            del acc
+
+    # 3. 清理冗余数据，瘦身打包 (剔除 optimizer，因为新 Teacher 只用于推理或作为下一轮的起点)
+    base_ckpt['model'] = base_model
+    base_ckpt['ema'] = None
+    if 'optimizer' in base_ckpt:
+        base_ckpt['optimizer'] = None
+    del other_sds, ckpts
+
+    # 4. 保存
+    output_path = Path(output_ckpt_path)
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    torch.save(base_ckpt, output_path)
+
+    print("-" * 60)
+    print(f"✅ 融合完成！共处理了 {fused_layers} 个张量。")
+    if skipped:
+        print(f"⚠️ 有 {len(skipped)} 个张量因缺失或形状不一致被跳过 (沿用基底权重)，例如: {skipped[:3]}")
+    print(f"💾 新代模型已保存至: {output_path}")
+    print("=" * 60)
+
+
+def apply_ema_chain_streaming(ckpt_paths, alphas, output_ckpt_path):
+    """
+    EMA 链融合: 依次将 ckpt_paths[1:] 以 alphas 融入 ckpt_paths[0]，等价于多次调用 ema_fusion.py
+    :param ckpt_paths: [C_0 (最初的 Teacher), C_1, ..., C_n (各轮 Student)]
+    :param alphas: [alpha_1, ..., alpha_n]
+    """
+    if len(alphas) != len(ckpt_paths) - 1:
+        raise ValueError(f"EMA 链需要 {len(ckpt_paths) - 1} 个 alpha，实际提供了 {len(alphas)} 个")
+    weights = ema_chain_weights(alphas)
+    print(f"🔗 EMA 链展开后的权重: {[round(w, 6) for w in weights]}")
+    fuse_checkpoints_streaming(ckpt_paths, weights, output_ckpt_path)
+
+
+if __name__ == '__main__':
+    # ================= 配置区 =================
+    # 模式 1: EMA 链 (第一个是最初的 Teacher，后面依次是各轮训练出来的 Student)
+    CKPT_CHAIN = [
+        "/data/ZS/defect-vlm/output/yolo_weights/yolo_gt_col3.pt",
+        "/data/ZS/defect-vlm/output/yolo_weights/iter1_col3_0p1.pt",
+        "/data/ZS/defect-vlm/output/yolo_weights/iter2_3_col3_0p1.pt",
+        "/data/ZS/defect-vlm/output/yolo_weights/iter3_9_col3_0p1.pt",
+    ]
+    ALPHAS = [0.01, 0.01, 0.01]      # 每一步 EMA 的动量因子 (关键超参数！)
+
+    # 模式 2: N 路任意权重融合 (设为 None 则使用模式 1)
+    CUSTOM_WEIGHTS = None            # 例如 [0.2, 0.3, 0.5] ，需与 CKPT_CHAIN 等长
+
+    OUTPUT_WEIGHT = "/data/ZS/defect-vlm/output/yolo_weights/iter3_9_col3_0p1_emachain0p01.pt"
+    # ==========================================
+
+    if CUSTOM_WEIGHTS is not None:
+        fuse_checkpoints_streaming(CKPT_CHAIN, CUSTOM_WEIGHTS, OUTPUT_WEIGHT)
+    else:
+        apply_ema_chain_streaming(CKPT_CHAIN, ALPHAS, OUTPUT_WEIGHT)
@@ -6,6 +6,7 @@
 import os
 import json
 from pathlib import Path
+from defect_vlm.utils.vlm_response_parser import parse_label_strict
 
 def extract_vlm_core_data(input_jsonl, output_dir):
     input_path = Path(input_jsonl)
@@ -42,10 +43,8 @@ def extract_vlm_core_data(input_jsonl, output_dir):
                 confidence = meta["confidence"]
                 model_source = meta["model_source"]
                 
-                # 3. 将 pred 字符串反序列化为字典，并提取 defect
-                pred_str = data["pred"]
-                pred_dict = json.loads(pred_str)
-                defect_result = pred_dict["defect"]
+                # 3. 严格模式提取 defect (pred 必须是合法 JSON，否则触发 JSONDecodeError / KeyError)
+                defect_result = parse_label_strict(data["pred"])
                 
                 # 4. 组装清洗后的纯净数据
                 clean_data = {
@@ -57,6 +56,8 @@ def extract_vlm_core_data(input_jsonl, output_dir):
                     "prior_label": prior_label,
                     "vlm_pred": defect_result
                 }
+                if meta.get("original_image"):
+                    clean_data["original_image"] = meta["original_image"]   # 簇结论回填的成员框没有自己的拼图映射
                 
                 # 5. 写入新文件
                 fout.write(json.dumps(clean_data, ensure_ascii=False) + '\n')
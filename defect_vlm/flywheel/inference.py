@@ -23,8 +23,29 @@ import torch
 import numpy as np
 from ultralytics import YOLO
 from tqdm import tqdm
+from defect_vlm.utils.multistream_manifest import load_manifest, iter_multistream_images
 
-def run_multistream_inference(model_path, input_dir, output_json, conf_thres=0.001, nms_iou=0.6):
+def _load_stacked_from_dirs(input_dir, val_dirs, filename):
+    """依次读取各个视角的光照图像，并沿着通道维度拼接，形成 (H, W, N) 的多流 Numpy 数组"""
+    ims_list = []
+    for val_dir in val_dirs:
+        img_path = input_dir / val_dir / "images" / filename
+        if not img_path.exists():
+            print(f"\n⚠️ 警告: 缺失图像分支 {img_path}")
+            continue
+            
+        # 读取灰度图 (保持与你之前 base.py 中 load_image 的逻辑一致)
+        img = cv2.imread(str(img_path), cv2.IMREAD_GRAYSCALE)
+        if img is not None:
+            ims_list.append(img)
+    
+    if not ims_list:
+        return None
+        
+    # 如果是 6 个视角，则变成 (300, 300, 6)
+    return np.dstack(ims_list)
+
+def run_multistream_inference(model_path, input_dir, output_json, conf_thres=0.001, nms_iou=0.6, manifest_path=None):
     """
     多流 YOLO 模型推理脚本，并将结果保存为 JSON
     
@@ -33,6 +54,7 @@ def run_multistream_inference(model_path, input_dir, output_json, conf_thres=0.0
         input_dir: 输入的根目录 (例如: '/data/ZS/v11_input/datasets/col3')
         output_json: 保存的 json 文件路径
         conf_thres: 置信度阈值。级联融合前建议设低一点(如0.1)，把决策权交给后续的 NMS
+        manifest_path: 多流索引 (build_chunks.py 生成的子索引)，提供时直接按索引拼接读取各视角，不再依赖目录布局
     """
     input_dir = Path(input_dir)
     model_source = input_dir.name  # 提取模型来源名称，比如 'col3' 或 'row3'
@@ -46,43 +68,33 @@ def run_multistream_inference(model_path, input_dir, output_json, conf_thres=0.0
     # 获取类别映射字典 (例如 {0: 'breakage', 1: 'inclusion', ...})
     names_dict = model.names 
     
-    # 2. 探测有多少个输入流 (val, val_1, val_2 ...)
-    # 寻找所有以 val 开头的文件夹
-    val_dirs = sorted([d for d in os.listdir(input_dir) if d.startswith('val') and (input_dir / d).is_dir()])
-    print(f"🔍 探测到 {len(val_dirs)} 个多流数据文件夹: {val_dirs}")
-    
-    # 3. 获取所有验证集图片文件名 (以基础的 val 文件夹为准)
-    base_images_dir = input_dir / "val" / "images"
-    image_filenames = [f for f in os.listdir(base_images_dir) if f.endswith(('.png', '.jpg', '.jpeg'))]
-    print(f"📸 共找到 {len(image_filenames)} 张待推理图片。")
+    if manifest_path is not None:
+        # 2/3. 按索引读取，各视角由线程池预读并沿通道拼接
+        manifest = load_manifest(manifest_path)
+        image_filenames = list(manifest["images"].keys())
+        print(f"🔍 多流索引: {manifest_path} | 视角数: {len(manifest['suffixes'])}")
+        print(f"📸 共找到 {len(image_filenames)} 张待推理图片。")
+        stacked_iter = ((name, img) for name, img, _ in iter_multistream_images(manifest, image_filenames))
+    else:
+        # 2. 探测有多少个输入流 (val, val_1, val_2 ...)
+        # 寻找所有以 val 开头的文件夹
+        val_dirs = sorted([d for d in os.listdir(input_dir) if d.startswith('val') and (input_dir / d).is_dir()])
+        print(f"🔍 探测到 {len(val_dirs)} 个多流数据文件夹: {val_dirs}")
+        
+        # 3. 获取所有验证集图片文件名 (以基础的 val 文件夹为准)
+        base_images_dir = input_dir / "val" / "images"
+        image_filenames = [f for f in os.listdir(base_images_dir) if f.endswith(('.png', '.jpg', '.jpeg'))]
+        print(f"📸 共找到 {len(image_filenames)} 张待推理图片。")
+        stacked_iter = ((name, _load_stacked_from_dirs(input_dir, val_dirs, name)) for name in image_filenames)
     
     # 结果字典
     results_dict = {}
     
     # 4. 遍历所有图片进行推理
-    for filename in tqdm(image_filenames, desc="推理进度"):
-        ims_list = []
-        
-        # 依次读取各个视角的光照图像
-        for val_dir in val_dirs:
-            img_path = input_dir / val_dir / "images" / filename
-            if not img_path.exists():
-                print(f"\n⚠️ 警告: 缺失图像分支 {img_path}")
-                continue
-                
-            # 读取灰度图 (保持与你之前 base.py 中 load_image 的逻辑一致)
-            img = cv2.imread(str(img_path), cv2.IMREAD_GRAYSCALE)
-            if img is not None:
-                ims_list.append(img)
-        
-        if not ims_list:
+    for filename, stacked_img in tqdm(stacked_iter, total=len(image_filenames), desc="推理进度"):
+        if stacked_img is None:
             results_dict[filename] = []
             continue
-            
-        # 沿着通道维度拼接，形成 (H, W, N) 的多流 Numpy 数组
-        # 如果是 6 个视角，则变成 (300, 300, 6)
-        stacked_img = np.dstack(ims_list)
-        # stacked_img = stacked_img[..., ::-1]
         
         # 5. 执行推理
         # 直接传入 Numpy 数组，YOLO 内部会调用我们之前修复好的 LetterBox 补边，再转 Tensor
@@ -138,6 +150,7 @@ def main():
     parser.add_argument('--output_json', type=str, required=True, help='输出json路径')
     parser.add_argument('--conf_thres', type=float, required=True, help='置信度阈值')
     parser.add_argument('--nms_iou', type=float, required=True, default=0.6, help='NMS的默认IoU阈值')
+    parser.add_argument('--manifest_path', type=str, default=None, help='多流索引 (可选)，提供时按索引读取各视角')
     args = parser.parse_args()
 
     run_multistream_inference(
@@ -145,7 +158,8 @@ def main():
         input_dir = args.input_dir,
         output_json = args.output_json,
         conf_thres = args.conf_thres,            # 设低一点，让下一步的 NMS 去做决策
-        nms_iou = args.nms_iou
+        nms_iou = args.nms_iou,
+        manifest_path = args.manifest_path
     )
     
 if __name__ == '__main__':
@@ -156,7 +170,8 @@ if __name__ == '__main__':
         model_path="/data/ZS/defect-vlm/output/yolo_weights/iter1_col3_0p1_ema0p01.pt",  # 填入你昨晚训练出来的 col3 权重
         input_dir="/data/ZS/flywheel_dataset/0_multi_input/iter3/col3",
         output_json="/data/ZS/flywheel_dataset/2_yolo_preds/iter3_weight_iter1ema/col3_0p1_chunk123.json",
-        conf_thres=0.05            # 故意设低一点，让下一步的 NMS 去做决策
+        conf_thres=0.05,           # 故意设低一点，让下一步的 NMS 去做决策
+        manifest_path="/data/ZS/flywheel_dataset/0_multi_input/iter3/col3/manifest.json"   # build_chunks.py 生成的子索引
     )
 
     # 推理 GT 的验证集
@@ -0,0 +1,81 @@
+"""
+融合之后、抠图之前的 proposal 分流
+按伪标签精炼时使用的 (th_l, th_h) 把融合结果拆成三份 (规则见 defect_vlm/utils/proposal_routing.py)：
+    drop   : 直接丢弃
+    verify : 写成与融合结果相同格式的 json，后续照常走 crop -> composite -> message -> VLM
+    trust  : 写成提取后 VLM 数据的 JSONL 格式，作为 refine_pseudo_labels 的 trusted_jsonl 输入
+同时保存 meta (阈值 + 统计)，refine_pseudo_labels 会据此检查两边阈值是否一致。
+输入：/data/ZS/flywheel_dataset/2_yolo_preds 下的融合结果
+输出：verify 区间的融合 json + trust 区间的 JSONL + meta json
+"""
+import json
+from pathlib import Path
+from defect_vlm.utils.proposal_routing import route_fusion_preds, BAND_DROP, BAND_TRUST, BAND_VERIFY
+
+LIGHTS_PER_PROPOSAL = 4     # 每个框要在 4 个光源上抠图
+
+
+def route_meta_path(trusted_jsonl):
+    trusted_jsonl = Path(trusted_jsonl)
+    return trusted_jsonl.parent / f"{trusted_jsonl.stem}_route_meta.json"
+
+
+def route_proposals(fusion_json, verify_json, trusted_jsonl, th_l, th_h):
+    print(f"📖 正在加载融合结果: {fusion_json}")
+    with open(fusion_json, 'r', encoding='utf-8') as f:
+        fusion_preds = json.load(f)
+
+    verify_preds, trusted, stats = route_fusion_preds(fusion_preds, th_l, th_h)
+
+    verify_json, trusted_jsonl = Path(verify_json), Path(trusted_jsonl)
+    verify_json.parent.mkdir(parents=True, exist_ok=True)
+    trusted_jsonl.parent.mkdir(parents=True, exist_ok=True)
+    with open(verify_json, 'w', encoding='utf-8') as f:
+        json.dump(verify_preds, f, indent=2, ensure_ascii=False)
+    with open(trusted_jsonl, 'w', encoding='utf-8') as f:
+        for rec in trusted:
+            f.write(json.dumps(rec, ensure_ascii=False) + '\n')
+
+    total = max(stats["total"], 1)
+    saved = stats["total"] - stats[BAND_VERIFY]
+    meta = {
+        "th_l": th_l,
+        "th_h": th_h,
+        "fusion_json": str(fusion_json),
+        "verify_json": str(verify_json),
+        "statistics": stats,
+        "vlm_requests_saved_ratio": round(saved / total, 4),
+    }
+    with open(route_meta_path(trusted_jsonl), 'w', encoding='utf-8') as f:
+        json.dump(meta, f, ensure_ascii=False, indent=4)
+
+    print("\n" + "=" * 50)
+    print("🚦 Proposal 分流报告")
+    print("=" * 50)
+    print(f"   [配置] th_l: {th_l}, th_h: {th_h}")
+    print(f"📥 融合后候选框总数 : {stats['total']} (共 {stats['images']} 张图)")
+    print(f"  ├── 🗑️  [drop]   p < th_l 直接丢弃        : {stats[BAND_DROP]} ({stats[BAND_DROP] / total * 100:.2f}%)")
+    print(f"  ├── 🟢  [trust]  p >= th_h 直通精炼        : {stats[BAND_TRUST]} ({stats[BAND_TRUST] / total * 100:.2f}%)")
+    print(f"  └── 🔍  [verify] th_l <= p < th_h 送入 VLM : {stats[BAND_VERIFY]} ({stats[BAND_VERIFY] / total * 100:.2f}%)")
+    print("-" * 50)
+    print(f"⚡ VLM 请求减少 : {saved} 条 ({saved / total * 100:.2f}%)")
+    print(f"⚡ 免去抠图     : {saved * LIGHTS_PER_PROPOSAL} 张, 免去拼图: {saved} 组")
+    print("=" * 50)
+    print(f"✅ verify 区间融合结果已保存至: {verify_json}")
+    print(f"✅ trust 区间直通数据已保存至 : {trusted_jsonl}")
+    return stats
+
+
+if __name__ == '__main__':
+    # 1. 输入：融合结果
+    FUSION_JSON = "/data/ZS/flywheel_dataset/2_yolo_preds/iter3_weight_iter1ema/decision_fusion_0p1_chunk123.json"
+
+    # 2. 输出：verify 区间交给 crop_yolo_preds_bbox.py，trust 区间交给 refine_pseudo_labels.py
+    VERIFY_JSON = "/data/ZS/flywheel_dataset/2_yolo_preds/iter3_weight_iter1ema/decision_fusion_0p1_chunk123_verify.json"
+    TRUSTED_JSONL = "/data/ZS/flywheel_dataset/7_vlm_extracted_data/iter3_weight_iter1ema/0p1_chunk123_trusted.jsonl"
+
+    # 3. 阈值：必须与 refine_pseudo_labels.py 中使用的一致
+    th_l = 0.1      # R72
+    th_h = 0.83     # P95
+
+    route_proposals(FUSION_JSON, VERIFY_JSON, TRUSTED_JSONL, th_l, th_h)
@@ -0,0 +1,395 @@
+"""
+伪标签精炼超参数网格扫描 (th_l, th_h, eta, class_weights)
+`refine_pseudo_labels.py` 每次只能跑一组超参数，这里把提取后的 VLM JSONL 一次性读成数组，
+按置信度排序后构建前缀和，任意 (th_l, th_h) 组合下的决策漏斗统计 (抛弃/直通/一致/纠正) 和
+最终权重分布都可以通过 searchsorted + 前缀和差分在一次向量化计算中得到。
+
+可选：提供 GT (COCO json) 和拼图映射文件时，会把每个候选框与 GT 做一对一匹配 (IoU >= 0.5，类别无关)，
+进而给出每组超参数下伪标签的精确率、召回率和 F1。
+
+输入：
+/data/ZS/flywheel_dataset/7_vlm_extracted_data 里面提取后的 VLM 结果
+(可选) route_proposals.py 分流出的 trust 区间 JSONL (trusted_jsonl)，与 refine_pseudo_labels.py 一样合并后再扫描
+(可选) GT 的 COCO json + 4_composite_yolo_preds 下的拼图映射 json
+输出：
+sweep 结果表 (csv)，同时在终端打印按指定指标排序的前若干组
+"""
+import csv
+import json
+import itertools
+import numpy as np
+from pathlib import Path
+from collections import defaultdict
+from defect_vlm.flywheel.refine_pseudo_labels import iter_jsonl_records
+from defect_vlm.flywheel.route_proposals import route_meta_path
+
+VLM_BACKGROUND = -1
+VLM_INVALID = -2        # 类别表之外的预测、trust 区间没有 VLM 结论的框
+
+
+# ================= 1. 读取数据 =================
+def load_extracted_arrays(input_jsonl, class_names, trusted_jsonl=None):
+    """
+    将提取后的 VLM JSONL (以及可选的 trusted_jsonl) 读成按置信度升序排列的数组
+    返回 dict: conf(N,), prior(N,), vlm(N,) (background 为 -1，类别表之外的预测及缺失为 -2), ids(N,), bbox(N,4),
+              original_image(N,) (trust 区间 / 簇成员框自带的原图文件名，其余为 None)
+    """
+    name2idx = {name: i for i, name in enumerate(class_names)}
+    vlm2idx = dict(name2idx, background=VLM_BACKGROUND)
+    confs, priors, vlms, ids, bboxes, originals = [], [], [], [], [], []
+    invalid = defaultdict(int)
+    input_paths = [Path(input_jsonl)] + ([Path(trusted_jsonl)] if trusted_jsonl else [])
+
+    for data in iter_jsonl_records(input_paths):
+        vlm_pred = data["vlm_pred"]
+        confs.append(float(data["confidence"]))
+        priors.append(name2idx[data["prior_label"]])
+        vlm = vlm2idx.get(vlm_pred, VLM_INVALID)
+        if vlm == VLM_INVALID and data.get("route") != "trust":
+            invalid[vlm_pred] += 1
+        vlms.append(vlm)
+        ids.append(data["id"])
+        bboxes.append(data["bbox"])
+        originals.append(data.get("original_image"))
+
+    if invalid:
+        # refine_pseudo_labels.py 遇到这些记录 (落在 VLM 区间时) 会在 class_weights[final_label] 处抛出 KeyError
+        print(f"⚠️ 有 {sum(invalid.values())} 条 VLM 记录的 vlm_pred 不在类别表中: {dict(invalid)}，"
+              f"落在 VLM 区间的组合会在结果的 vlm_invalid 列中计数")
+
+    conf = np.asarray(confs, dtype=np.float64)
+    order = np.argsort(conf, kind='stable')
+    return {
+        "conf": conf[order],
+        "prior": np.asarray(priors, dtype=np.int64)[order],
+        "vlm": np.asarray(vlms, dtype=np.int64)[order],
+        "ids": [ids[i] for i in order],
+        "bbox": np.asarray(bboxes, dtype=np.float64).reshape(-1, 4)[order],
+        "original_image": [originals[i] for i in order],
+    }
+
+
+def match_to_gt(arrays, mapping_json, gt_json, class_names, iou_thresh=0.5):
+    """
+    将每个候选框与 GT 做类别无关的一对一贪心匹配 (按 IoU 从大到小)
+    返回: gt_label(N,) (未匹配为 -1)，以及 GT 总数 (只统计出现在候选图像中的图像)
+    带 original_image 的记录 (trust 区间直通框、簇成员框) 没有拼图映射，直接按原图文件名归属
+    """
+    with open(mapping_json, 'r', encoding='utf-8') as f:
+        id2filename = {item["id"]: Path(item["original_image_paths"][0]).name for item in json.load(f)}
+
+    with open(gt_json, 'r', encoding='utf-8') as f:
+        coco_gt = json.load(f)
+    catid2idx = {}
+    name2idx = {name: i for i, name in enumerate(class_names)}
+    for cat in coco_gt["categories"]:
+        if cat["name"] in name2idx:
+            catid2idx[cat["id"]] = name2idx[cat["name"]]
+    imgid2name = {img['id']: img['file_name'] for img in coco_gt['images']}
+    gt_dict = defaultdict(list)
+    for ann in coco_gt['annotations']:
+        x, y, w, h = ann['bbox']
+        gt_dict[imgid2name[ann['image_id']]].append([catid2idx.get(ann['category_id'], -1), x, y, x + w, y + h])
+
+    # 按图像聚合候选框索引
+    img2idx = defaultdict(list)
+    for i, vlm_id in enumerate(arrays["ids"]):
+        filename = arrays["original_image"][i]
+        if filename is None:
+            tail = str(vlm_id).rsplit("_", 1)[-1]
+            filename = id2filename.get(int(tail)) if tail.isdigit() else None
+        if filename is not None:
+            img2idx[filename].append(i)
+
+    gt_label = np.full(len(arrays["conf"]), -1, dtype=np.int64)
+    xywh = arrays["bbox"]
+    for filename, idxs in img2idx.items():
+        gts = np.asarray(gt_dict.get(filename, []), dtype=np.float64).reshape(-1, 5)
+        if len(gts) == 0:
+            continue
+        idxs = np.asarray(idxs)
+        boxes = xywh[idxs].copy()
+        boxes[:, 2:] += boxes[:, :2]
+
+        lt = np.maximum(boxes[:, None, :2], gts[None, :, 1:3])
+        rb = np.minimum(boxes[:, None, 2:], gts[None, :, 3:5])
+        inter = np.clip(rb - lt, 0, None).prod(axis=2)
+        area_p = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+        area_g = (gts[:, 3] - gts[:, 1]) * (gts[:, 4] - gts[:, 2])
+        ious = inter / (area_p[:, None] + area_g[None, :] - inter + 1e-16)
+
+        pi, gi = np.nonzero(ious >= iou_thresh)
+        order = np.argsort(-ious[pi, gi], kind='stable')
+        used_p, used_g = set(), set()
+        for k in order:
+            p, g = int(pi[k]), int(gi[k])
+            if p in used_p or g in used_g:
+                continue
+            used_p.add(p)
+            used_g.add(g)
+            gt_label[idxs[p]] = int(gts[g, 0])
+
+    total_gts = sum(len(gt_dict.get(name, [])) for name in img2idx)
+    return gt_label, total_gts
+
+
+# ================= 2. 前缀和 =================
+def build_prefix_tables(arrays, num_classes, gt_label=None):
+    """
+    为每一种决策分支构建前缀和表 (长度 N+1)，第 k 项表示置信度最低的前 k 个框中的累计值。
+    - trust / agreed 分支的最终类别是 prior，corrected 分支的最终类别是 vlm
+    - cls_*: 每个最终类别的计数 (N+1, C)
+    - conf_*: 每个最终类别的置信度累加 (N+1, C)，用于计算带 beta 的权重
+    - ok_*: 最终类别与 GT 一致的计数 (需要 gt_label)
+    """
+    conf, prior, vlm = arrays["conf"], arrays["prior"], arrays["vlm"]
+    n = len(conf)
+    is_bg = vlm == VLM_BACKGROUND
+    is_invalid = vlm == VLM_INVALID
+    agreed = (vlm >= 0) & (vlm == prior)
+    corrected = (vlm >= 0) & (vlm != prior)
+
+    def prefix(x):
+        out = np.zeros((n + 1,) + x.shape[1:], dtype=np.float64)
+        np.cumsum(x, axis=0, out=out[1:])
+        return out
+
+    onehot_prior = np.zeros((n, num_classes))
+    onehot_prior[np.arange(n), prior] = 1.0
+    onehot_vlm = np.zeros((n, num_classes))
+    vlm_valid = vlm >= 0
+    onehot_vlm[np.nonzero(vlm_valid)[0], vlm[vlm_valid]] = 1.0
+
+    tables = {
+        "bg": prefix(is_bg.astype(np.float64)),
+        "invalid": prefix(is_invalid.astype(np.float64)),
+        "agreed": prefix(agreed.astype(np.float64)),
+        "corrected": prefix(corrected.astype(np.float64)),
+        "cls_trust": prefix(onehot_prior),
+        "cls_agreed": prefix(onehot_prior * agreed[:, None]),
+        "cls_corrected": prefix(onehot_vlm * corrected[:, None]),
+        "conf_trust": prefix(onehot_prior * conf[:, None]),
+        "conf_agreed": prefix(onehot_prior * (agreed * conf)[:, None]),
+        "conf_corrected": prefix(onehot_vlm * (corrected * conf)[:, None]),
+    }
+    if gt_label is not None:
+        tables["ok_trust"] = prefix((gt_label == prior).astype(np.float64))
+        tables["ok_agreed"] = prefix((agreed & (gt_label == prior)).astype(np.float64))
+        tables["ok_corrected"] = prefix((corrected & (gt_label == vlm)).astype(np.float64))
+    return tables
+
+
+# ================= 3. 网格扫描 =================
+def sweep_grid(arrays, tables, class_names, th_l_list, th_h_list, eta_list, class_weights_list,
+               alpha=1.0, use_beta=False, total_gts=None):
+    """
+    对所有 (th_l, th_h) 组合一次性向量化计算漏斗统计，再对 eta / class_weights 做广播。
+    use_beta=False 与 refine_pseudo_labels.py 当前的行为一致 (beta 被强制置为 1.0)。
+    返回: list[dict]，每一项是一组超参数对应的一行结果
+    """
+    conf = arrays["conf"]
+    n = len(conf)
+
+    pairs = np.array([(l, h) for l, h in itertools.product(th_l_list, th_h_list) if l <= h], dtype=np.float64)
+    if len(pairs) == 0:
+        return []
+    # 升序数组上: conf < th 的个数 = searchsorted(th, 'left')
+    idx_l = np.searchsorted(conf, pairs[:, 0], side='left')
+    idx_h = np.searchsorted(conf, pairs[:, 1], side='left')
+
+    def band(key):
+        t = tables[key]
+        return t[idx_h] - t[idx_l]
+
+    def upper(key):
+        t = tables[key]
+        return t[n] - t[idx_h]
+
+    discard = idx_l.astype(np.float64)
+    trust = n - idx_h.astype(np.float64)
+    vlm_bg = band("bg")
+    vlm_agreed = band("agreed")
+    vlm_corrected = band("corrected")
+    vlm_invalid = band("invalid")
+
+    # 每个类别最终保留的数量 (P, C)
+    cls_keep = upper("cls_trust") + band("cls_agreed") + band("cls_corrected")
+    # 权重计算所需的分支量 (P, C)
+    if use_beta:
+        w_base = upper("conf_trust") + band("conf_agreed")
+        w_corr = band("conf_corrected")
+    else:
+        w_base = upper("cls_trust") + band("cls_agreed")
+        w_corr = band("cls_corrected")
+
+    ok_keep = None
+    if "ok_trust" in tables:
+        ok_keep = upper("ok_trust") + band("ok_agreed") + band("ok_corrected")
+
+    gammas = np.array([[cw[name] for name in class_names] for cw in class_weights_list], dtype=np.float64)
+    etas = np.asarray(eta_list, dtype=np.float64)
+
+    # 权重之和: (P, E, G)  —— 不带 beta 时 eta 不影响结果 (与原脚本一致)
+    corr_factor = etas if use_beta else np.ones_like(etas)
+    sum_base = w_base @ gammas.T                     # (P, G)
+    sum_corr = w_corr @ gammas.T                     # (P, G)
+    weight_sum = alpha * (sum_base[:, None, :] + corr_factor[None, :, None] * sum_corr[:, None, :])
+
+    saved = trust + vlm_agreed + vlm_corrected
+    rows = []
+    for p, (th_l, th_h) in enumerate(pairs):
+        for e, eta in enumerate(etas):
+            for g in range(len(gammas)):
+                row = {
+                    "th_l": round(float(th_l), 4),
+                    "th_h": round(float(th_h), 4),
+                    "eta": float(eta),
+                    "cw_idx": g,
+                    "total_input": n,
+                    "discard_low_conf": int(discard[p]),
+                    "trust_yolo_high": int(trust[p]),
+                    "vlm_discard_bg": int(vlm_bg[p]),
+                    "vlm_agreed": int(vlm_agreed[p]),
+                    "vlm_corrected": int(vlm_corrected[p]),
+                    "vlm_invalid": int(vlm_invalid[p]),
+                    "final_saved": int(saved[p]),
+                    "keep_rate": round(float(saved[p] / max(n, 1)), 4),
+                    "vlm_calls": int(n - discard[p] - trust[p]),
+                    "weight_sum": round(float(weight_sum[p, e, g]), 4),
+                    "weight_mean": round(float(weight_sum[p, e, g] / max(saved[p], 1)), 4),
+                }
+                for c, name in enumerate(class_names):
+                    row[f"n_{name}"] = int(cls_keep[p, c])
+                if ok_keep is not None:
+                    tp = float(ok_keep[p])
+                    prec = tp / saved[p] if saved[p] > 0 else 0.0
+                    rec = tp / total_gts if total_gts else 0.0
+                    row["precision"] = round(prec, 4)
+                    row["recall"] = round(rec, 4)
+                    row["f1"] = round(2 * prec * rec / (prec + rec + 1e-16), 4)
+                rows.append(row)
+    return rows
+
+
+def sweep_refine_pseudo_labels(
+    input_jsonl,
+    output_csv,
+    class_names,
+    th_l_list,
+    th_h_list,
+    eta_list,
+    class_weights_list,
+    alpha=1.0,
+    use_beta=False,
+    gt_json=None,
+    mapping_json=None,
+    sort_by="final_saved",
+    top_k=20,
+    trusted_jsonl=None
+):
+    output_csv = Path(output_csv)
+    output_csv.parent.mkdir(parents=True, exist_ok=True)
+
+    print(f"📖 正在加载 VLM 提取结果: {input_jsonl}")
+    if trusted_jsonl:
+        print(f"   [直通数据] {trusted_jsonl}")
+        meta_path = route_meta_path(trusted_jsonl)
+        if meta_path.exists():
+            with open(meta_path, 'r', encoding='utf-8') as f:
+                route_meta = json.load(f)
+            # 扫描的 th_h 高于分流阈值时，trust 区间的框会落入 VLM 区间却没有 VLM 结论
+            print(f"   [分流阈值] th_l: {route_meta['th_l']}, th_h: {route_meta['th_h']} "
+                  f"(只有 th_h 与之相同的组合和 refine_pseudo_labels.py 的实际输入一致)")
+    arrays = load_extracted_arrays(input_jsonl, class_names, trusted_jsonl)
+    print(f"   [状态] 共 {len(arrays['conf'])} 个候选框")
+
+    gt_label, total_gts = None, None
+    if gt_json and mapping_json:
+        print(f"📖 正在与 GT 匹配: {gt_json}")
+        gt_label, total_gts = match_to_gt(arrays, mapping_json, gt_json, class_names)
+        print(f"   [状态] 匹配到 GT 的候选框 {int((gt_label >= 0).sum())} 个，GT 总数 {total_gts}")
+
+    tables = build_prefix_tables(arrays, len(class_names), gt_label)
+    rows = sweep_grid(arrays, tables, class_names, th_l_list, th_h_list, eta_list, class_weights_list,
+                      alpha=alpha, use_beta=use_beta, total_gts=total_gts)
+    if not rows:
+        print("❌ 网格为空，请检查 th_l / th_h 配置 (需要 th_l <= th_h)。")
+        return
+
+    with open(output_csv, 'w', encoding='utf-8', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=list(rows[0].keys()))
+        writer.writeheader()
+        writer.writerows(rows)
+
+    meta_path = output_csv.parent / f"{output_csv.stem}_meta.json"
+    with open(meta_path, 'w', encoding='utf-8') as f:
+        json.dump({
+            "input_jsonl": str(input_jsonl),
+            "trusted_jsonl": str(trusted_jsonl) if trusted_jsonl else None,
+            "gt_json": gt_json,
+            "alpha": alpha,
+            "use_beta": use_beta,
+            "class_weights_list": class_weights_list
+        }, f, ensure_ascii=False, indent=4)
+
+    n_invalid = sum(r["vlm_invalid"] > 0 for r in rows)
+    if n_invalid:
+        print(f"⚠️ {n_invalid} 组超参数的 VLM 区间内有无效 vlm_pred (vlm_invalid > 0)，"
+              f"refine_pseudo_labels.py 在这些组合上会因 KeyError 中断，结果仅供参考")
+
+    if sort_by in rows[0]:
+        rows = sorted(rows, key=lambda r: r[sort_by], reverse=True)
+    cols = ["th_l", "th_h", "eta", "cw_idx", "discard_low_conf", "trust_yolo_high", "vlm_discard_bg",
+            "vlm_agreed", "vlm_corrected", "vlm_invalid", "final_saved", "weight_mean"]
+    if gt_label is not None:
+        cols += ["precision", "recall", "f1"]
+
+    print("\n" + "=" * 50)
+    print(f"🎯 超参数扫描完成，共 {len(rows)} 组 (按 {sort_by} 降序展示前 {top_k} 组)")
+    print("=" * 50)
+    print(" | ".join(f"{c:>10}" for c in cols))
+    for r in rows[:top_k]:
+        print(" | ".join(f"{r[c]:>10}" for c in cols))
+    print("=" * 50)
+    print(f"✅ 完整结果已保存至: {output_csv}")
+    print(f"📄 元数据已保存至: {meta_path}")
+
+
+if __name__ == '__main__':
+    CLASS_NAMES = ["breakage", "inclusion", "scratch", "crater", "run", "bulge"]
+
+    # 1. 路径配置
+    INPUT_JSONL = "/data/ZS/flywheel_dataset/7_vlm_extracted_data/iter3/0p1_chunk123_v1_LM.jsonl"
+    OUTPUT_CSV = "/data/ZS/defect-vlm/output/sweep/iter3_0p1_chunk123.csv"
+
+    # 可选：在带标注的验证集上扫描时填写，用于计算伪标签的 P / R / F1
+    GT_JSON = None          # "/data/ZS/defect_dataset/0_defect_dataset_raw/paint_stripe/labels/val.json"
+    MAPPING_JSON = None     # "/data/ZS/flywheel_dataset/4_composite_yolo_preds/iter3/labels/0p1_chunk123.json"
+    # 可选：route_proposals.py 分流出的 trust 区间，与 refine_pseudo_labels.py 的 trusted_jsonl 保持一致
+    TRUSTED_JSONL = None    # "/data/ZS/flywheel_dataset/7_vlm_extracted_data/iter3_weight_iter1ema/0p1_chunk123_trusted.jsonl"
+
+    # 2. 网格配置
+    TH_L_LIST = [0.1, 0.15, 0.2, 0.25, 0.3]
+    TH_H_LIST = [0.7, 0.75, 0.8, 0.83, 0.85, 0.9]
+    ETA_LIST = [0.5, 0.8, 1.0]
+    CLASS_WEIGHTS_LIST = [
+        {"breakage": 1, "inclusion": 1, "scratch": 1, "crater": 1, "run": 1, "bulge": 1},
+        {"breakage": 0.79, "inclusion": 0.64, "scratch": 1.09, "crater": 1.14, "run": 1.34, "bulge": 1.01},
+    ]
+
+    sweep_refine_pseudo_labels(
+        input_jsonl=INPUT_JSONL,
+        output_csv=OUTPUT_CSV,
+        class_names=CLASS_NAMES,
+        th_l_list=TH_L_LIST,
+        th_h_list=TH_H_LIST,
+        eta_list=ETA_LIST,
+        class_weights_list=CLASS_WEIGHTS_LIST,
+        alpha=1.0,
+        use_beta=False,
+        gt_json=GT_JSON,
+        mapping_json=MAPPING_JSON,
+        sort_by="f1" if GT_JSON else "final_saved",
+        top_k=20,
+        trusted_jsonl=TRUSTED_JSONL
+    )
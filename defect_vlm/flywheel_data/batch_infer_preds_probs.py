@@ -8,7 +8,10 @@ import math
 os.environ['CUDA_VISIBLE_DEVICES'] = '0,1,2,3'
 os.environ['MAX_PIXELS'] = '1003520'
 import json
+import time
 from tqdm import tqdm
+from defect_vlm.utils.tracing import span, count, observe
+from defect_vlm.utils.json_early_stop import EarlyStopStats, stop_words_for, finalize_engine_output, resolve_stop_mode
 from swift.infer_engine import TransformersEngine, RequestConfig, InferRequest
 from swift import get_model_processor, get_template
 from swift.utils import safe_snapshot_download
@@ -22,7 +25,7 @@ def get_val(obj, key, default=None):
         return obj.get(key, default)
     return default
 
-def init_engine(model_path: str, adapter_path: str=None, max_batch_size: int=2):
+def init_engine(model_path: str, adapter_path: str=None, max_batch_size: int=2, early_stop: str='off'):
     """
     初始化模型引擎和配置参数
     建议：配置 max_batch_size (比如4或8) 和 temperature=0
@@ -49,7 +52,8 @@ def init_engine(model_path: str, adapter_path: str=None, max_batch_size: int=2):
         max_tokens=4096,
         temperature=0,
         logprobs=True,       # 开启对数概率输出
-        top_logprobs=5       # 保存排名前 5 的 Token 和概率
+        top_logprobs=5,      # 保存排名前 5 的 Token 和概率
+        stop=stop_words_for(early_stop)     # on 模式: 生成到 JSON 的右大括号即停止
     )
     
     return engine, request_config
@@ -72,7 +76,7 @@ def build_requests(data_chunk: list) -> list[InferRequest]:
     return infer_requests
 
 
-def infer_and_save_chunk(engine, request_config, data_chunk: list, output_path: str):
+def infer_and_save_chunk(engine, request_config, data_chunk: list, output_path: str, early_stop_stats=None):
     """
     【你的 infer_batch 的进阶版】
     1. 调用 build_requests 组装请求
@@ -81,14 +85,24 @@ def infer_and_save_chunk(engine, request_config, data_chunk: list, output_path:
     4. 以追加模式 ('a') 将这批数据写入 output_path
     """
     # 组装请求
-    infer_requests = build_requests(data_chunk)
+    with span("vlm_infer.build_requests", n=len(data_chunk)):
+        infer_requests = build_requests(data_chunk)
     
     # 推理
-    resp_list = engine.infer(infer_requests, request_config)
+    with span("vlm_infer.engine", n=len(infer_requests)):
+        infer_start = time.perf_counter()
+        resp_list = engine.infer(infer_requests, request_config)
+    observe("vlm_infer.ms_per_item", (time.perf_counter() - infer_start) * 1000 / max(len(infer_requests), 1))
+    count("vlm_infer.items", len(infer_requests))
     
     for i, resp in enumerate(resp_list):
         # 1. message 是对象，继续用点号访问
         data_chunk[i]['pred'] = resp.choices[0].message.content
+        if early_stop_stats is not None:
+            # JSON 结论完成即停止: on 模式补回被 stop 词截掉的右大括号，measure 模式只统计多余 token
+            completion_tokens = getattr(getattr(resp, 'usage', None), 'completion_tokens', 0)
+            data_chunk[i]['pred'], data_chunk[i]['early_stop'] = finalize_engine_output(
+                data_chunk[i]['pred'], completion_tokens, early_stop_stats)
     
         # 2. 提取概率数据
         token_probs_list = []
@@ -123,11 +137,11 @@ def infer_and_save_chunk(engine, request_config, data_chunk: list, output_path:
         data_chunk[i]['pred_token_probs'] = token_probs_list[-20:]
 
     # 保存处理结果
-    with open(output_path, 'a', encoding='utf-8') as f:
+    with span("vlm_infer.write"), open(output_path, 'a', encoding='utf-8') as f:
         for item in data_chunk:
             f.write(json.dumps(item, ensure_ascii=False) + '\n')
 
-def main(input_path, output_path, model_path, adapter_path, chunk_size=2, max_batch_size=2):
+def main(input_path, output_path, model_path, adapter_path, chunk_size=2, max_batch_size=2, early_stop='off'):
     """
     主控流：
     1. 定义 input_path, output_path, model_path
@@ -164,16 +178,21 @@ def main(input_path, output_path, model_path, adapter_path, chunk_size=2, max_ba
         return
         
     # 5. 只有在需要推理时，才消耗时间加载模型 (优化点)
-    engine, request_config = init_engine(model_path, adapter_path, max_batch_size)
+    early_stop = resolve_stop_mode(early_stop, rest_data)     # stop 词只适用于只输出 defect 的提示词
+    engine, request_config = init_engine(model_path, adapter_path, max_batch_size, early_stop)
+    early_stop_stats = EarlyStopStats(early_stop) if early_stop != 'off' else None
     
     # 6. 开始分块推理
     for i in tqdm(range(0, rest_items, chunk_size), desc='Processing'):
         try:
             chunk = rest_data[i: i+chunk_size]
-            infer_and_save_chunk(engine, request_config, chunk, output_path)
+            infer_and_save_chunk(engine, request_config, chunk, output_path, early_stop_stats)
         
         except Exception as e:
             print(f"❌ 处理第 {i} 个chunk时发生错误: {e}")
+
+    if early_stop_stats is not None:
+        early_stop_stats.print_report()
             
 
 if __name__ == "__main__":
@@ -50,7 +50,7 @@ def generate_message_entries(
             # 因为 prompts.json 里已经写了 <image>\n<image>\n
             final_content = prompt_template.replace('{}', prior_label)
             
-            yield {
+            record = {
                 "id": message_id,
                 "images": [global_abs_path, local_abs_path],
                 "messages": [
@@ -67,6 +67,9 @@ def generate_message_entries(
                     "origin_id": origin_id,
                 }
             }
+            if 'cluster_id' in item:
+                record["meta_info"]["cluster_id"] = item['cluster_id']   # fan_out_cluster_verdicts 据此回填簇内成员
+            yield record
         except Exception as e:
             print(f"⚠️ Skipping index {idx} due to error: {e}")
 
@@ -173,6 +173,8 @@ def process_composite_inference(input_json: str, data_root: str, output_img_dir:
             "original_crop_paths": [p.replace("\\", "/") for p in crop_paths_record]
         }
         
+        if 'cluster_id' in base_item:
+            out_item["cluster_id"] = base_item['cluster_id']
         processed_data_list.append(out_item)
         current_id += 1
 
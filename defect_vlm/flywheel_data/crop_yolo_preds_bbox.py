@@ -139,6 +139,8 @@ def main(fusion_json_path, rgb_image_root, save_img_dir, out_json_path, data_roo
                     "model_source": model_source,
                     "light_source": light
                 }
+                if 'cluster_id' in pred:
+                    metadata["cluster_id"] = pred['cluster_id']   # dedup_proposals 聚类后的代表框
                 metadata_list.append(metadata)
                 global_id += 1
                 
@@ -3,8 +3,8 @@
 """
 import streamlit as st
 import os
-from PIL import Image, ImageDraw, ImageFont
 import math
+from defect_vlm.utils.thumbnail_cache import ThumbnailCache, warm_thumbnails, yolo_label_boxes
 
 # ==========================================
 # 1. 页面与全局配置
@@ -35,6 +35,12 @@ GT_LBL_DIR = '/data/ZS/v11_input/datasets/row3/train/labels'
 # 中文字体路径 (防止乱码方块)
 ZH_FONT_PATH = '/data/ZS/defect-vlm/defect_vlm/paper_plots/fonts/simsun.ttc' 
 
+# 缩略图缓存 (缩放 + 画框后的 WebP，按大小 LRU 淘汰)，网格里每张图按 THUMB_SIDE 档位显示
+THUMB_CACHE_DIR = '/data/ZS/flywheel_dataset/.thumb_cache'
+THUMB_CACHE_MAX_BYTES = 4 << 30
+THUMB_SIDE = 512
+WARM_WORKERS = 16
+
 # ==========================================
 # 3. 数据加载与过滤 (提取纯伪标签)
 # ==========================================
@@ -64,60 +70,20 @@ if not pseudo_image_ids:
     st.stop()
 
 # ==========================================
-# 4. 绘图函数 (解析 YOLO 归一化坐标)
+# 4. 缩略图缓存 (解析 YOLO 归一化坐标，画框结果按阈值缓存)
 # ==========================================
-def draw_yolo_pseudo_labels(img_path, lbl_path, threshold):
-    try:
-        img = Image.open(img_path).convert("RGB")
-    except Exception as e:
-        return None
-        
-    img_w, img_h = img.size
-    draw = ImageDraw.Draw(img)
-    
-    try:
-        font = ImageFont.truetype(ZH_FONT_PATH, 20)
-    except IOError:
-        font = ImageFont.load_default()
-
-    has_valid_boxes = False
-
-    if os.path.exists(lbl_path):
-        with open(lbl_path, 'r') as f:
-            for line in f:
-                parts = line.strip().split()
-                if len(parts) >= 5:
-                    cat_id = int(parts[0])
-                    xc, yc, w, h = map(float, parts[1:5])
-                    
-                    # 伪标签通常有第6列作为置信度
-                    conf = float(parts[5]) if len(parts) >= 6 else 1.0
-                    
-                    if conf < threshold:
-                        continue
-                        
-                    has_valid_boxes = True
-                    
-                    # 反归一化为绝对坐标
-                    w_abs = w * img_w
-                    h_abs = h * img_h
-                    x_min = (xc - w / 2) * img_w
-                    y_min = (yc - h / 2) * img_h
-                    
-                    cat_name = CLASS_MAP.get(cat_id, str(cat_id))
-                    color = COLOR_MAP.get(cat_id, '#FFFFFF')
-                    
-                    # 画框
-                    draw.rectangle([x_min, y_min, x_min+w_abs, y_min+h_abs], outline=color, width=3)
-                    
-                    # 画文字
-                    label_text = f"{cat_name} {conf:.2f}"
-                    text_bbox = draw.textbbox((x_min, y_min), label_text, font=font)
-                    draw.rectangle([x_min, y_min - (text_bbox[3] - text_bbox[1]), 
-                                  x_min + (text_bbox[2] - text_bbox[0]), y_min], fill=color)
-                    draw.text((x_min, y_min - (text_bbox[3] - text_bbox[1])), label_text, fill="white", font=font)
-                    
-    return img, has_valid_boxes
+@st.cache_resource
+def get_thumb_cache():
+    style = {"class_names": CLASS_MAP, "class_colors": COLOR_MAP, "font_path": ZH_FONT_PATH,
+             "line_width": 3, "font_size": 20}
+    return ThumbnailCache(THUMB_CACHE_DIR, max_bytes=THUMB_CACHE_MAX_BYTES, style=style)
+
+def find_image_path(img_id):
+    img_path_jpg = os.path.join(IMG_DIR, f"{img_id}.jpg")
+    img_path_png = os.path.join(IMG_DIR, f"{img_id}.png")
+    return img_path_jpg if os.path.exists(img_path_jpg) else img_path_png
+
+thumb_cache = get_thumb_cache()
 
 # ==========================================
 # 5. UI 与分页逻辑
@@ -147,6 +113,19 @@ st.sidebar.markdown("---")
 # 仅展示有框的图像选项
 only_show_objects = st.sidebar.checkbox("👀 仅显示包含缺陷(大于阈值)的图像", value=True)
 
+st.sidebar.markdown("---")
+# 按当前阈值用进程池预生成全部缩略图，之后翻页只读取缓存
+if st.sidebar.button("⚡ 预生成全部缩略图"):
+    items = [(find_image_path(i), yolo_label_boxes(os.path.join(LBL_DIR, f"{i}.txt"), conf_threshold), 'yolo')
+             for i in pseudo_image_ids]
+    with st.spinner(f"正在为 {len(items)} 张图生成缩略图..."):
+        warm_thumbnails(thumb_cache, [it for it in items if os.path.exists(it[0])],
+                        levels=(THUMB_SIDE,), num_workers=WARM_WORKERS)
+    st.sidebar.success("✅ 缩略图已就绪")
+stats = thumb_cache.stats(scan=False)
+st.sidebar.caption(f"缩略图缓存: {stats['bytes'] / 1024 / 1024:.0f} MB / {stats['max_bytes'] / 1024 / 1024 / 1024:.0f} GB, "
+                   f"本次会话命中 {stats['hits']} 次, 生成 {stats['misses']} 次")
+
 # ==========================================
 # 6. 主区域网格渲染 (一行 5 列)
 # ==========================================
@@ -165,20 +144,21 @@ current_row_cols = st.columns(cols_per_row)
 col_idx = 0
 
 for img_id in current_ids:
-    img_path_jpg = os.path.join(IMG_DIR, f"{img_id}.jpg")
-    img_path_png = os.path.join(IMG_DIR, f"{img_id}.png")
-    img_path = img_path_jpg if os.path.exists(img_path_jpg) else img_path_png
-    
+    img_path = find_image_path(img_id)
     lbl_path = os.path.join(LBL_DIR, f"{img_id}.txt")
     
     if os.path.exists(img_path):
-        result_img, has_boxes = draw_yolo_pseudo_labels(img_path, lbl_path, conf_threshold)
+        # 先读标签判断是否有框 (很快)，需要显示时才取缩略图 (命中缓存时不解码原图)
+        boxes = yolo_label_boxes(lbl_path, conf_threshold)
+        has_boxes = len(boxes) > 0
+        
+        # 如果勾选了"仅显示有框图像"且该图没框，则跳过
+        if only_show_objects and not has_boxes:
+            continue
+        
+        result_img = thumb_cache.thumbnail(img_path, THUMB_SIDE, boxes=boxes, box_format='yolo')
         
         if result_img:
-            # 如果勾选了"仅显示有框图像"且该图没框，则跳过
-            if only_show_objects and not has_boxes:
-                continue
-                
             # 在对应的列中绘制图像
             with current_row_cols[col_idx]:
                 st.image(result_img, use_container_width=True)
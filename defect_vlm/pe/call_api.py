@@ -8,12 +8,15 @@ author:zhaoshe
 import os
 import json
 import base64
+import time
 import asyncio
 from tqdm import tqdm
 import argparse
 from typing import List, Dict, Any
 from openai import AsyncOpenAI, APIError
 from defect_vlm.utils import APIConfigManager  
+from defect_vlm.utils.tracing import span, count, observe, add_trace_args, setup_tracing
+from defect_vlm.utils.json_early_stop import EARLY_STOP_MODES, VerdictTracker, EarlyStopStats
 
 # 如果采用openai等外网官方网站作为base_url，需要设置下代理的映射端口
 # os.environ['HTTP_PROXY'] = 'http://127.0.0.1:xxxx'
@@ -96,11 +99,60 @@ def build_send_message(sample: Dict[str, Any]) -> List[Dict[str, Any]]:
     return message
 
 
+async def stream_until_verdict(client: AsyncOpenAI, model: str, messages: List[Dict[str, Any]], early_stop: str):
+    """流式请求并增量识别 JSON 结论
+
+    on: 出现包含 defect 的完整 JSON 后立即关闭流 (断开连接，服务端随之停止生成)，回复只保留到右大括号为止;
+    measure: 照常读完整个流，统计结论之后又生成了多少 chunk (约等于 token)，用于评估 on 模式能省多少
+
+    Returns:
+        (str, Dict): 回复文本, 以及 EarlyStopStats.add 所需的统计字段
+    """
+    stream = await client.chat.completions.create(
+        model = model,
+        messages = messages,
+        temperature=0.0,
+        max_tokens=8192,
+        stream=True,
+        stream_options={'include_usage': True}
+    )
+    tracker = VerdictTracker()
+    pieces = []
+    tail_chunks = 0
+    usage = None
+    stopped = False
+    try:
+        async for chunk in stream:
+            if chunk.usage is not None:
+                usage = chunk.usage
+            if not chunk.choices or not chunk.choices[0].delta.content:
+                continue
+            pieces.append(chunk.choices[0].delta.content)
+            if tracker.done:
+                tail_chunks += 1
+            elif tracker.feed(pieces[-1]) and early_stop == 'on':
+                stopped = True
+                break
+    finally:
+        await stream.close()
+
+    content = "".join(pieces)
+    generated = usage.completion_tokens if usage is not None and usage.completion_tokens else len(pieces)
+    tail = tail_chunks
+    if usage is not None and usage.completion_tokens and pieces:
+        tail = round(usage.completion_tokens * tail_chunks / len(pieces))     # 按 chunk 比例折算成 token
+    if stopped:
+        content = content[:tracker.end]
+    return content, {'generated_tokens': generated, 'tail_tokens': tail, 'stopped': stopped, 'complete': tracker.done}
+
+
 async def process_single_task(
     client: AsyncOpenAI,
     sample: Dict[str, Any],
     model: str,
-    semaphore: asyncio.Semaphore
+    semaphore: asyncio.Semaphore,
+    early_stop: str = 'off',
+    early_stop_stats: EarlyStopStats = None
 ) -> Dict[str, Any]:
     """提交单个API调用的协程函数, 当调用失败的时候会自动保存'ERROR',
     后续处理的时候可以通过判断sample['conversation'][1]['value'] == 'ERROR'来剔除调用失败的数据
@@ -110,19 +162,47 @@ async def process_single_task(
         sample (Dict[str, Any]): 待处理的单个样本（任务）
         model (str): 调用API的名称（调用模型的名称）
         semaphore(asyncio.Semaphore): 接收信号量
+        early_stop (str): off / measure / on, 非 off 时改用流式请求, 见 stream_until_verdict
+        early_stop_stats (EarlyStopStats): 汇总每条请求的 token 统计
 
     Returns:
         Dict[str, Any]:包含模型回复的数据
     """
+    wait_start = time.perf_counter()
     async with semaphore:       # 确保在任何时候，最多都只有semaphore个任务同时执行with内的代码
+        observe("call_api.queue_wait_ms", (time.perf_counter() - wait_start) * 1000)
         try:
-            messages = build_send_message(sample)
-            response = await client.chat.completions.create(
-                model = model,
-                messages = messages,
-                temperature=0.0,
-                max_tokens=8192
-            )
+            with span("call_api.build_message"):
+                messages = build_send_message(sample)
+            request_start = time.perf_counter()
+            if early_stop != 'off':
+                with span("call_api.request", id=sample['id'], stream=True) as sp:
+                    ai_response, es_record = await stream_until_verdict(client, model, messages, early_stop)
+                    sp.set(completion_tokens=es_record['generated_tokens'], tail_tokens=es_record['tail_tokens'])
+                    count("call_api.completion_tokens", es_record['generated_tokens'])
+                observe("call_api.latency_ms", (time.perf_counter() - request_start) * 1000)
+                if early_stop_stats is not None:
+                    es_record = early_stop_stats.add(**es_record)
+                sample['early_stop'] = es_record
+                if ai_response:
+                    sample['conversation'][1]['value'] = ai_response
+                    count("call_api.ok")
+                else:
+                    print(f"❌ API 警告 (ID: {sample['id']}): 流式响应中没有任何内容。")
+                    sample['conversation'][1]['value'] = 'ERROR: Empty message content'
+                return sample
+            with span("call_api.request", id=sample['id']) as sp:
+                response = await client.chat.completions.create(
+                    model = model,
+                    messages = messages,
+                    temperature=0.0,
+                    max_tokens=8192
+                )
+                usage = getattr(response, 'usage', None)
+                if usage is not None:
+                    sp.set(prompt_tokens=usage.prompt_tokens, completion_tokens=usage.completion_tokens)
+                    count("call_api.completion_tokens", usage.completion_tokens or 0)
+            observe("call_api.latency_ms", (time.perf_counter() - request_start) * 1000)
             
             # 检查 response 和 choices 是否有效
             if response and response.choices and len(response.choices) > 0:
@@ -130,6 +210,7 @@ async def process_single_task(
                 if response.choices[0].message and response.choices[0].message.content:
                     ai_response = response.choices[0].message.content
                     sample['conversation'][1]['value'] = ai_response
+                    count("call_api.ok")
                 else:
                     # API 成功了，但 message.content 为空
                     print(f"❌ API 警告 (ID: {sample['id']}): 响应中缺少 message.content。")
@@ -150,9 +231,11 @@ async def process_single_task(
         except APIError as e: # 更具体地捕获 API 错误
             print(f"❌ API 错误 (ID: {sample['id']}): {e} ")
             sample['conversation'][1]['value'] = f'ERROR: APIError {e}'
+            count("call_api.api_error")
         except Exception as e:
             print(f"❌ 未知错误 (ID: {sample['id']}): {e} ")
             sample['conversation'][1]['value'] = f'ERROR: Exception {e}'
+            count("call_api.exception")
         
     return sample
     
@@ -182,8 +265,14 @@ async def process_batch_task(args):
     print(f"    并发数量: {args.concurrency}")
     
     # 初始化模型
-    config_manager = APIConfigManager()
-    model_config = config_manager.get_model_config(args.provider, args.model)
+    base_url = getattr(args, 'base_url', None)
+    if base_url:
+        # 直接指定服务地址 (本地 mock 服务 / 自建 vLLM 服务)，不读取 api_config.yaml
+        model_config = {'provider': args.provider, 'api_key': getattr(args, 'api_key', None) or 'EMPTY',
+                        'base_url': base_url, 'model': args.model}
+    else:
+        config_manager = APIConfigManager()
+        model_config = config_manager.get_model_config(args.provider, args.model)
     client = initialize_client(api_key=model_config['api_key'], base_url=model_config['base_url'])
     print(f"    模型: {args.provider} - {args.model}")
 
@@ -217,8 +306,13 @@ async def process_batch_task(args):
     # 创建信号量
     semaphore = asyncio.Semaphore(args.concurrency)
     
+    # JSON 结论完成即停止 (off / measure / on)
+    early_stop = getattr(args, 'early_stop', 'off')
+    early_stop_stats = EarlyStopStats(early_stop) if early_stop != 'off' else None
+
     # 创建所有任务的协程，存储在list中
-    coroutines = [process_single_task(client, sample, model_config['model'], semaphore) for sample in task_to_process]
+    coroutines = [process_single_task(client, sample, model_config['model'], semaphore, early_stop, early_stop_stats)
+                  for sample in task_to_process]
     
     # 并发执行所有任务并保存结果
     print(f"✨✨开始并发执行 {len(coroutines)} 个任务，最大并发数: {args.concurrency}")
@@ -229,8 +323,9 @@ async def process_batch_task(args):
                 result = await future           # await获取事件循环中的一个处理结果
             
                 if result:
-                    f_out.write(json.dumps(result, ensure_ascii=False) + '\n')
-                    f_out.flush()           # 立刻将文件写入
+                    with span("call_api.write"):
+                        f_out.write(json.dumps(result, ensure_ascii=False) + '\n')
+                        f_out.flush()           # 立刻将文件写入
                     results_count += 1
     except Exception as e:
         print(f"❌  循环处理过程中遇到错误: {e}")
@@ -238,6 +333,8 @@ async def process_batch_task(args):
         return
     
     print(f"\n✅ 任务处理完成，{results_count} 个新结果已追加至 {args.output_file}")
+    if early_stop_stats is not None:
+        early_stop_stats.print_report()
     await client.close()
 
 def main():
@@ -250,8 +347,14 @@ def main():
     parser.add_argument('--input_file', type=str, required=True, help='输入的 .jsonl 待处理文件')
     parser.add_argument('--output_file', type=str, required=True, help='输出的处理结果文件')
     parser.add_argument('--concurrency', type=int, default=2, help='并发调用数量, 默认为10')
+    parser.add_argument('--base_url', type=str, default=None, help='直接指定 OpenAI 兼容服务地址，不读取配置文件 (例如本地 mock 服务)')
+    parser.add_argument('--api_key', type=str, default=None, help='配合 --base_url 使用，默认为 EMPTY')
+    parser.add_argument('--early_stop', type=str, choices=EARLY_STOP_MODES, default='off',
+                        help='JSON 结论完成即停止: off 关闭; measure 只统计结论之后多生成的 token; on 提前断开流')
+    add_trace_args(parser)
 
     args = parser.parse_args()
+    setup_tracing(args.trace, args.trace_chrome)
     asyncio.run(process_batch_task(args))
 
 if __name__ == "__main__":
@@ -83,7 +83,8 @@ def build_semi_dataset(
             
             # 提取并转换 bbox 作为查询键
             bbox_key = get_bbox_key(data["bbox"])
-            filename = bbox2filename[bbox_key]
+            # route_proposals 直通的框没有拼图，精炼结果中直接带有原图文件名
+            filename = data.get("original_image") or bbox2filename.get(bbox_key)
             
             if not filename:
                 miss_count += 1
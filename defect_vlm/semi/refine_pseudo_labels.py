@@ -1,9 +1,34 @@
 """
 基于双阈值 (th_l, th_h) ,对vlm的打标结果进行过滤
 同时保存各部分的 Loss 权重: 半监督权重alpha(lambda)、类别级权重gamma_c、实例级权重beta 
+可选 trusted_jsonl：route_proposals.py 在抠图前分流出的 trust 区间 (p_yolo >= th_h) 候选框，
+这些框没有经过 VLM，与 VLM 结果合并后走同一棵决策树
 """
 import json
 from pathlib import Path
+from defect_vlm.utils.proposal_routing import route_band, BAND_DROP, BAND_TRUST
+
+
+def iter_jsonl_records(paths):
+    """依次读取多个 JSONL 文件 (跳过空行)"""
+    for path in paths:
+        with open(path, 'r', encoding='utf-8') as fin:
+            for line in fin:
+                if line.strip():
+                    yield json.loads(line)
+
+
+def check_route_meta(trusted_jsonl, th_l, th_h):
+    """trusted_jsonl 必须与当前阈值使用同一组 (th_l, th_h) 分流，否则 verify 区间会出现空洞或重叠"""
+    trusted_jsonl = Path(trusted_jsonl)
+    meta_path = trusted_jsonl.parent / f"{trusted_jsonl.stem}_route_meta.json"
+    if not meta_path.exists():
+        print(f"⚠️ 未找到分流元数据 {meta_path}，无法校验阈值一致性")
+        return
+    with open(meta_path, 'r', encoding='utf-8') as f:
+        meta = json.load(f)
+    if (meta["th_l"], meta["th_h"]) != (th_l, th_h):
+        print(f"⚠️ 分流阈值 (th_l={meta['th_l']}, th_h={meta['th_h']}) 与当前精炼阈值 (th_l={th_l}, th_h={th_h}) 不一致！")
 
 def generate_refined_pseudo_labels(
     input_jsonl,
@@ -14,7 +39,8 @@ def generate_refined_pseudo_labels(
     eta,
     class_weights,
     class_method,
-    class_args
+    class_args,
+    trusted_jsonl=None
 ):
     input_path = Path(input_jsonl)
     output_path = Path(output_jsonl)
@@ -25,6 +51,11 @@ def generate_refined_pseudo_labels(
     print(f"🚀 开始生成精炼伪标签...")
     print(f"   [配置] th_l: {th_l}, th_h: {th_h}, eta: {eta}")
     print(f"   [类别权重] {class_weights}")
+    input_paths = [input_path]
+    if trusted_jsonl:
+        print(f"   [直通数据] {trusted_jsonl}")
+        check_route_meta(trusted_jsonl, th_l, th_h)
+        input_paths.append(Path(trusted_jsonl))
     
     # 决策漏斗统计器
     stats = {
@@ -37,14 +68,9 @@ def generate_refined_pseudo_labels(
         "final_saved": 0
     }
     
-    with open(input_path, 'r', encoding='utf-8') as fin, \
-         open(output_path, 'w', encoding='utf-8') as fout:
+    with open(output_path, 'w', encoding='utf-8') as fout:
         
-        for line in fin:
-            if not line.strip():
-                continue
-                
-            data = json.loads(line)
+        for data in iter_jsonl_records(input_paths):
             stats["total_input"] += 1
             
             # 提取关键字段
@@ -58,12 +84,13 @@ def generate_refined_pseudo_labels(
             decision_source = ""
             
             # ================= 核心决策树 =================
-            if p_yolo < th_l:
+            band = route_band(p_yolo, th_l, th_h)
+            if band == BAND_DROP:
                 # 规则 1：直接抛弃底座噪点
                 stats["discard_low_conf"] += 1
                 continue
                 
-            elif p_yolo >= th_h:
+            elif band == BAND_TRUST:
                 # 规则 2：完全信任底座小模型
                 final_label = c_yolo
                 beta = p_yolo
@@ -106,6 +133,8 @@ def generate_refined_pseudo_labels(
                 "final_weight": round(final_weight, 4),
                 "decision_source": decision_source     # 记录这打标是怎么来的，方便分析
             }
+            if data.get("original_image"):
+                refined_item["original_image"] = data["original_image"]   # 直通框没有拼图映射，直接记录原图文件名
             
             fout.write(json.dumps(refined_item, ensure_ascii=False) + '\n')
             stats["final_saved"] += 1
@@ -118,7 +147,8 @@ def generate_refined_pseudo_labels(
             "alpha": alpha,
             "class_weights": class_weights,
             "class_method": class_method,
-            "class_args": class_args 
+            "class_args": class_args,
+            "trusted_jsonl": str(trusted_jsonl) if trusted_jsonl else None
         },
         "statistics": stats
     }
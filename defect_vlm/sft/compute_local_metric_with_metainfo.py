@@ -8,7 +8,7 @@ import matplotlib.pyplot as plt
 import seaborn as sns
 from sklearn.metrics import accuracy_score, precision_score, f1_score
 from sklearn.metrics import confusion_matrix, classification_report
-import re
+from defect_vlm.utils.vlm_response_parser import parse_label_regex
 
 CLASSES = ['breakage', 'inclusion', 'crater', 'bulge', 'scratch', 'run', 'background']
 
@@ -33,12 +33,9 @@ def main(json_path: str, cm_name: str) -> None:
                 true_label = json.loads(true_label_text)['defect']
 
             # 匹配格式如 "defect": "Breakage" 或 "defect":"background"
-            match = re.search(r'"defect"\s*:\s*"([^"]+)"', ai_response_str, re.IGNORECASE)
+            pred_label = parse_label_regex(ai_response_str)
             
-            if match:
-                # 提取出 defect 冒号后面的字符串
-                pred_label = match.group(1).lower()
-            else:
+            if pred_label is None:
                 # 兜底容错：如果连正则都没匹配到，说明模型输出完全崩了
                 print(f"⚠️ 警告: 样本 {item['id']} 未找到合法的 defect 字段。原串: {ai_response_str[-50:]}")
                 pred_label = "unknown" # 赋一个未知标签，防止列表长度错位
@@ -0,0 +1,189 @@
+"""
+utils/box_geometry.py 的属性校验与微基准
+1. 属性校验：随机生成大量框 (含相切、包含、退化为 0 面积等边界情况)，
+   将矩阵版本与原来散落在各脚本中的标量实现逐元素对比，并检查对称性、取值范围、格式转换往返一致等性质；
+2. 微基准：对比 "双重 Python 循环 + 标量函数" 与 "一次矩阵计算" 在不同规模下的耗时。
+仅依赖 NumPy，CPU 上几秒内跑完。
+"""
+import time
+import numpy as np
+from defect_vlm.utils.box_geometry import (
+    box_iou, calculate_nwd, get_area_ratio,
+    pairwise_iou, pairwise_giou, pairwise_nwd, area_ratio, pairwise_area_ratio,
+    xywh_to_xyxy, xyxy_to_xywh, xyxy_to_cxcywh, cxcywh_to_xyxy
+)
+
+# ================= 原始标量实现 (逐字拷贝，作为对照) =================
+def ref_compute_iou_xyxy(box1, box2):
+    """exp1/exp2/exp3_*.py 中的 compute_iou"""
+    x1 = max(box1[0], box2[0])
+    y1 = max(box1[1], box2[1])
+    x2 = min(box1[2], box2[2])
+    y2 = min(box1[3], box2[3])
+    inter_area = max(0, x2 - x1) * max(0, y2 - y1)
+    if inter_area == 0:
+        return 0.0
+    box1_area = (box1[2] - box1[0]) * (box1[3] - box1[1])
+    box2_area = (box2[2] - box2[0]) * (box2[3] - box2[1])
+    return inter_area / float(box1_area + box2_area - inter_area)
+
+
+def ref_compute_iou_xywh(box1, box2):
+    """general_dataset/get_negative_bbox_from_gt.py 中的 compute_iou"""
+    x1, y1, w1, h1 = box1
+    x2, y2, w2, h2 = box2
+    inter_x1 = max(x1, x2)
+    inter_y1 = max(y1, y2)
+    inter_x2 = min(x1 + w1, x2 + w2)
+    inter_y2 = min(y1 + h1, y2 + h2)
+    if inter_x2 < inter_x1 or inter_y2 < inter_y1:
+        return 0.0
+    inter_area = (inter_x2 - inter_x1) * (inter_y2 - inter_y1)
+    union_area = w1 * h1 + w2 * h2 - inter_area
+    return 0.0 if union_area <= 0 else inter_area / union_area
+
+
+def ref_calculate_nwd(box1, box2, C):
+    """legacy/nwd_decision_fusion.py 中的 calculate_nwd"""
+    cx1, cy1 = (box1[0] + box1[2]) / 2.0, (box1[1] + box1[3]) / 2.0
+    w1, h1 = box1[2] - box1[0], box1[3] - box1[1]
+    cx2, cy2 = (box2[0] + box2[2]) / 2.0, (box2[1] + box2[3]) / 2.0
+    w2, h2 = box2[2] - box2[0], box2[3] - box2[1]
+    w2_dist_sq = (cx1 - cx2)**2 + (cy1 - cy2)**2 + ((w1 - w2)**2 + (h1 - h2)**2) / 4.0
+    return np.exp(-np.sqrt(w2_dist_sq) / C)
+
+
+def ref_giou(box1, box2):
+    iou = ref_compute_iou_xyxy(box1, box2)
+    inter = max(0, min(box1[2], box2[2]) - max(box1[0], box2[0])) * max(0, min(box1[3], box2[3]) - max(box1[1], box2[1]))
+    union = (box1[2] - box1[0]) * (box1[3] - box1[1]) + (box2[2] - box2[0]) * (box2[3] - box2[1]) - inter
+    ew = max(box1[2], box2[2]) - min(box1[0], box2[0])
+    eh = max(box1[3], box2[3]) - min(box1[1], box2[1])
+    enclose = ew * eh
+    return iou - ((enclose - union) / enclose if enclose > 0 else 0.0)
+
+
+# ================= 随机框生成 =================
+def random_xywh(rng, n, img=300, integer=True):
+    """随机 xywh 框，整数坐标时相切/包含/重合的情况会频繁出现"""
+    if integer:
+        wh = rng.integers(0, 40, (n, 2)).astype(np.float64)
+        xy = rng.integers(0, img - 40, (n, 2)).astype(np.float64)
+    else:
+        wh = rng.uniform(0, 40, (n, 2))
+        xy = rng.uniform(0, img - 40, (n, 2))
+    boxes = np.concatenate([xy, wh], axis=1)
+    # 注入一些完全重合的框
+    k = n // 10
+    if k:
+        boxes[:k] = boxes[n - k:]
+    return boxes
+
+
+# ================= 属性校验 =================
+def check_properties(num_rounds=20, n=60, m=50, seed=0):
+    rng = np.random.default_rng(seed)
+    failures = []
+
+    def check(name, ok):
+        if not ok:
+            failures.append(name)
+
+    for r in range(num_rounds):
+        integer = r % 2 == 0
+        a_wh = random_xywh(rng, n, integer=integer)
+        b_wh = random_xywh(rng, m, integer=integer)
+        a_xy, b_xy = xywh_to_xyxy(a_wh), xywh_to_xyxy(b_wh)
+        la_xy, lb_xy = a_xy.tolist(), b_xy.tolist()
+        la_wh, lb_wh = a_wh.tolist(), b_wh.tolist()
+
+        # 1. 矩阵 IoU 与原始标量实现一致 (两种格式)
+        ref = np.array([[ref_compute_iou_xyxy(p, q) for q in lb_xy] for p in la_xy])
+        mat = pairwise_iou(a_xy, b_xy)
+        check("iou_xyxy vs ref", np.allclose(mat, ref, atol=1e-12))
+        ref_wh = np.array([[ref_compute_iou_xywh(p, q) for q in lb_wh] for p in la_wh])
+        check("iou_xywh vs ref", np.allclose(pairwise_iou(a_wh, b_wh, fmt='xywh'), ref_wh, atol=1e-12))
+
+        # 2. 标量 box_iou 与原始实现逐位一致
+        check("box_iou scalar", all(box_iou(p, q) == ref_compute_iou_xyxy(p, q) for p, q in zip(la_xy, lb_xy)))
+        check("box_iou scalar xywh", all(box_iou(p, q, fmt='xywh') == ref_compute_iou_xywh(p, q) for p, q in zip(la_wh, lb_wh)))
+
+        # 3. NWD 与原始实现一致
+        C = 12.8
+        ref_nwd = np.array([[ref_calculate_nwd(p, q, C) for q in lb_xy] for p in la_xy])
+        check("nwd vs ref", np.allclose(pairwise_nwd(a_xy, b_xy, C), ref_nwd, atol=1e-12))
+        check("nwd xywh", np.allclose(pairwise_nwd(a_wh, b_wh, C, fmt='xywh'), ref_nwd, atol=1e-12))
+        check("nwd scalar", all(abs(calculate_nwd(p, q, C) - ref_calculate_nwd(p, q, C)) < 1e-12 for p, q in zip(la_xy, lb_xy)))
+
+        # 4. GIoU 与逐对实现一致
+        ref_g = np.array([[ref_giou(p, q) for q in lb_xy] for p in la_xy])
+        giou = pairwise_giou(a_xy, b_xy)
+        check("giou vs ref", np.allclose(giou, ref_g, atol=1e-12))
+
+        # 5. 对称性与取值范围
+        aa = pairwise_iou(a_xy, a_xy)
+        check("iou symmetric", np.allclose(aa, aa.T))
+        check("iou range", ((mat >= 0) & (mat <= 1 + 1e-12)).all())
+        check("giou range", ((giou >= -1 - 1e-12) & (giou <= 1 + 1e-12)).all())
+        check("giou <= iou", (giou <= mat + 1e-12).all())
+        nn = pairwise_nwd(a_xy, a_xy, C)
+        check("nwd self = 1", np.allclose(np.diag(nn), 1.0))
+        check("nwd symmetric", np.allclose(nn, nn.T))
+        pos = (a_wh[:, 2] > 0) & (a_wh[:, 3] > 0)
+        check("iou self = 1", np.allclose(np.diag(aa)[pos], 1.0))
+
+        # 6. 面积比
+        ratio = area_ratio(a_xy, 300.0, 300.0)
+        check("area_ratio vs scalar", np.allclose(ratio, [get_area_ratio(p, 300.0, 300.0) for p in la_xy]))
+        par = pairwise_area_ratio(a_xy, b_xy)
+        check("pairwise_area_ratio range", ((par >= 0) & (par <= 1)).all())
+
+        # 7. 格式转换往返
+        check("xywh roundtrip", np.allclose(xyxy_to_xywh(xywh_to_xyxy(a_wh)), a_wh))
+        check("cxcywh roundtrip", np.allclose(cxcywh_to_xyxy(xyxy_to_cxcywh(a_xy)), a_xy))
+
+    # 8. 空输入
+    check("empty", pairwise_iou(np.empty((0, 4)), b_xy).shape == (0, m))
+
+    print("=" * 50)
+    if failures:
+        print(f"❌ 属性校验失败: {sorted(set(failures))}")
+    else:
+        print(f"✅ 属性校验全部通过 ({num_rounds} 轮, 每轮 {n}x{m} 对)")
+    print("=" * 50)
+    return not failures
+
+
+# ================= 微基准 =================
+def _timeit(fn, repeat=3):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def run_benchmarks(sizes=((10, 10), (50, 50), (200, 200), (1000, 300)), seed=0):
+    rng = np.random.default_rng(seed)
+    print(f"{'规模':<12}{'指标':<8}{'标量循环(ms)':>14}{'矩阵(ms)':>12}{'加速比':>10}")
+    print("-" * 56)
+    for n, m in sizes:
+        a = xywh_to_xyxy(random_xywh(rng, n, integer=False))
+        b = xywh_to_xyxy(random_xywh(rng, m, integer=False))
+        la, lb = a.tolist(), b.tolist()
+        cases = [
+            ("IoU", lambda: [[ref_compute_iou_xyxy(p, q) for q in lb] for p in la], lambda: pairwise_iou(a, b)),
+            ("NWD", lambda: [[ref_calculate_nwd(p, q, 12.8) for q in lb] for p in la], lambda: pairwise_nwd(a, b, 12.8)),
+            ("GIoU", lambda: [[ref_giou(p, q) for q in lb] for p in la], lambda: pairwise_giou(a, b)),
+        ]
+        for name, scalar_fn, vec_fn in cases:
+            t_s = _timeit(scalar_fn, repeat=1 if n * m > 100000 else 3)
+            t_v = _timeit(vec_fn)
+            print(f"{f'{n}x{m}':<12}{name:<8}{t_s * 1e3:>14.3f}{t_v * 1e3:>12.3f}{t_s / max(t_v, 1e-12):>9.1f}x")
+    print("-" * 56)
+
+
+if __name__ == "__main__":
+    check_properties()
+    run_benchmarks()
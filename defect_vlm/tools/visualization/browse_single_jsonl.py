@@ -4,6 +4,7 @@
 import streamlit as st
 import json
 import os
+from defect_vlm.utils.jsonl_index import load_jsonl_index
 
 # 1. 页面配置
 st.set_page_config(page_title="JSONL 单文件查看器", layout="wide")
@@ -19,8 +20,9 @@ with st.sidebar:
     load_btn = st.button("🚀 加载数据", type="primary")
 
 # 3. 初始化 Session State (保持翻页时不丢失数据)
-if 'single_data' not in st.session_state:
-    st.session_state.single_data = []
+# 只保存字节偏移索引，当前条目按偏移 seek 读取，多 GB 文件也不会整体读进内存
+if 'single_index' not in st.session_state:
+    st.session_state.single_index = None
 if 'single_current_idx' not in st.session_state:
     st.session_state.single_current_idx = 0
 
@@ -31,11 +33,10 @@ def load_data(path):
         return
     
     try:
-        with open(path, 'r', encoding='utf-8') as f:
-            st.session_state.single_data = [json.loads(line) for line in f if line.strip()]
+        st.session_state.single_index = load_jsonl_index(path, profile='plain')
             
         st.session_state.single_current_idx = 0 # 重置索引
-        st.sidebar.success(f"✅ 加载成功！共计 {len(st.session_state.single_data)} 条数据")
+        st.sidebar.success(f"✅ 加载成功！共计 {len(st.session_state.single_index)} 条数据")
     except Exception as e:
         st.error(f"❌ 解析 JSONL 失败: {e}")
 
@@ -43,8 +44,8 @@ if load_btn:
     load_data(file_path)
 
 # 5. 主界面渲染与交互
-if st.session_state.single_data:
-    max_len = len(st.session_state.single_data)
+if st.session_state.single_index is not None and len(st.session_state.single_index):
+    max_len = len(st.session_state.single_index)
     
     # 顶部控制台 (翻页器)
     st.markdown("---")
@@ -77,7 +78,11 @@ if st.session_state.single_data:
     idx = st.session_state.single_current_idx
     
     # 使用 st.json 渲染，自带美观的语法高亮和折叠
-    st.json(st.session_state.single_data[idx], expanded=True)
+    try:
+        st.json(st.session_state.single_index.read(idx), expanded=True)
+    except json.JSONDecodeError as e:
+        st.error(f"❌ 第 {idx + 1} 条不是合法的 JSON: {e}")
+        st.code(st.session_state.single_index.read_raw(idx))
 
 else:
     st.info("👈 请在左侧边栏输入 JSONL 文件的绝对路径，并点击“加载数据”。")
@@ -5,24 +5,19 @@
 import streamlit as st
 import json
 import os
-import re
+import numpy as np
 import pandas as pd
-from PIL import Image
+from defect_vlm.utils.jsonl_index import load_jsonl_index
+from defect_vlm.utils.thumbnail_cache import ThumbnailCache
 
 st.set_page_config(layout="wide", page_title="VLM Result Explorer")
 
-# ================= 工具函数 =================
-def parse_vlm_prediction(pred_text):
-    try:
-        clean_text = pred_text.replace("```json", "").replace("```", "").strip()
-        data = json.loads(clean_text)
-        return data.get("defect", "background").lower()
-    except Exception:
-        match = re.search(r'"defect"\s*:\s*"([^"]+)"', pred_text, re.IGNORECASE)
-        if match:
-            return match.group(1).lower()
-        return "background"
+# 拼图缩略图缓存 (WebP，按大小 LRU 淘汰)，翻页时不再解码原始 PNG
+THUMB_CACHE_DIR = "/data/ZS/defect_dataset/.thumb_cache"
+THUMB_CACHE_MAX_BYTES = 2 << 30
+THUMB_SIDE = 1024
 
+# ================= 工具函数 =================
 def extract_probability(token_probs, target_class):
     for t_info in reversed(token_probs):
         token_str = t_info["token"].strip().strip('"').strip("'").lower()
@@ -30,23 +25,15 @@ def extract_probability(token_probs, target_class):
             return t_info["probability"]
     return 0.5
 
-@st.cache_data
-def load_jsonl(file_path):
-    data = []
-    with open(file_path, 'r', encoding='utf-8') as f:
-        for line in f:
-            if line.strip():
-                item = json.loads(line)
-                # ================= 新增：预处理一致性标识 =================
-                # 在加载数据时就提前算好 prior 和 pred，方便后续极速筛选
-                parsed_pred = parse_vlm_prediction(item.get("pred", ""))
-                prior = item.get("meta_info", {}).get("prior_label", "unknown")
-                item["_parsed_pred"] = parsed_pred
-                item["_prior"] = prior
-                item["_is_match"] = (parsed_pred == prior)
-                # =======================================================
-                data.append(item)
-    return data
+@st.cache_resource
+def load_index(file_path, mtime_ns):
+    # 字节偏移索引 + 列存 (prior / pred / match / conf)，首次建立后缓存在 JSONL 同目录，
+    # 之后打开只读 npz；翻页时按偏移 seek 读取单条记录，不再把整个文件读进内存
+    return load_jsonl_index(file_path, profile='vlm')
+
+@st.cache_resource
+def get_thumb_cache():
+    return ThumbnailCache(THUMB_CACHE_DIR, max_bytes=THUMB_CACHE_MAX_BYTES)
 
 # ================= 主界面 =================
 st.title("👁️ VLM 推理结果深度可视化看板")
@@ -59,8 +46,8 @@ if not os.path.exists(jsonl_path):
     st.warning("找不到文件，请检查路径！")
     st.stop()
 
-# 加载数据
-all_data = load_jsonl(jsonl_path)
+# 加载索引 (文件被续写后 mtime 变化，会自动增量更新)
+index = load_index(jsonl_path, os.stat(jsonl_path).st_mtime_ns)
 
 # ================= 新增：筛选控制器 =================
 st.write("### 🎛️ 数据筛选")
@@ -70,15 +57,15 @@ filter_option = st.radio(
     horizontal=True
 )
 
-# 根据选择过滤数据
+# 根据选择过滤数据 (只在列存上筛选，得到行号)
 if "✅" in filter_option:
-    display_data = [item for item in all_data if item["_is_match"]]
+    display_rows = index.filter(match=True)
 elif "❌" in filter_option:
-    display_data = [item for item in all_data if not item["_is_match"]]
+    display_rows = index.filter(match=False)
 else:
-    display_data = all_data
+    display_rows = np.arange(len(index))
 
-total_samples = len(display_data)
+total_samples = len(display_rows)
 
 if total_samples == 0:
     st.warning("🕵️‍♂️ 当前筛选条件下没有找到任何数据！")
@@ -103,11 +90,13 @@ with col_idx:
     st.markdown(f"### 当前样本: {st.session_state.current_idx + 1} / {total_samples}")
 
 # 获取当前要展示的样本
-item = display_data[st.session_state.current_idx]
+row = int(display_rows[st.session_state.current_idx])
+item = index.read(row)
 
-# 直接使用预处理好的分类结果
-pred_cls = item["_parsed_pred"]
-prior_label = item["_prior"]
+# 直接使用列存中预处理好的分类结果
+pred_cls = index.value("pred", row)
+prior_label = index.value("prior", row)
+is_match = index.value("match", row)
 prob = extract_probability(item.get("pred_token_probs", []), pred_cls)
 
 # ================= 数据展示区 =================
@@ -122,8 +111,13 @@ with col1:
     local_img_path = item["images"][1]
     
     try:
-        st.image(Image.open(global_img_path), caption="Global View (Image 1)", use_container_width=True)
-        st.image(Image.open(local_img_path), caption="Local Detail (Image 2)", use_container_width=True)
+        thumb_cache = get_thumb_cache()
+        global_thumb = thumb_cache.thumbnail(global_img_path, THUMB_SIDE)
+        local_thumb = thumb_cache.thumbnail(local_img_path, THUMB_SIDE)
+        if global_thumb is None or local_thumb is None:
+            raise FileNotFoundError(f"{global_img_path} / {local_img_path}")
+        st.image(global_thumb, caption="Global View (Image 1)", use_container_width=True)
+        st.image(local_thumb, caption="Local Detail (Image 2)", use_container_width=True)
     except Exception as e:
         st.error(f"无法加载图像: {e}")
 
@@ -136,7 +130,7 @@ with col2:
     metrics_col1.metric("先验提示 (Prior)", prior_label)
     
     # 根据是否匹配给出不同颜色
-    metrics_col2.metric("VLM 预测结论", pred_cls, delta="匹配" if item["_is_match"] else "已矫正", delta_color="normal" if item["_is_match"] else "inverse")
+    metrics_col2.metric("VLM 预测结论", pred_cls, delta="匹配" if is_match else "已矫正", delta_color="normal" if is_match else "inverse")
     metrics_col3.metric("最终提取置信度", f"{prob:.4f}")
 
     st.markdown("#### 📝 思维链 (CoT) 输出原文")
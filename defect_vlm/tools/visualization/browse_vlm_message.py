@@ -8,8 +8,10 @@ import json
 import os
 import re
 import glob
+import numpy as np
 import pandas as pd
 from PIL import Image
+from defect_vlm.utils.jsonl_index import load_jsonl_index, NO_OUTPUT
 
 st.set_page_config(layout="wide", page_title="VLM Result Explorer")
 
@@ -26,49 +28,23 @@ def parse_assistant_content(content):
         defect = match.group(1).lower() if match else "unknown"
         return defect, {"raw_output": content}
 
-@st.cache_data
-def load_jsonl(file_path):
-    data = []
-    with open(file_path, 'r', encoding='utf-8') as f:
-        for line in f:
-            if not line.strip():
-                continue
-            item = json.loads(line)
-            
-            # 兼容 messages 格式的数据集/推理结果
-            messages = item.get("messages", [])
-            user_content = ""
-            ast_content = ""
-            
-            for msg in messages:
-                if msg.get("role") == "user":
-                    user_content = msg.get("content", "")
-                elif msg.get("role") == "assistant":
-                    ast_content = msg.get("content", "")
-            
-            # 如果存在额外的 pred 字段 (来自你之前的推理脚本)，则优先使用 pred
-            if "pred" in item and item["pred"]:
-                ast_content = item["pred"]
-
-            # 1. 提取先验提示 (Prior Hint)
-            prior_match = re.search(r'Prior Hint:\s*([^\n]+)', user_content)
-            prior = prior_match.group(1).strip().lower() if prior_match else "unknown"
-
-            # 2. 提取 Assistant 结果 (微调数据里的 GT，或者推理脚本里的 Pred)
-            if ast_content:
-                parsed_defect, parsed_dict = parse_assistant_content(ast_content)
-            else:
-                parsed_defect = "no_output"
-                parsed_dict = {}
-
-            item["_prior"] = prior
-            item["_parsed_defect"] = parsed_defect
-            item["_parsed_dict"] = parsed_dict
-            item["_is_match"] = (parsed_defect == prior)
-            item["_user_content"] = user_content
-            
-            data.append(item)
-    return data
+@st.cache_resource
+def load_index(file_path, mtime_ns):
+    # 字节偏移索引 + 列存 (prior / pred / match)，首次建立后缓存在 JSONL 同目录，翻页时按偏移 seek 读取单条记录
+    return load_jsonl_index(file_path, profile='message')
+
+def get_user_and_assistant(item):
+    """兼容 messages 格式的数据集/推理结果，存在额外的 pred 字段 (推理脚本输出) 时优先使用 pred"""
+    user_content = ""
+    ast_content = ""
+    for msg in item.get("messages", []):
+        if msg.get("role") == "user":
+            user_content = msg.get("content", "")
+        elif msg.get("role") == "assistant":
+            ast_content = msg.get("content", "")
+    if "pred" in item and item["pred"]:
+        ast_content = item["pred"]
+    return user_content, ast_content
 
 # ================= 顶部配置与文件选择 =================
 st.title("👁️ VLM 数据集与推理结果深度看板")
@@ -100,9 +76,9 @@ if 'last_file' not in st.session_state or st.session_state.last_file != jsonl_pa
     st.session_state.current_idx = 0
     st.session_state.last_file = jsonl_path
 
-# 加载数据
-with st.spinner('正在极速加载解析数据...'):
-    all_data = load_jsonl(jsonl_path)
+# 加载索引
+with st.spinner('正在加载 JSONL 索引 (首次打开需要扫描一遍文件)...'):
+    index = load_index(jsonl_path, os.stat(jsonl_path).st_mtime_ns)
 
 # ================= 筛选控制器 =================
 st.write("### 🎛️ 数据筛选")
@@ -113,15 +89,15 @@ filter_option = st.radio(
 )
 
 if "✅" in filter_option:
-    display_data = [item for item in all_data if item["_is_match"] and item["_parsed_defect"] != "no_output"]
+    display_rows = index.filter(match=True, exclude_pred=NO_OUTPUT)
 elif "❌" in filter_option:
-    display_data = [item for item in all_data if not item["_is_match"] and item["_parsed_defect"] != "no_output"]
+    display_rows = index.filter(match=False, exclude_pred=NO_OUTPUT)
 elif "⚠️" in filter_option:
-    display_data = [item for item in all_data if item["_parsed_defect"] == "no_output"]
+    display_rows = index.filter(pred=NO_OUTPUT)
 else:
-    display_data = all_data
+    display_rows = np.arange(len(index))
 
-total_samples = len(display_data)
+total_samples = len(display_rows)
 
 if total_samples == 0:
     st.warning("🕵️‍♂️ 当前筛选条件下没有找到任何数据！")
@@ -143,9 +119,13 @@ with col_idx:
     st.markdown(f"<h3 style='text-align: center;'>当前样本: {st.session_state.current_idx + 1} / {total_samples}</h3>", unsafe_allow_html=True)
 
 # 获取当前样本
-item = display_data[st.session_state.current_idx]
-pred_cls = item["_parsed_defect"]
-prior_label = item["_prior"]
+row = int(display_rows[st.session_state.current_idx])
+item = index.read(row)
+pred_cls = index.value("pred", row)
+prior_label = index.value("prior", row)
+is_match = index.value("match", row)
+user_content, ast_content = get_user_and_assistant(item)
+parsed_dict = parse_assistant_content(ast_content)[1] if ast_content else {}
 
 # ================= 数据展示区 =================
 st.divider()
@@ -176,15 +156,15 @@ with col_text:
     if pred_cls == "no_output":
          metrics_col2.metric("VLM 目标输出", "无回答 (尚未推理)", delta="待推理", delta_color="off")
     else:
-         metrics_col2.metric("VLM 目标输出", pred_cls, delta="一致 (匹配先验)" if item["_is_match"] else "矫正 (推翻先验)", delta_color="normal" if item["_is_match"] else "inverse")
+         metrics_col2.metric("VLM 目标输出", pred_cls, delta="一致 (匹配先验)" if is_match else "矫正 (推翻先验)", delta_color="normal" if is_match else "inverse")
 
     # 结构化展示 JSON
     st.markdown("#### 📝 Assistant 结构化输出")
     if pred_cls != "no_output":
-        st.json(item["_parsed_dict"])
+        st.json(parsed_dict)
     else:
         st.info("该条数据中 Assistant 为空。")
         
     # 可折叠的 Prompt
     with st.expander("🔍 查看完整的 User Prompt (输入指令)"):
-        st.text(item["_user_content"])
\ No newline at end of file
+        st.text(user_content)
\ No newline at end of file
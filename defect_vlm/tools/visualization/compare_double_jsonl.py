@@ -2,8 +2,8 @@
 输入两个jsonl文件，用streamlit进行对比。
 """
 import streamlit as st
-import json
 import os
+from defect_vlm.utils.jsonl_index import load_jsonl_index
 
 # 1. 页面配置：必须开启 wide 模式，否则左右对比会非常拥挤
 st.set_page_config(page_title="JSONL 数据对比工具", layout="wide")
@@ -20,10 +20,11 @@ with st.sidebar:
     load_btn = st.button("🚀 加载数据", type="primary")
 
 # 3. 初始化 Session State（保持翻页时数据不丢失）
-if 'data1' not in st.session_state:
-    st.session_state.data1 = []
-if 'data2' not in st.session_state:
-    st.session_state.data2 = []
+# 只保存两个文件的字节偏移索引，翻页时按偏移 seek 读取对应的一行
+if 'index1' not in st.session_state:
+    st.session_state.index1 = None
+if 'index2' not in st.session_state:
+    st.session_state.index2 = None
 if 'current_idx' not in st.session_state:
     st.session_state.current_idx = 0
 
@@ -34,13 +35,11 @@ def load_data(path1, path2):
         return
     
     try:
-        with open(path1, 'r', encoding='utf-8') as f:
-            st.session_state.data1 = [json.loads(line) for line in f if line.strip()]
-        with open(path2, 'r', encoding='utf-8') as f:
-            st.session_state.data2 = [json.loads(line) for line in f if line.strip()]
+        st.session_state.index1 = load_jsonl_index(path1, profile='plain')
+        st.session_state.index2 = load_jsonl_index(path2, profile='plain')
             
         st.session_state.current_idx = 0 # 重置索引
-        st.sidebar.success(f"✅ 加载成功！\n左: {len(st.session_state.data1)} 条\n右: {len(st.session_state.data2)} 条")
+        st.sidebar.success(f"✅ 加载成功！\n左: {len(st.session_state.index1)} 条\n右: {len(st.session_state.index2)} 条")
     except Exception as e:
         st.error(f"❌ 解析 JSONL 失败: {e}")
 
@@ -48,8 +47,10 @@ if load_btn:
     load_data(file1_path, file2_path)
 
 # 5. 主界面渲染与交互
-if st.session_state.data1 or st.session_state.data2:
-    max_len = max(len(st.session_state.data1), len(st.session_state.data2))
+len1 = len(st.session_state.index1) if st.session_state.index1 is not None else 0
+len2 = len(st.session_state.index2) if st.session_state.index2 is not None else 0
+if len1 or len2:
+    max_len = max(len1, len2)
     
     # 顶部控制台 (翻页器)
     st.markdown("---")
@@ -83,16 +84,16 @@ if st.session_state.data1 or st.session_state.data2:
     
     with col_left:
         st.subheader("📄 左侧数据")
-        if idx < len(st.session_state.data1):
+        if idx < len1:
             # st.json 渲染自带代码高亮、折叠功能
-            st.json(st.session_state.data1[idx], expanded=True)
+            st.json(st.session_state.index1.read(idx), expanded=True)
         else:
             st.warning("⚠️ 越界：左侧文件已到底")
 
     with col_right:
         st.subheader("📄 右侧数据")
-        if idx < len(st.session_state.data2):
-            st.json(st.session_state.data2[idx], expanded=True)
+        if idx < len2:
+            st.json(st.session_state.index2.read(idx), expanded=True)
         else:
             st.warning("⚠️ 越界：右侧文件已到底")
 else:
@@ -1,3 +1,5 @@
 from .config_manager import APIConfigManager
+from .bbox_sampler import sample_background_bboxes
+from .parallel_runner import make_image_rngs, run_image_tasks, merge_sample_groups
 
-__all__ = ['APIConfigManager']
+__all__ = ['APIConfigManager', 'sample_background_bboxes', 'make_image_rngs', 'run_image_tasks', 'merge_sample_groups']
@@ -0,0 +1,90 @@
+"""
+向量化的背景框采样器 (负样本生成用)
+原来的 generate_random_bbox 每次只摇一个候选框，再用 Python 循环逐个与 GT 计算 IoU，
+密集图像上 50 次尝试经常全部失败。这里一次性生成一批候选框，
+用 (K, G) 的相交面积矩阵一次性剔除与任何 GT 有重叠的候选，按抽样顺序返回前 num_samples 个。
+
+随机数全部来自传入的 rng (np.random.RandomState / np.random.Generator)，
+默认使用 np.random 全局状态，因此在脚本开头 np.random.seed(42) 之后结果可复现。
+"""
+import numpy as np
+
+
+def overlaps_any(candidates, gt_bboxes):
+    """
+    candidates: (K, 4) xywh，gt_bboxes: (G, 4) xywh
+    返回 (K,) bool，表示候选框是否与任意 GT 有正面积的交集 (等价于 compute_iou > 0)
+    """
+    if len(gt_bboxes) == 0 or len(candidates) == 0:
+        return np.zeros(len(candidates), dtype=bool)
+    c = np.asarray(candidates, dtype=np.float64)
+    g = np.asarray(gt_bboxes, dtype=np.float64).reshape(-1, 4)
+    inter_w = np.minimum(c[:, None, 0] + c[:, None, 2], g[None, :, 0] + g[None, :, 2]) - np.maximum(c[:, None, 0], g[None, :, 0])
+    inter_h = np.minimum(c[:, None, 1] + c[:, None, 3], g[None, :, 1] + g[None, :, 3]) - np.maximum(c[:, None, 1], g[None, :, 1])
+    return ((inter_w > 0) & (inter_h > 0)).any(axis=1)
+
+
+def sample_background_bboxes(
+    image_shape,
+    gt_bboxes,
+    num_samples,
+    ref_sizes=None,
+    size_range=None,
+    scale_range=(0.8, 1.2),
+    min_size=10,
+    batch_size=64,
+    max_rounds=8,
+    rng=None
+):
+    """
+    批量采样不与任何 GT 重叠的背景框
+    :param image_shape: (h, w)
+    :param gt_bboxes: GT 框列表 [x, y, w, h]
+    :param num_samples: 需要的背景框数量
+    :param ref_sizes: 尺寸参考池 [(w, h), ...]，随机取一个再乘以 scale_range 内的缩放；为空时基准尺寸为 100x100
+    :param size_range: (min, max)，提供时改为在该闭区间内直接均匀采样整数宽高 (微小负样本)
+    :param min_size: ref_sizes 模式下的最小边长
+    :param batch_size: 每轮生成的候选框数量
+    :param max_rounds: 最多尝试的轮数
+    :param rng: 随机数生成器，默认 np.random
+    :return: list[[x, y, w, h]]，长度 <= num_samples
+    """
+    if num_samples <= 0:
+        return []
+    rng = np.random if rng is None else rng
+    h_img, w_img = image_shape
+    gts = np.asarray(gt_bboxes, dtype=np.float64).reshape(-1, 4)
+    accepted = []
+
+    for _ in range(max_rounds):
+        # 1. 随机尺寸
+        if size_range is not None:
+            lo, hi = size_range
+            w = np.floor(rng.uniform(lo, hi + 1, batch_size)).astype(np.int64)
+            h = np.floor(rng.uniform(lo, hi + 1, batch_size)).astype(np.int64)
+        else:
+            if ref_sizes:
+                pool = np.asarray(ref_sizes, dtype=np.float64).reshape(-1, 2)
+                idx = np.minimum(np.floor(rng.uniform(0, len(pool), batch_size)).astype(np.int64), len(pool) - 1)
+                base = pool[idx]
+            else:
+                base = np.full((batch_size, 2), 100.0)
+            scale = rng.uniform(scale_range[0], scale_range[1], batch_size)
+            w = np.clip((base[:, 0] * scale).astype(np.int64), min_size, w_img - 1)
+            h = np.clip((base[:, 1] * scale).astype(np.int64), min_size, h_img - 1)
+
+        # 2. 随机位置 (等价于 randint(0, w_img - w))
+        u = rng.uniform(0, 1, (batch_size, 2))
+        valid = (w_img - w > 0) & (h_img - h > 0)
+        x = np.floor(u[:, 0] * (w_img - w + 1)).astype(np.int64)
+        y = np.floor(u[:, 1] * (h_img - h + 1)).astype(np.int64)
+        cands = np.stack([x, y, w, h], axis=1)[valid]
+
+        # 3. 向量化重叠检查 (必须是纯背景)
+        keep = cands[~overlaps_any(cands, gts)]
+        for box in keep[: num_samples - len(accepted)]:
+            accepted.append([int(v) for v in box])
+        if len(accepted) >= num_samples:
+            break
+
+    return accepted
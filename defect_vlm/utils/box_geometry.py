@@ -0,0 +1,184 @@
+"""
+边界框几何计算的公共模块
+原来 compute_iou 在 exp1/exp2/exp3、general_dataset 的三个采样脚本里各写了一份纯 Python 版本，
+calculate_nwd 只存在于 legacy/nwd_decision_fusion.py。这里统一为：
+1. 标量版本 (box_iou / calculate_nwd)：纯 Python，与原实现逐位一致，适合单对框的热循环；
+2. 矩阵版本 (pairwise_*)：(N, 4) x (M, 4) 的 NumPy 向量化计算，适合一次性算完一张图的所有配对；
+3. 格式转换：xyxy / xywh (COCO) / cxcywh；
+4. 纯 NumPy 的贪心 NMS (与 torchvision.ops.nms 一致，流式级联等没有 torchvision 的场景使用)。
+
+所有函数都通过 fmt 参数支持 'xyxy' 和 'xywh' 两种输入格式。
+属性校验和微基准见 tools/bench_box_geometry.py。
+"""
+import math
+import numpy as np
+
+# ================= 格式转换 =================
+def as_boxes(boxes):
+    """把列表/数组统一为 (N, 4) 的 float64 数组"""
+    return np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+
+
+def xywh_to_xyxy(boxes):
+    b = as_boxes(boxes)
+    return np.concatenate([b[:, :2], b[:, :2] + b[:, 2:]], axis=1)
+
+
+def xyxy_to_xywh(boxes):
+    b = as_boxes(boxes)
+    return np.concatenate([b[:, :2], b[:, 2:] - b[:, :2]], axis=1)
+
+
+def xyxy_to_cxcywh(boxes):
+    b = as_boxes(boxes)
+    return np.concatenate([(b[:, :2] + b[:, 2:]) / 2.0, b[:, 2:] - b[:, :2]], axis=1)
+
+
+def cxcywh_to_xyxy(boxes):
+    b = as_boxes(boxes)
+    return np.concatenate([b[:, :2] - b[:, 2:] / 2.0, b[:, :2] + b[:, 2:] / 2.0], axis=1)
+
+
+def to_xyxy(boxes, fmt='xyxy'):
+    """按 fmt 将输入转换为 (N, 4) 的 xyxy 数组"""
+    if fmt == 'xyxy':
+        return as_boxes(boxes)
+    if fmt == 'xywh':
+        return xywh_to_xyxy(boxes)
+    raise ValueError(f"不支持的框格式: {fmt}")
+
+
+def box_area(boxes, fmt='xyxy'):
+    b = to_xyxy(boxes, fmt)
+    return (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+
+
+# ================= 标量版本 =================
+def box_iou(box1, box2, fmt='xyxy'):
+    """计算两个框的 IoU (纯 Python)，无交集或并集面积为 0 时返回 0.0"""
+    if fmt == 'xywh':
+        ax1, ay1, ax2, ay2 = box1[0], box1[1], box1[0] + box1[2], box1[1] + box1[3]
+        bx1, by1, bx2, by2 = box2[0], box2[1], box2[0] + box2[2], box2[1] + box2[3]
+        area1, area2 = box1[2] * box1[3], box2[2] * box2[3]
+    else:
+        ax1, ay1, ax2, ay2 = box1[0], box1[1], box1[2], box1[3]
+        bx1, by1, bx2, by2 = box2[0], box2[1], box2[2], box2[3]
+        area1, area2 = (ax2 - ax1) * (ay2 - ay1), (bx2 - bx1) * (by2 - by1)
+
+    inter_area = max(0, min(ax2, bx2) - max(ax1, bx1)) * max(0, min(ay2, by2) - max(ay1, by1))
+    if inter_area == 0:
+        return 0.0
+
+    union_area = area1 + area2 - inter_area
+    if union_area <= 0:
+        return 0.0
+    return inter_area / float(union_area)
+
+
+def calculate_nwd(box1, box2, C, fmt='xyxy'):
+    """计算两个边界框之间的归一化 Wasserstein 距离 (NWD) 相似度，取值 (0, 1]"""
+    if fmt == 'xywh':
+        cx1, cy1, w1, h1 = box1[0] + box1[2] / 2.0, box1[1] + box1[3] / 2.0, box1[2], box1[3]
+        cx2, cy2, w2, h2 = box2[0] + box2[2] / 2.0, box2[1] + box2[3] / 2.0, box2[2], box2[3]
+    else:
+        cx1, cy1 = (box1[0] + box1[2]) / 2.0, (box1[1] + box1[3]) / 2.0
+        w1, h1 = box1[2] - box1[0], box1[3] - box1[1]
+        cx2, cy2 = (box2[0] + box2[2]) / 2.0, (box2[1] + box2[3]) / 2.0
+        w2, h2 = box2[2] - box2[0], box2[3] - box2[1]
+
+    # 二阶 Wasserstein 距离平方 (W_2^2)，再指数归一化
+    w2_dist_sq = (cx1 - cx2) ** 2 + (cy1 - cy2) ** 2 + ((w1 - w2) ** 2 + (h1 - h2) ** 2) / 4.0
+    return math.exp(-math.sqrt(w2_dist_sq) / C)
+
+
+def get_area_ratio(bbox, img_w, img_h, fmt='xyxy'):
+    """计算边界框占全图的相对面积比 R_A"""
+    if fmt == 'xywh':
+        return (bbox[2] * bbox[3]) / (img_w * img_h)
+    return ((bbox[2] - bbox[0]) * (bbox[3] - bbox[1])) / (img_w * img_h)
+
+
+# ================= 矩阵版本 =================
+def _inter_union(a, b):
+    """a: (N, 4) xyxy, b: (M, 4) xyxy -> (inter, union) 均为 (N, M)"""
+    lt = np.maximum(a[:, None, :2], b[None, :, :2])
+    rb = np.minimum(a[:, None, 2:], b[None, :, 2:])
+    wh = np.clip(rb - lt, 0, None)
+    inter = wh[..., 0] * wh[..., 1]
+    area_a = (a[:, 2] - a[:, 0]) * (a[:, 3] - a[:, 1])
+    area_b = (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+    union = area_a[:, None] + area_b[None, :] - inter
+    return inter, union
+
+
+def pairwise_iou(boxes1, boxes2, fmt='xyxy'):
+    """(N, 4) x (M, 4) -> (N, M) IoU 矩阵，语义与 box_iou 一致"""
+    a, b = to_xyxy(boxes1, fmt), to_xyxy(boxes2, fmt)
+    inter, union = _inter_union(a, b)
+    out = np.zeros_like(inter)
+    np.divide(inter, union, out=out, where=(inter > 0) & (union > 0))
+    return out
+
+
+def pairwise_giou(boxes1, boxes2, fmt='xyxy'):
+    """(N, 4) x (M, 4) -> (N, M) GIoU 矩阵，取值 [-1, 1]"""
+    a, b = to_xyxy(boxes1, fmt), to_xyxy(boxes2, fmt)
+    inter, union = _inter_union(a, b)
+    iou = np.zeros_like(inter)
+    np.divide(inter, union, out=iou, where=union > 0)
+
+    # 最小外接矩形
+    lt = np.minimum(a[:, None, :2], b[None, :, :2])
+    rb = np.maximum(a[:, None, 2:], b[None, :, 2:])
+    wh = np.clip(rb - lt, 0, None)
+    enclose = wh[..., 0] * wh[..., 1]
+    penalty = np.zeros_like(inter)
+    np.divide(enclose - union, enclose, out=penalty, where=enclose > 0)
+    return iou - penalty
+
+
+def pairwise_nwd(boxes1, boxes2, C, fmt='xyxy'):
+    """(N, 4) x (M, 4) -> (N, M) NWD 相似度矩阵，语义与 calculate_nwd 一致"""
+    a = xyxy_to_cxcywh(to_xyxy(boxes1, fmt))
+    b = xyxy_to_cxcywh(to_xyxy(boxes2, fmt))
+    d_center = ((a[:, None, :2] - b[None, :, :2]) ** 2).sum(axis=2)
+    d_shape = ((a[:, None, 2:] - b[None, :, 2:]) ** 2).sum(axis=2) / 4.0
+    return np.exp(-np.sqrt(d_center + d_shape) / C)
+
+
+def area_ratio(boxes, img_w, img_h, fmt='xyxy'):
+    """(N, 4) -> (N,) 每个框占全图的相对面积比，与 get_area_ratio 一致"""
+    return box_area(boxes, fmt) / (img_w * img_h)
+
+
+def pairwise_area_ratio(boxes1, boxes2, fmt='xyxy'):
+    """(N, 4) x (M, 4) -> (N, M) 面积比 min(A, B) / max(A, B)，两者面积都为 0 时为 0"""
+    area_a = box_area(boxes1, fmt)
+    area_b = box_area(boxes2, fmt)
+    lo = np.minimum(area_a[:, None], area_b[None, :])
+    hi = np.maximum(area_a[:, None], area_b[None, :])
+    out = np.zeros_like(lo)
+    np.divide(lo, hi, out=out, where=hi > 0)
+    return out
+
+
+# ================= NMS =================
+def nms(boxes, scores, iou_thres, fmt='xyxy'):
+    """
+    贪心 NMS，语义与 torchvision.ops.nms 一致 (IoU > iou_thres 的低分框被抑制)
+    :return: 保留框的索引，按分数降序
+    """
+    b = to_xyxy(boxes, fmt)
+    scores = np.asarray(scores, dtype=np.float64).reshape(-1)
+    if len(b) == 0:
+        return np.empty(0, dtype=np.int64)
+    order = np.argsort(-scores, kind='stable')
+    iou = pairwise_iou(b[order], b[order])
+    suppressed = np.zeros(len(order), dtype=bool)
+    keep = []
+    for i in range(len(order)):
+        if suppressed[i]:
+            continue
+        keep.append(order[i])
+        suppressed |= iou[i] > iou_thres
+    return np.asarray(keep, dtype=np.int64)
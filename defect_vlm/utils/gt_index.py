@@ -0,0 +1,199 @@
+"""
+持久化的 GT 索引 (COCO val.json -> 扁平数组 + 图像偏移表)
+各个评估脚本 (compute_*_metric*.py、compute_th_PR.py、exp1/2/3) 每次都要重新解析 COCO json、
+重建 imgid2name / gt_dict，并逐个把 xywh 转成 xyxy。这里只解析一次，缓存到磁盘：
+    file_names : 所有图像的文件名 (保持 json 中 images 的顺序)
+    offsets    : (num_images + 1,) 第 i 张图的标注位于 [offsets[i], offsets[i+1])
+    cls        : (num_anns,) 类别 id
+    boxes      : (num_anns, 4) xyxy
+缓存以 GT 文件内容的 sha256 作为失效依据，GT 一旦修改会自动重建；
+同一进程内多次加载同一个 GT 会直接复用内存中的索引 (批量评估多个预测文件时只加载一次)。
+"""
+import hashlib
+import json
+from collections import defaultdict
+from pathlib import Path
+
+import numpy as np
+
+GT_INDEX_VERSION = 1
+_MEMO = {}
+
+
+def file_sha256(path, chunk_size=1 << 20):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class GTIndex:
+    """扁平数组形式的 GT 索引，get(file_name) 为 O(1)"""
+
+    def __init__(self, file_names, image_ids, offsets, cls, boxes, categories, source_hash=""):
+        self.file_names = list(file_names)
+        self.image_ids = list(image_ids)
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self.cls = np.asarray(cls, dtype=np.int64)
+        self.boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+        self.categories = categories
+        self.source_hash = source_hash
+
+        self.name2idx = {name: i for i, name in enumerate(self.file_names)}
+        self.names_dict = {cat['id']: cat['name'] for cat in categories}
+        self.name2id = {cat['name']: cat['id'] for cat in categories}
+        self.imgid2name = dict(zip(self.image_ids, self.file_names))
+
+    # ================= 构建 / 读写 =================
+    @classmethod
+    def from_coco(cls_, coco_gt, source_hash=""):
+        file_names = [img['file_name'] for img in coco_gt['images']]
+        image_ids = [img['id'] for img in coco_gt['images']]
+        id2idx = {img_id: i for i, img_id in enumerate(image_ids)}
+
+        # 按图像分组 (保持标注在 json 中的相对顺序，与原来的 gt_dict 一致)
+        ann_img = np.array([id2idx[ann['image_id']] for ann in coco_gt['annotations']], dtype=np.int64)
+        ann_cls = np.array([ann['category_id'] for ann in coco_gt['annotations']], dtype=np.int64)
+        ann_xywh = np.array([ann['bbox'] for ann in coco_gt['annotations']], dtype=np.float64).reshape(-1, 4)
+
+        order = np.argsort(ann_img, kind='stable')
+        counts = np.bincount(ann_img, minlength=len(file_names))
+        offsets = np.concatenate([[0], np.cumsum(counts)])
+        xywh = ann_xywh[order]
+        boxes = np.concatenate([xywh[:, :2], xywh[:, :2] + xywh[:, 2:]], axis=1)
+        return cls_(file_names, image_ids, offsets, ann_cls[order], boxes, coco_gt['categories'], source_hash)
+
+    def save(self, cache_path):
+        meta = {
+            "version": GT_INDEX_VERSION,
+            "source_hash": self.source_hash,
+            "file_names": self.file_names,
+            "image_ids": self.image_ids,
+            "categories": self.categories,
+        }
+        cache_path = Path(cache_path)
+        cache_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(cache_path, 'wb') as f:
+            np.savez(f, offsets=self.offsets, cls=self.cls, boxes=self.boxes, meta=np.array(json.dumps(meta, ensure_ascii=False)))
+
+    @classmethod
+    def load(cls_, cache_path):
+        with np.load(cache_path, allow_pickle=False) as data:
+            meta = json.loads(str(data['meta']))
+            if meta.get("version") != GT_INDEX_VERSION:
+                raise ValueError(f"不支持的 GT 索引版本: {meta.get('version')}")
+            return cls_(meta['file_names'], meta['image_ids'], data['offsets'], data['cls'], data['boxes'],
+                        meta['categories'], meta['source_hash'])
+
+    # ================= 查询 =================
+    def __repr__(self):
+        return f"GTIndex({len(self.file_names)} images, {len(self.cls)} boxes, sha256={self.source_hash[:12]})"
+
+    def __len__(self):
+        return len(self.file_names)
+
+    def __contains__(self, file_name):
+        return file_name in self.name2idx
+
+    def get(self, file_name):
+        """返回 (cls (k,), boxes (k, 4) xyxy)，不在 GT 中的图像返回空数组"""
+        i = self.name2idx.get(file_name)
+        if i is None:
+            return self.cls[:0], self.boxes[:0]
+        s, e = self.offsets[i], self.offsets[i + 1]
+        return self.cls[s:e], self.boxes[s:e]
+
+    def labels(self, file_name):
+        """返回 (k, 5) 的 [cls, x1, y1, x2, y2] 数组"""
+        c, b = self.get(file_name)
+        return np.concatenate([c[:, None].astype(np.float64), b], axis=1)
+
+    def to_gt_dict(self):
+        """兼容原 compute_*_metric 脚本的 {file_name: [[cat_id, x1, y1, x2, y2], ...]} (包含无标注的图像)"""
+        cls_list, box_list = self.cls.tolist(), self.boxes.tolist()
+        gt_dict = {}
+        for i, name in enumerate(self.file_names):
+            s, e = int(self.offsets[i]), int(self.offsets[i + 1])
+            gt_dict[name] = [[cls_list[k]] + box_list[k] for k in range(s, e)]
+        return gt_dict
+
+    def to_records(self, key='class_id'):
+        """
+        兼容 exp1/2/3 的 defaultdict(list)：{file_name: [{key: ..., 'bbox': [x1, y1, x2, y2]}, ...]} (只包含有标注的图像)
+        key='class_id' 时存类别 id，key='class_name' 时存类别名
+        """
+        cls_list, box_list = self.cls.tolist(), self.boxes.tolist()
+        records = defaultdict(list)
+        for i, name in enumerate(self.file_names):
+            s, e = int(self.offsets[i]), int(self.offsets[i + 1])
+            for k in range(s, e):
+                value = cls_list[k] if key == 'class_id' else self.names_dict[cls_list[k]]
+                records[name].append({key: value, 'bbox': box_list[k]})
+        return records
+
+
+def default_cache_path(gt_json):
+    gt_json = Path(gt_json)
+    return gt_json.with_name(f"{gt_json.stem}.gt_index.npz")
+
+
+def load_gt_index(gt_json, cache_path=None, verbose=True):
+    """
+    加载 GT 索引：同一进程内直接复用；磁盘缓存的哈希与 GT 文件一致时直接读缓存；否则解析 json 并重建缓存
+    :param gt_json: COCO 格式的 GT 路径，也可以直接传入 GTIndex (原样返回)
+    :param cache_path: 缓存路径，默认与 GT 同目录的 {stem}.gt_index.npz；缓存目录不可写时只保留在内存中
+    """
+    if isinstance(gt_json, GTIndex):
+        return gt_json
+
+    gt_json = Path(gt_json)
+    st = gt_json.stat()
+    memo_key = (str(gt_json.resolve()), st.st_size, st.st_mtime_ns)
+    if memo_key in _MEMO:
+        return _MEMO[memo_key]
+
+    cache_path = Path(cache_path) if cache_path else default_cache_path(gt_json)
+    source_hash = file_sha256(gt_json)
+
+    index = None
+    if cache_path.exists():
+        try:
+            cached = GTIndex.load(cache_path)
+            if cached.source_hash == source_hash:
+                index = cached
+                if verbose:
+                    print(f"⚡ 命中 GT 索引缓存: {cache_path}")
+        except (ValueError, KeyError, OSError) as e:
+            print(f"⚠️ GT 索引缓存损坏，将重建: {e}")
+
+    if index is None:
+        if verbose:
+            print(f"📖 正在解析真实标签并建立索引: {gt_json}")
+        with open(gt_json, 'r', encoding='utf-8') as f:
+            coco_gt = json.load(f)
+        index = GTIndex.from_coco(coco_gt, source_hash)
+        try:
+            index.save(cache_path)
+            if verbose:
+                print(f"💾 GT 索引已缓存至: {cache_path}")
+        except OSError as e:
+            print(f"⚠️ GT 索引缓存写入失败 (仅在内存中使用): {e}")
+
+    _MEMO[memo_key] = index
+    return index
+
+
+def batch_evaluate(eval_fn, pred_jsons, gt_json, output_root, **kwargs):
+    """
+    批量模式：在同一个进程中用同一份 GT 评估多个预测文件
+    :param eval_fn: 评估函数，签名为 eval_fn(pred_json, gt_json, output_dir, **kwargs)
+    :param pred_jsons: {名称: 预测文件路径}，每个预测文件的结果输出到 output_root/名称
+    """
+    gt_index = load_gt_index(gt_json)
+    results = {}
+    for name, pred_json in pred_jsons.items():
+        print("\n" + "=" * 70)
+        print(f"🚀 [{name}] {pred_json}")
+        results[name] = eval_fn(pred_json, gt_index, Path(output_root) / name, **kwargs)
+    return results
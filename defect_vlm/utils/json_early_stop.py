@@ -0,0 +1,282 @@
+"""
+JSON 结论完成即停止生成
+教师 API (max_tokens=8192) 和 swift 推理 (max_tokens=4096) 都会一直生成到 EOS，模型在右大括号之后
+偶尔还会继续输出解释、总结甚至第二份 JSON，这部分 token 既花钱又占推理时间，下游解析也用不到。
+这里提供：
+    VerdictTracker      : 增量扫描器，逐段喂入生成文本，一旦出现包含 defect 的完整顶层 JSON 对象即判定完成
+                          (单遍扫描，只在大括号内跟踪字符串/转义；代码块标记、前缀废话不影响)
+    find_verdict_end    : 一次性版本，返回完整结论结束位置
+    VERDICT_STOP_WORDS / restore_verdict :
+                          swift VllmEngine / TransformersEngine 无法挂自定义停止条件，用 stop 词 "}" 近似：
+                          只对输出模板只有 defect 一个键的提示词 (如 prompts.json 的 3 号) 成立；
+                          带 step1..3 的提示词中前面的字符串里可能出现 "}"，会把结论截断，
+                          resolve_stop_mode 会把这类数据的 on 模式降级为 measure。
+                          推理框架会去掉 stop 词本身，restore_verdict 负责补回
+    make_hf_stopping_criteria : 直接使用 transformers.generate 时的精确停止条件 (逐条序列增量解码)
+    EarlyStopStats      : 每条请求生成 / 节省的 token 统计与报告
+三种模式：off 不处理；measure 照常生成到结束，只记录结论之后还生成了多少 token (评估能省多少)；on 提前停止。
+"""
+import json
+import re
+
+EARLY_STOP_MODES = ('off', 'measure', 'on')
+VERDICT_KEY = 'defect'
+VERDICT_STOP_WORDS = ['}']
+
+
+class VerdictTracker:
+    """
+    增量识别 "包含 defect 的完整 JSON 对象"
+        tracker = VerdictTracker()
+        for delta in stream:
+            if tracker.feed(delta):
+                break
+        tracker.end     -> 结论在累计文本中的结束位置 (不含)
+        tracker.verdict -> 解析出的 dict
+    """
+
+    def __init__(self, key=VERDICT_KEY):
+        self.key = key
+        self.text = ""
+        self.end = None
+        self.verdict = None
+        self._pos = 0           # 下一个待扫描字符
+        self._depth = 0
+        self._start = None      # 当前顶层对象的起点
+        self._in_str = False
+        self._escape = False
+
+    @property
+    def done(self):
+        return self.end is not None
+
+    def feed(self, delta):
+        """追加一段文本并继续扫描，返回是否已经得到完整结论"""
+        if self.done:
+            return True
+        if delta:
+            self.text += delta
+        text = self.text
+        i = self._pos
+        n = len(text)
+        while i < n:
+            ch = text[i]
+            if self._depth == 0:
+                # 对象外的引号、反斜杠都是普通文字，只找下一个左大括号
+                j = text.find('{', i)
+                if j < 0:
+                    i = n
+                    break
+                self._start, self._depth, i = j, 1, j + 1
+                continue
+            if self._in_str:
+                if self._escape:
+                    self._escape = False
+                elif ch == '\\':
+                    self._escape = True
+                elif ch == '"':
+                    self._in_str = False
+            elif ch == '"':
+                self._in_str = True
+            elif ch == '{':
+                self._depth += 1
+            elif ch == '}':
+                self._depth -= 1
+                if self._depth == 0 and self._accept(text[self._start:i + 1]):
+                    self.end = i + 1
+                    self._pos = i + 1
+                    return True
+            i += 1
+        self._pos = i
+        return False
+
+    def _accept(self, candidate):
+        try:
+            obj = json.loads(candidate)
+        except json.JSONDecodeError:
+            return False
+        if isinstance(obj, dict) and self.key in obj:
+            self.verdict = obj
+            return True
+        return False
+
+
+def find_verdict_end(text, key=VERDICT_KEY):
+    """返回第一个包含 key 的完整 JSON 对象的结束位置，没有则返回 None"""
+    tracker = VerdictTracker(key)
+    tracker.feed(text)
+    return tracker.end
+
+
+def restore_verdict(text):
+    """
+    stop 词 "}" 被推理框架截掉后补回：只有补上之后才构成完整结论时才追加，
+    本来就完整 (框架保留了 stop 词) 或补了也不完整 (生成到 max_tokens 被截断) 时原样返回
+    """
+    if not text or find_verdict_end(text) is not None:
+        return text
+    restored = text + VERDICT_STOP_WORDS[0]
+    return restored if find_verdict_end(restored) is not None else text
+
+
+def tail_token_estimate(text, completion_tokens):
+    """
+    measure 模式：结论之后多生成的 token 数，按字符比例从 completion_tokens 折算
+    (推理框架只返回总 token 数时使用；流式 API 直接按 chunk 计数)
+    """
+    end = find_verdict_end(text) if text else None
+    if end is None or not completion_tokens:
+        return 0
+    tail = len(text) - end
+    return int(round(completion_tokens * tail / max(len(text), 1)))
+
+
+def stop_words_for(mode):
+    """swift RequestConfig 的 stop 参数：只有 on 模式才加 stop 词 (先用 resolve_stop_mode 确认数据适用)"""
+    return list(VERDICT_STOP_WORDS) if mode == 'on' else []
+
+
+_SCHEMA_START_RE = re.compile(r'\{\s*"')
+_SCHEMA_KEY_RE = re.compile(r'"(\w+)"\s*:')
+
+
+def prompt_output_keys(prompt_text):
+    """提示词末尾输出格式模板 (最后一个以 {" 开头的块) 中的键，找不到模板时返回 []"""
+    starts = [m.start() for m in _SCHEMA_START_RE.finditer(prompt_text or "")]
+    if not starts:
+        return []
+    return _SCHEMA_KEY_RE.findall(prompt_text[starts[-1]:])
+
+
+def item_prompt_text(item):
+    """取出一条推理数据中用户提问的文本 (messages / conversation 两种格式)"""
+    texts = []
+    for msg in item.get('messages') or []:
+        if msg.get('role') != 'user':
+            continue
+        content = msg.get('content')
+        if isinstance(content, list):
+            texts.extend(c.get('text', '') for c in content if isinstance(c, dict))
+        elif content:
+            texts.append(content)
+    for msg in item.get('conversation') or []:
+        if msg.get('from') == 'human':
+            texts.append(msg.get('value', ''))
+    return '\n'.join(texts)
+
+
+def resolve_stop_mode(mode, items, key=VERDICT_KEY):
+    """
+    stop 词 "}" 只在输出模板只有 key 一个键时安全；数据中任一提示词的模板还有其他键 (step1..3 等) 时，
+    on 模式降级为 measure (照常生成，只统计)，避免前面字段中的 "}" 提前截断结论
+    """
+    if mode != 'on':
+        return mode
+    unsafe = 0
+    checked = {}
+    for item in items:
+        text = item_prompt_text(item)
+        if text not in checked:
+            checked[text] = prompt_output_keys(text) == [key]
+        unsafe += not checked[text]
+    if unsafe:
+        print(f"⚠️ 有 {unsafe} 条数据的输出模板不只包含 {key} 字段，stop 词会截断结论，early_stop 由 on 降级为 measure")
+        return 'measure'
+    return mode
+
+
+def finalize_engine_output(content, completion_tokens, stats):
+    """
+    swift 推理结果的后处理 + 统计 (VllmEngine / TransformersEngine 共用)
+    on 模式补回被截掉的 "}"；measure 模式按字符比例估算结论之后的 token
+    :return: (content, record)，stats 为 None 时原样返回 (content, None)
+    """
+    if stats is None:
+        return content, None
+    if stats.mode == 'on':
+        content = restore_verdict(content)
+    complete = bool(content) and find_verdict_end(content) is not None
+    tail = tail_token_estimate(content, completion_tokens) if stats.mode == 'measure' else 0
+    return content, stats.add(completion_tokens, tail, stopped=(stats.mode == 'on' and complete), complete=complete)
+
+
+def make_hf_stopping_criteria(tokenizer, prompt_len, key=VERDICT_KEY):
+    """
+    transformers.generate 的精确停止条件：每步只增量解码新 token，出现完整结论的序列即停止
+    :param prompt_len: 输入部分的长度 (input_ids.shape[1])，只解码其后的生成部分
+    """
+    import torch
+    from transformers import StoppingCriteria, StoppingCriteriaList
+
+    class JsonVerdictStoppingCriteria(StoppingCriteria):
+        def __init__(self):
+            self.trackers = None
+            self.decoded = None
+
+        def __call__(self, input_ids, scores, **kwargs):
+            if self.trackers is None:
+                self.trackers = [VerdictTracker(key) for _ in range(input_ids.shape[0])]
+                self.decoded = [0] * input_ids.shape[0]
+            for b, tracker in enumerate(self.trackers):
+                if tracker.done:
+                    continue
+                gen = input_ids[b, prompt_len:]
+                # 整段重新解码再取增量，避免多字节字符被 token 边界切开
+                text = tokenizer.decode(gen, skip_special_tokens=True)
+                tracker.feed(text[self.decoded[b]:])
+                self.decoded[b] = len(text)
+            # 返回逐序列的布尔张量，已完成的序列先停，其余继续生成
+            return torch.tensor([t.done for t in self.trackers], dtype=torch.bool, device=input_ids.device)
+
+    return StoppingCriteriaList([JsonVerdictStoppingCriteria()])
+
+
+class EarlyStopStats:
+    """逐条记录生成 token 数与结论之后的 token 数 (measure 为实测多余量，on 为被截掉的量无法得知，只统计提前停止次数)"""
+
+    def __init__(self, mode):
+        self.mode = mode
+        self.records = []
+
+    def add(self, generated_tokens, tail_tokens=0, stopped=False, complete=True):
+        rec = {"generated_tokens": int(generated_tokens or 0), "tail_tokens": int(tail_tokens or 0),
+               "stopped": bool(stopped), "complete": bool(complete)}
+        self.records.append(rec)
+        return rec
+
+    def summary(self):
+        n = len(self.records)
+        generated = sum(r["generated_tokens"] for r in self.records)
+        tail = sum(r["tail_tokens"] for r in self.records)
+        return {
+            "mode": self.mode,
+            "requests": n,
+            "generated_tokens": generated,
+            "tail_tokens": tail,
+            "stopped": sum(r["stopped"] for r in self.records),
+            "no_verdict": sum(not r["complete"] for r in self.records),
+            "tail_tokens_per_request": tail / n if n else 0.0,
+            "generated_tokens_per_request": generated / n if n else 0.0,
+        }
+
+    def print_report(self, title="JSON 结论提前停止"):
+        s = self.summary()
+        if not s["requests"]:
+            return s
+        print("\n" + "=" * 50)
+        print(f"✂️ {title} 报告 (模式: {s['mode']})")
+        print("=" * 50)
+        print(f"📥 请求数               : {s['requests']}")
+        print(f"🧾 生成 token 总数      : {s['generated_tokens']} (平均 {s['generated_tokens_per_request']:.1f} / 条)")
+        print(f"❓ 未出现完整结论       : {s['no_verdict']} 条")
+        if s["mode"] == 'measure':
+            total = max(s["generated_tokens"], 1)
+            print(f"✂️ 结论之后多余的 token : {s['tail_tokens']} (平均 {s['tail_tokens_per_request']:.1f} / 条, "
+                  f"占 {s['tail_tokens'] / total * 100:.2f}%)")
+            print("   -> 开启 on 模式后预计每条节省上述 token")
+        else:
+            print(f"✂️ 结论完成后提前停止   : {s['stopped']} 条")
+            if s["tail_tokens"]:
+                print(f"✂️ 已丢弃的结论后文本   : {s['tail_tokens']} token (停止信号到达前已生成的部分)")
+        print("=" * 50)
+        return s
@@ -0,0 +1,365 @@
+"""
+JSONL 的字节偏移索引 + 小型列存 (供 tools/visualization 下的 Streamlit 浏览器使用)
+原来几个浏览器都是把整个 JSONL json.loads 进内存、再逐行预计算 prior / pred，几个 GB 的推理结果要加载好几分钟。
+这里只扫描一遍文件，缓存到 JSONL 同目录的 {stem}.{profile}.jsonl_index.npz：
+    starts / ends : (n,) 第 i 条非空记录位于字节区间 [starts[i], ends[i])，翻页时直接 seek 读取这一行
+    列存    : 用于筛选的少量字段，字符串列按类别编码 (codes + vocab)
+              vlm     : prior (meta_info.prior_label) / pred (parse_vlm_prediction) / match / conf (meta_info.confidence)
+              message : prior (user 中的 Prior Hint) / pred (assistant 或 pred 字段，没有时为 no_output) / match
+              plain   : 只建偏移索引
+缓存失效依据为 (文件大小, mtime, 开头 / 结尾各 1MB 的 sha256)，不对整个文件求哈希，打开缓存只需读取 npz；
+推理脚本以追加方式续写结果时，只要原有部分未改动 (开头与原结尾处的指纹一致)，只为新增的尾部建立索引。
+"""
+import hashlib
+import json
+import os
+import re
+from pathlib import Path
+
+import numpy as np
+
+from defect_vlm.utils.vlm_response_parser import DEFAULT_LABEL, parse_vlm_prediction, read_record_field, split_byte_ranges
+
+JSONL_INDEX_VERSION = 2      # 2: message 列改为与 browse_vlm_message 原逻辑一致 (合法 JSON 缺 defect 为 background)
+INDEX_PROFILES = ('plain', 'vlm', 'message')
+FINGERPRINT_BYTES = 1 << 20
+NO_OUTPUT = "no_output"
+UNKNOWN = "unknown"
+_MEMO = {}
+
+_CONF_RE = re.compile(r'"confidence"\s*:\s*(-?\d+(?:\.\d+)?(?:[eE][-+]?\d+)?)')
+_PRIOR_HINT_RE = re.compile(r'Prior Hint:\s*([^\n]+)')
+
+PROFILE_COLUMNS = {
+    'plain': (),
+    'vlm': ('prior', 'pred', 'match', 'conf'),
+    'message': ('prior', 'pred', 'match'),
+}
+
+
+# ================= 逐行提取列 =================
+
+def _vlm_row(line):
+    """VLM 推理结果：原始行直接取字段，只有找不到时才反序列化整行"""
+    pred = read_record_field(line, 'pred', fallback=False)
+    prior = read_record_field(line, 'prior_label', fallback=False)
+    m = _CONF_RE.search(line)
+    conf = float(m.group(1)) if m else None
+    if pred is None or prior is None:
+        item = json.loads(line)
+        meta = item.get("meta_info", {})
+        pred = item.get("pred") if pred is None else pred
+        prior = meta.get("prior_label", UNKNOWN) if prior is None else prior
+        if conf is None and isinstance(meta.get("confidence"), (int, float)):
+            conf = float(meta["confidence"])
+    parsed = parse_vlm_prediction(pred if isinstance(pred, str) else "")
+    return prior, parsed, parsed == prior, conf
+
+
+def _message_row(line):
+    """ms-swift message 格式：先验来自 user 中的 Prior Hint，结论优先取 pred 字段，其次 assistant"""
+    item = json.loads(line)
+    user_content, ast_content = "", ""
+    for msg in item.get("messages", []):
+        if msg.get("role") == "user":
+            user_content = msg.get("content", "")
+        elif msg.get("role") == "assistant":
+            ast_content = msg.get("content", "")
+    if item.get("pred"):
+        ast_content = item["pred"]
+    prior_match = _PRIOR_HINT_RE.search(user_content) if isinstance(user_content, str) else None
+    prior = prior_match.group(1).strip().lower() if prior_match else UNKNOWN
+    if ast_content:
+        # 与原 parse_assistant_content 一致：合法 JSON 但没有 defect 键为 background，正则兜底也失败才是 unknown
+        defect = parse_vlm_prediction(ast_content, default=UNKNOWN, missing=DEFAULT_LABEL)
+    else:
+        defect = NO_OUTPUT
+    return prior, defect, defect == prior, None
+
+
+_ROW_FN = {'vlm': _vlm_row, 'message': _message_row}
+
+
+def _index_range(task):
+    """扫描 [start, end) 内的所有非空行，返回绝对偏移与列值"""
+    path, start, end, profile = task
+    row_fn = _ROW_FN.get(profile)
+    starts, ends, rows = [], [], []
+    with open(path, 'rb') as f:
+        f.seek(start)
+        data = f.read(end - start)
+    pos = 0
+    n = len(data)
+    while pos < n:
+        nl = data.find(b'\n', pos)
+        stop = n if nl < 0 else nl
+        raw = data[pos:stop]
+        if raw.strip():
+            starts.append(start + pos)
+            ends.append(start + stop)
+            if row_fn is not None:
+                try:
+                    rows.append(row_fn(raw.decode('utf-8')))
+                except (ValueError, UnicodeDecodeError):
+                    rows.append((UNKNOWN, UNKNOWN, False, None))
+        pos = stop + 1
+    return starts, ends, rows
+
+
+# ================= 指纹 =================
+
+def _hash_range(path, start, end):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        f.seek(start)
+        h.update(f.read(max(end - start, 0)))
+    return h.hexdigest()
+
+
+def file_fingerprint(path, size=None):
+    """(大小, 开头 1MB 哈希, 结尾 1MB 哈希)，size 指定时只看文件的前 size 字节 (用于判断是否为追加写入)"""
+    size = os.path.getsize(path) if size is None else size
+    head = _hash_range(path, 0, min(size, FINGERPRINT_BYTES))
+    tail = _hash_range(path, max(size - FINGERPRINT_BYTES, 0), size)
+    return {"size": size, "head": head, "tail": tail}
+
+
+# ================= 索引 =================
+
+class JsonlIndex:
+    """字节偏移 + 列存，read(i) / page() 按需 seek 读取记录"""
+
+    def __init__(self, path, profile, starts, ends, columns=None, vocabs=None, fingerprint=None, mtime_ns=0):
+        self.path = str(path)
+        self.profile = profile
+        self.starts = np.asarray(starts, dtype=np.int64)
+        self.ends = np.asarray(ends, dtype=np.int64)
+        self.columns = columns or {}        # name -> np.ndarray (字符串列为 int32 编码)
+        self.vocabs = vocabs or {}          # name -> list[str]
+        self.fingerprint = fingerprint or {}
+        self.mtime_ns = mtime_ns
+
+    # ================= 构建 / 读写 =================
+    @classmethod
+    def build(cls_, path, profile='vlm', num_workers=0, start=0, base=None):
+        """
+        扫描文件建立索引；start > 0 时只扫描 [start, EOF) 并接在 base 之后 (追加写入的增量索引)
+        :param num_workers: > 1 时按字节区间切块并行扫描
+        """
+        if profile not in INDEX_PROFILES:
+            raise ValueError(f"profile 必须是 {INDEX_PROFILES} 之一，当前为 {profile}")
+        path = str(path)
+        size = os.path.getsize(path)
+        ranges = [(s + start, e + start) for s, e in _split_tail(path, start, size, max(num_workers, 1) * 4)]
+        tasks = [(path, s, e, profile) for s, e in ranges]
+        if num_workers > 1 and len(tasks) > 1:
+            from multiprocessing import Pool
+            with Pool(num_workers) as pool:
+                parts = pool.map(_index_range, tasks)
+        else:
+            parts = [_index_range(t) for t in tasks]
+
+        starts = [x for p in parts for x in p[0]]
+        ends = [x for p in parts for x in p[1]]
+        rows = [x for p in parts for x in p[2]]
+        columns, vocabs = _encode_columns(profile, rows, base)
+        if base is not None:
+            starts = np.concatenate([base.starts, np.asarray(starts, dtype=np.int64)])
+            ends = np.concatenate([base.ends, np.asarray(ends, dtype=np.int64)])
+        return cls_(path, profile, starts, ends, columns, vocabs, file_fingerprint(path, size),
+                    os.stat(path).st_mtime_ns)
+
+    def save(self, cache_path):
+        meta = {
+            "version": JSONL_INDEX_VERSION,
+            "profile": self.profile,
+            "fingerprint": self.fingerprint,
+            "mtime_ns": self.mtime_ns,
+            "vocabs": self.vocabs,
+        }
+        arrays = {f"col_{k}": v for k, v in self.columns.items()}
+        cache_path = Path(cache_path)
+        tmp_path = cache_path.with_name(cache_path.name + ".tmp")
+        with open(tmp_path, 'wb') as f:
+            np.savez(f, starts=self.starts, ends=self.ends, meta=np.array(json.dumps(meta, ensure_ascii=False)),
+                     **arrays)
+        os.replace(tmp_path, cache_path)
+
+    @classmethod
+    def load(cls_, path, cache_path):
+        with np.load(cache_path, allow_pickle=False) as data:
+            meta = json.loads(str(data['meta']))
+            if meta.get("version") != JSONL_INDEX_VERSION:
+                raise ValueError(f"不支持的 JSONL 索引版本: {meta.get('version')}")
+            columns = {k[4:]: data[k] for k in data.files if k.startswith("col_")}
+            return cls_(path, meta['profile'], data['starts'], data['ends'], columns, meta['vocabs'],
+                        meta['fingerprint'], meta['mtime_ns'])
+
+    # ================= 查询 =================
+    def __repr__(self):
+        return f"JsonlIndex({len(self)} rows, profile={self.profile}, {self.path})"
+
+    def __len__(self):
+        return len(self.starts)
+
+    def read_raw(self, i):
+        with open(self.path, 'rb') as f:
+            f.seek(int(self.starts[i]))
+            return f.read(int(self.ends[i] - self.starts[i])).decode('utf-8')
+
+    def read(self, i):
+        return json.loads(self.read_raw(i))
+
+    def page(self, rows=None, page=0, page_size=20):
+        """
+        返回第 page 页的记录 (rows 为筛选后的行号，None 表示全部)
+        同一页内按文件偏移排序后顺序 seek，只打开一次文件
+        """
+        rows = np.arange(len(self)) if rows is None else np.asarray(rows)
+        sel = rows[page * page_size:(page + 1) * page_size]
+        out = [None] * len(sel)
+        with open(self.path, 'rb') as f:
+            for k in np.argsort(self.starts[sel], kind='stable'):
+                i = sel[k]
+                f.seek(int(self.starts[i]))
+                out[k] = json.loads(f.read(int(self.ends[i] - self.starts[i])).decode('utf-8'))
+        return out
+
+    def value(self, name, i):
+        """第 i 行某一列的值 (字符串列自动解码，conf 缺失为 None)"""
+        v = self.columns[name][i]
+        if name in self.vocabs:
+            return self.vocabs[name][int(v)]
+        if v.dtype == np.bool_:
+            return bool(v)
+        return None if np.isnan(v) else float(v)
+
+    def filter(self, match=None, prior=None, pred=None, min_conf=None, max_conf=None, exclude_pred=None):
+        """按列存筛选，返回满足条件的行号数组 (不读取任何记录)"""
+        mask = np.ones(len(self), dtype=bool)
+        if match is not None:
+            mask &= self.columns['match'] == bool(match)
+        for name, value, keep in (('prior', prior, True), ('pred', pred, True), ('pred', exclude_pred, False)):
+            if value is None:
+                continue
+            vocab = self.vocabs[name]
+            code = vocab.index(value) if value in vocab else -1
+            mask &= (self.columns[name] == code) if keep else (self.columns[name] != code)
+        if min_conf is not None:
+            mask &= self.columns['conf'] >= min_conf
+        if max_conf is not None:
+            mask &= self.columns['conf'] <= max_conf
+        return np.flatnonzero(mask)
+
+    def counts(self, name):
+        """字符串列的取值分布"""
+        codes = self.columns[name]
+        hist = np.bincount(codes, minlength=len(self.vocabs[name]))
+        return {v: int(c) for v, c in zip(self.vocabs[name], hist)}
+
+
+def _split_tail(path, start, size, num_chunks):
+    """[start, size) 的切块，相对 start 的偏移 (复用 split_byte_ranges 的换行对齐规则)"""
+    if start == 0:
+        return split_byte_ranges(path, num_chunks)
+    if start >= size:
+        return []
+    # 追加部分一般不大，直接作为一块处理
+    return [(0, size - start)]
+
+
+def _encode_columns(profile, rows, base=None):
+    names = PROFILE_COLUMNS[profile]
+    if not names:
+        return {}, {}
+    columns, vocabs = {}, {}
+    for k, name in enumerate(names):
+        values = [r[k] for r in rows]
+        old = base.columns.get(name) if base is not None else None
+        if name == 'match':
+            arr = np.asarray(values, dtype=np.bool_)
+        elif name == 'conf':
+            arr = np.asarray([np.nan if v is None else v for v in values], dtype=np.float32)
+        else:
+            vocab = list(base.vocabs[name]) if base is not None else []
+            lookup = {v: i for i, v in enumerate(vocab)}
+            codes = np.empty(len(values), dtype=np.int32)
+            for j, v in enumerate(values):
+                code = lookup.get(v)
+                if code is None:
+                    code = lookup[v] = len(vocab)
+                    vocab.append(v)
+                codes[j] = code
+            arr, vocabs[name] = codes, vocab
+        columns[name] = arr if old is None else np.concatenate([old, arr])
+    return columns, vocabs
+
+
+def default_cache_path(jsonl_path, profile):
+    jsonl_path = Path(jsonl_path)
+    return jsonl_path.with_name(f"{jsonl_path.stem}.{profile}.jsonl_index.npz")
+
+
+def load_jsonl_index(jsonl_path, profile='vlm', cache_path=None, num_workers=0, verbose=True):
+    """
+    打开 JSONL 索引：同一进程内直接复用；磁盘缓存与文件指纹一致时直接读缓存；
+    文件是在原内容之后追加写入的，只为新增部分建索引；否则全量重建
+    :param cache_path: 默认与 JSONL 同目录的 {stem}.{profile}.jsonl_index.npz；目录不可写时只保留在内存中
+    """
+    jsonl_path = Path(jsonl_path)
+    st = jsonl_path.stat()
+    memo_key = (str(jsonl_path.resolve()), profile, st.st_size, st.st_mtime_ns)
+    if memo_key in _MEMO:
+        return _MEMO[memo_key]
+
+    cache_path = Path(cache_path) if cache_path else default_cache_path(jsonl_path, profile)
+    index, cached = None, None
+    if cache_path.exists():
+        try:
+            cached = JsonlIndex.load(jsonl_path, cache_path)
+        except (ValueError, KeyError, OSError) as e:
+            print(f"⚠️ JSONL 索引缓存损坏，将重建: {e}")
+
+    if cached is not None and cached.profile == profile:
+        old_size = cached.fingerprint.get("size", -1)
+        if old_size == st.st_size and cached.mtime_ns == st.st_mtime_ns:
+            index = cached
+            if verbose:
+                print(f"⚡ 命中 JSONL 索引缓存: {cache_path} ({len(index)} 条)")
+        elif 0 <= old_size <= st.st_size and _ends_with_newline(jsonl_path, old_size) \
+                and file_fingerprint(jsonl_path, old_size) == cached.fingerprint:
+            if old_size == st.st_size:
+                index = cached      # 只是 mtime 变了，内容没变
+                index.mtime_ns = st.st_mtime_ns
+            else:
+                if verbose:
+                    print(f"➕ 检测到追加写入，只为新增的 {(st.st_size - old_size) / 1024 / 1024:.1f} MB 建立索引")
+                index = JsonlIndex.build(jsonl_path, profile, num_workers, start=old_size, base=cached)
+            _try_save(index, cache_path, verbose)
+
+    if index is None:
+        if verbose:
+            print(f"📖 正在建立 JSONL 索引 ({st.st_size / 1024 / 1024:.1f} MB): {jsonl_path}")
+        index = JsonlIndex.build(jsonl_path, profile, num_workers)
+        _try_save(index, cache_path, verbose)
+
+    _MEMO[memo_key] = index
+    return index
+
+
+def _ends_with_newline(path, size):
+    """原内容以换行结尾时，追加的内容才是新的行 (否则最后一行可能被续写)"""
+    if size == 0:
+        return True
+    with open(path, 'rb') as f:
+        f.seek(size - 1)
+        return f.read(1) == b'\n'
+
+
+def _try_save(index, cache_path, verbose):
+    try:
+        index.save(cache_path)
+        if verbose:
+            print(f"💾 JSONL 索引已缓存至: {cache_path}")
+    except OSError as e:
+        print(f"⚠️ JSONL 索引缓存写入失败 (仅在内存中使用): {e}")
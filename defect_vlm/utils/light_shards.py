@@ -0,0 +1,257 @@
+"""
+多光源图像打包工具 (Packed multi-light shards)
+裁剪、拼图、负样本采样、YOLO 推理等环节，每张图都要按路径分别打开 4~6 张 PNG
+(16col/16row/32col/32row 或 val..val_5)。300x300 灰度图的解码本身很快，
+真正的瓶颈是海量小文件的 open/stat 开销。
+
+这里把同一张图的所有光源/相位通道拼成一个 uint8 的 (H, W, C) 数组，顺序写入若干个分块文件 (shard)，
+并生成一份索引。读取时用 np.memmap 映射分块文件，任意通道子集都只需要一次定位 (一段连续内存)。
+
+输出目录结构:
+    output_dir/
+        index.json          # {"version", "channels", "streams", "shards", "images": {file_name: [shard, offset, H, W]}}
+        shard_00000.bin
+        shard_00001.bin
+        ...
+通道命名: 单通道的流直接用流名 (如 "val_1")，多通道的流用 "流名:通道号" (如 "16col:0" 对应 BGR 中的 B)。
+"""
+import json
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import cv2
+import numpy as np
+from tqdm import tqdm
+
+SHARD_VERSION = 1
+INDEX_NAME = "index.json"
+
+
+def _read_streams(stream_dirs, file_name):
+    """读取某张图的所有流，返回 [(流名, (H, W, c) 数组)]，任一流缺失时返回 None"""
+    arrays = []
+    for stream, stream_dir in stream_dirs.items():
+        img = cv2.imread(str(Path(stream_dir) / file_name), cv2.IMREAD_UNCHANGED)
+        if img is None or img.dtype != np.uint8:
+            return None
+        if img.ndim == 2:
+            img = img[:, :, None]
+        arrays.append((stream, img))
+    return arrays
+
+
+def _iter_read_streams(stream_dirs, file_names, num_workers, prefetch):
+    """
+    按 file_names 顺序产出 (file_name, arrays)
+    线程池最多同时预读 prefetch 张 (滑动窗口，写出一张再提交一张)，内存占用与数据集大小无关
+    """
+    with ThreadPoolExecutor(max_workers=num_workers) as pool:
+        pending = deque()
+        names = iter(file_names)
+        for name in names:
+            pending.append((name, pool.submit(_read_streams, stream_dirs, name)))
+            if len(pending) >= prefetch:
+                break
+        while pending:
+            name, future = pending.popleft()
+            next_name = next(names, None)
+            if next_name is not None:
+                pending.append((next_name, pool.submit(_read_streams, stream_dirs, next_name)))
+            yield name, future.result()
+
+
+def _channel_names(arrays):
+    names = []
+    for stream, img in arrays:
+        c = img.shape[2]
+        names.extend([stream] if c == 1 else [f"{stream}:{k}" for k in range(c)])
+    return names
+
+
+def pack_light_shards(stream_dirs, output_dir, file_names=None, shard_size_mb=1024, num_workers=8, prefetch=None):
+    """
+    将多光源图像打包为分块文件
+    :param stream_dirs: {流名: 图像目录}，例如 {"16col": ".../images/16col", ...}，顺序即通道顺序
+    :param output_dir: 输出目录
+    :param file_names: 需要打包的文件名，默认取第一个流目录下的全部 png (排序)
+    :param shard_size_mb: 单个分块文件的大小上限 (一张图不会跨分块)
+    :param num_workers: 读取 PNG 的线程数
+    :param prefetch: 最多预读的图像数，默认 2 * num_workers
+    """
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    if file_names is None:
+        first_dir = Path(next(iter(stream_dirs.values())))
+        file_names = sorted(p.name for p in first_dir.glob('*.png'))
+
+    shard_limit = int(shard_size_mb * 1024 * 1024)
+    channels = None
+    shards = []
+    images = {}
+    skipped = []
+    shard_f = None
+    shard_bytes = 0
+    start = time.perf_counter()
+
+    def open_new_shard():
+        name = f"shard_{len(shards):05d}.bin"
+        shards.append(name)
+        return open(output_dir / name, 'wb')
+
+    try:
+        results = _iter_read_streams(stream_dirs, file_names, num_workers, prefetch or 2 * num_workers)
+        for file_name, arrays in tqdm(results, total=len(file_names), desc="Packing"):
+            if arrays is None:
+                skipped.append(file_name)
+                continue
+            names = _channel_names(arrays)
+            if channels is None:
+                channels = names
+            elif names != channels:
+                skipped.append(file_name)
+                continue
+
+            stacked = np.ascontiguousarray(np.concatenate([a for _, a in arrays], axis=2))
+            h, w = stacked.shape[:2]
+            if shard_f is None or (shard_bytes > 0 and shard_bytes + stacked.nbytes > shard_limit):
+                if shard_f is not None:
+                    shard_f.close()
+                shard_f = open_new_shard()
+                shard_bytes = 0
+
+            images[file_name] = [len(shards) - 1, shard_bytes, h, w]
+            shard_f.write(stacked.tobytes())
+            shard_bytes += stacked.nbytes
+    finally:
+        if shard_f is not None:
+            shard_f.close()
+
+    index = {
+        "version": SHARD_VERSION,
+        "channels": channels or [],
+        "streams": list(stream_dirs.keys()),
+        "shards": shards,
+        "images": images,
+    }
+    with open(output_dir / INDEX_NAME, 'w', encoding='utf-8') as f:
+        json.dump(index, f, ensure_ascii=False)
+
+    elapsed = time.perf_counter() - start
+    print("=" * 50)
+    print(f"📦 打包完成: {len(images)} 张图像, {len(index['channels'])} 个通道, {len(shards)} 个分块, 耗时 {elapsed:.1f}s")
+    if skipped:
+        print(f"⚠️ 有 {len(skipped)} 张图像因缺失光源或通道不一致被跳过，例如: {skipped[:3]}")
+    print(f"💾 索引已保存: {output_dir / INDEX_NAME}")
+    print("=" * 50)
+    return index
+
+
+class LightShardReader:
+    """
+    分块文件的随机读取器
+    reader.read(file_name)                        -> (H, W, C) 全部通道
+    reader.read(file_name, ["16col:0", "32row:2"]) -> 任意通道子集
+    reader.read_stream(file_name, "16col")        -> 与 cv2.imread 原图一致的单个流 (BGR 或灰度)
+    """
+
+    def __init__(self, shard_dir):
+        self.shard_dir = Path(shard_dir)
+        with open(self.shard_dir / INDEX_NAME, 'r', encoding='utf-8') as f:
+            index = json.load(f)
+        if index.get("version") != SHARD_VERSION:
+            raise ValueError(f"❌ 不支持的分块索引版本: {index.get('version')}")
+        self.channels = index["channels"]
+        self.streams = index["streams"]
+        self.shards = index["shards"]
+        self.images = index["images"]
+        self.channel_to_idx = {name: i for i, name in enumerate(self.channels)}
+        self._maps = [None] * len(self.shards)
+
+    def __len__(self):
+        return len(self.images)
+
+    def __contains__(self, file_name):
+        return file_name in self.images
+
+    @property
+    def file_names(self):
+        return list(self.images.keys())
+
+    def _shard(self, i):
+        if self._maps[i] is None:
+            self._maps[i] = np.memmap(self.shard_dir / self.shards[i], dtype=np.uint8, mode='r')
+        return self._maps[i]
+
+    def view(self, file_name):
+        """返回 (H, W, C) 的只读内存映射视图 (零拷贝)"""
+        shard_idx, offset, h, w = self.images[file_name]
+        c = len(self.channels)
+        return self._shard(shard_idx)[offset: offset + h * w * c].reshape(h, w, c)
+
+    def channel_indices(self, channels):
+        try:
+            return [self.channel_to_idx[c] for c in channels]
+        except KeyError as e:
+            raise KeyError(f"❌ 通道 {e} 不存在，可选通道: {self.channels}") from None
+
+    def read(self, file_name, channels=None):
+        """读取某张图的全部或部分通道，返回可写的拷贝"""
+        block = self.view(file_name)
+        if channels is None:
+            return np.array(block)
+        return np.ascontiguousarray(block[:, :, self.channel_indices(channels)])
+
+    def read_stream(self, file_name, stream):
+        """读取单个流，恢复为 cv2.imread 的形状 (单通道为 (H, W))"""
+        names = [c for c in self.channels if c == stream or c.startswith(f"{stream}:")]
+        if not names:
+            raise KeyError(f"❌ 流 {stream} 不存在，可选流: {self.streams}")
+        arr = self.read(file_name, names)
+        return arr[:, :, 0] if len(names) == 1 and names[0] == stream else arr
+
+
+def bench_random_access(stream_dirs, reader, num_samples=500, seed=0):
+    """对比 "逐个打开 PNG" 与 "分块映射" 的随机读取吞吐"""
+    rng = np.random.default_rng(seed)
+    names = reader.file_names
+    picks = [names[i] for i in rng.integers(0, len(names), num_samples)]
+
+    start = time.perf_counter()
+    for n in picks:
+        _read_streams(stream_dirs, n)
+    png_ips = num_samples / (time.perf_counter() - start)
+
+    start = time.perf_counter()
+    for n in picks:
+        reader.read(n)
+    shard_ips = num_samples / (time.perf_counter() - start)
+
+    print("=" * 50)
+    print(f"📊 随机读取吞吐 ({num_samples} 次, 每次读取全部 {len(reader.channels)} 个通道)")
+    print(f"  PNG 逐文件读取: {png_ips:.1f} images/sec")
+    print(f"  分块映射读取  : {shard_ips:.1f} images/sec (x{shard_ips / max(png_ips, 1e-9):.1f})")
+    print("=" * 50)
+
+
+if __name__ == "__main__":
+    # ================= 配置区 =================
+    # 例 1: 1_paint_rgb 下的 4 个光源 (每个光源是 3 相位的伪 BGR 图，共 12 个通道)
+    IMAGE_ROOT = Path("/data/ZS/defect_dataset/1_paint_rgb/stripe_phase012/images")
+    STREAM_DIRS = {light: IMAGE_ROOT / light for light in ['16col', '16row', '32col', '32row']}
+    OUTPUT_DIR = "/data/ZS/defect_dataset/1_paint_rgb/stripe_phase012/shards"
+
+    # 例 2: 多流推理目录 val..val_5 (每个流是单通道灰度图，共 6 个通道)
+    # MULTI_ROOT = Path("/data/ZS/flywheel_dataset/0_multi_input/sp012/col3")
+    # STREAM_DIRS = {sub: MULTI_ROOT / sub / "images" for sub in ['val', 'val_1', 'val_2', 'val_3', 'val_4', 'val_5']}
+    # OUTPUT_DIR = "/data/ZS/flywheel_dataset/0_multi_input/sp012/col3_shards"
+
+    SHARD_SIZE_MB = 1024
+    NUM_WORKERS = 16
+    RUN_BENCH = True
+    # ==========================================
+
+    pack_light_shards(STREAM_DIRS, OUTPUT_DIR, shard_size_mb=SHARD_SIZE_MB, num_workers=NUM_WORKERS)
+    if RUN_BENCH:
+        bench_random_access(STREAM_DIRS, LightShardReader(OUTPUT_DIR))
@@ -0,0 +1,383 @@
+"""
+基于索引清单 (manifest) 的虚拟多流数据集
+`convert_coco_to_multistream.py` 会把每张图复制到 6 个 train{suffix}/val{suffix} 文件夹，
+`build_chunks.py` 每轮迭代又要重新建一遍软链接目录。这里改为只维护一份索引：
+    file_name -> {split, 6 个视角的源路径, YOLO 标签}
+- iter_multistream_images: 直接按索引读取 6 个视角并沿通道拼接，不需要任何中间目录；
+- select_chunks / filter_manifest: chunk 选择变成对索引的过滤，不再重建文件系统；
+- materialize_manifest: 对仍然需要文件夹布局的工具 (如官方 val.py)，按需用硬链接/软链接增量同步出目录结构
+                        (默认只增补/更新，不删除目标目录中的其他文件)。
+
+索引格式 (JSON，也可以保存为 Parquet):
+{
+    "version": 1,
+    "root": "/data/ZS/defect_dataset/0_defect_dataset_raw/paint_stripe",   # 相对路径的根目录
+    "streams": ["16row0", "16row1", ...],                                   # 视角名称，顺序即通道顺序
+    "suffixes": ["", "_1", "_2", "_3", "_4", "_5"],                         # 物化时的文件夹后缀
+    "images": {
+        "0000_xxx.png": {"split": "train", "paths": [6 个相对/绝对路径], "label": "labels/yolo/0000_xxx.txt", "labels": [[cls, cx, cy, w, h], ...]}
+    }
+}
+"""
+import os
+import json
+import shutil
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+MANIFEST_VERSION = 1
+STREAM_SUFFIXES = ["", "_1", "_2", "_3", "_4", "_5"]
+
+
+def read_yolo_labels(label_path):
+    """读取 YOLO txt 标签，返回 [[cls, cx, cy, w, h], ...]，文件不存在时返回 None"""
+    label_path = Path(label_path)
+    if not label_path.exists():
+        return None
+    labels = []
+    with open(label_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) >= 5:
+                labels.append([int(parts[0])] + [float(v) for v in parts[1:5]])
+    return labels
+
+
+def _rel(path, root):
+    try:
+        return str(Path(path).relative_to(root))
+    except ValueError:
+        return str(path)
+
+
+def build_manifest_from_coco(source_root, stream_mapping, split_jsons, label_dir=None):
+    """
+    由原始数据集 (images/{视角}/xxx.png + coco json + yolo txt) 构建索引
+    :param source_root: 原始数据集根目录，例如 0_defect_dataset_raw/paint_stripe
+    :param stream_mapping: {视角文件夹: 后缀}，例如 {"16row0": "", "16row1": "_1", ...}，顺序即通道顺序
+    :param split_jsons: {"train": train.json 路径, "val": val.json 路径}
+    :param label_dir: YOLO 标签目录，默认 source_root/labels/yolo
+    """
+    source_root = Path(source_root)
+    label_dir = Path(label_dir) if label_dir else source_root / "labels" / "yolo"
+    streams = list(stream_mapping.keys())
+
+    images = {}
+    missing_images = 0
+    missing_labels = 0
+    for split_name, json_path in split_jsons.items():
+        with open(json_path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        for item in data['images']:
+            filename = item['file_name']
+            paths = [source_root / "images" / s / filename for s in streams]
+            missing_images += sum(not p.exists() for p in paths)
+
+            label_path = label_dir / (os.path.splitext(filename)[0] + ".txt")
+            labels = read_yolo_labels(label_path)
+            if labels is None:
+                missing_labels += 1
+
+            images[filename] = {
+                "split": split_name,
+                "image_id": item.get('id'),
+                "paths": [_rel(p, source_root) for p in paths],
+                "label": _rel(label_path, source_root) if labels is not None else None,
+                "labels": labels,
+            }
+
+    if missing_images or missing_labels:
+        print(f"⚠️ 注意：索引中有 {missing_images} 个视角图片未找到，{missing_labels} 个标签未找到。")
+
+    return {
+        "version": MANIFEST_VERSION,
+        "root": str(source_root),
+        "streams": streams,
+        "suffixes": list(stream_mapping.values()),
+        "images": images,
+    }
+
+
+def build_manifest_from_layout(layout_root, splits=("val",), suffixes=STREAM_SUFFIXES):
+    """
+    由已有的多流文件夹布局 ({split}{suffix}/images/xxx.png) 构建索引，例如 0_multi_input/sp012/col3
+    以 {split}/images 下的文件为准，标签取 {split}/labels 下的同名 txt (没有则为空)
+    """
+    layout_root = Path(layout_root)
+    images = {}
+    for split_name in splits:
+        base_dir = layout_root / split_name / "images"
+        for img_path in sorted(base_dir.glob('*.png')):
+            filename = img_path.name
+            label_path = layout_root / split_name / "labels" / (img_path.stem + ".txt")
+            labels = read_yolo_labels(label_path)
+            images[filename] = {
+                "split": split_name,
+                "image_id": None,
+                "paths": [f"{split_name}{suffix}/images/{filename}" for suffix in suffixes],
+                "label": _rel(label_path, layout_root) if labels is not None else None,
+                "labels": labels,
+            }
+
+    return {
+        "version": MANIFEST_VERSION,
+        "root": str(layout_root),
+        "streams": [f"stream{i}" for i in range(len(suffixes))],
+        "suffixes": list(suffixes),
+        "images": images,
+    }
+
+
+def save_manifest(manifest, manifest_path):
+    """保存索引，后缀为 .parquet 时保存为 Parquet (需要 pandas + pyarrow)，否则保存为 JSON"""
+    manifest_path = Path(manifest_path)
+    manifest_path.parent.mkdir(parents=True, exist_ok=True)
+
+    if manifest_path.suffix == '.parquet':
+        import pandas as pd
+        rows = []
+        for filename, entry in manifest["images"].items():
+            row = {"file_name": filename, "split": entry["split"], "image_id": entry.get("image_id"),
+                   "label": entry.get("label"), "labels": json.dumps(entry.get("labels"))}
+            for i, p in enumerate(entry["paths"]):
+                row[f"path_{i}"] = p
+            rows.append(row)
+        df = pd.DataFrame(rows)
+        df.to_parquet(manifest_path, index=False)
+        # 根目录、视角等元信息保存在同名的 .meta.json 中
+        meta = {k: v for k, v in manifest.items() if k != "images"}
+        with open(manifest_path.with_suffix('.meta.json'), 'w', encoding='utf-8') as f:
+            json.dump(meta, f, indent=2, ensure_ascii=False)
+    else:
+        with open(manifest_path, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False)
+
+    print(f"💾 多流索引已保存: {manifest_path} (共 {len(manifest['images'])} 张图像)")
+
+
+def load_manifest(manifest_path):
+    """加载 save_manifest 保存的索引 (JSON 或 Parquet)"""
+    manifest_path = Path(manifest_path)
+    if manifest_path.suffix == '.parquet':
+        import pandas as pd
+        with open(manifest_path.with_suffix('.meta.json'), 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+        df = pd.read_parquet(manifest_path)
+        path_cols = sorted([c for c in df.columns if c.startswith('path_')], key=lambda c: int(c.split('_')[1]))
+        images = {}
+        for row in df.to_dict('records'):
+            image_id = row.get("image_id")
+            images[row["file_name"]] = {
+                "split": row["split"],
+                "image_id": None if image_id is None or image_id != image_id else int(image_id),
+                "paths": [row[c] for c in path_cols],
+                "label": row.get("label"),
+                "labels": json.loads(row["labels"]),
+            }
+        manifest["images"] = images
+        return manifest
+
+    with open(manifest_path, 'r', encoding='utf-8') as f:
+        manifest = json.load(f)
+    if manifest.get("version") != MANIFEST_VERSION:
+        raise ValueError(f"❌ 不支持的索引版本: {manifest.get('version')}")
+    return manifest
+
+
+def filter_manifest(manifest, split=None, file_names=None):
+    """按 split 和/或文件名列表过滤索引，返回新的索引 (条目按 file_names 的顺序排列)"""
+    images = manifest["images"]
+    if file_names is not None:
+        missing = [n for n in file_names if n not in images]
+        if missing:
+            print(f"⚠️ 有 {len(missing)} 个文件名不在索引中，已忽略，例如: {missing[:3]}")
+        selected = {n: images[n] for n in file_names if n in images}
+    else:
+        selected = dict(images)
+    if split is not None:
+        selected = {n: e for n, e in selected.items() if e["split"] == split}
+    return {**manifest, "images": selected}
+
+
+def select_chunks(manifest, chunk_json, target_chunks):
+    """把 chunk_splits.json 中若干 chunk 的名单合并，作为对索引的过滤 (代替 build_chunks 的重建目录)"""
+    with open(chunk_json, 'r', encoding='utf-8') as f:
+        chunks_data = json.load(f)
+
+    target_filenames = []
+    for chunk_name in target_chunks:
+        if chunk_name not in chunks_data:
+            raise ValueError(f"❌ 找不到指定的 {chunk_name}，请检查 JSON 文件！")
+        target_filenames.extend(chunks_data[chunk_name])
+
+    print(f"🎯 目标 Chunks: {target_chunks} | 总计图像数量: {len(target_filenames)}")
+    return filter_manifest(manifest, file_names=target_filenames)
+
+
+def resolve_stream_paths(manifest, file_name):
+    """返回某张图 6 个视角的绝对路径"""
+    root = Path(manifest["root"])
+    return [root / p for p in manifest["images"][file_name]["paths"]]
+
+
+def load_multistream_image(manifest, file_name, flags=cv2.IMREAD_GRAYSCALE):
+    """
+    读取某张图的全部视角并沿通道拼接为 (H, W, N)
+    与 inference.py 的逻辑保持一致：缺失的视角跳过，全部缺失时返回 None
+    """
+    ims_list = []
+    for img_path in resolve_stream_paths(manifest, file_name):
+        img = cv2.imread(str(img_path), flags)
+        if img is not None:
+            ims_list.append(img)
+    if not ims_list:
+        return None
+    return np.dstack(ims_list)
+
+
+def iter_multistream_images(manifest, file_names=None, num_workers=8, prefetch=32):
+    """
+    惰性地产出 (file_name, 多流数组, labels)
+    线程池预读最多 prefetch 张，按 file_names (默认索引顺序) 依次产出，读取失败的图像数组为 None
+    """
+    if file_names is None:
+        file_names = list(manifest["images"].keys())
+
+    with ThreadPoolExecutor(max_workers=num_workers) as pool:
+        pending = deque()
+        names = iter(file_names)
+        for name in names:
+            pending.append((name, pool.submit(load_multistream_image, manifest, name)))
+            if len(pending) >= prefetch:
+                break
+        while pending:
+            name, future = pending.popleft()
+            next_name = next(names, None)
+            if next_name is not None:
+                pending.append((next_name, pool.submit(load_multistream_image, manifest, next_name)))
+            yield name, future.result(), manifest["images"][name].get("labels")
+
+
+def _link_file(src, dst, mode):
+    if mode == 'symlink':
+        os.symlink(str(src), str(dst))
+    elif mode == 'hardlink':
+        try:
+            os.link(str(src), str(dst))
+        except OSError:
+            # 跨文件系统无法硬链接，退回到复制
+            shutil.copy2(src, dst)
+    else:
+        shutil.copy2(src, dst)
+
+
+def _is_synced(src, dst, mode):
+    """目标文件是否仍然对应当前的源文件 (软链接比较指向，硬链接比较 inode，复制比较大小与修改时间)"""
+    if not os.path.lexists(dst):
+        return False
+    try:
+        if os.path.islink(dst):
+            return mode == 'symlink' and os.readlink(dst) == str(src)
+        if os.path.samefile(src, dst):
+            return True
+        if mode == 'symlink':
+            return False
+        # 硬链接跨文件系统时退回到复制，copy2 会保留修改时间
+        s, d = os.stat(src), os.stat(dst)
+        return s.st_size == d.st_size and int(s.st_mtime) == int(d.st_mtime)
+    except OSError:
+        return False
+
+
+def _label_text(labels):
+    return ''.join(f"{int(l[0])} {l[1]:.6f} {l[2]:.6f} {l[3]:.6f} {l[4]:.6f}\n" for l in labels)
+
+
+def materialize_manifest(manifest, target_dir, mode='symlink', with_labels=True, prune=False):
+    """
+    把索引物化为 {split}{suffix}/images|labels 的文件夹布局 (增量同步)
+    已存在且仍指向同一源文件的目标保留，源文件或标签内容变化的会重新链接/重写
+    :param mode: 'symlink' | 'hardlink' | 'copy'
+    :param prune: 是否删除索引中没有的旧文件 (只用于物化专用目录，例如 build_chunks 的迭代目录)；
+                  默认不删除，避免误清空 GT 数据集等已有目录。with_labels=False 时 labels 目录不会被触碰
+    """
+    target_dir = Path(target_dir)
+    root = Path(manifest["root"])
+    suffixes = manifest["suffixes"]
+
+    by_split = {}
+    for filename, entry in manifest["images"].items():
+        by_split.setdefault(entry["split"], []).append((filename, entry))
+
+    for split_name, entries in by_split.items():
+        for i, suffix in enumerate(suffixes):
+            sub = f"{split_name}{suffix}"
+            img_dir = target_dir / sub / "images"
+            lbl_dir = target_dir / sub / "labels"
+            img_dir.mkdir(parents=True, exist_ok=True)
+            if with_labels:
+                lbl_dir.mkdir(parents=True, exist_ok=True)
+
+            wanted_imgs = {}
+            wanted_lbls = {}
+            for filename, entry in entries:
+                wanted_imgs[filename] = root / entry["paths"][i]
+                if with_labels and entry.get("labels") is not None:
+                    wanted_lbls[os.path.splitext(filename)[0] + ".txt"] = entry
+
+            # 1. 删除不在索引中的旧文件 (仅 prune=True)
+            removed = 0
+            prune_dirs = [(img_dir, wanted_imgs)] + ([(lbl_dir, wanted_lbls)] if with_labels else [])
+            for d, wanted in (prune_dirs if prune else []):
+                if not d.exists():
+                    continue
+                for p in d.iterdir():
+                    if p.name not in wanted:
+                        p.unlink()
+                        removed += 1
+
+            # 2. 补齐缺失的文件，源文件已变化的重新链接
+            added = 0
+            relinked = 0
+            missing = 0
+            for filename, src in wanted_imgs.items():
+                dst = img_dir / filename
+                if not src.exists():
+                    missing += 1
+                    continue
+                if _is_synced(src, dst, mode):
+                    continue
+                if os.path.lexists(dst):
+                    dst.unlink()
+                    relinked += 1
+                else:
+                    added += 1
+                _link_file(src, dst, mode)
+
+            for label_name, entry in wanted_lbls.items():
+                dst = lbl_dir / label_name
+                src = root / entry["label"] if entry.get("label") else None
+                if src is not None and src.exists():
+                    if _is_synced(src, dst, mode):
+                        continue
+                    if os.path.lexists(dst):
+                        dst.unlink()
+                    _link_file(src, dst, mode)
+                else:
+                    text = _label_text(entry["labels"])
+                    if os.path.isfile(dst) and not os.path.islink(dst):
+                        with open(dst, 'r', encoding='utf-8') as f:
+                            if f.read() == text:
+                                continue
+                    if os.path.lexists(dst):
+                        dst.unlink()
+                    with open(dst, 'w', encoding='utf-8') as f:
+                        f.write(text)
+
+            print(f"✅ 视角 [{sub}] 同步完毕: 新增 {added} 张, 重新链接 {relinked} 张, 删除 {removed} 个旧文件, 缺失 {missing} 张。")
+
+    print(f"📁 多流目录已物化至: {target_dir} (mode={mode})")
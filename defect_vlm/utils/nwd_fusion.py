@@ -0,0 +1,105 @@
+"""
+基于 NWD 的微小缺陷跨源共识融合 (向量化版本)
+legacy/nwd_decision_fusion.py 中的 nwd_consensus_fusion 对每一对框调用一次 calculate_nwd，
+是 O(N x M) 的双重 Python 循环，在无标注数据池上跑不动。这里改为：
+1. 按类别分组，每个类别用一次 pairwise_nwd 得到完整的 NWD 相似度矩阵；
+2. 在矩阵上做分配：
+   - 'greedy'  : 与原实现逐一致的贪心策略 (网络 A 按置信度降序，依次取未被占用的 B 中 NWD 最高者)；
+   - 'optimal' : 匈牙利算法求全局最优的一对一匹配 (需要 scipy)，NWD 不超过阈值的配对不参与；
+3. 匹配上的框做概率联合提权，未匹配的框作为单流检出保留，输出格式与原实现完全一致。
+"""
+import numpy as np
+from defect_vlm.utils.box_geometry import pairwise_nwd
+
+
+def _greedy_assign(nwd, nwd_thr):
+    """原实现的贪心分配：行按顺序处理，每行取未被占用且 NWD 最大的列 (并列时取靠前的列)"""
+    matches = {}
+    if nwd.size == 0:
+        return matches
+    available = np.ones(nwd.shape[1], dtype=bool)
+    for i in range(nwd.shape[0]):
+        row = np.where(available, nwd[i], -np.inf)
+        j = int(np.argmax(row))
+        # 原实现的 best_nwd 初值为 0.0，因此 NWD 必须同时 > 0 且 > 阈值
+        if row[j] > 0.0 and row[j] > nwd_thr:
+            matches[i] = j
+            available[j] = False
+    return matches
+
+
+def _optimal_assign(nwd, nwd_thr):
+    """匈牙利算法：最大化匹配上的 NWD 之和，低于阈值的配对视为不可匹配"""
+    try:
+        from scipy.optimize import linear_sum_assignment
+    except ImportError as e:
+        raise ImportError("assign='optimal' 需要安装 scipy，或改用 assign='greedy'") from e
+
+    if nwd.size == 0:
+        return {}
+    valid = (nwd > nwd_thr) & (nwd > 0.0)
+    cost = np.where(valid, -nwd, 0.0)
+    rows, cols = linear_sum_assignment(cost)
+    return {int(i): int(j) for i, j in zip(rows, cols) if valid[i, j]}
+
+
+def nwd_consensus_fusion(preds_A, preds_B, nwd_thr, C, assign='greedy'):
+    """
+    基于 NWD 和联合概率的微小缺陷跨源共识融合机制
+    :param preds_A / preds_B: 两个网络的预测列表 [{bbox (xyxy), confidence, class_id, class_name, ...}]
+    :param nwd_thr: NWD 相似度匹配阈值
+    :param C: NWD 归一化常数 (通常取微小目标的平均绝对尺寸)
+    :param assign: 'greedy' | 'optimal'
+    :return: 融合后的预测列表 (顺序与原实现一致：先按 A 的置信度降序，再追加 B 中未匹配的框)
+    """
+    if assign not in ('greedy', 'optimal'):
+        raise ValueError(f"不支持的分配策略: {assign}")
+    assign_fn = _greedy_assign if assign == 'greedy' else _optimal_assign
+
+    # 按照置信度降序排列 (稳定排序，与 sorted(..., reverse=True) 的并列顺序一致)
+    preds_A = sorted(preds_A, key=lambda x: x['confidence'], reverse=True)
+    preds_B = sorted(preds_B, key=lambda x: x['confidence'], reverse=True)
+
+    cls_A = np.array([p['class_id'] for p in preds_A], dtype=np.int64)
+    cls_B = np.array([p['class_id'] for p in preds_B], dtype=np.int64)
+    box_A = np.array([p['bbox'] for p in preds_A], dtype=np.float64).reshape(-1, 4)
+    box_B = np.array([p['bbox'] for p in preds_B], dtype=np.float64).reshape(-1, 4)
+
+    # 1. 每个类别一次矩阵计算 + 分配，得到 A 索引 -> B 索引
+    a_to_b = {}
+    for c in np.intersect1d(cls_A, cls_B):
+        idx_A = np.flatnonzero(cls_A == c)
+        idx_B = np.flatnonzero(cls_B == c)
+        nwd = pairwise_nwd(box_A[idx_A], box_B[idx_B], C)
+        for i, j in assign_fn(nwd, nwd_thr).items():
+            a_to_b[int(idx_A[i])] = int(idx_B[j])
+
+    # 2. 组装输出
+    fused_preds = []
+    for i, pA in enumerate(preds_A):
+        j = a_to_b.get(i)
+        if j is not None:
+            pB = preds_B[j]
+            # 置信度提权：概率联合公式 (A + B - A*B)；坐标直接取置信度高的那个框
+            new_conf = pA['confidence'] + pB['confidence'] - (pA['confidence'] * pB['confidence'])
+            best_box = pA['bbox'] if pA['confidence'] > pB['confidence'] else pB['bbox']
+            fused_preds.append({
+                "class_id": pA['class_id'],
+                "class_name": pA['class_name'],
+                "bbox": best_box,
+                "confidence": new_conf,
+                "model_source": "fused_NWD_consensus"
+            })
+        else:
+            pA_copy = pA.copy()
+            pA_copy['model_source'] = "fused_NWD_single"
+            fused_preds.append(pA_copy)
+
+    used_B = set(a_to_b.values())
+    for j, pB in enumerate(preds_B):
+        if j not in used_B:
+            pB_copy = pB.copy()
+            pB_copy['model_source'] = "fused_NWD_single"
+            fused_preds.append(pB_copy)
+
+    return fused_preds
@@ -0,0 +1,72 @@
+"""
+按图像并行处理的通用执行器 (GT 区域提取等逐图任务)
+- 每张图像的随机数由 (全局种子, image_id) 派生，与处理顺序、worker 数量无关；
+- 结果按 image_id 升序合并，全局 id 在合并阶段统一分配，因此任意 worker 数量下输出完全一致；
+- 文件名中需要全局 id 的样本先以临时名落盘，合并阶段再重命名为最终名称。
+"""
+import os
+import random
+import hashlib
+import numpy as np
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+from tqdm import tqdm
+
+# 记录中表示 "最终文件名模板" 的私有字段，合并时会被移除
+RENAME_KEY = "_final_name"
+
+
+def derive_seed(seed, image_id):
+    """由 (全局种子, image_id) 派生一个稳定的 64 位种子 (不依赖 Python 的 hash 随机化)"""
+    digest = hashlib.sha256(f"{seed}:{image_id}".encode("utf-8")).digest()
+    return int.from_bytes(digest[:8], "little")
+
+
+def make_image_rngs(seed, image_id):
+    """返回该图像专属的 (random.Random, np.random.Generator)"""
+    s = derive_seed(seed, image_id)
+    return random.Random(s), np.random.default_rng(s)
+
+
+def run_image_tasks(worker_fn, tasks, num_workers=8, desc="Processing", chunksize=4):
+    """
+    并行执行逐图任务
+    :param worker_fn: 顶层函数 (可被 pickle)，输入一个 task，返回该图的结果
+    :param tasks: task 列表，调用方需保证已按 image_id 排序
+    :param num_workers: 进程数，<= 1 时在当前进程内顺序执行 (结果与并行完全一致)
+    :return: 与 tasks 一一对应的结果列表
+    """
+    if num_workers <= 1:
+        return [worker_fn(t) for t in tqdm(tasks, desc=desc)]
+
+    with ProcessPoolExecutor(max_workers=num_workers) as pool:
+        return list(tqdm(pool.map(worker_fn, tasks, chunksize=chunksize), total=len(tasks), desc=desc))
+
+
+def merge_sample_groups(results, data_root):
+    """
+    按顺序合并每张图的样本组并分配全局 id
+    :param results: list[list[list[dict]]]，每张图 -> 每个样本组 (例如同一 bbox 的 4 个光源) -> 每条记录
+                    记录中如果带有 RENAME_KEY (含 {id} 占位符的文件名模板)，会把临时文件重命名为最终文件名
+    :param data_root: crop_image_path 相对的根目录
+    :return: 扁平的 metadata 列表
+    """
+    data_root = Path(data_root)
+    metadata_list = []
+    global_id_counter = 0
+
+    for groups in results:
+        for group in groups:
+            for record in group:
+                record = dict(record)
+                record.pop("id", None)
+                final_fmt = record.pop(RENAME_KEY, None)
+                if final_fmt is not None:
+                    tmp_path = data_root / record["crop_image_path"]
+                    final_path = tmp_path.parent / final_fmt.format(id=global_id_counter)
+                    os.replace(tmp_path, final_path)
+                    record["crop_image_path"] = str(final_path.relative_to(data_root))
+                metadata_list.append({"id": global_id_counter, **record})
+                global_id_counter += 1
+
+    return metadata_list
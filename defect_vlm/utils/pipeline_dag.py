@@ -0,0 +1,507 @@
+"""
+带缓存的 DAG 流水线执行器
+级联流程 (YOLO 推理 -> 融合 -> 抠图 -> 拼图 -> Message -> VLM 推理 -> 指标) 以前要挨个改 __main__ 里的路径手动串起来。
+这里把每一步声明成 Stage (函数 + 输入/输出 Artifact + 参数)，按 Artifact 路径自动连成 DAG：
+    - 指纹 = 阶段名 + 函数名 + 函数所在源文件内容 + 参数 + 每个输入 Artifact 的内容指纹
+    - 指纹与上次成功运行一致且输出都还在 (且未被改动) 时直接跳过
+    - 上游重跑但输出内容没变时，下游的指纹也不变，同样跳过 (只重算真正受影响的部分)
+    - 互不依赖的分支 (col3 / row3 推理、多个置信度阈值) 并发执行；
+      声明了同一 resource 的阶段 (例如共用一张 GPU 的 VLM 推理) 按 resources 给定的容量限流
+运行状态保存在 state_path (JSON)，文件哈希按 (大小, mtime) 缓存，未改动的大文件不会重复计算 sha256。
+"""
+import hashlib
+import importlib
+import importlib.util
+import inspect
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, FIRST_COMPLETED, wait
+from pathlib import Path
+
+from defect_vlm.utils.tracing import span, count
+
+STATE_VERSION = 1
+ARTIFACT_KINDS = ('file', 'json', 'jsonl', 'dir')
+
+
+# ================= Artifact =================
+class Artifact:
+    """
+    流水线中的一个数据产物
+    :param path: 文件或目录路径
+    :param kind: 'file' / 'json' / 'jsonl' / 'dir'，运行结束后据此校验输出
+    """
+
+    def __init__(self, path, kind='file'):
+        if kind not in ARTIFACT_KINDS:
+            raise ValueError(f"未知的 Artifact 类型: {kind} (可选: {ARTIFACT_KINDS})")
+        self.path = Path(path)
+        self.kind = kind
+
+    @property
+    def key(self):
+        return str(self.path.resolve())
+
+    def exists(self):
+        return self.path.is_dir() if self.kind == 'dir' else self.path.is_file()
+
+    def validate(self):
+        """阶段运行后检查输出是否符合声明的类型，返回错误信息 (None 表示通过)"""
+        if not self.exists():
+            return f"缺少输出 {self.kind}: {self.path}"
+        if self.kind == 'json':
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    json.load(f)
+            except ValueError as e:
+                return f"输出不是合法 JSON: {self.path} ({e})"
+        elif self.kind == 'jsonl':
+            with open(self.path, 'r', encoding='utf-8') as f:
+                first = next((line for line in f if line.strip()), None)
+            if first is not None:
+                try:
+                    json.loads(first)
+                except ValueError as e:
+                    return f"输出不是合法 JSONL: {self.path} ({e})"
+        return None
+
+    def __repr__(self):
+        return f"Artifact({self.kind}:{self.path})"
+
+
+class _HashCache:
+    """文件内容哈希，按 (路径, 大小, mtime_ns) 记忆，目录只对文件清单 (相对路径, 大小, mtime_ns) 做哈希"""
+
+    def __init__(self, entries=None):
+        self.entries = dict(entries or {})
+        self._lock = threading.Lock()
+
+    def file_hash(self, path):
+        st = os.stat(path)
+        key = str(Path(path).resolve())
+        stamp = [st.st_size, st.st_mtime_ns]
+        with self._lock:
+            hit = self.entries.get(key)
+        if hit and hit[:2] == stamp:
+            return hit[2]
+        h = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                h.update(chunk)
+        digest = h.hexdigest()
+        with self._lock:
+            self.entries[key] = stamp + [digest]
+        return digest
+
+    @staticmethod
+    def dir_hash(path):
+        h = hashlib.sha256()
+        root = Path(path)
+        for dirpath, dirnames, filenames in os.walk(root):
+            dirnames.sort()
+            for name in sorted(filenames):
+                p = os.path.join(dirpath, name)
+                st = os.stat(p)
+                h.update(f"{os.path.relpath(p, root)}\0{st.st_size}\0{st.st_mtime_ns}\n".encode('utf-8'))
+        return h.hexdigest()
+
+    def artifact_hash(self, artifact):
+        if not artifact.exists():
+            return None
+        if artifact.kind == 'dir':
+            return self.dir_hash(artifact.path)
+        return self.file_hash(artifact.path)
+
+
+# ================= Stage =================
+def _jsonl_ids(path, id_field):
+    ids = set()
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                ids.add(json.loads(line).get(id_field))
+    return ids
+
+
+def jsonl_coverage_check(input_key, output_key, id_field='id'):
+    """
+    输出校验：output 的 JSONL 必须覆盖 input 的全部 id (逐块 try/except 的推理脚本部分失败时不能被当作完成缓存)
+    用法: Stage(..., checks=[jsonl_coverage_check('input_path', 'output_path')])
+    """
+    def check(stage):
+        src = stage.inputs.get(input_key) or stage.outputs.get(input_key)
+        dst = stage.outputs[output_key]
+        missing = _jsonl_ids(src.path, id_field) - _jsonl_ids(dst.path, id_field)
+        if missing:
+            return f"输出缺少 {len(missing)} 条 {id_field}: {sorted(map(str, missing))[:3]} ..."
+        return None
+    return check
+
+
+def resolve_callable(fn):
+    """支持直接传函数，或 'package.module:function' 字符串 (延迟导入，缺少 ultralytics / swift 时不影响其余阶段)"""
+    if callable(fn):
+        return fn
+    module_name, _, attr = fn.partition(':')
+    return getattr(importlib.import_module(module_name), attr)
+
+
+def _callable_name(fn):
+    if isinstance(fn, str):
+        return fn
+    return f"{fn.__module__}:{fn.__qualname__}"
+
+
+def _source_hash(fn):
+    """函数所在源文件的内容哈希：脚本改动后相关阶段自动失效"""
+    try:
+        if isinstance(fn, str):
+            spec = importlib.util.find_spec(fn.partition(':')[0])
+            src = spec.origin if spec else None
+        else:
+            src = inspect.getsourcefile(fn)
+        if src and os.path.isfile(src):
+            with open(src, 'rb') as f:
+                return hashlib.sha256(f.read()).hexdigest()
+    except (ImportError, TypeError, ValueError):
+        pass
+    return None
+
+
+class Stage:
+    """
+    一个流水线阶段：调用 fn(**inputs, **outputs, **params)
+    :param name: 阶段名 (唯一)
+    :param fn: 函数或 'module:function' 字符串
+    :param inputs / outputs: {形参名: Artifact}，调用时传入路径
+    :param params: 其余关键字参数 (参与指纹计算，需可 JSON 序列化，Path 等会转成字符串)
+    :param resource: 资源名，同名阶段受 Pipeline.resources 中的并发容量约束
+    :param path_type: 传给 fn 的路径类型 (str 或 Path)
+    :param clean_outputs: 重跑前删除旧的文件输出 (避免追加写的脚本把新旧结果混在一起)；
+                          同一指纹中断后重跑视为断点续跑，不删除
+    :param checks: 额外的输出校验 [fn(stage) -> 错误信息或 None]，例如 jsonl_coverage_check；
+                   任一失败时阶段记为 failed，不写入缓存，下次运行按断点续跑补齐
+    """
+
+    def __init__(self, name, fn, inputs=None, outputs=None, params=None, resource=None,
+                 path_type=str, clean_outputs=True, checks=None):
+        self.name = name
+        self.fn = fn
+        self.inputs = dict(inputs or {})
+        self.outputs = dict(outputs or {})
+        self.params = dict(params or {})
+        self.resource = resource
+        self.path_type = path_type
+        self.clean_outputs = clean_outputs
+        self.checks = list(checks or [])
+        self._source_hash = None
+
+    def fingerprint(self, hash_cache):
+        if self._source_hash is None:
+            self._source_hash = _source_hash(self.fn) or ""
+        payload = {
+            "name": self.name,
+            "fn": _callable_name(self.fn),
+            "source": self._source_hash,
+            "params": self.params,
+            "inputs": {k: [a.kind, hash_cache.artifact_hash(a)] for k, a in sorted(self.inputs.items())},
+            "outputs": {k: [a.kind, a.key] for k, a in sorted(self.outputs.items())},
+        }
+        blob = json.dumps(payload, sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha256(blob.encode('utf-8')).hexdigest()
+
+    def call_kwargs(self):
+        kwargs = {k: self.path_type(a.path) for k, a in self.inputs.items()}
+        kwargs.update({k: self.path_type(a.path) for k, a in self.outputs.items()})
+        kwargs.update(self.params)
+        return kwargs
+
+    def __repr__(self):
+        return f"Stage({self.name})"
+
+
+def _run_stage_fn(fn, kwargs):
+    """在 worker (线程或子进程) 中执行阶段函数，返回值不回传 (阶段之间只通过 Artifact 通信)"""
+    resolve_callable(fn)(**kwargs)
+
+
+# ================= Pipeline =================
+class Pipeline:
+    """
+    :param stages: Stage 列表 (顺序无关，依赖关系由 Artifact 路径推导)
+    :param state_path: 运行状态 JSON 的保存位置
+    :param max_workers: 同时运行的阶段数上限
+    :param resources: {资源名: 并发容量}，未列出的资源默认容量为 1
+    :param use_processes: True 时每个阶段在独立子进程中运行 (spawn，fn 需可导入)，适合纯 Python 的 CPU 阶段
+    """
+
+    def __init__(self, stages, state_path, max_workers=2, resources=None, use_processes=False):
+        self.stages = {}
+        for st in stages:
+            if st.name in self.stages:
+                raise ValueError(f"阶段名重复: {st.name}")
+            self.stages[st.name] = st
+        self.state_path = Path(state_path)
+        self.max_workers = max(1, int(max_workers))
+        self.resources = dict(resources or {})
+        self.use_processes = use_processes
+
+        self.producer = {}
+        for st in self.stages.values():
+            for art in st.outputs.values():
+                if art.key in self.producer:
+                    raise ValueError(f"输出 {art.path} 同时由 {self.producer[art.key]} 和 {st.name} 产生")
+                self.producer[art.key] = st.name
+
+        self.deps = {name: set() for name in self.stages}
+        for st in self.stages.values():
+            for art in st.inputs.values():
+                up = self.producer.get(art.key)
+                if up is None:
+                    continue
+                up_kind = next(a.kind for a in self.stages[up].outputs.values() if a.key == art.key)
+                if up_kind != art.kind:
+                    raise TypeError(f"{st.name} 期望 {art.kind} 输入 {art.path}，但 {up} 产出的是 {up_kind}")
+                if up == st.name:
+                    raise ValueError(f"{st.name} 的输入与输出相同: {art.path}")
+                self.deps[st.name].add(up)
+        self.order = self._toposort()
+
+        self.state = self._load_state()
+        self.hash_cache = _HashCache(self.state.get("_hash_cache"))
+        self._state_lock = threading.Lock()
+
+    # ---------- 图 ----------
+    def _toposort(self):
+        indeg = {n: len(d) for n, d in self.deps.items()}
+        children = {n: [] for n in self.stages}
+        for n, d in self.deps.items():
+            for up in d:
+                children[up].append(n)
+        ready = [n for n in self.stages if indeg[n] == 0]
+        order = []
+        while ready:
+            n = ready.pop(0)
+            order.append(n)
+            for c in children[n]:
+                indeg[c] -= 1
+                if indeg[c] == 0:
+                    ready.append(c)
+        if len(order) != len(self.stages):
+            cyc = sorted(n for n in self.stages if n not in order)
+            raise ValueError(f"流水线存在环: {cyc}")
+        return order
+
+    def upstream_closure(self, targets):
+        """targets 及其全部上游阶段"""
+        need, stack = set(), list(targets)
+        while stack:
+            n = stack.pop()
+            if n not in self.stages:
+                raise KeyError(f"未知阶段: {n}")
+            if n not in need:
+                need.add(n)
+                stack.extend(self.deps[n])
+        return need
+
+    # ---------- 状态 ----------
+    def _load_state(self):
+        if self.state_path.exists():
+            try:
+                with open(self.state_path, 'r', encoding='utf-8') as f:
+                    state = json.load(f)
+                if state.get("version") == STATE_VERSION:
+                    return state
+            except ValueError:
+                print(f"⚠️ 状态文件损坏，将全部重新判断: {self.state_path}")
+        return {"version": STATE_VERSION, "stages": {}}
+
+    def _save_state(self):
+        with self._state_lock:
+            self.state["_hash_cache"] = self.hash_cache.entries
+            self.state_path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = self.state_path.with_suffix(self.state_path.suffix + ".tmp")
+            with open(tmp, 'w', encoding='utf-8') as f:
+                json.dump(self.state, f, ensure_ascii=False, indent=1)
+            os.replace(tmp, self.state_path)
+
+    def _record(self, name, **fields):
+        with self._state_lock:
+            self.state["stages"].setdefault(name, {}).update(fields)
+        self._save_state()
+
+    def is_up_to_date(self, name, fp):
+        """指纹一致 + 输出都存在 + 输出内容与上次记录一致"""
+        rec = self.state["stages"].get(name)
+        if not rec or rec.get("fingerprint") != fp:
+            return False
+        outputs = rec.get("outputs", {})
+        for k, art in self.stages[name].outputs.items():
+            if not art.exists() or outputs.get(k) != self.hash_cache.artifact_hash(art):
+                return False
+        return True
+
+    def _prepare_outputs(self, st, fp):
+        rec = self.state["stages"].get(st.name, {})
+        resuming = rec.get("running") == fp
+        for art in st.outputs.values():
+            if art.kind == 'dir':
+                art.path.mkdir(parents=True, exist_ok=True)
+            else:
+                art.path.parent.mkdir(parents=True, exist_ok=True)
+                if st.clean_outputs and not resuming and art.path.exists():
+                    art.path.unlink()
+        return resuming
+
+    # ---------- 执行 ----------
+    def plan(self, targets=None, force=()):
+        """不执行，只返回 [(阶段名, 'cached' / 'run' / 'pending')]；pending 表示取决于上游的输出是否变化"""
+        need = self.upstream_closure(targets) if targets else set(self.stages)
+        status = {}
+        for n in self.order:
+            if n not in need:
+                continue
+            st = self.stages[n]
+            if n in force:
+                status[n] = 'run'
+            elif any(status[d] != 'cached' for d in self.deps[n]):
+                status[n] = 'pending'
+            elif not all(a.exists() for a in st.inputs.values()):
+                status[n] = 'run'
+            else:
+                status[n] = 'cached' if self.is_up_to_date(n, st.fingerprint(self.hash_cache)) else 'run'
+        return [(n, status[n]) for n in self.order if n in status]
+
+    def run(self, targets=None, force=(), dry_run=False):
+        """
+        执行流水线
+        :param targets: 只运行这些阶段及其上游 (None 表示全部)
+        :param force: 无论是否最新都强制重跑的阶段名
+        :return: {阶段名: {'status': 'cached'/'done'/'failed'/'blocked', 'seconds': float, 'error': str}}
+        """
+        force = set(force or ())
+        if dry_run:
+            plan = self.plan(targets, force)
+            print("=" * 50)
+            print("🧭 执行计划 (dry run)")
+            for n, s in plan:
+                icon = {'cached': '⚡', 'run': '🚀', 'pending': '⏳'}[s]
+                print(f"  {icon} {n:<28} {s}")
+            print("=" * 50)
+            return {n: {'status': s} for n, s in plan}
+
+        need = self.upstream_closure(targets) if targets else set(self.stages)
+        remaining = {n: set(self.deps[n]) & need for n in need}
+        results = {}
+        sems = {}
+        for st in self.stages.values():
+            if st.resource and st.resource not in sems:
+                sems[st.resource] = threading.Semaphore(self.resources.get(st.resource, 1))
+
+        pool_cls = ProcessPoolExecutor if self.use_processes else ThreadPoolExecutor
+        pool_kwargs = {}
+        if self.use_processes:
+            import multiprocessing as mp
+            pool_kwargs["mp_context"] = mp.get_context("spawn")
+
+        t_start = time.perf_counter()
+        print("=" * 50)
+        print(f"🚀 开始执行流水线: {len(need)} 个阶段, 最多 {self.max_workers} 个并发")
+        with pool_cls(max_workers=self.max_workers, **pool_kwargs) as pool, \
+                ThreadPoolExecutor(max_workers=self.max_workers) as driver:
+            running = {}
+            while remaining or running:
+                for n in [n for n, d in remaining.items() if not d]:
+                    del remaining[n]
+                    failed_up = [d for d in self.deps[n] & need if results[d]['status'] in ('failed', 'blocked')]
+                    if failed_up:
+                        results[n] = {'status': 'blocked', 'seconds': 0.0, 'error': f"上游失败: {failed_up}"}
+                        print(f"⛔ [{n}] 上游失败，跳过")
+                        self._release(n, remaining)
+                        continue
+                    running[driver.submit(self._execute, n, n in force, pool, sems)] = n
+                if not running:
+                    continue
+                done, _ = wait(list(running), return_when=FIRST_COMPLETED)
+                for fut in done:
+                    n = running.pop(fut)
+                    results[n] = fut.result()
+                    self._release(n, remaining)
+
+        self._save_state()
+        self._print_summary(results, time.perf_counter() - t_start)
+        return results
+
+    def _release(self, name, remaining):
+        for deps in remaining.values():
+            deps.discard(name)
+
+    def _execute(self, name, forced, pool, sems):
+        st = self.stages[name]
+        with span("pipeline.fingerprint", stage=name):
+            missing = [a.path for a in st.inputs.values() if not a.exists()]
+            fp = None if missing else st.fingerprint(self.hash_cache)
+        if missing:
+            print(f"❌ [{name}] 缺少输入: {[str(p) for p in missing]}")
+            count("pipeline.failed")
+            return {'status': 'failed', 'seconds': 0.0, 'error': f"缺少输入: {missing}"}
+        if not forced and self.is_up_to_date(name, fp):
+            print(f"⚡ [{name}] 输入与参数未变化，跳过")
+            count("pipeline.cached")
+            return {'status': 'cached', 'seconds': 0.0, 'error': None}
+
+        sem = sems.get(st.resource)
+        if sem:
+            sem.acquire()
+        try:
+            resuming = self._prepare_outputs(st, fp)
+            self._record(name, running=fp)
+            print(f"▶️ [{name}] {'断点续跑' if resuming else '开始运行'}")
+            t0 = time.perf_counter()
+            with span("pipeline.stage", stage=name):
+                try:
+                    pool.submit(_run_stage_fn, st.fn, st.call_kwargs()).result()
+                except Exception as e:
+                    count("pipeline.failed")
+                    print(f"❌ [{name}] 运行失败: {type(e).__name__}: {e}")
+                    return {'status': 'failed', 'seconds': time.perf_counter() - t0,
+                            'error': f"{type(e).__name__}: {e}"}
+            seconds = time.perf_counter() - t0
+        finally:
+            if sem:
+                sem.release()
+
+        errors = [err for err in (a.validate() for a in st.outputs.values()) if err]
+        if not errors:
+            errors = [err for err in (check(st) for check in st.checks) if err]
+        if errors:
+            count("pipeline.failed")
+            print(f"❌ [{name}] 输出校验失败: {errors}")
+            return {'status': 'failed', 'seconds': seconds, 'error': "; ".join(errors)}
+
+        outputs = {k: self.hash_cache.artifact_hash(a) for k, a in st.outputs.items()}
+        self._record(name, fingerprint=fp, outputs=outputs, running=None,
+                     seconds=round(seconds, 3), finished_at=time.strftime('%Y-%m-%d %H:%M:%S'))
+        count("pipeline.done")
+        print(f"✅ [{name}] 完成，用时 {seconds:.1f}s")
+        return {'status': 'done', 'seconds': seconds, 'error': None}
+
+    def _print_summary(self, results, total_seconds):
+        print("=" * 50)
+        print(f"📊 流水线执行报告 (总耗时 {total_seconds:.1f}s)")
+        icons = {'cached': '⚡', 'done': '✅', 'failed': '❌', 'blocked': '⛔'}
+        for n in self.order:
+            if n in results:
+                r = results[n]
+                line = f"  {icons[r['status']]} {n:<28} {r['status']:<8} {r.get('seconds', 0.0):>8.1f}s"
+                if r.get('error'):
+                    line += f"  {r['error']}"
+                print(line)
+        tally = {}
+        for r in results.values():
+            tally[r['status']] = tally.get(r['status'], 0) + 1
+        print(f"  合计: {tally}")
+        print("=" * 50)
+
@@ -0,0 +1,96 @@
+"""
+送入 VLM 之前的类别无关 proposal 聚类
+col3 / row3 两路融合之后，同一个缺陷区域仍可能留下多个高度重叠的框：
+    - 跨类别重复：NMS / WBF 按类别分别进行，同一位置被两个类别各预测一次时都会保留
+    - 跨流重复：decision_fusion 的小目标分支、NMS 阈值之外的错位框
+这些框抠出来的 4 光源图几乎一样，VLM 给出的结论也一样。这里在一张图内按 IoU (或 NWD) >= thr
+建图，求连通分量作为一个簇，每簇只把置信度最高的框 (代表框) 送入 VLM，结论再回填给簇内所有成员。
+VLM 本身就是在做类别判定，所以聚类不看 YOLO 的类别。
+"""
+import numpy as np
+from defect_vlm.utils.box_geometry import pairwise_iou, pairwise_nwd
+
+
+def cluster_boxes(boxes, method='iou', thr=0.7, C=50.0, fmt='xyxy'):
+    """
+    一张图内的框按相似度 >= thr 求连通分量 (并查集)
+    :param boxes: (N, 4)
+    :param method: 'iou' 或 'nwd'
+    :return: 长度为 N 的簇编号列表，编号按簇内首个框的出现顺序从 0 开始
+    """
+    n = len(boxes)
+    if n == 0:
+        return []
+    if method == 'iou':
+        sim = pairwise_iou(boxes, boxes, fmt=fmt)
+    elif method == 'nwd':
+        sim = pairwise_nwd(boxes, boxes, C, fmt=fmt)
+    else:
+        raise ValueError(f"不支持的聚类方式: {method}")
+
+    parent = list(range(n))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    rows, cols = np.nonzero(np.triu(sim >= thr, k=1))
+    for i, j in zip(rows.tolist(), cols.tolist()):
+        ri, rj = find(i), find(j)
+        if ri != rj:
+            parent[max(ri, rj)] = min(ri, rj)
+
+    labels, remap = [], {}
+    for i in range(n):
+        root = find(i)
+        if root not in remap:
+            remap[root] = len(remap)
+        labels.append(remap[root])
+    return labels
+
+
+def dedup_fusion_preds(fusion_preds, method='iou', thr=0.7, C=50.0):
+    """
+    :param fusion_preds: 融合结果 {img_name: [pred, ...]} (bbox 为 xyxy)
+    :return: (rep_preds, clusters, stats)
+             rep_preds 与输入格式相同，每簇只保留置信度最高的代表框，并带上 cluster_id / cluster_size，
+                       可直接交给 crop_yolo_preds_bbox.main；
+             clusters  为 {cluster_id: {"image": img_name, "members": [pred, ...]}}，members[0] 为代表框；
+             stats     为聚类统计
+    """
+    rep_preds = {}
+    clusters = {}
+    stats = {"images": 0, "proposals": 0, "clusters": 0, "size_hist": {},
+             "cross_class": 0, "cross_stream": 0}
+    for img_name, preds in fusion_preds.items():
+        if img_name == 'config':
+            continue    # decision_fusion 输出中保存的融合配置项
+        stats["images"] += 1
+        stats["proposals"] += len(preds)
+        labels = cluster_boxes([p['bbox'] for p in preds], method, thr, C)
+
+        groups = {}
+        for pred, k in zip(preds, labels):
+            groups.setdefault(k, []).append(pred)
+
+        keep = []
+        for k, members in groups.items():
+            # 稳定排序：置信度相同时保留原来的先后顺序
+            members = sorted(members, key=lambda p: p['confidence'], reverse=True)
+            cluster_id = f"{img_name}#{k}"
+            rep = dict(members[0], cluster_id=cluster_id, cluster_size=len(members))
+            keep.append(rep)
+            clusters[cluster_id] = {"image": img_name, "members": members}
+
+            size = len(members)
+            stats["size_hist"][size] = stats["size_hist"].get(size, 0) + 1
+            if size > 1:
+                if len({p['class_name'] for p in members}) > 1:
+                    stats["cross_class"] += 1
+                if len({p.get('model_source') for p in members}) > 1:
+                    stats["cross_stream"] += 1
+        stats["clusters"] += len(keep)
+        rep_preds[img_name] = keep
+    return rep_preds, clusters, stats
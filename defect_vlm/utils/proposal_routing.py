@@ -0,0 +1,67 @@
+"""
+基于 YOLO 置信度的 proposal 分流 (drop / trust / verify)
+refine_pseudo_labels 的决策树只在 th_l <= p_yolo < th_h 时才使用 VLM 的结论：
+    p_yolo <  th_l          -> drop   : 直接抛弃
+    p_yolo >= th_h          -> trust  : 直接信任 YOLO
+    th_l <= p_yolo < th_h   -> verify : 交给 VLM 判定
+而上游的抠图 / 拼图 / VLM 推理却对所有框都做了一遍。这里把同一套判定前移到融合之后，
+只有 verify 区间的框需要物化并送入 VLM，trust 区间的框直接带着原图文件名传给伪标签精炼。
+"""
+BAND_DROP = 'drop'
+BAND_TRUST = 'trust'
+BAND_VERIFY = 'verify'
+
+
+def route_band(p_yolo, th_l, th_h):
+    """与 refine_pseudo_labels 的决策树逐条一致"""
+    if p_yolo < th_l:
+        return BAND_DROP
+    if p_yolo >= th_h:
+        return BAND_TRUST
+    return BAND_VERIFY
+
+
+def trusted_record(img_name, pred, idx):
+    """
+    trust 区间的框转为提取后的 VLM 数据格式 (extract_vlm_data 的输出)，供 refine_pseudo_labels 直接读取
+    没有拼图，images 为空；original_image 记录原图文件名，构建半监督数据集时不再需要拼图映射表
+    """
+    x1, y1, x2, y2 = pred['bbox']
+    return {
+        "id": f"trusted_{idx}",
+        "images": [],
+        "bbox": [x1, y1, x2 - x1, y2 - y1],     # 与拼图元数据一致，使用 COCO xywh
+        "confidence": pred['confidence'],
+        "model_source": pred['model_source'],
+        "prior_label": pred['class_name'],
+        "vlm_pred": None,
+        "original_image": img_name,
+        "route": BAND_TRUST,
+    }
+
+
+def route_fusion_preds(fusion_preds, th_l, th_h):
+    """
+    :param fusion_preds: 融合结果 {img_name: [pred, ...]} (bbox 为 xyxy)
+    :return: (verify_preds, trusted_records, stats)
+             verify_preds 与输入格式相同 (可直接交给 crop_yolo_preds_bbox.main)，
+             trusted_records 为 trusted_record 格式的列表，stats 为各区间计数
+    """
+    verify_preds = {}
+    trusted = []
+    stats = {"images": 0, "total": 0, BAND_DROP: 0, BAND_TRUST: 0, BAND_VERIFY: 0}
+    for img_name, preds in fusion_preds.items():
+        if img_name == 'config':
+            continue    # decision_fusion 输出中保存的融合配置项
+        stats["images"] += 1
+        keep = []
+        for pred in preds:
+            band = route_band(pred['confidence'], th_l, th_h)
+            stats["total"] += 1
+            stats[band] += 1
+            if band == BAND_VERIFY:
+                keep.append(pred)
+            elif band == BAND_TRUST:
+                trusted.append(trusted_record(img_name, pred, len(trusted)))
+        verify_preds[img_name] = keep
+    return verify_preds, trusted, stats
@@ -0,0 +1,111 @@
+"""
+API 回复并行清洗 / 划分
+pe/split_api_reponse_tea.py / stu.py 原来逐行 json.loads -> check_ai_response -> json.dumps 串行处理，
+几十万条教师回复要跑很久；失败原因还要再用 sandbox/analyse_response_fail_reason.py 读一遍 retry 文件统计。
+这里统一为：
+    1. 输入文件按字节区间切块 (边界对齐到换行，复用 vlm_response_parser.split_byte_ranges)
+    2. 每个 worker 自己读取区间、逐行校验，直接返回序列化好的合格 / 不合格文本块和失败原因计数
+    3. 主进程按块顺序写出，合格 / 不合格文件的行序与串行版本完全一致，失败原因直方图在同一遍中得到
+check_fn 必须是模块级函数 (进程池需要 pickle)，签名与原 check_ai_response 一致：接收 item (可原地清洗)，返回是否合格。
+"""
+import json
+import os
+from collections import Counter
+from multiprocessing import Pool
+from pathlib import Path
+
+from tqdm import tqdm
+
+from defect_vlm.utils.vlm_response_parser import split_byte_ranges
+
+# 单块上限，避免主进程同时持有过多待写出的文本
+CHUNK_BYTES = 32 << 20
+MAX_ERROR_EXAMPLES = 5
+
+
+def _split_range(task):
+    path, start, end, check_fn = task
+    with open(path, 'rb') as f:
+        f.seek(start)
+        data = f.read(end - start)
+
+    good, bad = [], []
+    reasons = Counter()
+    errors = []
+    for raw in data.split(b'\n'):
+        line = raw.decode('utf-8').strip()
+        if not line: continue
+        item = None
+        try:
+            item = json.loads(line)
+            if check_fn(item):
+                good.append(json.dumps(item, ensure_ascii=False))
+            else:
+                bad.append(json.dumps(item, ensure_ascii=False))
+                reasons[item.get('meta_info', {}).get('fail_reason')] += 1
+        except Exception as e:
+            item_id = item.get('id') if isinstance(item, dict) else None
+            errors.append(f"处理id: {item_id} 时发生错误{e}")
+
+    good_text = '\n'.join(good) + '\n' if good else ''
+    bad_text = '\n'.join(bad) + '\n' if bad else ''
+    return good_text, bad_text, len(good), len(bad), reasons, errors, end - start
+
+
+def split_api_responses(api_response_path, save_path, retry_path, check_fn, num_workers=0, save_mode='w',
+                        chunks_per_worker=4):
+    """
+    清洗并划分 API 回复文件
+    :param check_fn: 校验函数 (如 split_api_reponse_stu.check_ai_response)
+    :param num_workers: <= 1 时在当前进程内按块顺序执行，否则使用进程池
+    :param save_mode: 合格文件的打开方式，教师数据追加 ('a')，学生数据覆盖 ('w')；retry 文件总是覆盖
+    :return: {"good": int, "bad": int, "errors": int, "fail_reasons": Counter, "error_examples": list}
+    """
+    api_response_path = str(api_response_path)
+    save_path = Path(save_path)
+    retry_path = Path(retry_path)
+    save_path.parent.mkdir(exist_ok=True, parents=True)
+    retry_path.parent.mkdir(exist_ok=True, parents=True)
+
+    size = os.path.getsize(api_response_path)
+    num_chunks = max(max(num_workers, 1) * chunks_per_worker, size // CHUNK_BYTES + 1)
+    tasks = [(api_response_path, s, e, check_fn) for s, e in split_byte_ranges(api_response_path, num_chunks)]
+
+    stats = {"good": 0, "bad": 0, "errors": 0, "fail_reasons": Counter(), "error_examples": []}
+    pool = Pool(num_workers) if num_workers > 1 else None
+    try:
+        parts = pool.imap(_split_range, tasks) if pool else map(_split_range, tasks)
+        with open(save_path, save_mode, encoding='utf-8') as f_good, \
+            open(retry_path, 'w', encoding='utf-8') as f_bad, \
+            tqdm(total=size, unit='B', unit_scale=True, desc='Processing item') as pbar:
+            # imap 按提交顺序返回，写出顺序与输入行序一致
+            for good_text, bad_text, good_cnt, bad_cnt, reasons, errors, nbytes in parts:
+                f_good.write(good_text)
+                f_bad.write(bad_text)
+                stats["good"] += good_cnt
+                stats["bad"] += bad_cnt
+                stats["errors"] += len(errors)
+                stats["fail_reasons"].update(reasons)
+                stats["error_examples"].extend(errors[:MAX_ERROR_EXAMPLES - len(stats["error_examples"])])
+                pbar.update(nbytes)
+    finally:
+        if pool:
+            pool.close()
+            pool.join()
+    return stats
+
+
+def print_split_report(stats, save_path, retry_path, top_k=10):
+    """与原脚本一致的合格 / 错误计数，附带失败原因直方图 (取代 analyse_response_fail_reason.py 的二次读取)"""
+    print("处理完成!")
+    print(f"✅ 合格样本 (Good): {stats['good']} -> 保存至 {save_path}")
+    print(f"❌ 错误样本 (Bad) : {stats['bad']} -> 保存至 {retry_path}")
+    if stats["errors"]:
+        print(f"⚠️ 处理异常 (已跳过): {stats['errors']} 条，例如:")
+        for msg in stats["error_examples"]:
+            print(f"   {msg}")
+    if stats["fail_reasons"]:
+        print("-" * 50)
+        print(f"📊 失败原因分布 (前 {top_k} 项，共 {len(stats['fail_reasons'])} 种):")
+        for reason, cnt in stats["fail_reasons"].most_common(top_k):
+            print(f"   {cnt:>8} ({cnt / max(stats['bad'], 1) * 100:5.1f}%) | {reason}")
@@ -0,0 +1,317 @@
+"""
+可视化工具的缩略图金字塔 + 预渲染叠加框缓存
+Streamlit 每次交互都会整段重跑脚本，原来的浏览器每次都要用 PIL 打开整张 PNG、重新画框再缩放显示，
+一页 20 张伪标签图就要解码 20 张原图。这里把 "缩放 + 画框" 的结果缓存为 WebP (不支持时退化为 JPEG)：
+    - 金字塔：缩略图边长只取 PYRAMID_LEVELS 中的档位，请求尺寸向上取整到最近的档位；
+              批量生成时一张原图只解码一次，从大到小逐级缩放得到所有档位
+    - 内容寻址：文件名为 (源图签名, 档位, 格式, 质量, 叠加框及样式) 的 sha256，同一输入永远命中同一文件，
+              源图被覆盖 (大小 / mtime 变化) 后自然失效；hash_mode='content' 时源图签名改为文件内容哈希
+    - LRU 淘汰：命中时刷新文件 mtime，缓存总大小超过 max_bytes 时按 mtime 从旧到新删除到 LOW_WATER 以下
+    - 按需生成 (thumbnail) 或用进程池批量预生成 (warm)，写入先落临时文件再 os.replace，多进程并发安全
+叠加框格式：
+    boxes = [{"bbox": [...], "cls": 0, "conf": 0.9, "label": "可选，默认由 class_names 和 conf 生成"}, ...]
+    box_format = 'xyxy' (原图像素坐标) 或 'yolo' (归一化 xc, yc, w, h)
+"""
+import hashlib
+import json
+import os
+import tempfile
+from pathlib import Path
+
+from PIL import Image, ImageDraw, ImageFont, features
+
+from defect_vlm.utils.parallel_runner import run_image_tasks
+
+THUMB_CACHE_VERSION = 1
+PYRAMID_LEVELS = (256, 512, 1024)
+LOW_WATER = 0.9
+DEFAULT_COLOR = '#E64B35'
+DEFAULT_CACHE_DIR = os.environ.get("DEFECT_VLM_THUMB_CACHE", str(Path.home() / ".cache" / "defect_vlm" / "thumbs"))
+
+
+def snap_level(max_side, levels=PYRAMID_LEVELS):
+    """把请求的边长向上取整到金字塔档位 (超过最大档位时取最大档位)"""
+    for level in sorted(levels):
+        if max_side <= level:
+            return level
+    return max(levels)
+
+
+def yolo_label_boxes(lbl_path, conf_threshold=0.0):
+    """
+    读取 YOLO txt (cls xc yc w h [conf])，返回 conf >= 阈值的框 (box_format='yolo')
+    没有第 6 列时置信度记为 1.0 (GT 标签)；文件不存在时返回空列表
+    """
+    boxes = []
+    if not os.path.exists(lbl_path):
+        return boxes
+    with open(lbl_path, 'r') as f:
+        for line in f:
+            parts = line.strip().split()
+            if len(parts) < 5:
+                continue
+            conf = float(parts[5]) if len(parts) >= 6 else 1.0
+            if conf < conf_threshold:
+                continue
+            boxes.append({"cls": int(parts[0]), "bbox": [float(v) for v in parts[1:5]], "conf": conf})
+    return boxes
+
+
+def _load_font(font_path, size):
+    if font_path:
+        try:
+            return ImageFont.truetype(font_path, size)
+        except OSError:
+            pass
+    try:
+        return ImageFont.load_default(size=size)
+    except TypeError:
+        return ImageFont.load_default()
+
+
+def draw_boxes(img, boxes, box_format, src_size, style):
+    """在 (已缩放的) 图像上画框，坐标按 src_size -> img.size 缩放"""
+    if not boxes:
+        return img
+    src_w, src_h = src_size
+    w, h = img.size
+    sx, sy = w / src_w, h / src_h
+    line_width = max(1, int(round(style.get("line_width", 3) * max(w, h) / 1024)))
+    font = _load_font(style.get("font_path"), max(10, int(round(style.get("font_size", 20) * max(w, h) / 1024))))
+    class_names = style.get("class_names") or {}
+    class_colors = style.get("class_colors") or {}
+    draw = ImageDraw.Draw(img)
+    for box in boxes:
+        if box_format == 'yolo':
+            xc, yc, bw, bh = box["bbox"]
+            x1, y1, x2, y2 = (xc - bw / 2) * w, (yc - bh / 2) * h, (xc + bw / 2) * w, (yc + bh / 2) * h
+        else:
+            bx1, by1, bx2, by2 = box["bbox"]
+            x1, y1, x2, y2 = bx1 * sx, by1 * sy, bx2 * sx, by2 * sy
+        cls = box.get("cls")
+        color = box.get("color") or class_colors.get(str(cls), class_colors.get(cls, DEFAULT_COLOR))
+        draw.rectangle([x1, y1, x2, y2], outline=color, width=line_width)
+
+        label = box.get("label")
+        if label is None and cls is not None:
+            name = class_names.get(str(cls), class_names.get(cls, str(cls)))
+            label = f"{name} {box['conf']:.2f}" if "conf" in box else name
+        if label:
+            tb = draw.textbbox((x1, y1), label, font=font)
+            th = tb[3] - tb[1]
+            draw.rectangle([x1, y1 - th, x1 + (tb[2] - tb[0]), y1], fill=color)
+            draw.text((x1, y1 - th), label, fill="white", font=font)
+    return img
+
+
+class ThumbnailCache:
+    """
+    cache = ThumbnailCache("/data/ZS/defect_dataset/.thumb_cache", max_bytes=2 << 30)
+    st.image(cache.thumbnail(img_path, 512, boxes=boxes, box_format='yolo'))
+    """
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_bytes=2 << 30, fmt='webp', quality=80,
+                 levels=PYRAMID_LEVELS, hash_mode='stat', style=None):
+        if fmt == 'webp' and not features.check('webp'):
+            fmt = 'jpeg'
+        if fmt not in ('webp', 'jpeg'):
+            raise ValueError(f"fmt 必须是 webp 或 jpeg，当前为 {fmt}")
+        self.cache_dir = Path(cache_dir)
+        self.max_bytes = int(max_bytes)
+        self.fmt = fmt
+        self.quality = int(quality)
+        self.levels = tuple(sorted(levels))
+        self.hash_mode = hash_mode
+        self.style = dict(style or {})
+        self.hits = 0
+        self.misses = 0
+        self._approx_bytes = None   # 首次写入时扫描一次目录，之后增量累计
+
+    # ================= 键与路径 =================
+    def config(self):
+        """可 pickle 的构造参数，进程池 worker 用它重建同一个缓存"""
+        return {"cache_dir": str(self.cache_dir), "max_bytes": self.max_bytes, "fmt": self.fmt,
+                "quality": self.quality, "levels": self.levels, "hash_mode": self.hash_mode, "style": self.style}
+
+    def source_signature(self, src):
+        src = os.path.abspath(src)
+        if self.hash_mode == 'content':
+            h = hashlib.sha256()
+            with open(src, 'rb') as f:
+                for chunk in iter(lambda: f.read(1 << 20), b''):
+                    h.update(chunk)
+            return h.hexdigest()
+        st = os.stat(src)
+        return f"{src}|{st.st_size}|{st.st_mtime_ns}"
+
+    def key(self, src, level, boxes=None, box_format='xyxy', signature=None):
+        payload = {
+            "v": THUMB_CACHE_VERSION,
+            "src": signature or self.source_signature(src),
+            "level": level,
+            "fmt": self.fmt,
+            "q": self.quality,
+            "boxes": boxes or [],
+            "box_format": box_format if boxes else None,
+            "style": self.style if boxes else None,
+        }
+        blob = json.dumps(payload, sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha256(blob.encode('utf-8')).hexdigest()
+
+    def path_for(self, key):
+        ext = 'webp' if self.fmt == 'webp' else 'jpg'
+        return self.cache_dir / key[:2] / f"{key}.{ext}"
+
+    # ================= 读取 / 生成 =================
+    def thumbnail(self, src, max_side=512, boxes=None, box_format='xyxy'):
+        """返回缓存文件路径 (str)，未命中时就地生成；源图无法打开时返回 None"""
+        level = snap_level(max_side, self.levels)
+        try:
+            path = self.path_for(self.key(src, level, boxes, box_format))
+        except OSError:
+            return None
+        if path.exists():
+            self.hits += 1
+            try:
+                os.utime(path)      # 刷新 mtime，作为 LRU 的访问时间
+            except OSError:
+                pass
+            return str(path)
+        self.misses += 1
+        written = self.render(src, (level,), boxes, box_format)
+        return written.get(level)
+
+    def render(self, src, levels=None, boxes=None, box_format='xyxy', evict=True):
+        """
+        解码一次原图，从大到小逐级缩放生成多个档位 (已存在的档位跳过)
+        :return: {level: 缓存文件路径}
+        """
+        levels = sorted(set(levels or self.levels), reverse=True)
+        try:
+            signature = self.source_signature(src)
+        except OSError:
+            return {}
+        targets = {lv: self.path_for(self.key(src, lv, boxes, box_format, signature)) for lv in levels}
+        out = {lv: str(p) for lv, p in targets.items() if p.exists()}
+        todo = [lv for lv in levels if lv not in out]
+        if not todo:
+            return out
+
+        try:
+            with Image.open(src) as im:
+                src_size = im.size      # 框坐标按原图尺寸缩放 (draft 之后解码尺寸可能变小)
+                im.draft('RGB', (todo[0], todo[0]))     # JPEG 源图直接按缩小尺寸解码
+                cur = im.convert('RGB')
+        except OSError:
+            return out
+        added = 0
+        for lv in todo:
+            scale = min(1.0, lv / max(cur.size))
+            size = (max(1, int(round(cur.size[0] * scale))), max(1, int(round(cur.size[1] * scale))))
+            if size != cur.size:
+                cur = cur.resize(size, Image.LANCZOS, reducing_gap=2.0)
+            canvas = draw_boxes(cur.copy(), boxes, box_format, src_size, self.style) if boxes else cur
+            added += self._write(canvas, targets[lv])
+            out[lv] = str(targets[lv])
+
+        if self._approx_bytes is not None:
+            self._approx_bytes += added
+        if evict:
+            self.maybe_evict()
+        return out
+
+    def _write(self, img, path):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=path.parent, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                if self.fmt == 'webp':
+                    img.save(f, format='WEBP', quality=self.quality, method=4)
+                else:
+                    img.save(f, format='JPEG', quality=self.quality, optimize=True)
+            os.replace(tmp, path)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+        return path.stat().st_size
+
+    # ================= 容量管理 =================
+    def _scan(self):
+        entries = []
+        if self.cache_dir.exists():
+            for sub in self.cache_dir.iterdir():
+                if not sub.is_dir():
+                    continue
+                for p in sub.iterdir():
+                    if p.suffix == '.tmp':
+                        continue
+                    try:
+                        st = p.stat()
+                    except OSError:
+                        continue
+                    entries.append((st.st_mtime_ns, st.st_size, p))
+        return entries
+
+    def size_bytes(self):
+        return sum(e[1] for e in self._scan())
+
+    def maybe_evict(self):
+        if self._approx_bytes is None:
+            self._approx_bytes = self.size_bytes()
+        if self._approx_bytes > self.max_bytes:
+            return self.evict()
+        return 0
+
+    def evict(self, target_bytes=None):
+        """按 mtime 从旧到新删除，直到总大小不超过 target_bytes (默认 max_bytes * LOW_WATER)，返回删除的文件数"""
+        target = int(self.max_bytes * LOW_WATER) if target_bytes is None else target_bytes
+        entries = sorted(self._scan(), key=lambda e: e[0])
+        total = sum(e[1] for e in entries)
+        removed = 0
+        for _, size, p in entries:
+            if total <= target:
+                break
+            try:
+                p.unlink()
+            except OSError:
+                continue
+            total -= size
+            removed += 1
+        self._approx_bytes = total
+        return removed
+
+    def stats(self, scan=True):
+        """scan=False 时使用进程内累计的大小 (Streamlit 每次重跑都会调用，避免反复遍历缓存目录)，files 为 None"""
+        files = None
+        if scan or self._approx_bytes is None:
+            entries = self._scan()
+            files = len(entries)
+            self._approx_bytes = sum(e[1] for e in entries)
+        return {"files": files, "bytes": self._approx_bytes, "max_bytes": self.max_bytes,
+                "hits": self.hits, "misses": self.misses, "fmt": self.fmt}
+
+
+# ================= 批量预生成 =================
+
+def _warm_worker(task):
+    config, src, levels, boxes, box_format = task
+    cache = ThumbnailCache(**config)
+    return len(cache.render(src, levels, boxes, box_format, evict=False))
+
+
+def warm_thumbnails(cache, items, levels=None, num_workers=8, desc="Warming thumbnails"):
+    """
+    用进程池批量预生成缩略图
+    :param items: [(src, boxes, box_format), ...] 或 [src, ...]
+    :return: 生成 / 命中的文件数
+    """
+    config = cache.config()
+    tasks = []
+    for it in items:
+        src, boxes, box_format = (it, None, 'xyxy') if isinstance(it, (str, Path)) else it
+        tasks.append((config, str(src), tuple(levels or cache.levels), boxes, box_format))
+    counts = run_image_tasks(_warm_worker, tasks, num_workers=num_workers, desc=desc, chunksize=8)
+    cache._approx_bytes = None
+    cache.maybe_evict()
+    return sum(counts)
@@ -0,0 +1,432 @@
+"""
+轻量级阶段追踪 (Tracing)
+各个脚本之前只有 tqdm 进度条，看不出时间到底花在读图、推理、融合还是写文件上。这里提供：
+    span(name, **attrs)  : 上下文管理器，记录一段代码的起止时间 (也可用 @traced 装饰函数)
+    count(name, value)   : 计数器 (处理了多少张图、多少个框、多少次失败 ...)
+    observe(name, value) : 直方图 (单次请求延迟、每张图的框数 ...)
+事件写入 JSONL 文件，进程退出时追加计数器 / 直方图 / 各 span 的耗时汇总，并可选导出 Chrome trace
+(chrome://tracing 或 https://ui.perfetto.dev 打开)。
+
+开启方式 (二选一)：
+    1. 环境变量: DEFECT_VLM_TRACE=/path/trace.jsonl [DEFECT_VLM_TRACE_CHROME=/path/trace.chrome.json]
+    2. 命令行参数: 支持 --trace / --trace_chrome 的脚本 (见 add_trace_args / setup_tracing)
+未开启时 span() 直接返回一个共享的空上下文，count() / observe() 只做一次 None 判断，开销可以忽略。
+
+多进程：fork 出的子进程自动改用自己的写句柄，spawn 的子进程通过环境变量继承开关；
+所有进程以 O_APPEND 整块追加到同一个 JSONL，每个进程在退出时写入各自的汇总。
+"""
+import atexit
+import functools
+import json
+import os
+import random
+import sys
+import threading
+import time
+from collections import defaultdict
+from pathlib import Path
+
+ENV_TRACE = "DEFECT_VLM_TRACE"
+ENV_CHROME = "DEFECT_VLM_TRACE_CHROME"
+_ENV_OWNER = "DEFECT_VLM_TRACE_OWNER"      # 创建 trace 文件的主进程 pid，子进程据此只追加不截断
+
+_BUFFER_LINES = 512
+_RESERVOIR_SIZE = 4096
+
+_TRACER = None
+
+
+# ================= 统计容器 =================
+class _Histogram:
+    """count / sum / min / max + 固定容量的蓄水池采样 (用于估计分位数)"""
+    __slots__ = ("count", "total", "min", "max", "samples", "_rng")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.min = float('inf')
+        self.max = float('-inf')
+        self.samples = []
+        self._rng = random.Random(0)
+
+    def add(self, value):
+        self.count += 1
+        self.total += value
+        if value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+        if len(self.samples) < _RESERVOIR_SIZE:
+            self.samples.append(value)
+        else:
+            k = self._rng.randrange(self.count)
+            if k < _RESERVOIR_SIZE:
+                self.samples[k] = value
+
+    def summary(self):
+        s = sorted(self.samples)
+
+        def q(p):
+            return s[min(len(s) - 1, int(p * len(s)))] if s else None
+
+        return {"count": self.count, "sum": self.total, "min": self.min if self.count else None,
+                "max": self.max if self.count else None, "mean": self.total / self.count if self.count else None,
+                "p50": q(0.5), "p90": q(0.9), "p99": q(0.99)}
+
+
+class _Tracer:
+    def __init__(self, path, chrome_path=None, truncate=True):
+        self.path = Path(path)
+        self.chrome_path = Path(chrome_path) if chrome_path else None
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        flags = os.O_WRONLY | os.O_CREAT | os.O_APPEND | (os.O_TRUNC if truncate else 0)
+        self.fd = os.open(self.path, flags, 0o644)
+        self.lock = threading.Lock()
+        self.pid = os.getpid()
+        self.is_owner = truncate
+        self._reset_state()
+
+    def _reset_state(self):
+        self.buffer = []
+        self.counters = defaultdict(float)
+        self.histograms = defaultdict(_Histogram)
+        self.span_stats = defaultdict(_Histogram)
+        self.closed = False
+        self.emit({"type": "meta", "argv": sys.argv, "start_unix": time.time()})
+
+    def emit(self, event):
+        event["pid"] = self.pid
+        line = json.dumps(event, ensure_ascii=False, default=str) + "\n"
+        with self.lock:
+            self.buffer.append(line)
+            if len(self.buffer) >= _BUFFER_LINES:
+                self._flush_buffer()
+
+    def _flush_buffer(self):
+        if self.buffer:
+            data = "".join(self.buffer).encode("utf-8")
+            self.buffer = []
+            os.write(self.fd, data)
+
+    def flush(self):
+        with self.lock:
+            self._flush_buffer()
+
+    def after_fork_in_child(self):
+        """fork 后的子进程：换用自己的 pid，清空继承来的统计，继续追加到同一个文件"""
+        self.lock = threading.Lock()
+        self.pid = os.getpid()
+        self.is_owner = False
+        self._reset_state()
+        _register_exit_hooks()
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        for name, value in self.counters.items():
+            self.emit({"type": "counter", "name": name, "value": value})
+        for name, h in self.histograms.items():
+            self.emit({"type": "histogram", "name": name, **h.summary()})
+        for name, h in self.span_stats.items():
+            self.emit({"type": "span_stats", "name": name, **h.summary()})
+        self.flush()
+        os.close(self.fd)
+        if self.is_owner and self.chrome_path is not None:
+            write_chrome_trace(self.path, self.chrome_path)
+
+
+# ================= span =================
+class _NoopSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def set(self, **attrs):
+        pass
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+class _Span:
+    __slots__ = ("tracer", "name", "attrs", "ts_us", "t0")
+
+    def __init__(self, tracer, name, attrs):
+        self.tracer = tracer
+        self.name = name
+        self.attrs = attrs
+
+    def __enter__(self):
+        self.ts_us = time.time_ns() // 1000
+        self.t0 = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        dur_us = (time.perf_counter_ns() - self.t0) / 1000.0
+        event = {"type": "span", "name": self.name, "ts": self.ts_us, "dur": dur_us,
+                 "tid": threading.get_ident()}
+        if exc_type is not None:
+            self.attrs["error"] = exc_type.__name__
+        if self.attrs:
+            event["attrs"] = self.attrs
+        self.tracer.emit(event)
+        with self.tracer.lock:
+            self.tracer.span_stats[self.name].add(dur_us / 1000.0)
+        return False
+
+    def set(self, **attrs):
+        """在 span 内部补充属性 (例如处理完才知道的框数)"""
+        self.attrs.update(attrs)
+
+
+def span(name, **attrs):
+    """with span("fusion.image", file=img_name): ...  未开启追踪时零成本"""
+    tracer = _TRACER
+    if tracer is None:
+        return _NOOP_SPAN
+    return _Span(tracer, name, attrs)
+
+
+def traced(name=None):
+    """函数装饰器版本的 span，默认以 模块名.函数名 命名"""
+    def decorator(fn):
+        span_name = name or f"{fn.__module__.rsplit('.', 1)[-1]}.{fn.__name__}"
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if _TRACER is None:
+                return fn(*args, **kwargs)
+            with _Span(_TRACER, span_name, {}):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def count(name, value=1):
+    tracer = _TRACER
+    if tracer is None:
+        return
+    with tracer.lock:
+        tracer.counters[name] += value
+
+
+def observe(name, value):
+    tracer = _TRACER
+    if tracer is None:
+        return
+    with tracer.lock:
+        tracer.histograms[name].add(float(value))
+
+
+def enabled():
+    return _TRACER is not None
+
+
+# ================= 开关 =================
+def _close_tracer():
+    if _TRACER is not None and _TRACER.pid == os.getpid():
+        _TRACER.close()
+
+
+def _before_fork():
+    if _TRACER is not None:
+        _TRACER.flush()
+
+
+def _after_fork_in_child():
+    if _TRACER is not None:
+        _TRACER.after_fork_in_child()
+
+
+def _register_exit_hooks():
+    atexit.register(_close_tracer)
+    # multiprocessing 的工作进程以 os._exit 结束，不会执行 atexit，需要额外注册 Finalize
+    try:
+        from multiprocessing import util
+        util.Finalize(None, _close_tracer, exitpriority=10)
+        # Process._bootstrap 会在 fork 之后清空 Finalize 注册表，因此还要在 after_fork 阶段重新注册
+        util.register_after_fork(_close_tracer, lambda _: util.Finalize(None, _close_tracer, exitpriority=10))
+    except ImportError:
+        pass
+
+
+_FORK_HOOKED = False
+
+
+def enable_tracing(path, chrome_path=None):
+    """开启追踪并写入 path；同时写入环境变量，让后续 spawn 的子进程自动继承"""
+    global _TRACER, _FORK_HOOKED
+    if _TRACER is not None:
+        return _TRACER
+    owner = os.environ.get(_ENV_OWNER)
+    truncate = owner is None
+    _TRACER = _Tracer(path, chrome_path, truncate=truncate)
+
+    os.environ[ENV_TRACE] = str(path)
+    if chrome_path:
+        os.environ[ENV_CHROME] = str(chrome_path)
+    if truncate:
+        os.environ[_ENV_OWNER] = str(os.getpid())
+
+    _register_exit_hooks()
+    if not _FORK_HOOKED and hasattr(os, "register_at_fork"):
+        os.register_at_fork(before=_before_fork, after_in_child=_after_fork_in_child)
+        _FORK_HOOKED = True
+    return _TRACER
+
+
+def disable_tracing():
+    """关闭追踪并写出汇总 (一般不需要手动调用，进程退出时会自动完成)"""
+    global _TRACER
+    tracer, _TRACER = _TRACER, None
+    if tracer is not None and tracer.pid == os.getpid():
+        tracer.close()
+
+
+def init_from_env():
+    path = os.environ.get(ENV_TRACE)
+    if path:
+        enable_tracing(path, os.environ.get(ENV_CHROME))
+
+
+def add_trace_args(parser):
+    """给 argparse 脚本统一添加 --trace / --trace_chrome 参数"""
+    parser.add_argument('--trace', type=str, default=None, help=f'追踪事件 JSONL 输出路径 (也可用环境变量 {ENV_TRACE})')
+    parser.add_argument('--trace_chrome', type=str, default=None, help='额外导出 Chrome trace 格式的路径')
+    return parser
+
+
+def setup_tracing(trace=None, trace_chrome=None):
+    """命令行参数优先，其次环境变量；都没有时保持关闭"""
+    if trace:
+        enable_tracing(trace, trace_chrome)
+    else:
+        init_from_env()
+
+
+# ================= 读取 / 导出 =================
+def load_trace(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def _assign_lanes(spans):
+    """
+    同一线程内的 span 在异步代码 (asyncio) 中可能交叠而不嵌套，Chrome 的 X 事件要求同一轨道严格嵌套，
+    这里把不能嵌套的 span 分到额外的虚拟轨道上
+    """
+    lanes = []          # 每个轨道一个 "结束时间" 栈
+    out = []
+    for ev in sorted(spans, key=lambda e: (e["ts"], -e["dur"])):
+        start, end = ev["ts"], ev["ts"] + ev["dur"]
+        for lane_idx, stack in enumerate(lanes):
+            while stack and stack[-1] <= start:
+                stack.pop()
+            if not stack or end <= stack[-1]:
+                stack.append(end)
+                break
+        else:
+            lanes.append([end])
+            lane_idx = len(lanes) - 1
+        out.append((lane_idx, ev))
+    return out
+
+
+def write_chrome_trace(jsonl_path, chrome_path):
+    """将 JSONL 追踪文件转换为 Chrome trace event 格式"""
+    events = load_trace(jsonl_path)
+    by_thread = defaultdict(list)
+    for ev in events:
+        if ev.get("type") == "span":
+            by_thread[(ev["pid"], ev["tid"])].append(ev)
+
+    trace_events = []
+    track_ids = {}
+    for (pid, tid), spans in by_thread.items():
+        for lane, ev in _assign_lanes(spans):
+            key = (pid, tid, lane)
+            if key not in track_ids:
+                track_ids[key] = len(track_ids) + 1
+                label = f"thread-{len(track_ids)}" + (f" (lane {lane})" if lane else "")
+                trace_events.append({"name": "thread_name", "ph": "M", "pid": pid, "tid": track_ids[key],
+                                     "args": {"name": label}})
+            trace_events.append({"name": ev["name"], "ph": "X", "ts": ev["ts"], "dur": ev["dur"],
+                                 "pid": pid, "tid": track_ids[key], "args": ev.get("attrs", {})})
+    # 计数器只在进程退出时写一次，放在该进程最后一个 span 结束的位置
+    pid_end = defaultdict(float)
+    for (pid, _), spans in by_thread.items():
+        pid_end[pid] = max(pid_end[pid], max(e["ts"] + e["dur"] for e in spans))
+    for ev in events:
+        if ev.get("type") == "counter":
+            trace_events.append({"name": ev["name"], "ph": "C", "pid": ev["pid"], "tid": 0,
+                                 "ts": pid_end.get(ev["pid"], 0), "args": {"value": ev["value"]}})
+
+    chrome_path = Path(chrome_path)
+    chrome_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(chrome_path, 'w', encoding='utf-8') as f:
+        json.dump({"traceEvents": trace_events, "displayTimeUnit": "ms"}, f, ensure_ascii=False)
+    return chrome_path
+
+
+def summarize_trace(path):
+    """汇总所有进程的 span 耗时、计数器和直方图 (span 按原始事件重新统计，计数器跨进程求和)"""
+    events = load_trace(path)
+    spans = defaultdict(list)
+    counters = defaultdict(float)
+    histograms = defaultdict(list)
+    pids = set()
+    for ev in events:
+        pids.add(ev.get("pid"))
+        t = ev.get("type")
+        if t == "span":
+            spans[ev["name"]].append(ev["dur"] / 1000.0)
+        elif t == "counter":
+            counters[ev["name"]] += ev["value"]
+        elif t == "histogram":
+            histograms[ev["name"]].append(ev)
+
+    print("=" * 80)
+    print(f"🔍 追踪汇总: {path} ({len(pids)} 个进程, {sum(len(v) for v in spans.values())} 个 span)")
+    print("=" * 80)
+    print(f"{'Span':<36}{'次数':>8}{'总耗时(s)':>12}{'均值(ms)':>11}{'P90(ms)':>11}")
+    print("-" * 80)
+    for name, durs in sorted(spans.items(), key=lambda kv: -sum(kv[1])):
+        durs.sort()
+        p90 = durs[min(len(durs) - 1, int(0.9 * len(durs)))]
+        print(f"{name:<36}{len(durs):>8}{sum(durs) / 1000:>12.3f}{sum(durs) / len(durs):>11.3f}{p90:>11.3f}")
+    if counters:
+        print("-" * 80)
+        print("🔢 计数器:")
+        for name, value in sorted(counters.items()):
+            print(f"  {name:<40}{value:>14g}")
+    if histograms:
+        print("-" * 80)
+        print("📊 直方图 (各进程分别统计):")
+        for name, parts in sorted(histograms.items()):
+            for h in parts:
+                if h["count"]:
+                    print(f"  {name:<32} pid={h['pid']:<8} n={h['count']:<8} mean={h['mean']:.4g} "
+                          f"p50={h['p50']:.4g} p90={h['p90']:.4g} p99={h['p99']:.4g} max={h['max']:.4g}")
+    print("=" * 80)
+    return {"spans": {k: {"count": len(v), "total_ms": sum(v)} for k, v in spans.items()},
+            "counters": dict(counters)}
+
+
+init_from_env()
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="汇总追踪文件 / 转换为 Chrome trace")
+    parser.add_argument('trace', type=str, help='追踪事件 JSONL 路径')
+    parser.add_argument('--chrome', type=str, default=None, help='导出 Chrome trace 的路径')
+    args = parser.parse_args()
+
+    summarize_trace(args.trace)
+    if args.chrome:
+        print(f"💾 Chrome trace 已导出至: {write_chrome_trace(args.trace, args.chrome)}")
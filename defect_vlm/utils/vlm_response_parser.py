@@ -0,0 +1,310 @@
+"""
+VLM / 教师 API 回复的统一解析库
+原来 parse_vlm_prediction 在 compute_vlm_metric*.py、exp1/2/3、pr_curve_engine.py、browse_vlm_inference.py 里各有一份，
+pe/split_api_reponse_tea.py / stu.py 的 check_ai_response、flywheel(semi)/extract_vlm_data.py 又各自实现了一套，
+规则不完全一致，改一处漏一处。这里统一为：
+    parse_vlm_prediction : 只要类别时的快速路径。只有一个扁平 "defect" 键的常见回复直接取字符串值，不构建整个 JSON 对象；
+                           嵌套、重复键、大小写变体等情况退回原实现 (json.loads + 正则兜底)，结果与原实现逐条一致
+    parse_label_regex    : 只用正则取第一个 defect (compute_local_metric_with_metainfo.py 原有语义)
+    parse_label_strict   : 严格模式取类别，整段必须是合法 JSON 且含 defect 键，否则抛出 JSONDecodeError / KeyError
+                           (extract_vlm_data.py 原有语义)
+    scan_fields          : 单遍扫描同时取出 step1/step2/step3/defect 等字符串字段，同样不构建对象
+    parse_response       : 完整校验，返回 ParsedResponse
+                           strict  : 与原 check_ai_response 完全一致 (ERROR 前缀 / 首个 { 到最后一个 } / 允许真实换行 /
+                                     字段集合必须完全相等 / 可选的类别白名单)，失败原因文案保持不变，
+                                     sandbox/analyse_response_fail_reason.py 的统计口径不受影响
+                           lenient : 先按 strict 的方式解析，失败时退化为 scan_fields 单遍扫描，
+                                     只要求有 defect，缺少的 step 记在 missing 中 (代码块、前后废话、截断、非法 JSON 都能救回)
+    read_record_field    : 从 JSONL 原始行中直接取出顶层字符串字段 (如 pred)，跳过 pred_token_probs 等大字段的反序列化
+    parse_jsonl          : 大文件批量解析，按字节区间切块交给多进程，结果按行序返回
+"""
+import json
+import os
+import re
+from json.decoder import scanstring
+from multiprocessing import Pool
+
+VERDICT_KEY = 'defect'
+RESPONSE_KEYS = ('step1', 'step2', 'step3', 'defect')
+DEFECT_LABELS = ('breakage', 'inclusion', 'crater', 'bulge', 'scratch', 'run', 'background')
+DEFAULT_LABEL = 'background'
+PARSE_MODES = ('label', 'strict', 'lenient')
+
+# 与原 check_ai_response 一致的失败原因文案 (retry 文件里的 meta_info.fail_reason)
+FAIL_API_ERROR = "API调用阶段报错: {}"
+FAIL_NO_BRACES = "模型回复中未找到有效的JSON大括号结构"
+FAIL_BAD_JSON = "JSON解析失败，非标准JSON格式"
+FAIL_MISSING_KEYS = "模型的回复缺少必须字段, 当前为 {}"
+FAIL_BAD_DEFECT = "模型回复的缺陷类型不符合要求, 当前为 {}"
+FAIL_NO_DEFECT = "模型回复中未找到 defect 字段"
+
+# 键之后的 ': "..."' 部分，字符串内允许转义
+_VALUE_RE = re.compile(r'\s*:\s*"((?:[^"\\]|\\.)*)"', re.S)
+# 原实现的正则兜底 (大小写不敏感、取第一个、不处理转义)
+_LEGACY_DEFECT_RE = re.compile(r'"defect"\s*:\s*"([^"]+)"', re.I)
+_DEFECT_KEY_RE_I = re.compile(r'"defect"', re.I)
+_FIELDS_RE_CACHE = {}
+
+
+def _unescape(value):
+    """只有包含反斜杠时才走 JSON 字符串解码"""
+    if '\\' not in value:
+        return value
+    try:
+        return scanstring('"' + value + '"', 1, False)[0]
+    except ValueError:
+        return value
+
+
+def parse_label_regex(pred_text, default=None):
+    """只用正则取第一个 "defect" 的值 (大小写不敏感，小写返回)，找不到返回 default"""
+    m = _LEGACY_DEFECT_RE.search(pred_text or "")
+    return m.group(1).lower() if m else default
+
+
+def parse_vlm_prediction(pred_text, default=DEFAULT_LABEL, missing=DEFAULT_LABEL):
+    """
+    鲁棒地解析 VLM 输出的 JSON 文本，提取缺陷类别 (小写)，结果与原实现逐条一致：
+        去代码块后是合法 JSON 对象 -> 顶层 defect 的值，没有该键时返回 missing
+        否则                     -> 正则兜底取第一个 "defect" (大小写不敏感)，仍然没有返回 default
+    快速路径只在结果与上述规则必然相同时使用：全文只有一个 "defect" 键 (不区分大小写) 且就是小写写法、
+    最多一个左大括号 (不可能嵌套)、值非空且不含转义。其余情况 (嵌套对象、重复键、Defect 等) 走原逻辑
+    """
+    if not pred_text:
+        return default
+    key = '"defect"'
+    pos = pred_text.find(key)
+    if pos >= 0 and pred_text.count('{') <= 1 and len(_DEFECT_KEY_RE_I.findall(pred_text)) == 1:
+        m = _VALUE_RE.match(pred_text, pos + len(key))
+        if m and m.group(1) and '\\' not in m.group(1):
+            return m.group(1).lower()
+    try:
+        data = json.loads(pred_text.replace("```json", "").replace("```", "").strip())
+        return data.get(VERDICT_KEY, missing).lower()
+    except Exception:
+        return parse_label_regex(pred_text, default)
+
+
+def parse_label_strict(pred_text):
+    """严格模式：整段必须是合法 JSON 且含 defect 键，返回原始类别字符串 (不做大小写处理)"""
+    return json.loads(pred_text)[VERDICT_KEY]
+
+
+def _fields_regex(keys):
+    keys = tuple(keys)
+    regex = _FIELDS_RE_CACHE.get(keys)
+    if regex is None:
+        alt = '|'.join(re.escape(k) for k in keys)
+        regex = re.compile(r'"(' + alt + r')"\s*:\s*"((?:[^"\\]|\\.)*)"', re.I | re.S)
+        _FIELDS_RE_CACHE[keys] = regex
+    return regex
+
+
+def scan_fields(text, keys=RESPONSE_KEYS):
+    """
+    单遍扫描取出指定键的字符串值 (键名大小写不敏感，统一成 keys 中的写法)
+    同一个键出现多次时取第一次 (模型在结论之后再输出第二份 JSON 时以第一份为准)
+    """
+    canon = {k.lower(): k for k in keys}
+    fields = {}
+    if not text:
+        return fields
+    for m in _fields_regex(keys).finditer(text):
+        k = canon[m.group(1).lower()]
+        if k not in fields:
+            fields[k] = _unescape(m.group(2))
+            if len(fields) == len(canon):
+                break
+    return fields
+
+
+class ParsedResponse:
+    """parse_response 的结果：ok、字段字典、失败原因，以及 lenient 模式下缺少的字段"""
+
+    __slots__ = ('ok', 'fields', 'fail_reason', 'missing', 'recovered')
+
+    def __init__(self, ok, fields=None, fail_reason=None, missing=(), recovered=False):
+        self.ok = ok
+        self.fields = fields if fields is not None else {}
+        self.fail_reason = fail_reason
+        self.missing = tuple(missing)
+        self.recovered = recovered      # lenient 模式下由单遍扫描救回 (非标准 JSON)
+
+    @property
+    def defect(self):
+        return self.fields.get(VERDICT_KEY)
+
+    def to_dict(self):
+        return {"ok": self.ok, "fields": self.fields, "fail_reason": self.fail_reason,
+                "missing": list(self.missing), "recovered": self.recovered}
+
+
+def _strict_object(text):
+    """原 check_ai_response 的提取方式：首个 { 到最后一个 }，允许字符串里有真实换行"""
+    start_idx = text.find('{')
+    end_idx = text.rfind('}')
+    if start_idx == -1 or end_idx == -1 or start_idx > end_idx:
+        return None, FAIL_NO_BRACES
+    try:
+        obj = json.loads(text[start_idx:end_idx + 1], strict=False)
+    except json.JSONDecodeError:
+        return None, FAIL_BAD_JSON
+    if not isinstance(obj, dict):
+        return None, FAIL_BAD_JSON
+    return obj, None
+
+
+def parse_response(text, mode='strict', keys=RESPONSE_KEYS, labels=None, overrides=None):
+    """
+    完整解析一条回复
+    :param mode: 'strict' 与原 check_ai_response 一致；'lenient' 只要求能找到 defect
+    :param keys: 必须字段，strict 模式要求解析出的键集合与之完全相等
+    :param labels: 类别白名单 (如 DEFECT_LABELS)，None 时不检查
+    :param overrides: 解析成功后、字段检查之前覆盖的字段 (教师回复的 defect 由 GT 标签覆盖)；
+                      也可以是无参函数，只在解析成功后才调用 (失败路径不会读取 GT 标签)
+    """
+    if text is None:
+        text = ""
+    if text.startswith("ERROR"):
+        return ParsedResponse(False, fail_reason=FAIL_API_ERROR.format(text))
+
+    obj, reason = _strict_object(text)
+    recovered = False
+    if obj is None:
+        if mode != 'lenient':
+            return ParsedResponse(False, fail_reason=reason)
+        obj = scan_fields(text, keys)
+        recovered = True
+        if VERDICT_KEY not in obj:
+            return ParsedResponse(False, fail_reason=reason if reason == FAIL_NO_BRACES else FAIL_NO_DEFECT)
+    if overrides:
+        obj.update(overrides() if callable(overrides) else overrides)
+
+    if mode == 'lenient':
+        if VERDICT_KEY not in obj or not isinstance(obj[VERDICT_KEY], str):
+            return ParsedResponse(False, obj, fail_reason=FAIL_NO_DEFECT, recovered=recovered)
+        missing = [k for k in keys if k not in obj]
+    else:
+        obj_keys = set(obj.keys())
+        if obj_keys != set(keys):
+            return ParsedResponse(False, obj, fail_reason=FAIL_MISSING_KEYS.format(obj_keys))
+        missing = ()
+
+    if labels is not None:
+        defect = obj.get(VERDICT_KEY)
+        defect = defect.lower() if isinstance(defect, str) else ''
+        if defect not in labels:
+            return ParsedResponse(False, obj, fail_reason=FAIL_BAD_DEFECT.format(defect), missing=missing,
+                                  recovered=recovered)
+    return ParsedResponse(True, obj, missing=missing, recovered=recovered)
+
+
+# ================= JSONL 原始行 =================
+
+def read_record_field(line, field='pred', fallback=True):
+    """
+    从 JSONL 原始行中取顶层字符串字段，不反序列化整行 (VLM 结果里 pred_token_probs 往往比 pred 大一个数量级)
+    找不到或字段不是字符串时退回 json.loads 整行 (fallback=False 时直接返回 None)；要求该键名在整行中唯一
+    """
+    key = '"' + field + '"'
+    pos = line.find(key)
+    while pos >= 0:
+        # 前面有奇数个反斜杠说明这个引号在某个字符串内部，不是键
+        k = pos - 1
+        while k >= 0 and line[k] == '\\':
+            k -= 1
+        if (pos - 1 - k) % 2 == 0:
+            j = pos + len(key)
+            n = len(line)
+            while j < n and line[j] in ' \t':
+                j += 1
+            if j < n and line[j] == ':':
+                j += 1
+                while j < n and line[j] in ' \t':
+                    j += 1
+                if j < n and line[j] == '"':
+                    return scanstring(line, j + 1, True)[0]
+                break
+        pos = line.find(key, pos + 1)
+    if not fallback:
+        return None
+    value = json.loads(line).get(field)
+    return value if isinstance(value, str) else ""
+
+
+def _get_path(item, path):
+    for k in path:
+        item = item[k]
+    return item
+
+
+def parse_line(line, field='pred', mode='label', keys=RESPONSE_KEYS, labels=None):
+    """
+    解析 JSONL 中的一行
+    :param field: 顶层字段名 (走 read_record_field 快速路径)，或键路径元组 (如 ('conversation', 1, 'value'))
+    :return: label 模式返回类别字符串，strict / lenient 返回 ParsedResponse.to_dict()；整行不是合法 JSON 时返回 None
+    """
+    try:
+        if isinstance(field, str):
+            text = read_record_field(line, field)
+        else:
+            text = _get_path(json.loads(line), field)
+    except (ValueError, KeyError, IndexError, TypeError):
+        return None
+    if mode == 'label':
+        return parse_vlm_prediction(text)
+    return parse_response(text, mode, keys, labels).to_dict()
+
+
+def split_byte_ranges(path, num_chunks):
+    """把文件按字节切成 num_chunks 段，每段边界对齐到换行之后"""
+    size = os.path.getsize(path)
+    if size == 0:
+        return []
+    num_chunks = max(1, min(num_chunks, size))
+    bounds = [0]
+    with open(path, 'rb') as f:
+        for i in range(1, num_chunks):
+            f.seek(max(size * i // num_chunks, bounds[-1]))
+            f.readline()
+            pos = f.tell()
+            if pos >= size:
+                break
+            if pos > bounds[-1]:
+                bounds.append(pos)
+    bounds.append(size)
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+def _parse_range(task):
+    path, start, end, field, mode, keys, labels = task
+    results = []
+    with open(path, 'rb') as f:
+        f.seek(start)
+        data = f.read(end - start)
+    for raw in data.split(b'\n'):
+        if not raw.strip():
+            continue
+        results.append(parse_line(raw.decode('utf-8'), field, mode, keys, labels))
+    return results
+
+
+def parse_jsonl(path, field='pred', mode='label', num_workers=0, keys=RESPONSE_KEYS, labels=None,
+                chunks_per_worker=4):
+    """
+    批量解析 JSONL (跳过空行)，返回与非空行一一对应的结果列表
+    :param num_workers: <= 1 时在当前进程内顺序执行；否则按字节区间切块交给进程池 (每个 worker 自己读文件，
+                        主进程不做逐行分发)，结果按块顺序拼接，与单进程完全一致
+    """
+    if mode not in PARSE_MODES:
+        raise ValueError(f"mode 必须是 {PARSE_MODES} 之一，当前为 {mode}")
+    path = str(path)
+    if num_workers <= 1:
+        return _parse_range((path, 0, os.path.getsize(path), field, mode, keys, labels))
+    ranges = split_byte_ranges(path, num_workers * chunks_per_worker)
+    tasks = [(path, s, e, field, mode, keys, labels) for s, e in ranges]
+    results = []
+    with Pool(num_workers) as pool:
+        for part in pool.imap(_parse_range, tasks):
+            results.extend(part)
+    return results
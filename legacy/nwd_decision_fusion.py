@@ -5,8 +5,8 @@
 """
 import json
 import os
-import numpy as np
 from ensemble_boxes import soft_nms
+from defect_vlm.utils.box_geometry import calculate_nwd
 
 # 类别 ID 到 名称 的映射 (用于融合后还原)
 CLASS_ID_TO_NAME = {
@@ -24,23 +24,6 @@ def get_area_ratio(bbox, img_w, img_h):
     h = bbox[3] - bbox[1]
     return (w * h) / (img_w * img_h)
 
-def calculate_nwd(box1, box2, C):
-    """计算两个边界框之间的归一化 Wasserstein 距离 (NWD)"""
-    # 计算框1的中心点和宽高
-    cx1, cy1 = (box1[0] + box1[2]) / 2.0, (box1[1] + box1[3]) / 2.0
-    w1, h1 = box1[2] - box1[0], box1[3] - box1[1]
-    
-    # 计算框2的中心点和宽高
-    cx2, cy2 = (box2[0] + box2[2]) / 2.0, (box2[1] + box2[3]) / 2.0
-    w2, h2 = box2[2] - box2[0], box2[3] - box2[1]
-    
-    # 计算二阶 Wasserstein 距离平方 (W_2^2)
-    w2_dist_sq = (cx1 - cx2)**2 + (cy1 - cy2)**2 + ((w1 - w2)**2 + (h1 - h2)**2) / 4.0
-    
-    # 指数归一化得到 NWD 相似度 (0 到 1 之间)
-    nwd = np.exp(-np.sqrt(w2_dist_sq) / C)
-    return nwd
-
 def nwd_consensus_fusion(preds_A, preds_B, nwd_thr, C):
     """基于 NWD 和联合概率的微小缺陷跨源共识融合机制"""
     fused_preds = []